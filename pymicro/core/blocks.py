@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Block processing of image fields larger than the memory.
+
+This module provides the tools used by `SampleData.process_image_blocks`
+to tile an image into blocks extended by a halo of neighbouring voxels,
+to run a kernel on each block, possibly in parallel processes, and to
+reduce per-label statistics (for instance per-grain statistics of a grain
+map) computed independently on each block.
+
+A kernel is a function defined at the module level (so that it can be sent
+to other processes) with the signature::
+
+    kernel(block, *arrays, **kwargs) -> (outputs, statistics)
+
+where `block` is the `ImageBlock` instance describing the block, `arrays`
+the blocks of the input fields extended by the halo, `outputs` a dictionary
+of arrays to write in the output fields (with the shape of the block with or
+without its halo) or None, and `statistics` any picklable object, for
+instance the dictionary returned by `label_statistics`.
+"""
+import itertools
+
+import numpy as np
+from scipy import ndimage
+
+
+class ImageBlock(object):
+    """Description of a block of an image and of its halo.
+
+    The core of the block is the part of the image it is responsible for,
+    the blocks of an image tile it without overlap. The halo extends the
+    core by a given number of voxels in each direction to give access to the
+    neighbourhood of the voxels at the block boundaries. The halo is clipped
+    to the image, unless it is padded (the `padded` attribute is then True
+    and the halo bounds may lie outside the image).
+    """
+
+    def __init__(self, index, start, stop, halo_start, halo_stop, shape,
+                 padded=False):
+        """Create a block.
+
+        :param tuple index: the index of the block in the grid of blocks.
+        :param start: the start indices of the core of the block.
+        :param stop: the stop indices of the core of the block.
+        :param halo_start: the start indices of the block with its halo.
+        :param halo_stop: the stop indices of the block with its halo.
+        :param tuple shape: the shape of the whole image.
+        :param bool padded: whether the halo is padded outside the image.
+        """
+        self.index = tuple(index)
+        self.start = np.array(start, dtype=np.int64)
+        self.stop = np.array(stop, dtype=np.int64)
+        self.halo_start = np.array(halo_start, dtype=np.int64)
+        self.halo_stop = np.array(halo_stop, dtype=np.int64)
+        self.image_shape = tuple(shape)
+        self.padded = padded
+
+    def __repr__(self):
+        return 'ImageBlock {} [{} - {}[, halo [{} - {}['.format(
+            self.index, self.start.tolist(), self.stop.tolist(),
+            self.halo_start.tolist(), self.halo_stop.tolist())
+
+    @property
+    def shape(self):
+        """Shape of the core of the block."""
+        return tuple(self.stop - self.start)
+
+    @property
+    def halo_shape(self):
+        """Shape of the block with its halo."""
+        return tuple(self.halo_stop - self.halo_start)
+
+    @property
+    def selection(self):
+        """Slices of the core of the block in the image."""
+        return tuple(slice(a, b) for a, b in zip(self.start, self.stop))
+
+    @property
+    def halo_selection(self):
+        """Slices of the block with its halo in the image (clipped)."""
+        return tuple(slice(max(0, a), min(n, b)) for a, b, n in
+                     zip(self.halo_start, self.halo_stop, self.image_shape))
+
+    @property
+    def core(self):
+        """Slices of the core in the array of the block with its halo."""
+        return tuple(slice(a - h, b - h) for a, b, h in
+                     zip(self.start, self.stop, self.halo_start))
+
+    @property
+    def pad_width(self):
+        """Padding of the clipped halo block to get the full halo block."""
+        return [(max(0, -a), max(0, b - n)) for a, b, n in
+                zip(self.halo_start, self.halo_stop, self.image_shape)]
+
+
+def get_block_shape(shape, itemsize, block_size=2 ** 24):
+    """Default shape of the blocks of an image.
+
+    The blocks extend over the whole image along all dimensions but the
+    last one, which is the first dimension of the image fields stored in the
+    dataset (with the (Z,Y,X) convention), so that each block is a
+    contiguous part of the stored arrays.
+
+    :param tuple shape: the shape of the image.
+    :param int itemsize: the number of bytes for the values of one voxel.
+    :param int block_size: the approximate size of a block in bytes.
+    :return: the shape of the blocks as a tuple.
+    """
+    slice_size = itemsize * int(np.prod(shape[:-1]))
+    depth = max(1, min(shape[-1], block_size // max(1, slice_size)))
+    return tuple(shape[:-1]) + (depth,)
+
+
+def iter_image_blocks(shape, block_shape, halo=0, padded=False):
+    """Iterate over the blocks tiling an image.
+
+    :param tuple shape: the shape of the image.
+    :param tuple block_shape: the shape of the blocks (the last blocks along
+        each dimension may be smaller).
+    :param halo: the width of the halo in voxels, a single value or one
+        value per dimension.
+    :param bool padded: if True, the halo is not clipped to the image.
+    :return: a generator of `ImageBlock` instances.
+    """
+    ndim = len(shape)
+    halo = np.broadcast_to(np.asarray(halo, dtype=np.int64), (ndim,))
+    block_shape = np.minimum(np.asarray(block_shape, dtype=np.int64), shape)
+    counts = [int(np.ceil(n / b)) for n, b in zip(shape, block_shape)]
+    for index in itertools.product(*[range(c) for c in counts]):
+        start = np.array(index) * block_shape
+        stop = np.minimum(start + block_shape, shape)
+        halo_start = start - halo
+        halo_stop = stop + halo
+        if not padded:
+            halo_start = np.maximum(halo_start, 0)
+            halo_stop = np.minimum(halo_stop, shape)
+        yield ImageBlock(index, start, stop, halo_start, halo_stop, shape,
+                         padded=padded)
+
+
+def run_block_kernel(kernel, block, arrays, kwargs):
+    """Run a kernel on a block, this is the task sent to the processes."""
+    return block, kernel(block, *arrays, **kwargs)
+
+
+def label_statistics(labels, offset=None):
+    """Compute the geometric statistics of the labels of a block.
+
+    Only positive labels are taken into account. The statistics of all the
+    blocks of an image can be reduced with `merge_label_statistics`.
+
+    :param ndarray labels: the labels of the block.
+    :param offset: the position of the block in the image, to compute
+        the coordinates in the image frame.
+    :return: a dictionary with the sorted labels (`ids`), their number of
+        voxels (`sizes`), the sums of their voxel coordinates (`sums`),
+        their bounding boxes as [start, stop[ indices along each dimension
+        (`bounding_boxes`) and the coordinates of their first voxel in the
+        raster order of the image (`first_voxels`).
+    """
+    ndim = labels.ndim
+    if offset is None:
+        offset = np.zeros(ndim, dtype=np.int64)
+    offset = np.asarray(offset, dtype=np.int64)
+    valid = labels > 0
+    values = labels[valid]
+    ids, first, inverse, sizes = np.unique(values, return_index=True,
+                                           return_inverse=True,
+                                           return_counts=True)
+    sums = np.zeros((len(ids), ndim))
+    first_voxels = np.zeros((len(ids), ndim), dtype=np.int64)
+    for axis, coords in enumerate(np.nonzero(valid)):
+        sums[:, axis] = np.bincount(inverse, weights=coords + offset[axis],
+                                    minlength=len(ids))
+        # the raster order of a block is the raster order of the image
+        first_voxels[:, axis] = coords[first] + offset[axis]
+    # bounding boxes from the objects of the labels renumbered from 1
+    compact = np.zeros(labels.shape, dtype=np.int64)
+    compact[valid] = inverse + 1
+    bounding_boxes = np.array(
+        [[(sl.start, sl.stop) for sl in obj]
+         for obj in ndimage.find_objects(compact)], dtype=np.int64)
+    bounding_boxes = bounding_boxes.reshape((len(ids), ndim, 2))
+    bounding_boxes += offset[:, np.newaxis]
+    return {'ids': ids,
+            'sizes': sizes,
+            'sums': sums,
+            'bounding_boxes': bounding_boxes,
+            'first_voxels': first_voxels}
+
+
+def reduce_label_values(ids, values, reduction='sum'):
+    """Reduce the values associated with repeated labels.
+
+    :param ndarray ids: the labels, possibly repeated.
+    :param ndarray values: the values for each label, the first dimension
+        is the one of `ids`.
+    :param str reduction: 'sum', 'min', 'max' or 'first'.
+    :return: the sorted unique labels and their reduced values.
+    """
+    unique_ids, inverse = np.unique(ids, return_inverse=True)
+    values = np.asarray(values)
+    if reduction == 'first':
+        first = np.full(len(unique_ids), len(ids), dtype=np.int64)
+        np.minimum.at(first, inverse, np.arange(len(ids)))
+        return unique_ids, values[first]
+    if reduction == 'sum':
+        reduced = np.zeros((len(unique_ids),) + values.shape[1:],
+                           dtype=values.dtype)
+        np.add.at(reduced, inverse, values)
+    elif reduction in ['min', 'max']:
+        if len(unique_ids) == 0:
+            return unique_ids, values
+        ufunc = np.minimum if reduction == 'min' else np.maximum
+        order = np.argsort(inverse, kind='stable')
+        starts = np.searchsorted(inverse[order], np.arange(len(unique_ids)))
+        reduced = ufunc.reduceat(values[order], starts, axis=0)
+    else:
+        raise ValueError('Unknown reduction {}, possible values are sum, '
+                         'min, max and first'.format(reduction))
+    return unique_ids, reduced
+
+
+def merge_label_statistics(statistics, relabel=None):
+    """Reduce the label statistics computed on the blocks of an image.
+
+    :param list statistics: the dictionaries returned by `label_statistics`
+        for each block.
+    :param tuple relabel: an optional tuple of two arrays (old labels
+        sorted in ascending order, new labels) to merge the statistics of
+        labels given the same new label.
+    :return: a dictionary with the sorted labels (`ids`), their number of
+        voxels (`sizes`), their center of mass in voxel unit (`centers`) and
+        their bounding boxes (`bounding_boxes`).
+    """
+    statistics = [s for s in statistics if s is not None]
+    ids = np.concatenate([s['ids'] for s in statistics])
+    if relabel is not None:
+        ids = relabel[1][np.searchsorted(relabel[0], ids)]
+    unique_ids, sizes = reduce_label_values(
+        ids, np.concatenate([s['sizes'] for s in statistics]))
+    _, sums = reduce_label_values(
+        ids, np.concatenate([s['sums'] for s in statistics]))
+    bounding_boxes = np.concatenate([s['bounding_boxes'] for s in statistics])
+    _, starts = reduce_label_values(ids, bounding_boxes[..., 0], 'min')
+    _, stops = reduce_label_values(ids, bounding_boxes[..., 1], 'max')
+    return {'ids': unique_ids,
+            'sizes': sizes,
+            'centers': sums / sizes[:, np.newaxis],
+            'bounding_boxes': np.stack((starts, stops), axis=-1)}
+
+
+def label_statistics_kernel(block, labels):
+    """Block kernel computing the geometric statistics of a label map."""
+    return None, label_statistics(labels[block.core], offset=block.start)
+
+
+def connected_components_kernel(block, field, structure=None):
+    """Block kernel labelling the connected components of a binary field.
+
+    The components are labelled independently in each block, each one with
+    the index of its first voxel in the raster order of the image plus one,
+    so that the labels are unique over the whole image.
+    """
+    local, n = ndimage.label(field != 0, structure=structure)
+    statistics = label_statistics(local, offset=block.start)
+    lut = np.zeros(n + 1, dtype=np.int64)
+    lut[1:] = np.ravel_multi_index(tuple(statistics['first_voxels'].T),
+                                   block.image_shape) + 1
+    statistics['ids'] = lut[1:]
+    return {'labels': lut[local]}, statistics
+
+
+def label_equivalences_kernel(block, labels, structure=None):
+    """Block kernel listing the pairs of distinct labels in contact.
+
+    :return: a (n, 2) array of the pairs of neighbouring labels (according
+        to the connectivity of `structure`) found in the block with its halo.
+    """
+    if structure is None:
+        structure = ndimage.generate_binary_structure(labels.ndim, 1)
+    structure = np.asarray(structure, dtype=bool)
+    pairs = [np.zeros((0, 2), dtype=labels.dtype)]
+    center = np.array(structure.shape) // 2
+    for offset in np.argwhere(structure) - center:
+        # each pair of neighbours is found with a single offset direction
+        if tuple(offset) <= (0,) * len(offset):
+            continue
+        a = labels[tuple(slice(max(0, -d), labels.shape[i] - max(0, d))
+                         for i, d in enumerate(offset))]
+        b = labels[tuple(slice(max(0, d), labels.shape[i] - max(0, -d))
+                         for i, d in enumerate(offset))]
+        contact = (a > 0) & (b > 0) & (a != b)
+        pairs.append(np.stack((a[contact], b[contact]), axis=-1))
+    pairs = np.concatenate(pairs)
+    return None, np.unique(np.sort(pairs, axis=1), axis=0)
+
+
+def relabel_kernel(block, labels, old_ids=None, new_ids=None):
+    """Block kernel replacing labels with new values.
+
+    :param ndarray old_ids: the labels to replace, sorted in ascending order.
+    :param ndarray new_ids: the new value of each label.
+    """
+    labels = labels[block.core]
+    relabelled = np.zeros(labels.shape, dtype=new_ids.dtype)
+    valid = labels > 0
+    relabelled[valid] = new_ids[np.searchsorted(old_ids, labels[valid])]
+    return {'labels': relabelled}, None
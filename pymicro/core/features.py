@@ -1,4 +1,5 @@
 from pymicro.core.samples import SampleData
+from pymicro.core.blocks import label_statistics_kernel, merge_label_statistics
 import tables
 import numpy as np
 from scipy import ndimage
@@ -41,7 +42,8 @@ class SampleWithFeatures(SampleData):
 
     def __init__(self,
                  filename=None, name='sample', description='',
-                 verbose=False, overwrite_hdf5=False, autodelete=False):
+                 verbose=False, overwrite_hdf5=False, autodelete=False,
+                 fast_open=False):
         if filename is None:
             # only add '_' if not present at the end of name
             filename = name + (not name.endswith('_')) * '_' + 'data'
@@ -50,7 +52,7 @@ class SampleWithFeatures(SampleData):
                             sample_description=description, verbose=verbose,
                             overwrite_hdf5=overwrite_hdf5,
                             autodelete=autodelete,
-                            after_file_open_args={})
+                            after_file_open_args={}, fast_open=fast_open)
         return
 
     def _after_file_open(self, **kwargs):
@@ -550,7 +552,87 @@ class SampleWithFeatures(SampleData):
         self.features.flush()
         return self.get_bounding_boxes()
 
-    def compute_geometry(self, overwrite_table=False):
+    def segment_features(self, field_name, structure=None, n_jobs=1,
+                         block_shape=None):
+        """Segment the features of a binary field and build the feature table.
+
+        The connected components of the non zero voxels of the field are
+        labelled by blocks with the `label_image_field` method, so that the
+        field is never entirely loaded in memory. The labels are written in
+        the feature map and the FeatureDataTable is replaced by the features
+        found, with their volume, center and bounding box.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the binary
+            field, it must be a field of the `CellData` image group.
+        :param ndarray structure: the structuring element defining the
+            connectivity, see `scipy.ndimage.label` (connectivity by faces
+            by default).
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks processed at once
+            (slabs of the field by default).
+        :return: the number of features found.
+        """
+        if self.get_attribute('parent_grid_path', field_name) != '/CellData':
+            raise ValueError('the field {} must belong to the CellData image '
+                             'group'.format(field_name))
+        statistics = self.label_image_field(
+            field_name, 'feature_map', structure=structure, n_jobs=n_jobs,
+            block_shape=block_shape,
+            compression_options=self.default_compression_options)
+        self._set_features_geometry(statistics, overwrite_table=True)
+        return len(statistics['ids'])
+
+    def _set_features_geometry(self, statistics, overwrite_table=False):
+        """Write the geometry of the features in the FeatureDataTable.
+
+        :param dict statistics: the statistics of the features in the feature
+            map, in voxel unit, see `merge_label_statistics`.
+        :param bool overwrite_table: if True, the table is replaced by the
+            features of `statistics`, otherwise only the rows of these
+            features are updated.
+        """
+        voxel_size = np.array(self.get_attribute('spacing', 'CellData'))
+        shape = np.array(self.get_attribute('dimension', 'CellData'))
+        ids = statistics['ids']
+        volumes = statistics['sizes'] * np.prod(voxel_size)
+        centers = statistics['centers']
+        bounding_boxes = statistics['bounding_boxes']
+        if len(voxel_size) == 2:
+            voxel_size = np.concatenate((voxel_size, [0]))
+            shape = np.concatenate((shape, [1]))
+            centers = np.pad(centers, ((0, 0), (0, 1)))
+            bounding_boxes = np.concatenate(
+                (bounding_boxes, np.tile([[[0, 1]]], (len(ids), 1, 1))),
+                axis=1)
+        # same convention as `compute_center`
+        centers = voxel_size * (centers + 0.5 - 0.5 * shape)
+        if overwrite_table:
+            if self.features.nrows > 0:
+                self.features.remove_rows(start=0)
+            rows = np.zeros(len(ids), dtype=self.features.dtype)
+            rows['id'] = ids
+            rows_index = np.arange(len(ids))
+        else:
+            rows = self.features.read()
+            index = np.searchsorted(ids, rows['id'])
+            in_map = index < len(ids)
+            in_map[in_map] = ids[index[in_map]] == rows['id'][in_map]
+            rows_index = np.flatnonzero(in_map)
+            volumes, centers, bounding_boxes = (
+                volumes[index[in_map]], centers[index[in_map]],
+                bounding_boxes[index[in_map]])
+        rows['volume'][rows_index] = volumes
+        rows['center'][rows_index] = centers
+        rows['bounding_box'][rows_index] = bounding_boxes
+        if overwrite_table:
+            self.features.append(rows)
+        elif len(rows) > 0:
+            self.features.modify_rows(start=0, stop=len(rows), rows=rows)
+        self.features.flush()
+        return
+
+    def compute_geometry(self, overwrite_table=False, n_jobs=1,
+                         block_shape=None):
         """Compute each feature geometry from the feature map.
 
         This method computes the feature centers, volume and bounding boxes
@@ -559,28 +641,19 @@ class SampleWithFeatures(SampleData):
         present, their information is unchanged unless the option
         `overwrite_table` is activated.
 
+        The geometry of all the features is computed in a single pass over
+        the feature map, processed by blocks (possibly in parallel) with the
+        `process_image_blocks` method.
+
         :param bool overwrite_table: if this is True, the features present in
         the data table and not in the feature map are removed from it.
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the feature map
+            processed at once (slabs of the map by default).
         """
-        feature_ids = self.get_ids_from_map()
-        if overwrite_table and self.features.nrows > 0:
-            self.features.remove_rows(start=0)
-            for feature_id in feature_ids:
-                index = self.features.get_where_list('(id == i)')
-                if len(index) > 0:
-                    feature = self.features[index]
-                else:
-                    feature = np.zeros((1,), dtype=self.features.dtype)
-                feature['bounding_box'] = self.compute_bounding_box(feature_id)
-                feature['center'] = self.compute_center(feature_id)
-                feature['volume'] = self.compute_volume(feature_id)
-                if len(index) > 0:
-                    self.features[index] = feature
-                else:
-                    self.features.append(feature)
-            self.features.flush()
-        else:
-            self.recompute_bounding_boxes()
-            self.recompute_centers()
-            self.recompute_volumes()
+        statistics = merge_label_statistics(self.process_image_blocks(
+            ['feature_map'], label_statistics_kernel, n_jobs=n_jobs,
+            block_shape=block_shape))
+        self._set_features_geometry(statistics,
+                                    overwrite_table=overwrite_table)
         return
@@ -14,8 +14,13 @@ and associated metadata.
 import os
 import subprocess
 import shutil
+import weakref
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 import tables
+import h5py
 import lxml.builder
 from lxml import etree
 from pathlib import Path
@@ -38,6 +43,14 @@ from pymicro.core.global_variables import (XDMF_FIELD_TYPE,
 # Import variables for SampleData data model
 from pymicro.core.global_variables import (SD_GROUP_TYPES, SD_GRID_GROUPS,
                                            SD_IMAGE_GROUPS, SD_MESH_GROUPS)
+# Import storage backends for dataset conversions
+from pymicro.core.storage import (HDF5Backend, ChunkedDirectoryBackend,
+                                  convert_storage)
+# Import block processing tools for images larger than the memory
+from pymicro.core.blocks import (get_block_shape, iter_image_blocks,
+                                 run_block_kernel, merge_label_statistics,
+                                 connected_components_kernel,
+                                 label_equivalences_kernel, relabel_kernel)
 
 
 # noinspection SpellCheckingInspection,PyProtectedMember
@@ -103,6 +116,11 @@ class SampleData:
         if `True`, the HDF5 file is automatically repacked when deleting
         the SampleData instance, to recover the memory space freed up by data
         compression operations. See :func:`repack_h5file` for more details.
+    :fast_open: `bool`, optional (False)
+        if `True` and the file exists, open it without checking the minimal
+        data model content (tables columns update, empty nodes), and only
+        rebuild the XDMF file when closing the dataset if its content has
+        been modified. Opening time is then independent of the dataset size.
 
     .. rubric:: Class attributes
 
@@ -122,7 +140,7 @@ class SampleData:
     def __init__(self, filename='sample_data', sample_name='',
                  sample_description=' ', verbose=False, overwrite_hdf5=False,
                  autodelete=False, autorepack=False,
-                 after_file_open_args=dict()):
+                 after_file_open_args=dict(), fast_open=False):
         """Sample Data constructor, see class documentation."""
         # get file directory and file name
         path_file = Path(filename).absolute()
@@ -137,6 +155,11 @@ class SampleData:
         self._verbose = verbose
         self.autodelete = autodelete
         self.autorepack = autorepack
+        self._memory_map_offsets = dict()
+        self._fast_open = fast_open
+        # XDMF file is rebuilt when closing the dataset only if outdated
+        self._xdmf_outdated = not (fast_open
+                                   and os.path.exists(self._xdmf_path))
         if os.path.exists(self.h5_path) and overwrite_hdf5:
             self._verbose_print('-- File "{}" exists  and will be '
                                 'overwritten'.format(self.h5_path))
@@ -160,7 +183,8 @@ class SampleData:
     def __del__(self):
         """Sample Data destructor."""
         self._verbose_print('Deleting DataSample object ')
-        self.write_xdmf()
+        if self._xdmf_outdated:
+            self.write_xdmf()
         self.sync()
         if self.autorepack:
             self.repack_h5file()
@@ -604,8 +628,11 @@ class SampleData:
                    ''.format(self.h5_file))
         self._verbose_print(message,
                             line_break=False)
-        self.add_attributes(dic=self.content_index, nodename='/Index')
-        self.add_attributes(dic=self.aliases, nodename='/Index/Aliases')
+        # an index that has not been loaded has not been modified
+        if getattr(self.content_index, 'loaded', True):
+            self.add_attributes(dic=self.content_index, nodename='/Index')
+        if getattr(self.aliases, 'loaded', True):
+            self.add_attributes(dic=self.aliases, nodename='/Index/Aliases')
         self._verbose_print('.... flushing data in file {}'.format(
                                 self.h5_file), line_break=False)
         self.h5_dataset.flush()
@@ -668,6 +695,7 @@ class SampleData:
                   ' other softwares during this pause.'
                   ' Press <Enter> when you want to resume data management'
                   ''.format(self.h5_file, self._xdmf_file))
+        self._memory_map_offsets.clear()
         self.h5_dataset = tables.File(self.h5_path, mode='r+')
         self._file_exist = True
         self._after_file_open()
@@ -987,6 +1015,28 @@ class SampleData:
                        field_index_prefix=(imagename + '_'))
         return
 
+    def _add_empty_image(self, imagename, dimension, spacing, origin=None,
+                         location='/'):
+        """Create an image group without fields.
+
+        :param str imagename: the name of the image group.
+        :param dimension: the number of voxels along each dimension.
+        :param spacing: the size of the voxels (scalar or one value per
+            dimension).
+        :param origin: the origin of the image (zero by default).
+        :param str location: the path of the parent of the image group.
+        """
+        ndim = len(dimension)
+        image = ConstantRectilinearMesh(dim=ndim)
+        image.SetDimensions(np.array(dimension) + 1)
+        image.SetSpacing(spacing * np.ones((ndim,)))
+        if origin is None:
+            origin = np.zeros((ndim,))
+        image.SetOrigin(np.array(origin)[:ndim])
+        self.add_image(image, imagename=imagename, location=location,
+                       replace=True)
+        return
+
     def add_field_time(self, fieldname, time):
         """Add a time value to a field array node.
 
@@ -1144,31 +1194,12 @@ class SampleData:
                              }
             self.add_attributes(attribute_dic, nodename=indexname)
             return node
-        # If needed, pad the field with 0s to comply with number of bulk and
-        # boundary elements
-        array, padding, vis_array = self._mesh_field_padding(array, gridname,
-                                                             bulk_padding)
-        # Check if the array shape is consistent with the grid geometry
-        # and returns field dimension, xdmf Center attribute
-        field_type, dimensionality = self._check_field_compatibility(
-                                                        gridname, array.shape)
-        # Apply indices transposition to assure consistency of the data
-        # visualization in paraview with SampleData ordering and indexing
-        # conventions
-        if self._is_image(gridname):
-            # indices transposition to ensure consistency between SampleData
-            # and geometrical interpretation of coordinates in Paraview
-            if self.get_attribute('group_type', gridname) == '2DImage':
-                if len(array.shape) == 3:
-                    array = np.squeeze(array)
-            array, transpose_indices = self._transpose_image_array(
-                                                         dimensionality, array)
-        if dimensionality in ['Tensor6', 'Tensor']:
-            # indices transposition to ensure consistency between SampleData
-            # components oredering convention and SampleData ordering
-            # convention
-            array, transpose_components = self._transpose_field_comp(
-                                                         dimensionality, array)
+        # Pad, check and transpose the field array to comply with the grid
+        # and Paraview conventions
+        array, vis_array, field_attributes = self._prepare_field_array(
+            gridname, array, bulk_padding)
+        field_type = field_attributes['field_type']
+        dimensionality = field_attributes['field_dimensionality']
         # get indexname or create one
         if indexname is None:
             grid_path = self._name_or_node_to_path(gridname)
@@ -1195,19 +1226,14 @@ class SampleData:
         xdmf_gname = self.get_attribute('xdmf_gridname', gridname)
         if time_gridname is not None:
             xdmf_gname = time_gridname
-        attribute_dic = {'field_type': field_type,
-                         'field_dimensionality': dimensionality,
-                         'parent_grid_path': gridpath,
-                         'xdmf_gridname': xdmf_gname, 'padding': padding,
+        attribute_dic = {'parent_grid_path': gridpath,
+                         'xdmf_gridname': xdmf_gname,
                          'node_type':'field_array'
                          }
+        attribute_dic.update(field_attributes)
         if time is not None:
             attribute_dic['time'] = time
             attribute_dic['time_serie_name'] = time_serie_name
-        if self._is_image(gridname):
-            attribute_dic['transpose_indices'] = transpose_indices
-        if dimensionality in ['Tensor6', 'Tensor']:
-            attribute_dic['transpose_components'] = transpose_components
         # Add field for visualization of Integration Points mesh fields
         if (field_type == 'IP_field') and not (visualisation_type == 'None'):
             vis_array = self._IP_field_for_visualisation(vis_array,
@@ -1228,9 +1254,332 @@ class SampleData:
         self._append_field_index(gridname, indexname)
         return node
 
+    def add_field_from_dataset(self, gridname, fieldname, dataset,
+                               location=None, indexname=None,
+                               chunkshape=None, replace=False,
+                               compression_options=dict(),
+                               storage_order=False, selection=None,
+                               dtype=None, block_size=2**26):
+        """Add a field to an image group, copying an array-like by blocks.
+
+        The field values are read from `dataset` and written in the HDF5
+        dataset block by block, so that the field is never entirely loaded in
+        memory. `dataset` can be any array-like supporting slicing, for
+        instance a `h5py` dataset or a `numpy.memmap`, which allows to import
+        fields larger than the memory.
+
+        Image fields are stored with their spatial dimensions in reversed
+        order, (Z,Y,X) for a 3D image. If `storage_order` is `True`, the
+        dataset is read as already being in this order, which is the case of
+        the volumes written by DCT and labDCT softwares: blocks are then
+        copied without any transposition.
+
+        :param str gridname: Path, name or indexname of the image Group on
+            which the field will be added
+        :param str fieldname: Name of the HDF5 node to create that will contain
+            the field value array
+        :param dataset: array-like containing the field values to add in the
+            dataset
+        :param str location: Path, name or indexname of the Group in which the
+            field array will be stored, see `add_field`.
+        :param str indexname: Index name used to reference the field node
+        :param tuple chunkshape: The shape of the data chunk to be read or
+            written in a single HDF5 I/O operation
+        :param bool replace: remove the node in the dataset with the same
+            name/location if `True` and such node exists
+        :param dict compression_options: Dictionary containing compression
+            options items, see `set_chunkshape_and_compression` method for
+            more details.
+        :param bool storage_order: if `True`, the spatial dimensions of
+            `dataset` are in reversed order, (Z,Y,X) for a 3D image.
+        :param tuple selection: tuple of slices to import only a part of
+            `dataset`, given for the (X,Y,Z) dimensions of the field.
+        :param dtype: if not `None`, convert the field values to this type.
+        :param int block_size: size in bytes of the blocks copied at once.
+        :return: the created field HDF5 node.
+        """
+        if not self._is_image(gridname):
+            raise tables.NodeError('{} is not an image, cannot add a field'
+                                   ' from a dataset in this group.'
+                                   ''.format(gridname))
+        ndim = len(self.get_attribute('dimension', gridname))
+        src_shape = tuple(dataset.shape)
+        if storage_order:
+            src_shape = src_shape[:ndim][::-1] + src_shape[ndim:]
+        if selection is None:
+            selection = tuple()
+        selection = tuple(selection) + (slice(None),) * (ndim - len(selection))
+        selection = tuple(slice(*sl.indices(n))
+                          for sl, n in zip(selection, src_shape))
+        if any(sl.step < 1 for sl in selection):
+            raise ValueError('Only positive steps are supported in the field'
+                             ' selection.')
+        field_shape = tuple(len(range(sl.start, sl.stop, sl.step))
+                            for sl in selection) + src_shape[ndim:]
+        # check the field shape and get its attributes as `add_field`
+        field_type, dimensionality = self._check_field_compatibility(
+            gridname, field_shape)
+        transpose_indices = self._get_image_transpose_indices(
+            dimensionality, len(field_shape))
+        storage_shape = tuple(field_shape[i] for i in transpose_indices)
+        # selection of the dataset along each storage dimension
+        storage_selection = selection[::-1]
+        if dtype is None:
+            dtype = dataset.dtype
+        if indexname is None:
+            grid_path = self._name_or_node_to_path(gridname)
+            grid_indexname = self.get_indexname_from_path(grid_path)
+            indexname = grid_indexname + '_' + fieldname
+        if replace and location is None:
+            node_field = self.get_node(fieldname)
+            if node_field is not None:
+                location = node_field._v_parent._v_pathname
+        array_location = gridname if location is None else location
+        node = self.add_data_array(array_location, fieldname, None, indexname,
+                                   chunkshape, replace,
+                                   compression_options=compression_options,
+                                   shape=storage_shape, dtype=dtype)
+        # copy the field by blocks along the first storage dimension, aligned
+        # with the chunks of the node
+        row_size = np.dtype(dtype).itemsize * int(np.prod(storage_shape[1:]))
+        rows = max(1, block_size // max(1, row_size))
+        rows = max(node.chunkshape[0], rows - rows % node.chunkshape[0])
+        sel0 = storage_selection[0]
+        for k0 in range(0, storage_shape[0], rows):
+            k1 = min(k0 + rows, storage_shape[0])
+            block_sel = ((slice(sel0.start + k0 * sel0.step,
+                                sel0.start + k1 * sel0.step, sel0.step),)
+                         + storage_selection[1:])
+            if storage_order:
+                block = np.asarray(dataset[block_sel])
+            else:
+                block = np.asarray(dataset[block_sel[::-1]])
+                block = block.transpose(transpose_indices)
+            if dimensionality in ['Tensor6', 'Tensor']:
+                block, transpose_components = self._transpose_field_comp(
+                    dimensionality, block)
+            node[k0:k1] = np.ascontiguousarray(block, dtype=dtype)
+        node.flush()
+        attribute_dic = {'parent_grid_path': self._name_or_node_to_path(
+                             gridname),
+                         'xdmf_gridname': self.get_attribute('xdmf_gridname',
+                                                             gridname),
+                         'node_type': 'field_array',
+                         'field_type': field_type,
+                         'field_dimensionality': dimensionality,
+                         'padding': 'None',
+                         'transpose_indices': transpose_indices}
+        if dimensionality in ['Tensor6', 'Tensor']:
+            attribute_dic['transpose_components'] = transpose_components
+        self.add_attributes(attribute_dic, nodename=indexname)
+        self._append_field_index(gridname, indexname)
+        return node
+
+    def copy_image_field(self, field_name, sample, gridname, selection=None,
+                         factor=None, majority_vote=False):
+        """Copy an image field into an image group of another dataset.
+
+        The field is read and written by blocks, so that it is never
+        entirely loaded in memory (except for time series fields). The copy
+        keeps the field name, index name and compression settings.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the field
+            to copy.
+        :param SampleData sample: the dataset in which the field is copied,
+            it may be this dataset.
+        :param str gridname: the image group of `sample` receiving the field,
+            its dimensions must match the copied region.
+        :param tuple selection: tuple of slices selecting the region to copy
+            along the (X,Y,Z) dimensions (the whole field by default).
+        :param tuple factor: if not None, the integer downsampling factor
+            along each dimension, `selection` is then ignored and the field
+            dimensions are truncated to multiples of the factor.
+        :param bool majority_vote: if True, integer scalar fields (label
+            maps) are downsampled by taking the most frequent value in each
+            block of voxels instead of the first voxel of the block.
+        :return: the created field HDF5 node.
+        """
+        node = self.get_node(field_name)
+        name = node._v_name
+        indexname = self.get_indexname_from_path(node._v_pathname)
+        compression = self._get_compression_opt_from_filter(node.filters)
+        if self._is_field_time_serie(field_name):
+            field = self.get_field(field_name)
+            if factor is not None:
+                selection = tuple(slice(0, (n // f) * f, f) for n, f in
+                                  zip(field.shape[1:], factor))
+            elif selection is None:
+                selection = tuple()
+            field = field[(slice(None),) + tuple(selection)]
+            time_list = self.get_attribute('time_list', field_name)
+            return sample.add_field_time_serie(
+                gridname, name, field, list(time_list), indexname=indexname,
+                replace=True, compression_options=compression)
+        dataset = _ImageFieldDataset(self, field_name)
+        if factor is not None:
+            dimensionality = self.get_attribute('field_dimensionality',
+                                                field_name)
+            if majority_vote and dimensionality == 'Scalar' and \
+                    np.issubdtype(dataset.dtype, np.integer):
+                dataset = _BlockModeDataset(dataset, factor)
+                selection = None
+            else:
+                selection = tuple(slice(0, (n // f) * f, f)
+                                  for n, f in zip(dataset.shape, factor))
+        return sample.add_field_from_dataset(
+            gridname, name, dataset, indexname=indexname, replace=True,
+            compression_options=compression, selection=selection)
+
+    def add_field_time_serie(self, gridname, fieldname, array, time,
+                             location=None, indexname=None, chunkshape=None,
+                             replace=False, compression_options=dict(),
+                             bulk_padding=True):
+        """Add a time serie field to a grid, stored in an enlargeable array.
+
+        Unlike fields added with the `time` argument of the `add_field`
+        method, that are stored as one data array per time value, all the
+        time steps of a time serie field are stored in a single enlargeable
+        HDF5 array whose first dimension is the time. New time steps can be
+        appended at low cost with the `append_field_time_step` method. The
+        field can be read at one time step with `get_field_time_step`, or
+        for all time steps at one point of the grid with `get_field_history`.
+        The time values of the serie are added to the grid time values, and
+        the field is written in each time step grid of the grid XDMF
+        temporal collection.
+
+        :param str gridname: Path, name or indexname of the grid Group on which
+            the field will be added
+        :param str fieldname: Name of the HDF5 node to create that will contain
+            the field time serie
+        :param np.array array: Array containing the field values for the
+            first time step(s). If `time` is a list of values, the first
+            dimension of the array indexes the time steps.
+        :param time: time value of the field values in `array`, or list of
+            time values (in ascending order) if `array` contains several time
+            steps.
+        :param str location: Path, name or indexname of the Group in which the
+            field array will be stored. This Group must be a children of the
+            `gridname` Group. If not provided, the field is stored in the
+            `gridname` Group.
+        :param str indexname: Index name used to reference the field node
+        :param tuple chunkshape: The shape of the data chunk to be read or
+            written in a single HDF5 I/O operation. Its first value is the
+            number of time steps in a chunk. By default, a chunk gathers 8
+            time steps of a block of the grid of about 16 kB.
+        :param bool replace: remove field in the dataset with the same
+            name/location if `True` and such field exists
+        :param dict compression_options: Dictionary containing compression
+            options items, see `set_chunkshape_and_compression` method for
+            more details. Data normalization and memory mapping are not
+            supported for time serie fields.
+        :param bool bulk_padding: If adding a field on a mesh  that has as many
+            bulk as boundary elements, forces field padding to `bulk` if True,
+            or to `boundary` if false
+        :return: the time serie field node
+        """
+        self._verbose_print('Adding time serie field `{}` into Grid `{}`'
+                            ''.format(fieldname, gridname))
+        if not(self._is_grid(gridname)):
+            raise tables.NodeError('{} is not a grid, cannot add a field data'
+                                   ' array in this group.'.format(gridname))
+        if 'normalization' in compression_options:
+            raise ValueError('Data normalization is not supported for time'
+                             ' serie fields.')
+        if compression_options.get('memory_map', False):
+            raise ValueError('Time serie fields are enlargeable arrays and'
+                             ' cannot be memory mapped.')
+        if location is None:
+            array_location = gridname
+        elif (self._is_children_of(location, gridname)
+              or self.get_node(location) == self.get_node(gridname)):
+            array_location = location
+        else:
+            raise tables.NodeError('Cannot add field at location `{}`.'
+                                   ' Field location must be a grid group'
+                                   ' (Mesh or Image), or a grid group'
+                                   ' children'.format(location))
+        if np.ndim(time) == 0:
+            array = array[np.newaxis, ...]
+        time_list = np.atleast_1d(time).astype(float).tolist()
+        steps, field_attributes = self._prepare_field_time_steps(
+            gridname, array, time_list, bulk_padding=bulk_padding)
+        # get indexname or create one
+        if indexname is None:
+            grid_path = self._name_or_node_to_path(gridname)
+            grid_indexname = self.get_indexname_from_path(grid_path)
+            indexname = grid_indexname+'_'+fieldname
+        # Create the enlargeable array with time as first dimension
+        self._check_SD_array_init(fieldname, array_location, replace)
+        location_path = self._name_or_node_to_path(array_location)
+        if chunkshape is None:
+            chunkshape = self._get_time_serie_chunkshape(steps.shape[1:],
+                                                         steps.dtype)
+        Filters = self._get_compression_opt(compression_options)
+        self.add_to_index(indexname, '%s/%s' % (location_path, fieldname))
+        Node = self.h5_dataset.create_earray(
+            where=location_path, name=fieldname,
+            atom=tables.Atom.from_dtype(steps.dtype),
+            shape=(0,) + steps.shape[1:], filters=Filters,
+            chunkshape=chunkshape, expectedrows=len(time_list),
+            title=indexname)
+        Node.append(steps)
+        # Create attributes of the field node
+        gridpath = self._name_or_node_to_path(gridname)
+        attribute_dic = {'parent_grid_path': gridpath,
+                         'xdmf_gridname': self.get_attribute('xdmf_gridname',
+                                                             gridname),
+                         'node_type': 'field_array', 'empty': False,
+                         'time_list': time_list}
+        attribute_dic.update(field_attributes)
+        self.add_attributes(attribute_dic, nodename=indexname)
+        self.add_grid_time(gridname, time_list)
+        self._append_field_index(gridname, indexname)
+        return Node
+
+    def append_field_time_step(self, fieldname, array, time):
+        """Append one or several time steps to a time serie field.
+
+        :param str fieldname: Name, Path, Index name or Alias of the time serie
+            field, created with the `add_field_time_serie` method
+        :param np.array array: Array containing the field values for the
+            time step(s) to append. If `time` is a list of values, the first
+            dimension of the array indexes the time steps.
+        :param time: time value of the appended step, or list of time values
+            if `array` contains several time steps. Time values must be larger
+            than the last time value of the field.
+        """
+        if not self._is_field_time_serie(fieldname):
+            raise tables.NodeError('{} is not a time serie field.'
+                                   ''.format(fieldname))
+        Node = self.get_node(fieldname)
+        time_serie = self.get_attribute('time_list', fieldname)
+        if np.ndim(time) == 0:
+            array = array[np.newaxis, ...]
+        time_list = np.atleast_1d(time).astype(float).tolist()
+        if time_list[0] <= time_serie[-1]:
+            raise ValueError('Time value {} must be larger than the last time'
+                             ' value {} of field {}.'
+                             ''.format(time_list[0], time_serie[-1],
+                                       fieldname))
+        gridname = self.get_attribute('parent_grid_path', fieldname)
+        padding = self.get_attribute('padding', fieldname)
+        steps, _ = self._prepare_field_time_steps(
+            gridname, array, time_list,
+            bulk_padding=(padding not in ['boundary', 'boundary_IP']))
+        if steps.shape[1:] != Node.shape[1:]:
+            raise ValueError('Time steps shape {} do not match the field {}'
+                             ' time steps shape {}.'
+                             ''.format(steps.shape[1:], fieldname,
+                                       Node.shape[1:]))
+        Node.append(steps.astype(Node.dtype, copy=False))
+        self.add_attributes({'time_list': list(time_serie) + time_list},
+                            fieldname)
+        self.add_grid_time(gridname, time_list)
+        return
+
     def add_data_array(self, location, name, array=None, indexname=None,
                        chunkshape=None, replace=False,
-                       compression_options=dict()):
+                       compression_options=dict(), shape=None, dtype=None):
         """Add a data array node at the given location in the HDF5 dataset.
 
         The method uses the :py:class:`CArray` and
@@ -1254,20 +1603,35 @@ class SampleData:
         :param dict compression_options: Dictionary containing compression
             options items, see `set_chunkshape_and_compression` method for
             more details.
+        :param tuple shape: if no array is provided, create an array with
+            this shape, to be filled after its creation (for instance by
+            blocks, see the `add_field_from_dataset` method).
+        :param dtype: data type of the array created with `shape`.
 
         """
         self._verbose_print('Adding array `{}` into Group `{}`'
                             ''.format(name, location))
-        if array is None:
+        if (array is None) and (shape is None):
             empty = True
         else:
             empty=False
+        if (array is None) and not empty:
+            if ('normalization' in compression_options
+                    or compression_options.get('memory_map', False)):
+                raise ValueError('Arrays filled after their creation cannot be'
+                                 ' normalized nor memory mapped.')
         # Safety checks
         saved_attrs = self._check_SD_array_init(name, location, replace, empty)
+        saved_attrs.pop('memory_map', None)
         # get location path
         location_path = self._name_or_node_to_path(location)
         # get compression options
         Filters = self._get_compression_opt(compression_options)
+        memory_map = compression_options.get('memory_map', False)
+        if memory_map and ((Filters.complevel > 0)
+                           or ('normalization' in compression_options)):
+            raise ValueError('Memory mapped arrays cannot be compressed or'
+                             ' normalized.')
         # add to index
         if indexname is None:
             indexname = name
@@ -1283,13 +1647,26 @@ class SampleData:
             if 'normalization' in compression_options:
                 optn = compression_options['normalization']
                 array, norm_attributes = self._data_normalization(array, optn)
-            Node = self.h5_dataset.create_carray(
-                    where=location_path, name=name, filters=Filters,
-                    obj=array, chunkshape=chunkshape,
-                    title=indexname)
+            if array is None:
+                Node = self.h5_dataset.create_carray(
+                        where=location_path, name=name, filters=Filters,
+                        atom=tables.Atom.from_dtype(np.dtype(dtype)),
+                        shape=shape, chunkshape=chunkshape, title=indexname)
+            elif memory_map:
+                # contiguous storage: no chunks nor filters
+                Node = self.h5_dataset.create_array(
+                        where=location_path, name=name, obj=array,
+                        title=indexname)
+            else:
+                Node = self.h5_dataset.create_carray(
+                        where=location_path, name=name, filters=Filters,
+                        obj=array, chunkshape=chunkshape,
+                        title=indexname)
             self.add_attributes(saved_attrs, Node._v_pathname)
             self.add_attributes({'empty': False, 'node_type':'data_array'},
                                  Node._v_pathname)
+            if memory_map:
+                self.add_attributes({'memory_map': True}, Node._v_pathname)
             if 'normalization' in compression_options:
                 if optn == 'standard_per_component':
                     mean_array = norm_attributes.pop('norm_mean_array')
@@ -1560,6 +1937,8 @@ class SampleData:
         node = self.get_node(nodename)
         for key, value in dic.items():
             node._v_attrs[key] = value
+        if not node._v_pathname.startswith('/Index'):
+            self._xdmf_outdated = True
         return
 
     def add_alias(self, aliasname, path=None, indexname=None):
@@ -1622,8 +2001,263 @@ class SampleData:
                 self.content_index[indexname] = path
             else:
                 self.content_index[indexname] = [path, colname]
+            self._xdmf_outdated = True
         return
 
+    def add_external_node(self, src_file, src_name, location='/', name=None,
+                          indexname_prefix='', replace=False):
+        """Link a node of another SampleData dataset into this dataset.
+
+        The node (and all its childrens if it is a Group) is added to this
+        dataset without copying its array data: each data array of the source
+        node is stored as a HDF5 virtual dataset mapping the array of the
+        source file. Groups, node attributes, Index names and aliases of the
+        linked nodes are recreated in this dataset and the pathes stored in
+        attributes are updated, so that linked data can be used as any other
+        data of the dataset, including in the XDMF file. Small enlargeable
+        nodes (tables, string arrays like the grids `Field_index`) are
+        copied so that they remain writable.
+
+        This method allows to assemble a dataset from several existing ones,
+        for instance a grain map image from an imaging experiment dataset and
+        a mesh with fields from a simulation dataset.
+
+        .. note::
+
+            The source dataset must not be opened when calling this method.
+            Linked arrays are read only, they must be modified in the source
+            dataset. The source file path is stored relatively to this dataset
+            file, so that both files can be moved together.
+
+        :param str src_file: path of the source SampleData dataset file.
+        :param str src_name: Path, Index name or Alias of the node to link
+            in the source dataset. Use '/' to link all the source dataset
+            content in a new Group.
+        :param str location: Path, Index name or Alias of the Group in which
+            the node is linked. If the linked node is a field, this group must
+            be a grid compatible with the field.
+        :param str name: name of the linked node in this dataset. The name of
+            the source node is used if not provided (mandatory if `src_name`
+            is '/').
+        :param str indexname_prefix: prefix added to the Index names and
+            aliases of the linked nodes, to avoid duplicates with the Index
+            names of this dataset.
+        :param bool replace: remove the node in the dataset with the same
+            name/location if `True` and such node exists
+        :return: the linked node, as a :py:class:`tables.Node` object.
+        """
+        src_h5 = os.path.splitext(str(Path(src_file).absolute()))[0] + '.h5'
+        if src_h5 == self.h5_path:
+            raise ValueError('Cannot link a node of the dataset into itself.')
+        location_path = self._name_or_node_to_path(location)
+        if (location_path is None) or not self._is_group(location_path):
+            raise tables.NodeError('{} is not a Group, cannot link external'
+                                   ' node in it.'.format(location))
+        src = tables.open_file(src_h5, mode='r')
+        try:
+            # read source dataset Index and find the path of the node to link
+            src_index = src.get_node('/Index')._v_attrs
+            src_index = {key: src_index[key] for key in src_index._f_list()}
+            src_aliases = src.get_node('/Index/Aliases')._v_attrs
+            src_aliases = {key: [str(a) for a in src_aliases[key]]
+                           for key in src_aliases._f_list()}
+            src_paths = {key: str(value) if isinstance(value, str)
+                         else str(value[0])
+                         for key, value in src_index.items()}
+            src_path = None
+            if src_name in src_paths:
+                src_path = src_paths[src_name]
+            for key, alias_list in src_aliases.items():
+                if src_name in alias_list:
+                    src_path = src_paths[key]
+            if src_path is None:
+                if src_name.startswith('/'):
+                    if src.__contains__(src_name):
+                        src_path = src_name
+                else:
+                    # find unique node with this name
+                    path_list = [n._v_pathname for n in src.walk_nodes('/')
+                                 if n._v_name == src_name]
+                    if len(path_list) == 1:
+                        src_path = path_list[0]
+            if src_path is None:
+                raise tables.NodeError('No node {} in dataset {}'
+                                       ''.format(src_name, src_h5))
+            src_root = src.get_node(src_path)
+            if name is None:
+                if src_path == '/':
+                    raise ValueError('A name must be provided to link the'
+                                     ' root Group of a dataset.')
+                name = src_root._v_name
+            dst_path = ('%s/%s' % (location_path, name)).replace('//', '/')
+
+            def _is_linked(path):
+                if (path == '/Index') or path.startswith('/Index/'):
+                    return False
+                return ((path == src_path)
+                        or path.startswith(src_path.rstrip('/') + '/'))
+
+            def _dst(path):
+                if src_path == '/':
+                    return dst_path + path.rstrip('/')
+                return dst_path + path[len(src_path):]
+
+            def _attributes(node):
+                dic = {}
+                for key in node._v_attrs._f_list('user'):
+                    value = node._v_attrs[key]
+                    if isinstance(value, str) and _is_linked(value):
+                        value = _dst(value)
+                    if ((key == 'xdmf_gridname') and (value == src_root._v_name)
+                            and isinstance(src_root, tables.Group)):
+                        value = name
+                    dic[key] = value
+                return dic
+
+            # Index names and aliases of linked nodes
+            new_index = {}
+            for key, path in src_paths.items():
+                if _is_linked(path):
+                    if isinstance(src_index[key], str):
+                        new_index[indexname_prefix + key] = _dst(path)
+                    else:
+                        new_index[indexname_prefix + key] = [
+                            _dst(path), str(src_index[key][1])]
+            if src_path == '/':
+                new_index[indexname_prefix + name] = dst_path
+            new_aliases = {indexname_prefix + key:
+                           [indexname_prefix + a for a in alias_list]
+                           for key, alias_list in src_aliases.items()
+                           if indexname_prefix + key in new_index}
+            # safety checks before modifying the dataset
+            removed = []
+            if self.__contains__(dst_path):
+                if not replace:
+                    raise tables.NodeError('Node {} already exists. Set arg.'
+                                           ' `replace=True` to replace it by'
+                                           ' the linked node.'
+                                           ''.format(dst_path))
+                for key in self.content_index:
+                    path = self._get_path_with_indexname(key)
+                    if (path == dst_path) or path.startswith(dst_path + '/'):
+                        removed += [key] + self.aliases.get(key, [])
+            names = list(new_index.keys())
+            for alias_list in new_aliases.values():
+                names += alias_list
+            duplicates = [n for n in names if n not in removed
+                          and (self._is_in_index(n) or self._is_alias(n))]
+            if len(duplicates) > 0:
+                raise ValueError('Names {} already in content_index :'
+                                 ' duplicates not allowed in Index. Use'
+                                 ' `indexname_prefix` argument.'
+                                 ''.format(duplicates))
+            # grids are identified by their name in the XDMF file
+            grid_names = []
+            if isinstance(src_root, tables.Group):
+                grid_names = [os.path.split(_dst(g._v_pathname))[1]
+                              for g in src.walk_groups(src_root)
+                              if _is_linked(g._v_pathname) and
+                              getattr(g._v_attrs, 'group_type', None)
+                              in SD_GRID_GROUPS]
+            duplicates = [g._v_pathname for g in self.h5_dataset.walk_groups()
+                          if (g._v_name in grid_names)
+                          and not (g._v_pathname + '/').startswith(
+                              dst_path + '/')]
+            if len(duplicates) > 0:
+                raise ValueError('Grids {} have the same name than a linked'
+                                 ' grid, grid names must be unique in the'
+                                 ' dataset.'.format(duplicates))
+            is_field = (isinstance(src_root, tables.Leaf)
+                        and ('field_type' in src_root._v_attrs._f_list()))
+            if is_field:
+                shape = np.array(src_root.shape)
+                if 'transpose_indices' in src_root._v_attrs._f_list():
+                    shape = shape[src_root._v_attrs['transpose_indices']]
+                if not self._is_grid(location_path):
+                    raise tables.NodeError('{} is not a grid, cannot link'
+                                           ' field {} in this group.'
+                                           ''.format(location, src_name))
+                self._check_field_compatibility(location_path, tuple(shape))
+            if self.__contains__(dst_path):
+                self.remove_node(dst_path, recursive=True)
+            # create linked groups, copy small nodes and gather the arrays to
+            # link as virtual datasets
+            if isinstance(src_root, tables.Group):
+                src_nodes = [n for n in src.walk_nodes(src_root)
+                             if _is_linked(n._v_pathname)]
+            else:
+                src_nodes = [src_root]
+            virtual_nodes = []
+            for node in src_nodes:
+                node_path = _dst(node._v_pathname)
+                parent_path, node_name = os.path.split(node_path)
+                if isinstance(node, tables.Group):
+                    group = self.h5_dataset.create_group(
+                        where=parent_path, name=node_name,
+                        title=node._v_title, createparents=True)
+                    self.add_attributes(_attributes(node), group)
+                elif ((node._v_attrs.CLASS in ['ARRAY', 'CARRAY'])
+                      and (node.dtype.kind in 'biufc')
+                      and (len(node.shape) > 0) and (np.prod(node.shape) > 0)
+                      and not getattr(node._v_attrs, 'empty', False)):
+                    sys_attrs = {'CLASS': node._v_attrs.CLASS,
+                                 'VERSION': node._v_attrs.VERSION,
+                                 'TITLE': node._v_title}
+                    virtual_nodes.append((node._v_pathname, node_path,
+                                          node.shape, node.dtype, sys_attrs,
+                                          _attributes(node)))
+                else:
+                    parent = self.h5_dataset.get_node(parent_path)
+                    copy = node._f_copy(newparent=parent, newname=node_name)
+                    self.add_attributes(_attributes(node), copy)
+                    if (node_name == 'Field_index') and indexname_prefix:
+                        field_list = [indexname_prefix + f.decode('utf-8')
+                                      for f in copy.read()]
+                        copy.truncate(0)
+                        copy.append(field_list)
+        finally:
+            src.close()
+        # HDF5 virtual datasets are created with h5py, the dataset file is
+        # closed and reopened to do so
+        self.sync()
+        self.h5_dataset.close()
+        src_relpath = os.path.relpath(src_h5, self.file_dir)
+        with h5py.File(self.h5_path, mode='a') as h5:
+            for src_node_path, node_path, shape, dtype, sys_attrs, _ \
+                    in virtual_nodes:
+                layout = h5py.VirtualLayout(shape=shape, dtype=dtype)
+                layout[...] = h5py.VirtualSource(src_relpath, src_node_path,
+                                                 shape=shape)
+                dset = h5.create_virtual_dataset(node_path, layout)
+                for key, value in sys_attrs.items():
+                    dset.attrs[key] = np.bytes_(value)
+        self._memory_map_offsets.clear()
+        self.h5_dataset = tables.File(self.h5_path, mode='r+')
+        self._file_exist = True
+        for _, node_path, _, _, _, attributes in virtual_nodes:
+            self.add_attributes(attributes, node_path)
+        # update dataset Index
+        for key, value in new_index.items():
+            if isinstance(value, list):
+                self.add_to_index(key, value[0], colname=value[1])
+            else:
+                self.add_to_index(key, value)
+        for key, alias_list in new_aliases.items():
+            for alias in alias_list:
+                self.add_alias(alias, indexname=key)
+        if self.get_indexname_from_path(dst_path) is None:
+            self.add_to_index(indexname_prefix + name, dst_path)
+        if is_field:
+            # link field to its new grid
+            xdmf_gname = self.get_attribute('xdmf_gridname', location_path)
+            self.add_attributes({'parent_grid_path': location_path,
+                                 'xdmf_gridname': xdmf_gname}, dst_path)
+            self._append_field_index(location_path,
+                                     self.get_indexname_from_path(dst_path))
+        self._after_file_open()
+        self.sync()
+        return self.get_node(dst_path)
+
     def compute_mesh_elements_normals(
             self, meshname, element_tag, Normal_fieldname=None,
             align_vector=np.random.rand(3), as_nodal_field=False):
@@ -1782,6 +2416,9 @@ class SampleData:
         if with_fields and (Field_index is not None):
             for fieldname in Field_index:
                 name = fieldname.decode('utf-8')
+                if self._is_field_time_serie(name):
+                    # time series are not handled by mesh objects
+                    continue
                 field_type = self.get_attribute('field_type', name)
                 if field_type == 'Nodal_field':
                     data = self.get_field(name, unpad_field=True)
@@ -2103,6 +2740,9 @@ class SampleData:
         if with_fields and (Field_index is not None):
             for fieldname in Field_index:
                 name = fieldname.decode('utf-8')
+                if self._is_field_time_serie(name):
+                    # time series are not handled by image objects
+                    continue
                 field_type = self.get_attribute('field_type', name)
                 if field_type == 'Nodal_field':
                     data = self.get_field(field_name=name)
@@ -2175,6 +2815,13 @@ class SampleData:
         than the mesh) or a boundary field (defined on elements of a lower
         dimensionality than the mesh).
 
+        For a time serie field, all time steps are returned, the first
+        dimension of the array indexing the time steps.
+
+        Fields stored with the `memory_map` compression option are returned
+        as a read-only `numpy.memmap` of the HDF5 file (no data copy, except
+        to reorder the components of tensor fields).
+
         :param str field_name: Name, Path, Index, Alias or Node of the field in
             dataset
         :param bool unpad_field: if `True` (default), remove the zeros added to
@@ -2187,6 +2834,8 @@ class SampleData:
             field_path = self.get_attribute('visualisation_field_path',
                                             field_name)
             field = self.get_node(field_path, as_numpy=True)
+        elif self.get_attribute('memory_map', field_name):
+            field = self._get_memory_map(field_name)
         else:
             field = self.get_node(field_name, as_numpy=True)
         # Handle array padding removal if needed
@@ -2196,13 +2845,192 @@ class SampleData:
         if (field_type == 'IP_field') and not get_visualisation_field:
             pad_field = False
         if pad_field:
-            field = self._mesh_field_unpadding(field, parent_mesh, padding)
+            if self._is_field_time_serie(field_name):
+                field = np.stack([self._mesh_field_unpadding(
+                    field_t, parent_mesh, padding) for field_t in field])
+            else:
+                field = self._mesh_field_unpadding(field, parent_mesh, padding)
         # Handle field array dimensions to remove singleton dimension if field
         # is a scalar mesh field
         if self._is_mesh(parent_mesh):
             field = np.squeeze(field)
         return field
 
+    def get_image_field_block(self, field_name, selection=None):
+        """Read a block of an image field without loading the whole array.
+
+        Only the hyperslab of the HDF5 node corresponding to the block is
+        read. The block is returned with the same conventions as the
+        `get_field` method (dimensions order, components order and data
+        normalization).
+
+        :param str field_name: Name, Path, Index, Alias or Node of the field
+            in dataset.
+        :param tuple selection: tuple of slices selecting the block along the
+            (X,Y,Z) dimensions of the image (the whole field by default).
+        :return: the block of the field as a numpy array.
+        """
+        parent_path = self.get_attribute('parent_grid_path', field_name)
+        if not self._is_image(parent_path) or \
+                self._is_field_time_serie(field_name):
+            raise tables.NodeError('{} is not an image field, cannot read a'
+                                   ' block of it.'.format(field_name))
+        ndim = len(self.get_attribute('dimension', parent_path))
+        if selection is None:
+            selection = tuple()
+        selection = tuple(selection) + (slice(None),) * (ndim - len(selection))
+        transpose_indices = self.get_attribute('transpose_indices', field_name)
+        if transpose_indices is not None:
+            # image fields are stored with reversed spatial dimensions
+            selection = selection[::-1]
+        block = self.get_node(field_name)[selection]
+        # same order of operations as in `get_node`
+        norm = self.get_attribute('data_normalization', field_name)
+        if norm == 'standard':
+            mu = self.get_attribute('normalization_mean', field_name)
+            std = self.get_attribute('normalization_std', field_name)
+            block = (block * std) + mu
+        elif norm == 'standard_per_component':
+            mu = self.get_attribute('normalization_mean', field_name)
+            std = self.get_attribute('normalization_std', field_name)
+            block = block * np.asarray(std) + np.asarray(mu)
+        if transpose_indices is not None:
+            block = block.transpose(transpose_indices)
+        transpose_components = self.get_attribute('transpose_components',
+                                                  field_name)
+        if transpose_components is not None:
+            block = block[..., transpose_components]
+        return block
+
+    def set_image_field_block(self, field_name, block, selection=None):
+        """Write a block of an image field without loading the whole array.
+
+        This is the counterpart of `get_image_field_block`: the block is
+        given with the same conventions as the arrays returned by the
+        `get_field` method and only the hyperslab of the HDF5 node
+        corresponding to the block is written.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the field
+            in dataset.
+        :param ndarray block: the values of the block.
+        :param tuple selection: tuple of slices selecting the block along the
+            (X,Y,Z) dimensions of the image (the whole field by default).
+        """
+        parent_path = self.get_attribute('parent_grid_path', field_name)
+        if not self._is_image(parent_path) or \
+                self._is_field_time_serie(field_name):
+            raise tables.NodeError('{} is not an image field, cannot write a'
+                                   ' block of it.'.format(field_name))
+        ndim = len(self.get_attribute('dimension', parent_path))
+        if selection is None:
+            selection = tuple()
+        selection = tuple(selection) + (slice(None),) * (ndim - len(selection))
+        block = np.asarray(block)
+        # reverse order of the operations of `get_image_field_block`
+        if self.get_attribute('transpose_components', field_name) is not None:
+            dimensionality = self.get_attribute('field_dimensionality',
+                                                field_name)
+            block, _ = self._transpose_field_comp(dimensionality, block)
+        norm = self.get_attribute('data_normalization', field_name)
+        if norm in ['standard', 'standard_per_component']:
+            mu = self.get_attribute('normalization_mean', field_name)
+            std = self.get_attribute('normalization_std', field_name)
+            block = (block - np.asarray(mu)) / np.asarray(std)
+        transpose_indices = self.get_attribute('transpose_indices', field_name)
+        if transpose_indices is not None:
+            # image fields are stored with reversed spatial dimensions
+            selection = selection[::-1]
+            block = block.transpose(transpose_indices)
+        self.get_node(field_name)[selection] = np.ascontiguousarray(block)
+        return
+
+    def get_field_time_step(self, field_name, time=None, time_index=None,
+                            unpad_field=True):
+        """Return the values of a time serie field at one time step.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the time
+            serie field in dataset
+        :param float time: time value of the step to return
+        :param int time_index: index of the time step to return (used if
+            `time` is not provided, the last time step is returned if none of
+            them is provided)
+        :param bool unpad_field: if `True` (default), remove the zeros added to
+            to the field to comply with the mesh topology and return it with
+            its original size (bulk or boundary field).
+        :return: the field array at the required time step
+        """
+        if not self._is_field_time_serie(field_name):
+            raise tables.NodeError('{} is not a time serie field.'
+                                   ''.format(field_name))
+        time_list = self.get_attribute('time_list', field_name)
+        if time is not None:
+            time_index = np.where(np.isclose(time_list, time))[0]
+            if len(time_index) == 0:
+                raise ValueError('No time value {} in field {} time values'
+                                 ' {}'.format(time, field_name, time_list))
+            time_index = time_index[0]
+        elif time_index is None:
+            time_index = len(time_list) - 1
+        field = self.get_node(field_name)[time_index]
+        # Reverse indices transpositions of the time step
+        transpose_indices = self.get_attribute('transpose_indices', field_name)
+        if transpose_indices is not None:
+            field = field.transpose(np.array(transpose_indices[1:]) - 1)
+        transpose_components = self.get_attribute('transpose_components',
+                                                  field_name)
+        if transpose_components is not None:
+            field = field[..., transpose_components]
+        padding = self.get_attribute('padding', field_name)
+        parent_mesh = self.get_attribute('parent_grid_path', field_name)
+        if (padding is not None) and unpad_field:
+            field = self._mesh_field_unpadding(field, parent_mesh, padding)
+        if self._is_mesh(parent_mesh):
+            field = np.squeeze(field)
+        return np.atleast_1d(field)
+
+    def get_field_history(self, field_name, index):
+        """Return the values of a time serie field at one point for all times.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the time
+            serie field in dataset
+        :param index: index of the point in the grid: a tuple of pixel/voxel
+            indices for an image field, the node or element index for a mesh
+            field.
+        :return: a tuple with the array of the field time values and the
+            array of the field values at this point, whose first dimension is
+            the time.
+        """
+        if not self._is_field_time_serie(field_name):
+            raise tables.NodeError('{} is not a time serie field.'
+                                   ''.format(field_name))
+        Node = self.get_node(field_name)
+        index = tuple(np.atleast_1d(index).tolist())
+        # get the index of the point in the stored time steps
+        transpose_indices = self.get_attribute('transpose_indices', field_name)
+        if transpose_indices is not None:
+            step_indices = np.array(transpose_indices[1:]) - 1
+            stored_index = tuple(index[i] if i < len(index) else slice(None)
+                                 for i in step_indices)
+        else:
+            stored_index = index
+            padding = self.get_attribute('padding', field_name)
+            if padding in ['boundary', 'boundary_IP']:
+                parent_mesh = self.get_attribute('parent_grid_path',
+                                                 field_name)
+                Nelem_bulk = np.sum(self.get_attribute(
+                    'Number_of_bulk_elements', parent_mesh))
+                stored_index = (index[0] + Nelem_bulk,) + index[1:]
+        history = Node[(slice(None),) + stored_index]
+        transpose_components = self.get_attribute('transpose_components',
+                                                  field_name)
+        if transpose_components is not None:
+            history = history[..., transpose_components]
+        history = history.reshape((history.shape[0], -1))
+        if history.shape[1] == 1:
+            history = history[:, 0]
+        time_list = np.array(self.get_attribute('time_list', field_name))
+        return time_list, history
+
     def get_node(self, name, as_numpy=False):
         """Return a HDF5 node in the dataset.
 
@@ -2466,7 +3294,8 @@ class SampleData:
             raise tables.NodeError('{} is not a structured table node'
                                    ''.format(tablename))
         table = self.get_node(tablename)
-        col_shape = self.get_tablecol(tablename, colname).shape
+        # get the column shape from the table description to avoid reading it
+        col_shape = (table.nrows,) + table.coldescrs[colname].shape
         if (column.shape != col_shape):
             raise ValueError('input column shape {} does not match the shape'
                              '{} of column {} in table {}'
@@ -2518,6 +3347,16 @@ class SampleData:
             In conjunction with enabling compression, this produces 'lossy',
             but significantly more efficient compression.
 
+        An additional option, that is not a Pytables `Filters` parameter, is
+        available:
+
+          * memory_map: if `True`, the array is stored as a contiguous and
+            uncompressed HDF5 dataset, and the `get_field` method returns it
+            as a read-only `numpy.memmap` of the HDF5 file, with no copy nor
+            decoding. Cannot be combined with compression or normalization.
+            Recommended for fields that are often read, like grain maps or
+            masks.
+
         .. important:: If the new compression settings reduce the size of the
             node in the dataset, the file size will not be changed. This is a
             standard behavior for HDF5 files, that preserves freed space in
@@ -2582,6 +3421,7 @@ class SampleData:
         # ==> New settings are set by reading rewriting data on the dataset
         # First get the hdf5 attributes of the target node
         attributes = self.get_dic_from_attributes(nodename)
+        attributes.pop('memory_map', None)
         node_tmp = self.get_node(nodename)
         # Get node name, indexname and path
         nodename = node_tmp._v_name
@@ -2687,6 +3527,7 @@ class SampleData:
         self.h5_dataset.rename_node(node, newname, overwrite=replace)
         # change index
         self.content_index[indexname] = node._v_pathname
+        self._xdmf_outdated = True
         self.sync()
         return
 
@@ -2738,6 +3579,7 @@ class SampleData:
         # Remove HDF5 node and its childrens
         self._verbose_print('Removing  node {} in content index....'
                             ''.format(Node._v_pathname))
+        self._memory_map_offsets.pop(Node._v_pathname, None)
         if isGroup and recursive:
             for child, child_node in Node._v_children.items():
                 self.remove_node(child_node, recursive=True)
@@ -2753,14 +3595,30 @@ class SampleData:
         return
 
     def resample_image_group(self, new_voxel_size, location='CellData',
-                             new_location=None, in_place=False):
+                             new_location=None, in_place=False,
+                             method='nearest', label_method='nearest',
+                             memory_budget=2 ** 28):
         """Resample a whole image group with a new spatial resolution.
 
+        The fields are resampled block by block, each block of a new field
+        being computed from the smallest block of the original field and
+        directly written to the new image group, so that the memory used is
+        bounded by `memory_budget`.
+
+        Three resampling methods are available:
+
+         * 'nearest': the value of the closest original voxel.
+         * 'linear': trilinear interpolation of the original voxel values.
+         * 'majority': the most frequent value of the original voxels whose
+           centers lie in the new voxel (the nearest value if there are none),
+           for label fields.
+
         .. note::
 
           In the case where the spatial resolution if increased, the new cell
           data will have a surrounding layer of zeros (for the new cells centers
-          located outside the original cells centers).
+          located outside the original cells centers) with the 'nearest' and
+          'linear' methods.
 
         :param float new_voxel_size: the new spatial resolution.
         :param str location: the location of the image group to process.
@@ -2768,86 +3626,308 @@ class SampleData:
         resampled image group.
         :param bool in_place: if True, the actual image group will be replaced
         by the new resampled group.
+        :param str method: the resampling method for the fields with floating
+            point values, 'nearest' or 'linear'.
+        :param str label_method: the resampling method for the scalar fields
+            with integer or boolean values (label maps), 'nearest' or
+            'majority'.
+        :param int memory_budget: approximate maximum size in bytes of the
+            arrays used at once to resample a field.
         """
         # TODO: move in Grid utils
         # sanity check
-        if not self._get_group_type(location) == '3DImage':
-            print('works only on 3D images for now')
+        if self._get_group_type(location) not in ['2DImage', '3DImage']:
+            print('works only on images for now')
             return
+        if method not in ['nearest', 'linear']:
+            raise ValueError('Unknown resampling method {} for floating point'
+                             ' fields.'.format(method))
+        if label_method not in ['nearest', 'majority']:
+            raise ValueError('Unknown resampling method {} for label fields.'
+                             ''.format(label_method))
 
         # work out each voxel coordinates
         dims = self.get_attribute('dimension', location)
         spacing = self.get_attribute('spacing', location)
         size = dims * spacing
-        x = np.arange(0.5 * spacing[0], size[0], spacing[0])
-        y = np.arange(0.5 * spacing[1], size[1], spacing[1])
-        z = np.arange(0.5 * spacing[2], size[2], spacing[2])
-        print(x.shape)
+        coords = [(np.arange(n) + 0.5) * sp for n, sp in zip(dims, spacing)]
 
         # create the new coordinates
-        new_spacing = np.array(3 * [new_voxel_size])
-        x_new = np.arange(0.5 * new_spacing[0], size[0], new_voxel_size)
-        y_new = np.arange(0.5 * new_spacing[1], size[1], new_voxel_size)
-        z_new = np.arange(0.5 * new_spacing[2], size[2], new_voxel_size)
-        print(x_new.shape)
-        X_new, Y_new, Z_new = np.meshgrid(x_new,
-                                          y_new,
-                                          z_new,
-                                          indexing='ij')
+        new_spacing = np.array(len(dims) * [new_voxel_size])
+        new_coords = [np.arange(0.5 * new_voxel_size, l, new_voxel_size)
+                      for l in size]
+        new_dims = [len(c) for c in new_coords]
+        self._verbose_print('resampling image from {} to {} voxels'.format(
+            list(dims), new_dims))
         # settings for the new group
-        compression = self.default_compression_options
         if new_location is None:
             new_location = '%s_resampled' % location
+        self._add_empty_image(new_location, new_dims, new_spacing)
 
         # now resample each field
         image_group = self.get_node(location)
         field_index_path = '%s/Field_index' % image_group._v_pathname
         field_list = self.get_node(field_index_path)
-        from scipy.interpolate import RegularGridInterpolator
         for name in field_list:
             field_name = name.decode('utf-8')
-            new_field_name = field_name
+            node = self.get_node(field_name)
+            new_field_name = node._v_name
             if not in_place:
                 new_field_name += '_resampled'
-            print('+ resampling field %s' % field_name)
-            field = self.get_field(field_name)
-            if field.shape == (1,):
+            if node.shape == (1,) or self._is_field_time_serie(field_name):
                 print('skipping field %s' % field_name)
                 continue
-            # instanciate our interpolator
-            resample = RegularGridInterpolator((x, y, z),
-                                               field,
-                                               method='nearest',
-                                               bounds_error=False,
-                                               fill_value=0)
-            new_shape = list(X_new.shape)
-            if field.ndim == 4:
-                new_shape = new_shape.append(field.shape[3])
-            new_field = resample(list(zip(X_new.ravel(), Y_new.ravel(),
-                        Z_new.ravel()))).reshape(new_shape).astype(field.dtype)
-            # now add the resampled field to the new location
-            if not self.__contains__(new_location):
-                print('using add_image_from_field with %s' % new_field_name)
-                self.add_image_from_field(field_array=new_field,
-                                          fieldname=new_field_name,
-                                          imagename=new_location,
-                                          location='/',
-                                          spacing=new_spacing,
-                                          replace=True,
-                                          compression_options=compression)
-            else:
-                print('using add_field with %s' % new_field_name)
-                self.add_field(gridname=new_location,
-                                 fieldname=new_field_name,
-                                 array=new_field,
-                                 location=new_location,
-                                 replace=True,
-                                 compression_options=compression)
+            self._verbose_print('+ resampling field %s' % field_name)
+            dataset = _ImageFieldDataset(self, field_name)
+            is_label = (self.get_attribute('field_dimensionality',
+                                           field_name) == 'Scalar'
+                        and (np.issubdtype(dataset.dtype, np.integer)
+                             or dataset.dtype == bool))
+            field_method = label_method if is_label else method
+            resampled = _ResampledImageDataset(dataset, coords, new_coords,
+                                               method=field_method)
+            compression = self._get_compression_opt_from_filter(node.filters)
+            self.add_field_from_dataset(
+                new_location, new_field_name, resampled,
+                location=new_location, replace=True,
+                compression_options=compression,
+                block_size=resampled.block_size(memory_budget))
         if in_place:
             self.remove_node(location, recursive=True)
             self.rename_node(new_location, location)
         return
 
+    def process_image_blocks(self, field_names, kernel, outputs=None,
+                             block_shape=None, halo=0, halo_fill=None,
+                             n_jobs=1, kernel_kwargs=None, block_size=2 ** 24,
+                             compression_options=dict()):
+        """Run a kernel on image fields block by block, possibly in parallel.
+
+        The image is tiled into blocks, extended by a halo of `halo` voxels
+        in each direction. For each block, the blocks of the input fields
+        are read from the dataset and passed to the kernel, which returns
+        the blocks of the output fields and some statistics (see the
+        `pymicro.core.blocks` module for the kernel signature). The kernels
+        run in `n_jobs` processes while the blocks are read and written by
+        this process, so that only a few blocks are in memory at once and
+        images larger than the memory can be processed.
+
+        .. note::
+
+          The processes are started with the `spawn` method, a script
+          calling this method with `n_jobs` > 1 must protect its main code
+          with a `if __name__ == '__main__':` block.
+
+        :param list field_names: the names of the image fields passed to the
+            kernel, they must belong to the same image group.
+        :param kernel: the function to run on each block, it must be defined
+            at the module level to be used in parallel processes.
+        :param dict outputs: the outputs of the kernel to write, as a
+            dictionary with the output names as keys and either a numpy array
+            with the shape of the image (the output is written in the array),
+            or the name of an existing field of the image group, or a data
+            type, or a tuple (data type, number of components): a field with
+            the output name is then created in the image group (an existing
+            field with the same name is replaced).
+        :param tuple block_shape: the shape of the blocks, by default the
+            blocks are slabs along the last dimension of the image of about
+            `block_size` bytes.
+        :param halo: the width of the halo in voxels, a single value or one
+            value per dimension.
+        :param halo_fill: if not None, the halo of the blocks at the image
+            boundaries is padded with this value instead of being clipped.
+        :param int n_jobs: the number of processes running the kernel, it
+            runs in this process if 1.
+        :param dict kernel_kwargs: the keyword arguments of the kernel.
+        :param int block_size: the approximate size in bytes of the input
+            blocks, used if `block_shape` is None.
+        :param dict compression_options: the compression options of the
+            created output fields, see `set_chunkshape_and_compression`.
+        :return: the list of the statistics returned by the kernel for each
+            block, in the order of the blocks.
+        """
+        if isinstance(field_names, str):
+            field_names = [field_names]
+        if outputs is None:
+            outputs = dict()
+        if kernel_kwargs is None:
+            kernel_kwargs = dict()
+        grids = set([self.get_attribute('parent_grid_path', name)
+                     for name in field_names])
+        if len(grids) != 1:
+            raise ValueError('The fields {} do not belong to a single grid.'
+                             ''.format(field_names))
+        gridname = grids.pop()
+        if not self._is_image(gridname):
+            raise tables.NodeError('{} is not an image, cannot process it by'
+                                   ' blocks.'.format(gridname))
+        shape = tuple(self.get_attribute('dimension', gridname))
+        ndim = len(shape)
+        # create the output fields
+        targets = dict()
+        for name, target in outputs.items():
+            if isinstance(target, (np.ndarray, str)):
+                targets[name] = target
+                continue
+            dtype, components = target, ()
+            if isinstance(target, tuple):
+                dtype, components = target[0], (target[1],)
+            zeros = np.broadcast_to(np.zeros((), dtype=dtype),
+                                    shape + components)
+            node = self.add_field_from_dataset(
+                gridname, name, zeros, replace=True,
+                compression_options=compression_options)
+            targets[name] = node._v_pathname
+        if block_shape is None:
+            itemsize = sum(self.get_node(name).dtype.itemsize *
+                           int(np.prod(self.get_node(name).shape[ndim:]))
+                           for name in field_names)
+            block_shape = get_block_shape(shape, itemsize, block_size)
+
+        statistics = []
+
+        def write_results(block, results):
+            block_outputs, block_statistics = results
+            statistics.append(block_statistics)
+            if block_outputs is None:
+                return
+            for name, values in block_outputs.items():
+                if name not in targets:
+                    continue
+                if values.shape[:ndim] != block.shape:
+                    # remove the halo
+                    values = values[block.core]
+                if isinstance(targets[name], np.ndarray):
+                    targets[name][block.selection] = values
+                else:
+                    self.set_image_field_block(targets[name], values,
+                                               block.selection)
+
+        def read_arrays(block):
+            arrays = []
+            for name in field_names:
+                array = self.get_image_field_block(name, block.halo_selection)
+                if block.padded:
+                    pad_width = (block.pad_width
+                                 + [(0, 0)] * (array.ndim - ndim))
+                    array = np.pad(array, pad_width, mode='constant',
+                                   constant_values=halo_fill)
+                arrays.append(array)
+            return arrays
+
+        blocks = iter_image_blocks(shape, block_shape, halo=halo,
+                                   padded=halo_fill is not None)
+        if n_jobs == 1:
+            for block in blocks:
+                write_results(*run_block_kernel(kernel, block,
+                                                read_arrays(block),
+                                                kernel_kwargs))
+            return statistics
+        pending = deque()
+        # forked processes would share the state of the open HDF5 file
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=n_jobs,
+                                 mp_context=context) as executor:
+            for block in blocks:
+                # bound the number of blocks in memory
+                if len(pending) >= 2 * n_jobs:
+                    write_results(*pending.popleft().result())
+                pending.append(executor.submit(run_block_kernel, kernel,
+                                               block, read_arrays(block),
+                                               kernel_kwargs))
+            while pending:
+                write_results(*pending.popleft().result())
+        return statistics
+
+    def label_image_field(self, field_name, label_name, structure=None,
+                          block_shape=None, n_jobs=1, block_size=2 ** 24,
+                          compression_options=dict()):
+        """Label the connected components of a binary image field by blocks.
+
+        This is the out-of-core equivalent of `scipy.ndimage.label`: the
+        labels are the same, numbered from 1 in the raster order of the
+        image, but the field is processed by blocks (possibly in parallel)
+        so that the memory used does not depend on the size of the image.
+        The non zero values of the field are labelled in three passes with
+        the `process_image_blocks` method:
+
+         * the components of each block are labelled independently and
+           written in a temporary field, with the index of their first voxel
+           in the image plus one as provisional label.
+         * the provisional labels in contact at the blocks boundaries are
+           listed and merged with a graph connected components algorithm.
+         * the final labels are written in the label field.
+
+        :param str field_name: Name, Path, Index, Alias or Node of the binary
+            image field to label.
+        :param str label_name: the name of the label field created in the
+            image group of the field (an existing field with the same name is
+            replaced).
+        :param ndarray structure: the structuring element defining the
+            connectivity, see `scipy.ndimage.label` (connectivity by faces
+            by default).
+        :param tuple block_shape: the shape of the blocks processed at once,
+            by default slabs of about `block_size` bytes.
+        :param int n_jobs: the number of processes used.
+        :param int block_size: the approximate size in bytes of the blocks,
+            used if `block_shape` is None.
+        :param dict compression_options: the compression options of the
+            label field, see `set_chunkshape_and_compression`.
+        :return: a dictionary with the labels (`ids`), their number of voxels
+            (`sizes`), their center of mass (`centers`) and their bounding
+            box as [start, stop[ indices (`bounding_boxes`) in voxel unit.
+        """
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        gridname = self.get_attribute('parent_grid_path', field_name)
+        shape = tuple(self.get_attribute('dimension', gridname))
+        ndim = len(shape)
+        if block_shape is None:
+            block_shape = get_block_shape(shape, 8, block_size)
+        kwargs = {'structure': structure}
+        # first pass: label each block independently
+        provisional = self.add_field_from_dataset(
+            gridname, label_name + '_provisional',
+            np.broadcast_to(np.zeros((), np.int64), shape), replace=True,
+            block_size=block_size)._v_pathname
+        statistics = self.process_image_blocks(
+            [field_name], connected_components_kernel,
+            outputs={'labels': provisional}, block_shape=block_shape,
+            n_jobs=n_jobs, kernel_kwargs=kwargs)
+        # second pass: find the labels in contact at the blocks boundaries
+        pairs = np.concatenate(self.process_image_blocks(
+            [provisional], label_equivalences_kernel, halo=1,
+            block_shape=block_shape, n_jobs=n_jobs, kernel_kwargs=kwargs))
+        old_ids = np.sort(np.concatenate([s['ids'] for s in statistics]))
+        nodes = np.searchsorted(old_ids, pairs)
+        graph = coo_matrix((np.ones(len(pairs), dtype=np.int8),
+                            (nodes[:, 0], nodes[:, 1])),
+                           shape=(len(old_ids), len(old_ids)))
+        n, components = connected_components(graph, directed=False)
+        # number the components in the raster order of their first voxel
+        first = np.full(n, len(old_ids), dtype=np.int64)
+        np.minimum.at(first, components, np.arange(len(old_ids)))
+        rank = np.empty(n, dtype=np.int64)
+        rank[np.argsort(first)] = np.arange(1, n + 1)
+        dtype = np.int32 if n < np.iinfo(np.int32).max else np.int64
+        new_ids = rank[components].astype(dtype)
+        # third pass: write the final labels
+        self.add_field_from_dataset(
+            gridname, label_name, np.broadcast_to(np.zeros((), dtype), shape),
+            replace=True, compression_options=compression_options,
+            block_size=block_size)
+        self.process_image_blocks(
+            [provisional], relabel_kernel, outputs={'labels': label_name},
+            block_shape=block_shape, n_jobs=n_jobs,
+            kernel_kwargs={'old_ids': old_ids, 'new_ids': new_ids})
+        self.remove_node(provisional)
+        if len(old_ids) == 0:
+            return {'ids': new_ids,
+                    'sizes': np.zeros(0, dtype=np.int64),
+                    'centers': np.zeros((0, ndim)),
+                    'bounding_boxes': np.zeros((0, ndim, 2), dtype=np.int64)}
+        return merge_label_statistics(statistics, relabel=(old_ids, new_ids))
+
     def repack_h5file(self):
         """Overwrite hdf5 file with a copy of itself to recover disk space.
 
@@ -2862,6 +3942,7 @@ class SampleData:
         self.h5_dataset.copy_file(tmp_file)
         self.h5_dataset.close()
         shutil.move(tmp_file, self.h5_path)
+        self._memory_map_offsets.clear()
         self.h5_dataset = tables.File(self.h5_path, mode='r+')
         self._file_exist = True
         self._after_file_open()
@@ -2897,6 +3978,57 @@ class SampleData:
             del new_sample
             return
 
+    def to_chunked_store(self, store_path, overwrite=False):
+        """Copy the dataset into a chunked directory store.
+
+        The store is a directory in which each data array chunk is an
+        independent file (see
+        :py:class:`pymicro.core.storage.ChunkedDirectoryBackend`).
+        Independent processes can open the store and write disjoint chunks of
+        the same field concurrently, which cannot be done in the HDF5 file.
+        Use `from_chunked_store` to convert the store back into a dataset. All
+        arrays, chunkshapes, compression settings and attributes are kept.
+
+        :param str store_path: path of the store directory to create
+        :param bool overwrite: if `True`, remove an existing store at
+            `store_path`.
+        """
+        if os.path.exists(store_path) and not overwrite:
+            raise FileExistsError('Store {} already exists, use'
+                                  ' `overwrite=True` to replace it.'
+                                  ''.format(store_path))
+        self.sync()
+        self._verbose_print('Copying dataset {} into chunked store {}'
+                            ''.format(self.h5_file, store_path))
+        with ChunkedDirectoryBackend(store_path, mode='w') as dst:
+            convert_storage(HDF5Backend(self.h5_dataset), dst)
+        return
+
+    @classmethod
+    def from_chunked_store(cls, store_path, filename, overwrite=False,
+                           autodelete=False):
+        """Create a dataset from a chunked directory store.
+
+        :param str store_path: path of the store directory, created with the
+            `to_chunked_store` method.
+        :param str filename: name of the dataset files to create.
+        :param bool overwrite: set to `True` to overwrite an existing dataset
+            file with name `filename`.
+        :param bool autodelete: remove dataset files when the instance is
+            destroyed.
+        :return: the dataset, as an instance of the class used to call the
+            method.
+        """
+        h5_path = os.path.splitext(filename)[0] + '.h5'
+        if os.path.exists(h5_path) and not overwrite:
+            raise FileExistsError('Dataset file {} already exists, use'
+                                  ' `overwrite=True` to replace it.'
+                                  ''.format(h5_path))
+        with ChunkedDirectoryBackend(store_path, mode='r') as src, \
+                HDF5Backend(h5_path, mode='w') as dst:
+            convert_storage(src, dst)
+        return cls(filename=h5_path, autodelete=autodelete)
+
     def create_elset_ids_field(self, mesh_name=None, store=True,
                                field_name=None, get_sets_ids=True,
                                tags_prefix='elset', remove_elset_fields=False):
@@ -2997,8 +4129,8 @@ class SampleData:
         self._init_xdmf_tree()
         # Generic Data Model initialization
         self._init_data_model()
-        self._verbose_print('**** FILE CONTENT ****')
-        if self._verbose:
+        if self._verbose and not self._fast_open:
+            self._verbose_print('**** FILE CONTENT ****')
             self.print_dataset_content(max_depth=2)
         if not self._file_exist:
             # add sample name and description specified at the creation
@@ -3011,6 +4143,9 @@ class SampleData:
         content_paths, content_type = self.minimal_data_model()
         self.minimal_content = content_paths
         self._init_content_index()
+        if self._fast_open and self._file_exist:
+            self._verbose_print('Fast open: data model checks skipped')
+            return
         self._verbose_print('Data model initialization....')
         # Determine maximum path level in data model elements
         max_path_level = 0
@@ -3085,7 +4220,11 @@ class SampleData:
         """Initialize content_index dictionary."""
         self.content_index = {}
         self.aliases = {}
-        if self._file_exist:
+        if self._file_exist and self._fast_open:
+            # index items are read from the file only when needed
+            self.content_index = _LazyAttributeDict(self, '/Index')
+            self.aliases = _LazyAttributeDict(self, '/Index/Aliases')
+        elif self._file_exist:
             self.content_index = self.get_dic_from_attributes(
                                                     nodename='/Index')
             self.aliases = self.get_dic_from_attributes(
@@ -3253,6 +4392,7 @@ class SampleData:
             removed_path = self.content_index.pop(key)
             if key in self.aliases:
                 self.aliases.pop(key)
+            self._xdmf_outdated = True
             self._verbose_print('item {} : {} removed from context index'
                                 ' dictionary'.format(key, removed_path))
         except:
@@ -3402,6 +4542,11 @@ class SampleData:
         test = self.get_attribute('field_type', fieldname)
         return test is not None
 
+    def _is_field_time_serie(self, fieldname):
+        """Check if node `name` is a field stored as a time serie array."""
+        return (self._is_field(fieldname)
+                and self.get_attribute('time_list', fieldname) is not None)
+
     def _is_in_index(self, name):
         return name in self.content_index
 
@@ -3540,6 +4685,86 @@ class SampleData:
                              '3D grid.')
         return field_type, XDMF_FIELD_TYPE[dimension]
 
+    def _prepare_field_array(self, gridname, array, bulk_padding=True):
+        """Pad, check and transpose a field array to store it in a grid.
+
+        :return: the array to store, the array for integration point fields
+            visualisation and the dictionary of field attributes.
+        """
+        # If needed, pad the field with 0s to comply with number of bulk and
+        # boundary elements
+        array, padding, vis_array = self._mesh_field_padding(array, gridname,
+                                                             bulk_padding)
+        # Check if the array shape is consistent with the grid geometry
+        # and returns field dimension, xdmf Center attribute
+        field_type, dimensionality = self._check_field_compatibility(
+                                                        gridname, array.shape)
+        attribute_dic = {'field_type': field_type,
+                         'field_dimensionality': dimensionality,
+                         'padding': padding}
+        # Apply indices transposition to assure consistency of the data
+        # visualization in paraview with SampleData ordering and indexing
+        # conventions
+        if self._is_image(gridname):
+            # indices transposition to ensure consistency between SampleData
+            # and geometrical interpretation of coordinates in Paraview
+            if self.get_attribute('group_type', gridname) == '2DImage':
+                if len(array.shape) == 3:
+                    array = np.squeeze(array)
+            array, transpose_indices = self._transpose_image_array(
+                                                         dimensionality, array)
+            attribute_dic['transpose_indices'] = transpose_indices
+        if dimensionality in ['Tensor6', 'Tensor']:
+            # indices transposition to ensure consistency between SampleData
+            # components oredering convention and SampleData ordering
+            # convention
+            array, transpose_components = self._transpose_field_comp(
+                                                         dimensionality, array)
+            attribute_dic['transpose_components'] = transpose_components
+        return array, vis_array, attribute_dic
+
+    def _prepare_field_time_steps(self, gridname, array, time_list,
+                                  bulk_padding=True):
+        """Prepare a stack of field time steps to store it in a grid."""
+        if array.shape[0] != len(time_list):
+            raise ValueError('Number of time steps in array ({}) and number'
+                             ' of time values ({}) do not match.'
+                             ''.format(array.shape[0], len(time_list)))
+        if np.any(np.diff(time_list) <= 0):
+            raise ValueError('Time values must be in strictly ascending'
+                             ' order.')
+        steps = []
+        for step in array:
+            step, _, field_attributes = self._prepare_field_array(
+                gridname, step, bulk_padding)
+            steps.append(step)
+        if field_attributes['field_type'] == 'IP_field':
+            raise ValueError('Integration point fields are not supported by'
+                             ' time serie fields, use the `time` argument of'
+                             ' the `add_field` method.')
+        # transpositions apply to the stack of time steps
+        if 'transpose_indices' in field_attributes:
+            field_attributes['transpose_indices'] = [0] + [
+                i + 1 for i in field_attributes['transpose_indices']]
+        return np.stack(steps), field_attributes
+
+    @staticmethod
+    def _get_time_serie_chunkshape(step_shape, dtype, time_chunk=8,
+                                   chunk_bytes=2**14):
+        """Compute a default chunkshape for a time serie field array.
+
+        A chunk gathers `time_chunk` time steps of a block of the grid, the
+        block being obtained by halving the largest dimension of the time step
+        until the block size is lower than `chunk_bytes`. This balances the
+        cost of reading one time step and the time history of a point.
+        """
+        block = list(step_shape)
+        while (np.prod(block) * np.dtype(dtype).itemsize > chunk_bytes
+               and max(block) > 1):
+            i = int(np.argmax(block))
+            block[i] = (block[i] + 1) // 2
+        return (time_chunk,) + tuple(block)
+
     def _mesh_field_padding(self, field, meshname, bulk_padding):
         """Pad with zeros the mesh elem field to comply with size."""
         if self._is_image(meshname):
@@ -4094,6 +5319,14 @@ class SampleData:
             self._add_field_to_xdmf(fieldname, field)
         for fieldname, field in image_object.elemFields.items():
             self._add_field_to_xdmf(fieldname, field)
+        # Add time serie fields, not loaded in image_object
+        image_group = self.get_node(imagename)
+        Field_index = self.get_node('%s/Field_index' % image_group._v_pathname)
+        if Field_index is not None:
+            for fieldname in Field_index:
+                name = fieldname.decode('utf-8')
+                if self._is_field_time_serie(name):
+                    self._add_field_time_serie_to_xdmf(name)
         return
 
     def _add_mesh_to_xdmf(self, mesh_group):
@@ -4188,6 +5421,9 @@ class SampleData:
                     print(f"Could not write field {fieldname.decode('utf-8')} "
                           " in XDMF file")
                     continue
+                if self._is_field_time_serie(name):
+                    self._add_field_time_serie_to_xdmf(name)
+                    continue
                 data = self.get_field(name, unpad_field=True)
                 self._add_field_to_xdmf(name, data)
         return
@@ -4222,26 +5458,33 @@ class SampleData:
 
     def _transpose_image_array(self, dimensionality, array):
         """Transpose the array X,Y,Z dimensions for XDMF conventions."""
+        transpose_indices = self._get_image_transpose_indices(dimensionality,
+                                                              len(array.shape))
+        return array.transpose(transpose_indices), transpose_indices
+
+    @staticmethod
+    def _get_image_transpose_indices(dimensionality, ndim):
+        """Indices transposition of an image field array for XDMF."""
         if dimensionality in ['Vector', 'Tensor6', 'Tensor']:
             # vector or tensor field
-            if len(array.shape) == 3:
+            if ndim == 3:
                 # 2D image
                 transpose_indices = [1,0,2]
-            elif len(array.shape) == 4:
+            elif ndim == 4:
                 # 3D image
                 transpose_indices = [2,1,0,3]
         elif dimensionality == 'Scalar':
             # scalar field
-            if len(array.shape) == 2:
+            if ndim == 2:
                 # 2D image
                 transpose_indices = [1,0]
-            elif len(array.shape) == 3:
+            elif ndim == 3:
                 # 3D image
                 transpose_indices = [2,1,0]
         else:
             raise ValueError('Unknown field dimensionality. Possible values'
                              ' are {}'.format(XDMF_FIELD_TYPE.values()))
-        return array.transpose(transpose_indices), transpose_indices
+        return transpose_indices
 
     def _add_field_to_xdmf(self, fieldname, field):
         """Write field data as Grid Attribute in xdmf tree/file.
@@ -4357,13 +5600,69 @@ class SampleData:
         Xdmf_grid_node.append(Attribute_xdmf)
         return
 
+    def _add_field_time_serie_to_xdmf(self, fieldname):
+        """Write time serie field steps as Attributes of the grid time steps.
+
+        Each time step is a hyperslab of the time serie array, added as an
+        Attribute to the Grid of the XDMF temporal collection with the same
+        time value.
+
+        :param str fieldname: the string representing the field name.
+        """
+        Node = self.get_node(fieldname)
+        Grid_name = self.get_attribute('xdmf_gridname', fieldname)
+        field_dimensionality = self.get_attribute('field_dimensionality',
+                                                  fieldname)
+        field_type = self.get_attribute('field_type', fieldname)
+        if field_type == 'Nodal_field':
+            Center_type = 'Node'
+        else:
+            Center_type = 'Cell'
+        if np.issubdtype(Node.dtype, np.floating):
+            NumberType = 'Float'
+        elif np.issubdtype(Node.dtype, np.unsignedinteger):
+            NumberType = 'UInt'
+        elif np.issubdtype(Node.dtype, np.integer):
+            NumberType = 'Int'
+        else:
+            return
+        Precision = str(Node.dtype.itemsize)
+        ndim = len(Node.shape)
+        count = (1,) + Node.shape[1:]
+        time_list = self.get_attribute('time_list', fieldname)
+        for T_index, T in enumerate(time_list):
+            Attribute_xdmf = etree.Element(_tag='Attribute',
+                                           Name=Node._v_name,
+                                           AttributeType=field_dimensionality,
+                                           Center=Center_type)
+            Slab_data = etree.Element(_tag='DataItem', ItemType='HyperSlab',
+                                      Dimensions=self._np_to_xdmf_str(count),
+                                      Type='HyperSlab')
+            # hyperslab start, stride and count
+            Slab_selection = etree.Element(_tag='DataItem', Format='XML',
+                                           Dimensions=f'3 {ndim}')
+            start = (T_index,) + (0,) * (ndim - 1)
+            Slab_selection.text = ' '.join(
+                [str(i) for i in start + (1,) * ndim + count])
+            Attribute_data = etree.Element(
+                _tag='DataItem', Format='HDF',
+                Dimensions=self._np_to_xdmf_str(Node.shape),
+                NumberType=NumberType, Precision=Precision)
+            Attribute_data.text = self.h5_file + ':' + Node._v_pathname
+            Slab_data.append(Slab_selection)
+            Slab_data.append(Attribute_data)
+            Attribute_xdmf.append(Slab_data)
+            Xdmf_grid_node = self._find_xdmf_grid(Grid_name, T)
+            Xdmf_grid_node.append(Attribute_xdmf)
+        return
+
     def _get_node_class(self, name):
         """Return Pytables Class type associated to the node name."""
         return self.get_attribute(attrname='CLASS', nodename=name)
 
     def _get_path_with_indexname(self, indexname):
         """Return node path from its indexname."""
-        if indexname in self.content_index.keys():
+        if indexname in self.content_index:
             if isinstance(self.content_index[indexname], list):
                 return self.content_index[indexname][0]
             else:
@@ -4489,6 +5788,47 @@ class SampleData:
             s = ''
         return s
 
+    def _get_memory_map(self, name):
+        """Return a memory mapped array node as a read-only numpy memmap.
+
+        The byte offset of the contiguous array in the HDF5 file is cached to
+        open the map without accessing the HDF5 metadata at the next calls.
+        Transpositions used to comply with the Paraview ordering conventions
+        are reversed, the indices transposition returns a view of the map.
+
+        :param str name: Name, Path, Index name or Alias of the array node
+        :return: the array as a read-only :py:class:`numpy.memmap`, or as a
+            numpy array if the node storage is not contiguous
+        """
+        node = self.get_node(name)
+        node_path = node._v_pathname
+        if node_path not in self._memory_map_offsets:
+            # the HDF5 file must be up to date on disk to read the offset
+            self.h5_dataset.flush()
+            with h5py.File(self.h5_path, mode='r', locking=False) as h5:
+                offset = h5[node_path].id.get_offset()
+            if offset is None:
+                # not a contiguous dataset (a virtual dataset for instance)
+                self._verbose_print('(get_field) {} cannot be memory mapped,'
+                                    ' reading it.'.format(node_path))
+                return self.get_node(name, as_numpy=True)
+            self._memory_map_offsets[node_path] = offset
+        dtype = node.dtype
+        if node.byteorder in ['little', 'big']:
+            dtype = dtype.newbyteorder({'little': '<',
+                                        'big': '>'}[node.byteorder])
+        array = np.memmap(self.h5_path, mode='r', dtype=dtype,
+                          shape=node.shape,
+                          offset=self._memory_map_offsets[node_path])
+        transpose_indices = self.get_attribute('transpose_indices', name)
+        if transpose_indices is not None:
+            array = array.transpose(transpose_indices)
+        transpose_components = self.get_attribute('transpose_components',
+                                                  name)
+        if transpose_components is not None:
+            array = array[..., transpose_components]
+        return array
+
     def _get_compression_opt(self, compression_opts=dict()):
         """Get input compression settings as `tables.Filters` instance."""
         Filters = tables.Filters()
@@ -4585,3 +5925,335 @@ class SampleData:
         Retstr =  str(Retstr).strip('[').strip(']')
         Retstr =  str(Retstr).replace(',', ' ')
         return Retstr
+
+
+class _LazyAttributeDict(dict):
+    """Dictionary synchronized with the attributes of a dataset HDF5 node.
+
+    Used for the `content_index` and `aliases` dictionaries of a dataset
+    opened from an existing file with `fast_open`. Item reads (`in`, `[]`,
+    `get`) are done directly in the node attributes, the whole dictionary is
+    loaded from them only when it is iterated or modified. The `loaded`
+    attribute tells if it has been loaded.
+
+    :param SampleData sample: dataset owning the dictionary (only a weak
+        reference to it is kept)
+    :param str node_path: path of the HDF5 node holding the dictionary items
+    """
+
+    def __init__(self, sample, node_path):
+        super().__init__()
+        self._sample = weakref.ref(sample)
+        self._h5_dataset = sample.h5_dataset
+        self._node_path = node_path
+        self.loaded = False
+
+    def _attrs(self):
+        sample = self._sample()
+        # the weak reference is cleared before the dataset finalizer runs
+        # when it is garbage collected, keep the last file object seen
+        if sample is not None:
+            self._h5_dataset = sample.h5_dataset
+        return self._h5_dataset.get_node(self._node_path)._v_attrs
+
+    def load(self):
+        """Load all items from the HDF5 node attributes."""
+        if not self.loaded:
+            attrs = self._attrs()
+            dict.update(self, {key: attrs[key] for key in attrs._f_list()})
+            self.loaded = True
+        return
+
+    def __getitem__(self, key):
+        if not self.loaded:
+            attrs = self._attrs()
+            if key in attrs._v_attrnamesuser:
+                return attrs[key]
+            raise KeyError(key)
+        return dict.__getitem__(self, key)
+
+    def __contains__(self, key):
+        if not self.loaded:
+            return key in self._attrs()._v_attrnamesuser
+        return dict.__contains__(self, key)
+
+    def __eq__(self, other):
+        self.load()
+        if isinstance(other, _LazyAttributeDict):
+            other.load()
+        return dict.__eq__(self, other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def __iter__(self):
+        self.load()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        self.load()
+        return dict.__len__(self)
+
+    def __repr__(self):
+        self.load()
+        return dict.__repr__(self)
+
+    def __setitem__(self, key, value):
+        self.load()
+        dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self.load()
+        dict.__delitem__(self, key)
+
+    def keys(self):
+        self.load()
+        return dict.keys(self)
+
+    def values(self):
+        self.load()
+        return dict.values(self)
+
+    def items(self):
+        self.load()
+        return dict.items(self)
+
+    def copy(self):
+        self.load()
+        return dict.copy(self)
+
+    def pop(self, *args):
+        self.load()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self.load()
+        return dict.popitem(self)
+
+    def setdefault(self, *args):
+        self.load()
+        return dict.setdefault(self, *args)
+
+    def update(self, *args, **kwargs):
+        self.load()
+        return dict.update(self, *args, **kwargs)
+
+    def clear(self):
+        self.load()
+        dict.clear(self)
+
+
+class _ImageFieldDataset:
+    """Array like view of an image field of a `SampleData` dataset.
+
+    Blocks are read with `SampleData.get_image_field_block`, so that the
+    view can be given to `SampleData.add_field_from_dataset` to copy the
+    field without loading it in memory.
+    """
+
+    def __init__(self, sample, field_name):
+        self.sample = sample
+        self.field_name = field_name
+        node = sample.get_node(field_name)
+        transpose_indices = sample.get_attribute('transpose_indices',
+                                                 field_name)
+        shape = tuple(node.shape)
+        if transpose_indices is not None:
+            shape = tuple(shape[i] for i in transpose_indices)
+        self.shape = shape
+        self.dtype = node.dtype
+        if sample.get_attribute('data_normalization', field_name) is not None:
+            self.dtype = np.dtype(np.float64)
+
+    def __getitem__(self, selection):
+        return self.sample.get_image_field_block(self.field_name, selection)
+
+
+class _BlockModeDataset:
+    """Array like view of a label image downsampled by majority vote.
+
+    Each voxel of the view takes the most frequent value (the smallest one
+    in case of a tie) of the corresponding block of the underlying dataset,
+    whose dimensions are truncated to a multiple of the block size.
+    """
+
+    def __init__(self, dataset, factor):
+        self.dataset = dataset
+        self.factor = tuple(int(f) for f in factor)
+        self.shape = tuple(n // f for n, f in zip(dataset.shape, self.factor))
+        self.dtype = dataset.dtype
+
+    def __getitem__(self, selection):
+        selection = tuple(selection)
+        selection += (slice(None),) * (len(self.shape) - len(selection))
+        src_selection = []
+        for sl, n, f in zip(selection, self.shape, self.factor):
+            start, stop, step = sl.indices(n)
+            if step != 1:
+                raise ValueError('Only unit steps are supported to read a '
+                                 'block of a majority vote view.')
+            src_selection.append(slice(start * f, max(start, stop) * f))
+        block = np.asarray(self.dataset[tuple(src_selection)])
+        return self.block_mode(block, self.factor)
+
+    @staticmethod
+    def block_mode(array, factor):
+        """Compute the most frequent value of each block of an array.
+
+        :param ndarray array: the array, its dimensions must be multiples of
+            the block size.
+        :param tuple factor: the block size along each dimension.
+        :return: the array of the most frequent value of each block.
+        """
+        out_shape = tuple(n // f for n, f in zip(array.shape, factor))
+        blocks = array.reshape(sum(((n, f) for n, f in
+                                    zip(out_shape, factor)), ()))
+        ndim = len(out_shape)
+        blocks = blocks.transpose(list(range(0, 2 * ndim, 2))
+                                  + list(range(1, 2 * ndim, 2)))
+        values = np.sort(blocks.reshape((-1, int(np.prod(factor)))), axis=1)
+        # length of the run of equal values ending at each position
+        runs = np.ones(values.shape, dtype=np.int32)
+        for j in range(1, values.shape[1]):
+            same = values[:, j] == values[:, j - 1]
+            runs[same, j] = runs[same, j - 1] + 1
+        mode = values[np.arange(len(values)), np.argmax(runs, axis=1)]
+        return mode.reshape(out_shape)
+
+
+class _ResampledImageDataset:
+    """Array like view of an image field resampled on a new regular grid.
+
+    The resampling is separable: each dimension of the new grid is mapped
+    to the original one with 1D index arrays, so that any block of the
+    resampled field is computed from the smallest block of the original
+    field. New voxel centers outside of the original voxel centers are set
+    to zero with the 'nearest' and 'linear' methods, as with a
+    `scipy.interpolate.RegularGridInterpolator` using a zero fill value.
+    """
+
+    def __init__(self, dataset, coords, new_coords, method='nearest'):
+        """Create the view.
+
+        :param dataset: the array-like of the original field, in (X,Y,Z)
+            order, for instance an `_ImageFieldDataset` instance.
+        :param list coords: the 1D arrays of the original voxel centers
+            along each dimension.
+        :param list new_coords: the 1D arrays of the new voxel centers along
+            each dimension.
+        :param str method: 'nearest', 'linear' or 'majority'.
+        """
+        self.dataset = dataset
+        self.method = method
+        ndim = len(coords)
+        self.shape = (tuple(len(c) for c in new_coords)
+                      + tuple(dataset.shape[ndim:]))
+        self.dtype = dataset.dtype
+        self.ratio = [max(1., (c[1] - c[0]) / (nc[1] - nc[0]) if
+                          len(c) > 1 and len(nc) > 1 else 1.)
+                      for c, nc in zip(coords, new_coords)]
+        self.axes = []
+        for c, nc in zip(coords, new_coords):
+            # find the enclosing original voxel centers as scipy does
+            i = np.clip(np.searchsorted(c, nc) - 1, 0, max(0, len(c) - 2))
+            step = np.diff(c)[0] if len(c) > 1 else 1.
+            w = (nc - c[i]) / step
+            inside = (nc >= c[0]) & (nc <= c[-1])
+            i1 = np.minimum(i + 1, len(c) - 1)
+            axis = {'i0': i, 'i1': i1, 'w': w, 'inside': inside,
+                    'nearest': np.where(w <= 0.5, i, i1)}
+            if method == 'majority':
+                # index of the new voxel containing each original voxel center
+                target = np.floor(c / (2 * nc[0])).astype(np.int64)
+                target[(target < 0) | (target >= len(nc))] = -1
+                axis['target'] = target
+            self.axes.append(axis)
+
+    def block_size(self, memory_budget):
+        """Size in bytes of the output blocks fitting in a memory budget."""
+        # original voxels read and temporary float arrays per output voxel
+        expansion = 4 * np.prod([r + 1 for r in self.ratio])
+        return max(1, int(memory_budget // expansion))
+
+    def _read(self, ranges):
+        """Read a block of the original field given (start, stop) ranges."""
+        return np.asarray(self.dataset[tuple(slice(a, b) for a, b in ranges)])
+
+    def __getitem__(self, selection):
+        selection = tuple(selection)
+        ndim = len(self.axes)
+        selection += (slice(None),) * (ndim - len(selection))
+        targets = [np.arange(*sl.indices(n))
+                   for sl, n in zip(selection, self.shape)]
+        if self.method == 'linear':
+            block = self._linear(targets)
+        else:
+            block = self._nearest(targets)
+            if self.method == 'majority':
+                self._majority(targets, block)
+        return block
+
+    def _outside_mask(self, targets):
+        """Boolean array of the new voxels outside the original grid."""
+        inside = np.ones([len(t) for t in targets], dtype=bool)
+        for k, (axis, t) in enumerate(zip(self.axes, targets)):
+            shape = [1] * len(targets)
+            shape[k] = len(t)
+            inside = inside & axis['inside'][t].reshape(shape)
+        return ~inside
+
+    def _nearest(self, targets):
+        indices = [axis['nearest'][t] for axis, t in zip(self.axes, targets)]
+        ranges = [(ind.min(), ind.max() + 1) for ind in indices]
+        block = self._read(ranges)
+        block = block[np.ix_(*[ind - r[0] for ind, r in zip(indices, ranges)])]
+        block[self._outside_mask(targets)] = 0
+        return block
+
+    def _linear(self, targets):
+        ranges = [(axis['i0'][t].min(), axis['i1'][t].max() + 1)
+                  for axis, t in zip(self.axes, targets)]
+        block = self._read(ranges).astype(np.float64)
+        # interpolate along each dimension in turn
+        for k, (axis, t, r) in enumerate(zip(self.axes, targets, ranges)):
+            w = axis['w'][t].reshape([-1 if j == k else 1
+                                      for j in range(block.ndim)])
+            block = (np.take(block, axis['i0'][t] - r[0], axis=k) * (1 - w)
+                     + np.take(block, axis['i1'][t] - r[0], axis=k) * w)
+        block[self._outside_mask(targets)] = 0
+        return block.astype(self.dtype)
+
+    def _majority(self, targets, block):
+        """Replace the values of the new voxels containing original voxel
+        centers by their most frequent value."""
+        ranges, local_targets = [], []
+        for axis, t in zip(self.axes, targets):
+            sources = np.flatnonzero((axis['target'] >= t[0])
+                                     & (axis['target'] <= t[-1]))
+            if len(sources) == 0:
+                return
+            ranges.append((sources[0], sources[-1] + 1))
+            local_targets.append(axis['target'][sources[0]:sources[-1] + 1]
+                                 - t[0])
+        labels = self._read(ranges).astype(np.int64).ravel()
+        # flat index of the new voxel containing each original voxel
+        flat = np.ravel_multi_index(np.ix_(*local_targets), block.shape)
+        flat = np.broadcast_to(flat, [len(lt) for lt in local_targets]).ravel()
+        offset = labels.min()
+        span = labels.max() - offset + 1
+        pairs, counts = np.unique(flat * span + (labels - offset),
+                                  return_counts=True)
+        voxels, values = pairs // span, pairs % span + offset
+        # most frequent value (smallest one in case of a tie) for each voxel
+        order = np.lexsort((values, -counts, voxels))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = voxels[order][1:] != voxels[order][:-1]
+        best = order[first]
+        block.ravel()[voxels[best]] = values[best]
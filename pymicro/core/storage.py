@@ -0,0 +1,673 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Storage backends for the data arrays of SampleData datasets.
+
+The `storage` module provides a small storage abstraction, the
+`StorageBackend` class, describing a hierarchy of groups and chunked arrays
+with attributes, like a HDF5 file. Two backends are implemented:
+
+  * `HDF5Backend`: wraps a Pytables HDF5 file, the native format of the
+    `SampleData` class.
+  * `ChunkedDirectoryBackend`: a local directory store, in which each group
+    is a directory and each chunk of an array is a separate file.
+
+As each chunk of a `ChunkedDirectoryBackend` array is an independent file,
+written atomically, independent processes can open the same store and write
+disjoint chunks of the same array concurrently, which is not possible with a
+HDF5 file. The `convert_storage` function copies losslessly a whole dataset
+from one backend to another (data, chunkshapes, compression settings, titles
+and attributes).
+
+A typical parallel workflow is::
+
+    sample.to_chunked_store('dataset_store')
+    # in each worker process
+    with ChunkedDirectoryBackend('dataset_store', mode='r+') as store:
+        store.write_field('/CellData/grain_map', block, selection)
+    # when all workers are done
+    sample = Microstructure.from_chunked_store('dataset_store', 'dataset')
+
+"""
+import os
+import ast
+import io
+import shutil
+import pickle
+import tempfile
+import zlib
+import itertools
+import numpy as np
+import tables
+
+# name of the metadata files of the chunked directory backend
+_GROUP_META = '.group'
+_ARRAY_META = '.array'
+_ATTRS_FILE = '.attrs'
+# supported array kinds
+ARRAY_KINDS = ['Array', 'CArray', 'EArray', 'Table']
+# maximum size (in bytes) of the blocks read and written by convert_storage
+CONVERSION_BLOCK_SIZE = 2**26
+
+
+class StorageBackend(object):
+    """Base class defining the interface of SampleData storage backends.
+
+    A backend stores a hierarchy of groups and arrays, both having a title
+    and a dictionary of attributes. Nodes are referenced by their path, the
+    root group being '/'. Arrays are described by an info dictionary with
+    the following items:
+
+      * kind: one of 'Array' (contiguous array), 'CArray' (chunked array),
+        'EArray' (enlargeable chunked array) or 'Table' (structured array)
+      * shape: tuple, shape of the array
+      * dtype: `numpy.dtype` of the array
+      * chunkshape: tuple, shape of the data chunks (`None` for 'Array')
+      * extdim: enlargeable dimension of 'EArray' arrays (`None` otherwise)
+      * filters: compression options dictionary (see
+        `SampleData.set_nodes_compression_chunkshape`)
+      * title: title of the node
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the backend."""
+        return
+
+    def walk(self):
+        """Iterate over the nodes of the backend, parents before children.
+
+        :return: iterator of (path, is_group) tuples
+        """
+        raise NotImplementedError()
+
+    def get_title(self, path):
+        """Return the title of a group."""
+        raise NotImplementedError()
+
+    def create_group(self, path, title=''):
+        """Create a group, its parent group must exist."""
+        raise NotImplementedError()
+
+    def get_attributes(self, path):
+        """Return the user attributes of a node as a dictionary."""
+        raise NotImplementedError()
+
+    def set_attributes(self, path, attributes):
+        """Add a dictionary of attributes to the attributes of a node."""
+        raise NotImplementedError()
+
+    def get_array_info(self, path):
+        """Return the info dictionary of an array (see class doc)."""
+        raise NotImplementedError()
+
+    def create_array(self, path, info):
+        """Create an array with no data from an info dictionary."""
+        raise NotImplementedError()
+
+    def read(self, path, selection=Ellipsis):
+        """Read data from an array.
+
+        :param str path: path of the array
+        :param selection: a slice, or tuple of slices, of the array to read
+        :return: the data as a numpy array
+        """
+        raise NotImplementedError()
+
+    def write(self, path, data, selection=Ellipsis):
+        """Write data into an array, enlarging it if it is an 'EArray'.
+
+        :param str path: path of the array
+        :param data: the numpy array to write
+        :param selection: a slice, or tuple of slices, of the array in which
+            data is written
+        """
+        raise NotImplementedError()
+
+
+class HDF5Backend(StorageBackend):
+    """Storage backend of a Pytables HDF5 file.
+
+    :param file: path of the HDF5 file, or an opened :py:class:`tables.File`
+        instance (for instance `SampleData.h5_dataset`), which is not closed
+        by the backend.
+    :param str mode: file opening mode if `file` is a path.
+    """
+
+    def __init__(self, file, mode='r'):
+        if isinstance(file, tables.File):
+            self.h5_dataset = file
+            self._own_file = False
+        else:
+            self.h5_dataset = tables.open_file(file, mode=mode)
+            self._own_file = True
+        return
+
+    def close(self):
+        """Close the HDF5 file if it was opened by the backend."""
+        if self._own_file and self.h5_dataset.isopen:
+            self.h5_dataset.close()
+        return
+
+    def walk(self):
+        """Iterate over the nodes of the file, parents before children."""
+        for node in self.h5_dataset.walk_nodes('/'):
+            if isinstance(node, tables.Group):
+                yield node._v_pathname, True
+            elif node.__class__.__name__ in ARRAY_KINDS:
+                yield node._v_pathname, False
+            else:
+                raise ValueError('Node {} of type {} is not supported by the'
+                                 ' storage backends.'
+                                 ''.format(node._v_pathname,
+                                           node.__class__.__name__))
+
+    def get_title(self, path):
+        """Return the title of a group."""
+        return self.h5_dataset.get_node(path)._v_title
+
+    def create_group(self, path, title=''):
+        """Create a group, its parent group must exist."""
+        if path == '/':
+            self.h5_dataset.root._v_attrs.TITLE = title
+            return
+        parent, name = os.path.split(path)
+        self.h5_dataset.create_group(parent, name, title=title)
+        return
+
+    def get_attributes(self, path):
+        """Return the user attributes of a node as a dictionary."""
+        attrs = self.h5_dataset.get_node(path)._v_attrs
+        return {name: attrs[name] for name in attrs._f_list('user')}
+
+    def set_attributes(self, path, attributes):
+        """Add a dictionary of attributes to the attributes of a node."""
+        attrs = self.h5_dataset.get_node(path)._v_attrs
+        for name, value in attributes.items():
+            attrs[name] = value
+        return
+
+    def get_array_info(self, path):
+        """Return the info dictionary of an array (see class doc)."""
+        node = self.h5_dataset.get_node(path)
+        kind = node.__class__.__name__
+        filters = node.filters
+        info = {'kind': kind,
+                'shape': tuple(node.shape),
+                'dtype': node.dtype,
+                'chunkshape': node.chunkshape,
+                'extdim': node.extdim if kind == 'EArray' else None,
+                'filters': {'complib': filters.complib,
+                            'complevel': filters.complevel,
+                            'shuffle': filters.shuffle,
+                            'bitshuffle': filters.bitshuffle,
+                            'checksum': filters.fletcher32,
+                            'least_significant_digit':
+                                filters.least_significant_digit},
+                'title': node.title}
+        return info
+
+    def create_array(self, path, info):
+        """Create an array with no data from an info dictionary."""
+        parent, name = os.path.split(path)
+        filters = _filters_from_options(info['filters'])
+        kind = info['kind']
+        if kind == 'Table':
+            self.h5_dataset.create_table(
+                parent, name, description=info['dtype'], title=info['title'],
+                filters=filters, expectedrows=max(info['shape'][0], 1),
+                chunkshape=info['chunkshape'])
+            return
+        atom = tables.Atom.from_dtype(info['dtype'])
+        if kind == 'Array':
+            self.h5_dataset.create_array(parent, name, atom=atom,
+                                         shape=info['shape'],
+                                         title=info['title'])
+        elif kind == 'CArray':
+            self.h5_dataset.create_carray(parent, name, atom=atom,
+                                          shape=info['shape'],
+                                          title=info['title'],
+                                          filters=filters,
+                                          chunkshape=info['chunkshape'])
+        elif kind == 'EArray':
+            shape = list(info['shape'])
+            expectedrows = max(shape[info['extdim']], 1)
+            shape[info['extdim']] = 0
+            self.h5_dataset.create_earray(parent, name, atom=atom,
+                                          shape=tuple(shape),
+                                          title=info['title'],
+                                          filters=filters,
+                                          expectedrows=expectedrows,
+                                          chunkshape=info['chunkshape'])
+        else:
+            raise ValueError('Unknown array kind {}, should be one of {}'
+                             ''.format(kind, ARRAY_KINDS))
+        return
+
+    def read(self, path, selection=Ellipsis):
+        """Read data from an array."""
+        node = self.h5_dataset.get_node(path)
+        if isinstance(node, tables.Table):
+            selection = _normalize_selection(selection, node.shape)[0]
+            return node.read(selection.start, selection.stop)
+        return node[selection]
+
+    def write(self, path, data, selection=Ellipsis):
+        """Write data into an array, enlarging it if it is an 'EArray'."""
+        node = self.h5_dataset.get_node(path)
+        if isinstance(node, (tables.EArray, tables.Table)):
+            # enlarge array if data is written after its end
+            extdim = node.extdim if isinstance(node, tables.EArray) else 0
+            shape = _selection_shape(selection, node.shape, data.shape)
+            sel = _normalize_selection(selection, shape)
+            if sel[extdim].stop > node.shape[extdim]:
+                new_rows = sel[extdim].stop - node.shape[extdim]
+                if isinstance(node, tables.Table):
+                    node.append(np.zeros((new_rows,), dtype=node.dtype))
+                else:
+                    new_shape = list(node.shape)
+                    new_shape[extdim] = new_rows
+                    node.append(np.zeros(new_shape, dtype=node.dtype))
+            if isinstance(node, tables.Table):
+                node.modify_rows(sel[0].start, sel[0].stop, rows=data)
+                return
+        node[selection] = data
+        return
+
+
+class ChunkedDirectoryBackend(StorageBackend):
+    """Storage backend writing each array chunk in a separate file.
+
+    The store is a directory mirroring the dataset hierarchy: each group is
+    a directory, and each array is a directory containing one file per
+    data chunk, named after the chunk grid indices (`c0.2.1` for instance).
+    Chunks are stored in the `.npy` format, compressed with zlib if the
+    array `complevel` filter option is larger than 0 (other compression
+    libraries are recorded for conversion to HDF5 but zlib is used in the
+    store). Titles, array descriptions and attributes are stored in hidden
+    files of each directory.
+
+    Chunk files are written atomically (temporary file then rename), so that
+    several processes can write simultaneously in the same array as long as
+    they write disjoint sets of chunks (use `get_chunk_selections` to split
+    the work between processes). Writing in the same chunk from several
+    processes, or creating nodes and enlarging arrays concurrently, is not
+    safe.
+
+    :param str path: path of the store directory
+    :param str mode: 'r' (read only), 'r+' (read and write, the store must
+        exist), 'a' (read and write, create the store if it does not exist),
+        or 'w' (create the store, remove existing store).
+    """
+
+    def __init__(self, path, mode='r'):
+        self.path = os.path.abspath(path)
+        self.mode = mode
+        if mode == 'w' and os.path.exists(self.path):
+            shutil.rmtree(self.path)
+        if not os.path.exists(os.path.join(self.path, _GROUP_META)):
+            if mode in ['r', 'r+']:
+                raise FileNotFoundError('No chunked directory store found at'
+                                        ' {}'.format(self.path))
+            os.makedirs(self.path, exist_ok=True)
+            self._write_meta(os.path.join(self.path, _GROUP_META),
+                             {'title': ''})
+        return
+
+    def walk(self):
+        """Iterate over the nodes of the store, parents before children."""
+        for dirpath, dirnames, filenames in os.walk(self.path):
+            dirnames.sort()
+            path = '/' + os.path.relpath(dirpath, self.path).replace(os.sep,
+                                                                     '/')
+            if path == '/.':
+                path = '/'
+            if _ARRAY_META in filenames:
+                # array nodes have no children
+                dirnames[:] = []
+                yield path, False
+            elif _GROUP_META in filenames:
+                yield path, True
+
+    def get_title(self, path):
+        """Return the title of a group."""
+        return self._read_meta(self._dir(path), _GROUP_META)['title']
+
+    def create_group(self, path, title=''):
+        """Create a group, its parent group must exist."""
+        self._check_writable()
+        dirpath = self._dir(path)
+        if path != '/':
+            os.mkdir(dirpath)
+        self._write_meta(os.path.join(dirpath, _GROUP_META), {'title': title})
+        return
+
+    def get_attributes(self, path):
+        """Return the user attributes of a node as a dictionary."""
+        attrs_file = os.path.join(self._dir(path), _ATTRS_FILE)
+        if not os.path.exists(attrs_file):
+            return dict()
+        with open(attrs_file, 'rb') as f:
+            return pickle.load(f)
+
+    def set_attributes(self, path, attributes):
+        """Add a dictionary of attributes to the attributes of a node."""
+        self._check_writable()
+        attrs = self.get_attributes(path)
+        attrs.update(attributes)
+        self._atomic_write(os.path.join(self._dir(path), _ATTRS_FILE),
+                           pickle.dumps(attrs))
+        return
+
+    def get_array_info(self, path):
+        """Return the info dictionary of an array (see class doc)."""
+        info = self._read_meta(self._dir(path), _ARRAY_META)
+        info['dtype'] = np.lib.format.descr_to_dtype(info['dtype'])
+        return info
+
+    def create_array(self, path, info):
+        """Create an array with no data from an info dictionary."""
+        self._check_writable()
+        if info['kind'] not in ARRAY_KINDS:
+            raise ValueError('Unknown array kind {}, should be one of {}'
+                             ''.format(info['kind'], ARRAY_KINDS))
+        info = dict(info)
+        info['shape'] = tuple(int(n) for n in info['shape'])
+        if info['chunkshape'] is None:
+            # contiguous array: one single chunk
+            chunkshape = tuple(max(n, 1) for n in info['shape'])
+        else:
+            info['chunkshape'] = tuple(int(c) for c in info['chunkshape'])
+            chunkshape = info['chunkshape']
+        info['store_chunkshape'] = chunkshape
+        info['dtype'] = np.lib.format.dtype_to_descr(np.dtype(info['dtype']))
+        dirpath = self._dir(path)
+        os.mkdir(dirpath)
+        self._write_meta(os.path.join(dirpath, _ARRAY_META), info)
+        return
+
+    def read(self, path, selection=Ellipsis):
+        """Read data from an array."""
+        info = self.get_array_info(path)
+        sel = _normalize_selection(selection, info['shape'])
+        out = np.zeros([s.stop - s.start for s in sel], dtype=info['dtype'])
+        for chunk_index, chunk_sel in self._iter_chunks(info, sel):
+            chunk = self._read_chunk(path, info, chunk_index)
+            if chunk is None:
+                continue
+            src, dst = _chunk_overlap(chunk_sel, sel, chunk.shape)
+            out[dst] = chunk[src]
+        if len(info['shape']) == 0:
+            return out[()]
+        return out
+
+    def write(self, path, data, selection=Ellipsis):
+        """Write data into an array, enlarging it if it is an 'EArray'.
+
+        Chunks entirely covered by `selection` are written without being
+        read, others are read, updated and written back.
+        """
+        self._check_writable()
+        info = self.get_array_info(path)
+        data = np.asarray(data, dtype=info['dtype'])
+        shape = _selection_shape(selection, info['shape'], data.shape)
+        sel = _normalize_selection(selection, shape)
+        data = data.reshape([s.stop - s.start for s in sel])
+        if shape != info['shape']:
+            extdim = 0 if info['kind'] == 'Table' else info['extdim']
+            if extdim is None or any(
+                    shape[i] != info['shape'][i] for i in range(len(shape))
+                    if i != extdim):
+                raise ValueError('Selection {} is out of the bounds of array'
+                                 ' {} of shape {}.'.format(selection, path,
+                                                           info['shape']))
+            self._set_shape(path, shape)
+            info['shape'] = shape
+        for chunk_index, chunk_sel in self._iter_chunks(info, sel):
+            chunk_shape = tuple(s.stop - s.start for s in chunk_sel)
+            src, dst = _chunk_overlap(chunk_sel, sel, chunk_shape)
+            if all((s.start == 0) and (s.stop == n)
+                   for s, n in zip(src, chunk_shape)):
+                chunk = data[dst]
+            else:
+                chunk = np.zeros(chunk_shape, dtype=info['dtype'])
+                old_chunk = self._read_chunk(path, info, chunk_index)
+                if old_chunk is not None:
+                    chunk[tuple(slice(0, n) for n in old_chunk.shape)] = \
+                        old_chunk
+                chunk[src] = data[dst]
+            self._write_chunk(path, info, chunk_index, chunk)
+        return
+
+    def write_field(self, path, data, selection=Ellipsis):
+        """Write a block of a SampleData field array.
+
+        SampleData fields are stored transposed to comply with the Paraview
+        ordering conventions. This method applies the transpositions recorded
+        in the field attributes to the block and selection before writing
+        them, so that they can be expressed with the ordering used by
+        `SampleData.get_field`.
+
+        :param str path: path of the field array
+        :param data: the field block to write
+        :param selection: a slice, or tuple of slices, of the field (as
+            returned by `SampleData.get_field`) in which data is written.
+        """
+        attributes = self.get_attributes(path)
+        transpose_indices = attributes.get('transpose_indices', None)
+        transpose_components = attributes.get('transpose_components', None)
+        if (transpose_indices is None) and (transpose_components is None):
+            self.write(path, data, selection)
+            return
+        info = self.get_array_info(path)
+        data = np.asarray(data)
+        if transpose_indices is not None:
+            shape = tuple(info['shape'][list(transpose_indices).index(d)]
+                          for d in range(len(info['shape'])))
+        else:
+            shape = info['shape']
+        sel = _normalize_selection(selection, shape)
+        data = data.reshape([s.stop - s.start for s in sel])
+        if transpose_components is not None:
+            if (sel[-1].start != 0) or (sel[-1].stop != shape[-1]):
+                raise ValueError('Blocks of tensor fields must contain all'
+                                 ' the field components.')
+            data = data[..., np.argsort(transpose_components)]
+        if transpose_indices is not None:
+            sel = tuple(sel[i] for i in transpose_indices)
+            data = data.transpose(transpose_indices)
+        self.write(path, data, sel)
+        return
+
+    def get_chunk_selections(self, path):
+        """Return the list of selections of each chunk of an array.
+
+        Use this list to distribute the writing of an array between
+        independent processes.
+        """
+        info = self.get_array_info(path)
+        sel = _normalize_selection(Ellipsis, info['shape'])
+        return [chunk_sel for _, chunk_sel in self._iter_chunks(info, sel)]
+
+    def _dir(self, path):
+        """Return the directory of a node of the store."""
+        return os.path.join(self.path, *[p for p in path.split('/') if p])
+
+    def _check_writable(self):
+        if self.mode == 'r':
+            raise PermissionError('Chunked directory store {} is opened in'
+                                  ' read only mode.'.format(self.path))
+
+    def _set_shape(self, path, shape):
+        info = self._read_meta(self._dir(path), _ARRAY_META)
+        info['shape'] = tuple(int(n) for n in shape)
+        self._write_meta(os.path.join(self._dir(path), _ARRAY_META), info)
+
+    @staticmethod
+    def _read_meta(dirpath, metafile):
+        with open(os.path.join(dirpath, metafile), 'r') as f:
+            return ast.literal_eval(f.read())
+
+    def _write_meta(self, filepath, meta):
+        self._atomic_write(filepath, repr(meta).encode('utf-8'))
+
+    @staticmethod
+    def _atomic_write(filepath, content):
+        """Write a file through a temporary file renamed at the end."""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(filepath),
+                                        prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    @staticmethod
+    def _iter_chunks(info, sel):
+        """Iterate over the chunks intersecting a normalized selection."""
+        shape = info['shape']
+        chunkshape = info['store_chunkshape']
+        ranges = []
+        for s, c, n in zip(sel, chunkshape, shape):
+            if s.stop <= s.start:
+                return
+            ranges.append(range(s.start // c, (s.stop - 1) // c + 1))
+        for chunk_index in itertools.product(*ranges):
+            chunk_sel = tuple(slice(i * c, min((i + 1) * c, n))
+                              for i, c, n in zip(chunk_index, chunkshape,
+                                                 shape))
+            yield chunk_index, chunk_sel
+
+    def _chunk_file(self, path, chunk_index):
+        name = 'c' + '.'.join([str(i) for i in chunk_index])
+        return os.path.join(self._dir(path), name)
+
+    def _read_chunk(self, path, info, chunk_index):
+        """Read a chunk file, return `None` if it has not been written."""
+        chunk_file = self._chunk_file(path, chunk_index)
+        if not os.path.exists(chunk_file):
+            return None
+        with open(chunk_file, 'rb') as f:
+            content = f.read()
+        if info['filters'].get('complevel', 0) > 0:
+            content = zlib.decompress(content)
+        return np.lib.format.read_array(io.BytesIO(content),
+                                        allow_pickle=False)
+
+    def _write_chunk(self, path, info, chunk_index, chunk):
+        buffer = io.BytesIO()
+        np.lib.format.write_array(buffer, np.ascontiguousarray(chunk),
+                                  allow_pickle=False)
+        content = buffer.getvalue()
+        complevel = info['filters'].get('complevel', 0)
+        if complevel > 0:
+            content = zlib.compress(content, complevel)
+        self._atomic_write(self._chunk_file(path, chunk_index), content)
+
+
+def convert_storage(src, dst):
+    """Copy all the content of a storage backend into another one.
+
+    Groups and arrays are created in the destination with the same titles,
+    attributes, array kinds, chunkshapes and compression settings. Data is
+    copied by blocks of chunks to limit memory usage.
+
+    :param StorageBackend src: backend to copy
+    :param StorageBackend dst: backend receiving the copy, must be empty.
+    """
+    for path, is_group in src.walk():
+        if is_group:
+            dst.create_group(path, title=src.get_title(path))
+        else:
+            info = src.get_array_info(path)
+            dst.create_array(path, info)
+            for block in _iter_blocks(info):
+                dst.write(path, src.read(path, block), block)
+        dst.set_attributes(path, src.get_attributes(path))
+    return
+
+
+def _iter_blocks(info):
+    """Iterate over blocks of chunks of an array, along its first axis."""
+    shape = info['shape']
+    if len(shape) == 0:
+        yield Ellipsis
+        return
+    axis = info['extdim'] if info['extdim'] is not None else 0
+    row_size = info['dtype'].itemsize * int(np.prod(shape)) // max(
+        shape[axis], 1)
+    step = max(1, CONVERSION_BLOCK_SIZE // max(row_size, 1))
+    if info['chunkshape'] is not None:
+        c = info['chunkshape'][axis]
+        step = max(c, (step // c) * c)
+    for start in range(0, shape[axis], step):
+        block = [slice(0, n) for n in shape]
+        block[axis] = slice(start, min(start + step, shape[axis]))
+        yield tuple(block)
+
+
+def _filters_from_options(options):
+    """Return a :py:class:`tables.Filters` from a compression dictionary."""
+    options = dict(options)
+    if 'checksum' in options:
+        options['fletcher32'] = options.pop('checksum')
+    return tables.Filters(**options)
+
+
+def _normalize_selection(selection, shape):
+    """Return a selection as a tuple of slices with explicit bounds."""
+    if selection is Ellipsis:
+        selection = ()
+    elif not isinstance(selection, tuple):
+        selection = (selection,)
+    if len(selection) > len(shape):
+        raise ValueError('Selection {} has more dimensions than array shape'
+                         ' {}'.format(selection, shape))
+    sel = []
+    for i, n in enumerate(shape):
+        s = selection[i] if i < len(selection) else slice(None)
+        if not isinstance(s, slice) or s.step not in [None, 1]:
+            raise ValueError('Only contiguous slices are supported as'
+                             ' selections, got {}'.format(s))
+        start, stop, _ = s.indices(n)
+        sel.append(slice(start, max(start, stop)))
+    return tuple(sel)
+
+
+def _selection_shape(selection, shape, data_shape):
+    """Return the array shape needed to write data in selection.
+
+    Selections whose stop exceeds the array shape (or is `None`, for empty
+    enlargeable arrays) enlarge the array to fit the written data.
+    """
+    if selection is Ellipsis:
+        selection = ()
+    elif not isinstance(selection, tuple):
+        selection = (selection,)
+    new_shape = list(shape)
+    for i, s in enumerate(selection):
+        start = s.start or 0
+        if i < len(data_shape):
+            new_shape[i] = max(shape[i], start + data_shape[i])
+    return tuple(new_shape)
+
+
+def _chunk_overlap(chunk_sel, sel, chunk_shape):
+    """Return the overlap of a chunk and a selection.
+
+    :return: the overlap as selections of the chunk array and of the
+        selection data array.
+    """
+    src, dst = [], []
+    for c, s, n in zip(chunk_sel, sel, chunk_shape):
+        start = max(c.start, s.start)
+        stop = min(c.start + n, s.stop)
+        src.append(slice(start - c.start, stop - c.start))
+        dst.append(slice(start - s.start, stop - s.start))
+    return tuple(src), tuple(dst)
@@ -0,0 +1,62 @@
+import unittest
+import numpy as np
+from pymicro.core.features import SampleWithFeatures
+
+
+class SampleWithFeaturesTests(unittest.TestCase):
+
+    def setUp(self):
+        # three separated blobs in a binary mask
+        self.mask = np.zeros((20, 16, 12), dtype=np.uint8)
+        self.mask[2:6, 3:9, 1:5] = 1
+        self.mask[9:17, 2:5, 6:11] = 1
+        self.mask[12:18, 10:15, 2:7] = 1
+        self.mask[14, 12, 7] = 1
+
+    def check_geometry(self, sample, ids):
+        self.assertEqual(sample.get_ids().tolist(), ids)
+        for feature in sample.features.read():
+            if feature['id'] not in sample.get_ids_from_map():
+                continue
+            self.assertAlmostEqual(feature['volume'],
+                                   sample.compute_volume(feature['id']),
+                                   places=5)
+            self.assertTrue(np.allclose(feature['center'],
+                                        sample.compute_center(feature['id']),
+                                        atol=1e-5))
+            self.assertTrue(np.array_equal(
+                feature['bounding_box'],
+                sample.compute_bounding_box(feature['id'])))
+
+    def test_segment_features(self):
+        """Test the segmentation and geometry of the features."""
+        sample = SampleWithFeatures(name='test_features', autodelete=True,
+                                    overwrite_hdf5=True)
+        sample.set_mask(self.mask, voxel_size=0.5)
+        n = sample.segment_features('mask', block_shape=(7, 16, 12))
+        self.assertEqual(n, 3)
+        self.assertEqual(sample.get_number_of_features(), 3)
+        self.check_geometry(sample, [1, 2, 3])
+        # the table is only updated for the features already in it
+        feature_map = sample.get_feature_map()
+        feature_map[2:8, 3:9, 1:5] = 1
+        sample.set_feature_map(feature_map)
+        sample.remove_features_from_table([3])
+        row = np.zeros(1, dtype=sample.features.dtype)
+        row['id'] = 7
+        row['volume'] = 2.
+        sample.features.append(row)
+        sample.features.flush()
+        sample.compute_geometry(block_shape=(5, 8, 12))
+        self.check_geometry(sample, [1, 2, 7])
+        self.assertEqual(sample.get_volumes([7]).tolist(), [2.])
+        self.assertAlmostEqual(sample.get_volumes([1])[0],
+                               6 * 6 * 4 * 0.5 ** 3)
+        # the table is rebuilt from the feature map
+        sample.compute_geometry(overwrite_table=True)
+        self.check_geometry(sample, [1, 2, 3])
+        del sample
+
+
+if __name__ == '__main__':
+    unittest.main()
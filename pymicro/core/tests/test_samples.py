@@ -2,6 +2,7 @@ import unittest
 import os
 import numpy as np
 import math
+import h5py
 from tables import IsDescription, Int32Col, Float32Col
 from pymicro.core.samples import SampleData
 from BasicTools.Containers.ConstantRectilinearMesh import ConstantRectilinearMesh
@@ -55,6 +56,13 @@ class TestDerivedClass(SampleData):
                                     }
         return minimal_content_index_dic, minimal_content_type_dic
 
+def box_sum_kernel(block, field):
+    """Sum of the values of the 3x3x3 neighbourhood of each voxel."""
+    box = sum(np.roll(field, (i, j, k), axis=(0, 1, 2))
+              for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1))
+    return {'box_sum': box}, field[block.core].sum()
+
+
 class SampleDataTests(unittest.TestCase):
 
     def setUp(self):
@@ -301,6 +309,141 @@ class SampleDataTests(unittest.TestCase):
         del sample
         self.assertTrue(not os.path.exists(self.filename+'.h5'))
 
+    def test_add_external_node(self):
+        """Test dataset assembly by linking nodes of other datasets."""
+        src_filename = self.filename + '_src'
+        sample = SampleData(filename=src_filename, overwrite_hdf5=True)
+        sample.add_image_from_field(field_array=self.image,
+                                    fieldname='test_image_field',
+                                    imagename='test_image', indexname='image')
+        sample.add_field(gridname='image', fieldname='test_tensor',
+                         array=self.tensor_field, indexname='tensor9')
+        del sample
+        sample = SampleData(filename=self.filename, overwrite_hdf5=True)
+        # link a whole image group
+        sample.add_external_node(src_filename, 'image')
+        self.assertTrue(np.all(sample['test_image_field'] == self.image))
+        self.assertTrue(np.all(sample['tensor9'] == self.tensor_field))
+        # link a field in an existing grid with a new name
+        sample.add_external_node(src_filename, 'test_image_field',
+                                 location='image', name='linked_field',
+                                 indexname_prefix='linked_')
+        self.assertTrue(np.all(sample['linked_field'] == self.image))
+        self.assertEqual(sample.get_attribute('parent_grid_path',
+                                              'linked_field'), '/test_image')
+        with self.assertRaises(ValueError):
+            sample.add_external_node(src_filename, 'image', name='image_2')
+        # check that no data has been copied and XDMF content
+        del sample
+        with h5py.File(self.filename + '.h5', 'r') as h5:
+            self.assertTrue(h5['/test_image/linked_field'].is_virtual)
+        sample = SampleData(filename=self.filename, autodelete=True)
+        self.assertTrue(np.all(sample['tensor9'] == self.tensor_field))
+        sample.write_xdmf()
+        with open(self.filename + '.xdmf', 'r') as f:
+            self.assertTrue('linked_field' in f.read())
+        del sample
+        os.remove(src_filename + '.h5')
+        os.remove(src_filename + '.xdmf')
+
+    def test_field_time_serie(self):
+        """Test time serie fields stored in enlargeable arrays."""
+        sample = SampleData(filename=self.filename, autodelete=True,
+                            overwrite_hdf5=True)
+        sample.add_image_from_field(field_array=self.image,
+                                    fieldname='test_image_field',
+                                    imagename='test_image', indexname='image')
+        steps = np.random.rand(3, *self.image.shape, 3)
+        sample.add_field_time_serie('image', 'displacement', steps[:2],
+                                    time=[0., 1.], indexname='U')
+        sample.append_field_time_step('U', steps[2], 2.5)
+        with self.assertRaises(ValueError):
+            sample.append_field_time_step('U', steps[2], 2.)
+        self.assertEqual(sample.get_attribute('time_list', 'image'),
+                         [0., 1., 2.5])
+        self.assertEqual(sample.get_field('U').shape, steps.shape)
+        self.assertTrue(np.allclose(sample.get_field_time_step('U', time=1.),
+                                    steps[1]))
+        self.assertTrue(np.allclose(
+            sample.get_field_time_step('U', time_index=2), steps[2]))
+        times, history = sample.get_field_history('U', (1, 2, 3))
+        self.assertTrue(np.allclose(times, [0., 1., 2.5]))
+        self.assertTrue(np.allclose(history, steps[:, 1, 2, 3]))
+        sample.write_xdmf()
+        with open(self.filename + '.xdmf', 'r') as f:
+            self.assertEqual(f.read().count('HyperSlab'), 6)
+        del sample
+        self.assertTrue(not os.path.exists(self.filename+'.h5'))
+
+    def test_memory_map_field(self):
+        """Test fields stored as contiguous memory mapped arrays."""
+        filename = self.filename + '_mmap'
+        sample = SampleData(filename=filename, autodelete=True,
+                            overwrite_hdf5=True)
+        sample.add_image_from_field(
+            field_array=self.image, fieldname='test_image_field',
+            imagename='test_image', indexname='image',
+            compression_options={'memory_map': True})
+        sample.add_field(gridname='image', fieldname='test_tensor',
+                         array=self.tensor_field, indexname='tensor9',
+                         compression_options={'memory_map': True})
+        field = sample.get_field('test_image_field')
+        self.assertIsInstance(field, np.memmap)
+        self.assertFalse(field.flags.writeable)
+        self.assertTrue(np.all(field == self.image))
+        self.assertTrue(np.all(sample.get_field('tensor9')
+                               == self.tensor_field))
+        with self.assertRaises(ValueError):
+            sample.add_field(gridname='image', fieldname='compressed',
+                             array=self.image,
+                             compression_options={'memory_map': True,
+                                                  'complib': 'zlib',
+                                                  'complevel': 1})
+        # compressing the field removes the memory map
+        sample.set_chunkshape_and_compression(
+            'test_image_field', compression_options={'complib': 'zlib',
+                                                     'complevel': 1})
+        field = sample.get_field('test_image_field')
+        self.assertNotIsInstance(field, np.memmap)
+        self.assertTrue(np.all(field == self.image))
+        del sample
+        self.assertTrue(not os.path.exists(filename + '.h5'))
+
+    def test_fast_open(self):
+        """Test opening a dataset without loading its index and model."""
+        filename = self.filename + '_fast'
+        sample = SampleData(filename=filename, overwrite_hdf5=True)
+        sample.add_image_from_field(
+            field_array=self.image, fieldname='test_image_field',
+            imagename='test_image', indexname='image')
+        sample.add_alias('field_alias', indexname='test_image_test_image_field')
+        del sample
+        xdmf_mtime = os.path.getmtime(filename + '.xdmf')
+        sample = SampleData(filename=filename, fast_open=True)
+        self.assertFalse(sample.content_index.loaded)
+        self.assertTrue(np.all(sample['field_alias'] == self.image))
+        self.assertTrue(np.all(sample.get_field('test_image_field')
+                               == self.image))
+        # single lookups do not load the whole index
+        self.assertFalse(sample.content_index.loaded)
+        del sample
+        # the XDMF file is not rewritten if the structure did not change
+        self.assertEqual(os.path.getmtime(filename + '.xdmf'), xdmf_mtime)
+        sample = SampleData(filename=filename, fast_open=True)
+        sample.add_data_array('/', 'new_array', np.arange(3))
+        del sample
+        # the index is only read lazily with fast_open
+        sample = SampleData(filename=filename)
+        self.assertIs(type(sample.content_index), dict)
+        self.assertIn('test_image_test_image_field', sample.aliases)
+        del sample
+        sample = SampleData(filename=filename, fast_open=True,
+                            autodelete=True)
+        self.assertTrue(np.all(sample['new_array'] == np.arange(3)))
+        self.assertIn('image', sample.content_index)
+        del sample
+        self.assertTrue(not os.path.exists(filename + '.h5'))
+
     def test_mesh_group(self):
         """Test storage and recovery of mesh data via SampleData."""
         # SampleData object Instantiation
@@ -637,3 +780,92 @@ class SampleDataTests(unittest.TestCase):
         self.assertEqual(field2.shape, (11 * 11 * 11,))
         self.assertEqual(field1.ravel()[37], field2.ravel()[37])
         del sample
+
+    def test_process_image_blocks(self):
+        """Test the processing of an image by blocks with halos."""
+        field = np.random.rand(11, 9, 7)
+        tensor = np.random.rand(11, 9, 7, 6)
+        sample = SampleData(filename='test_blocks', verbose=False,
+                            autodelete=True, overwrite_hdf5=True)
+        sample.add_image_from_field(field, 'field', imagename='image',
+                                    location='/')
+        sample.add_field('image', 'tensor', tensor)
+        sample.set_image_field_block('tensor', 2 * tensor[2:5, :, 3:],
+                                     (slice(2, 5), slice(None), slice(3, 7)))
+        tensor[2:5, :, 3:] *= 2
+        self.assertTrue(np.allclose(sample.get_field('tensor'), tensor))
+        sums = sample.process_image_blocks(
+            ['field'], box_sum_kernel, outputs={'box_sum': float},
+            block_shape=(4, 5, 3), halo=1, halo_fill=0.)
+        self.assertEqual(len(sums), 3 * 2 * 3)
+        self.assertAlmostEqual(sum(sums), field.sum())
+        padded = np.pad(field, 1)
+        box = sum(np.roll(padded, (i, j, k), axis=(0, 1, 2))
+                  for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1))
+        self.assertTrue(np.allclose(sample.get_field('box_sum'),
+                                    box[1:-1, 1:-1, 1:-1]))
+        del sample
+
+    def test_segment_binary_image(self):
+        """Test the labelling of a binary image by blocks."""
+        from scipy import ndimage
+        binary = ndimage.gaussian_filter(np.random.rand(30, 25, 20), 1.5)
+        binary = binary > np.percentile(binary, 70)
+        sample = SampleData(filename='test_labels', verbose=False,
+                            autodelete=True, overwrite_hdf5=True)
+        sample.add_image_from_field(binary.astype(np.uint8), 'binary',
+                                    imagename='image', location='/')
+        for structure in [None, np.ones((3, 3, 3))]:
+            labels, n = ndimage.label(binary, structure=structure)
+            stats = sample.label_image_field('binary', 'labels',
+                                             structure=structure,
+                                             block_shape=(8, 7, 6))
+            self.assertTrue(np.all(sample.get_field('labels') == labels))
+            self.assertEqual(len(stats['ids']), n)
+            self.assertTrue(np.all(stats['sizes']
+                                   == np.bincount(labels.ravel())[1:]))
+            centers = ndimage.center_of_mass(binary, labels, stats['ids'])
+            self.assertTrue(np.allclose(stats['centers'], centers))
+        self.assertFalse(sample.__contains__('labels_provisional'))
+        del sample
+
+    def test_resample_image_group(self):
+        """Test the blockwise resampling of an image group."""
+        from scipy.interpolate import RegularGridInterpolator
+        field = np.random.rand(13, 11, 7)
+        labels = np.random.randint(0, 4, (12, 9, 6)).astype(np.int32)
+        sample = SampleData(filename='test_resample', verbose=False,
+                            autodelete=True, overwrite_hdf5=True)
+        sample.add_image_from_field(field, 'field', imagename='image',
+                                    location='/')
+        sample.add_image_from_field(labels, 'labels', imagename='labels_image',
+                                    location='/')
+        # compare to a scipy interpolation of the whole field
+        centers = [np.arange(n) + 0.5 for n in field.shape]
+        new_centers = [np.arange(0.35, n, 0.7) for n in field.shape]
+        points = np.stack([x.ravel() for x in np.meshgrid(*new_centers,
+                                                           indexing='ij')], -1)
+        for method in ['nearest', 'linear']:
+            sample.resample_image_group(0.7, location='image',
+                                        new_location='image_' + method,
+                                        method=method, memory_budget=10000)
+            interp = RegularGridInterpolator(centers, field, method=method,
+                                             bounds_error=False,
+                                             fill_value=0)
+            ref = interp(points).reshape([len(c) for c in new_centers])
+            resampled = sample.get_field('image_%s_field_resampled' % method)
+            self.assertTrue(np.allclose(resampled, ref))
+        with self.assertRaises(ValueError):
+            sample.resample_image_group(0.7, location='image',
+                                        method='cubic')
+        # label maps with a majority vote
+        sample.resample_image_group(3., location='labels_image',
+                                    label_method='majority', in_place=True,
+                                    memory_budget=500)
+        resampled = sample.get_field('labels')
+        self.assertEqual(resampled.shape, (4, 3, 2))
+        blocks = labels.reshape(4, 3, 3, 3, 2, 3).transpose(0, 2, 4, 1, 3, 5)
+        for index in np.ndindex(4, 3, 2):
+            counts = np.bincount(blocks[index].ravel())
+            self.assertEqual(resampled[index], np.argmax(counts))
+        del sample
@@ -0,0 +1,104 @@
+import unittest
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pymicro.core.samples import SampleData
+from pymicro.core.storage import (ChunkedDirectoryBackend, HDF5Backend,
+                                  convert_storage)
+from config import PYMICRO_EXAMPLES_DATA_DIR
+
+
+def write_block(args):
+    """Write a block of a field in a store, run in a separate process."""
+    store_path, field_path, selection, value = args
+    shape = tuple(s.stop - s.start for s in selection)
+    with ChunkedDirectoryBackend(store_path, mode='r+') as store:
+        store.write_field(field_path, np.full(shape, value, dtype=np.int32),
+                          selection)
+    return value
+
+
+class StorageTests(unittest.TestCase):
+
+    def setUp(self):
+        print('testing the storage backends')
+        self.filename = os.path.join(PYMICRO_EXAMPLES_DATA_DIR,
+                                     'test_storage')
+        self.store_path = self.filename + '_store'
+        self.image = np.random.randint(0, 100, (40, 30, 20)).astype(np.int32)
+        self.tensor_field = np.random.rand(40, 30, 20, 6)
+
+    def tearDown(self):
+        if os.path.exists(self.store_path):
+            shutil.rmtree(self.store_path)
+
+    def test_hdf5_round_trip(self):
+        """Test conversion of a dataset to a chunked store and back."""
+        sample = SampleData(filename=self.filename, autodelete=True,
+                            overwrite_hdf5=True)
+        sample.add_image_from_field(self.image, 'image_field',
+                                    imagename='image', location='/')
+        sample.add_field('image', 'tensor', self.tensor_field,
+                         chunkshape=(10, 15, 20, 6),
+                         compression_options={'complib': 'zlib',
+                                              'complevel': 3})
+        sample.add_field_time_serie('image', 'serie', self.image, 0.)
+        sample.add_string_array('strings', location='/',
+                                data=['abc', 'de'])
+        sample.to_chunked_store(self.store_path)
+        with self.assertRaises(FileExistsError):
+            sample.to_chunked_store(self.store_path)
+        sample2 = SampleData.from_chunked_store(
+            self.store_path, self.filename + '_2', overwrite=True,
+            autodelete=True)
+        self.assertTrue(np.all(sample2.get_field('image_field')
+                               == self.image))
+        self.assertTrue(np.allclose(sample2.get_field('tensor'),
+                                    self.tensor_field))
+        node = sample2.get_node('tensor')
+        self.assertEqual(node.chunkshape,
+                         sample.get_node('tensor').chunkshape)
+        self.assertEqual(node.filters.complevel, 3)
+        self.assertEqual(sample2.get_attribute('field_dimensionality',
+                                               'tensor'), 'Tensor6')
+        self.assertEqual(sample2.content_index, sample.content_index)
+        self.assertEqual(sample2.get_node('strings').read().tolist(),
+                         [b'abc', b'de'])
+        # time series remain enlargeable
+        sample2.append_field_time_step('serie', self.image, 1.)
+        self.assertEqual(sample2.get_field('serie').shape,
+                         (2,) + self.image.shape)
+        del sample2
+        del sample
+
+    def test_concurrent_chunk_writes(self):
+        """Test writing disjoint chunks of a field from several processes."""
+        sample = SampleData(filename=self.filename, autodelete=True,
+                            overwrite_hdf5=True)
+        sample.add_image_from_field(self.image, 'image_field',
+                                    imagename='image', location='/')
+        sample.add_field('image', 'labels', self.image,
+                         chunkshape=(20, 15, 10))
+        sample.to_chunked_store(self.store_path)
+        del sample
+        # the field is stored transposed: chunks of 10 rows in memory order
+        jobs = [(self.store_path, '/image/labels',
+                 (slice(10 * i, 10 * (i + 1)), slice(0, 30), slice(0, 20)),
+                 i + 1) for i in range(4)]
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(list(executor.map(write_block, jobs)),
+                             [1, 2, 3, 4])
+        with ChunkedDirectoryBackend(self.store_path) as store, \
+                HDF5Backend(self.filename + '_2.h5', mode='w') as h5:
+            convert_storage(store, h5)
+        sample = SampleData(filename=self.filename + '_2', autodelete=True)
+        labels = sample.get_field('labels')
+        for i in range(4):
+            self.assertTrue(np.all(labels[10 * i:10 * (i + 1)] == i + 1))
+        self.assertTrue(np.all(sample.get_field('image_field') == self.image))
+        del sample
+
+
+if __name__ == '__main__':
+    unittest.main()
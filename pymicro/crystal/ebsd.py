@@ -116,6 +116,7 @@ class OimScan:
         self.init_arrays()
         self.grain_ids = None
         self.god = None
+        self.kam = None
         self.seg_params = {'tol': 5., 'min_ci': 0.2, 'min_size': 0.}
 
     def __repr__(self):
@@ -659,10 +660,12 @@ class OimScan:
         neighbors added to the list of candidates. When no more candidates are
         present, the next pixel is evaluated and a new grain is created.
 
-        .. warning::
-
-          This function does not account yet for multiple phases. Grains should
-          be created separately for each crystallographic phase.
+        The region growing is computed at once as the connected components of
+        the graph linking neighboring pixels with a misorientation lower
+        than `tol`, grains are numbered in the scan order of their first pixel.
+        Two neighboring pixels must belong to the same phase to be part of the
+        same grain, their misorientation is computed with the symmetry of
+        this phase.
 
         The segmentation parameters can be tuned using the following keywords:
          * 'tol': misorientation tolerance in degrees.
@@ -693,50 +696,49 @@ class OimScan:
         grain_ids[self.ci <= seg_params['min_ci']] = 0
         # grains with phase 0 are also not taken into account
         grain_ids[self.phase == 0] = 0
-
-        n_grains = 0
-        progress = 0
-        #phase_start = self.phase_list[0].phase_id
-        for j in range(self.rows):
-            for i in range(self.cols):
-                if grain_ids[i, j] >= 0:
-                    continue  # skip pixel
-                # create new grain with the pixel as seed
-                n_grains += 1
-                # print('segmenting grain %d' % n_grains)
-                grain_ids[i, j] = n_grains
-                candidates = [(i, j)]
-                # apply region growing based on the angle misorientation (strong connectivity)
-                while len(candidates) > 0:
-                    pixel = candidates.pop()
-                    #sym = self.get_phase(phase_start + int(self.phase[pixel])).get_symmetry()
-                    sym = self.get_phase(int(self.phase[pixel])).get_symmetry()
-                    # print('* pixel is {}, euler: {}'.format(pixel, np.degrees(euler[pixel])))
-                    # get orientation of this pixel
-                    o = Orientation.from_euler(np.degrees(self.euler[pixel]))
-                    # look around this pixel
-                    east = (pixel[0] - 1, pixel[1])
-                    north = (pixel[0], pixel[1] - 1)
-                    west = (pixel[0] + 1, pixel[1])
-                    south = (pixel[0], pixel[1] + 1)
-                    neighbors = [east, north, west, south]
-                    # look at unlabeled connected pixels
-                    neighbor_list = [n for n in neighbors if
-                                     0 <= n[0] < self.cols and
-                                     0 <= n[1] < self.rows and
-                                     grain_ids[n] == -1]
-                    # print(' * neighbors list is {}'.format([east, north, west, south]))
-                    for neighbor in neighbor_list:
-                        # check misorientation
-                        o_neighbor = Orientation.from_euler(np.degrees(self.euler[neighbor]))
-                        mis, _, _ = o.disorientation(o_neighbor, crystal_structure=sym)
-                        if mis * 180 / np.pi < seg_params['tol']:
-                            # add to this grain
-                            grain_ids[neighbor] = n_grains
-                            # add to the list of candidates
-                            candidates.append(neighbor)
-                    progress = 100 * np.sum(grain_ids >= 0) / (self.cols * self.rows)
-            print('segmentation progress: {0:.2f} %'.format(progress), end='\r')
+        unassigned = grain_ids < 0
+        symmetries = {phase_id: self.get_phase(int(phase_id)).get_symmetry()
+                      for phase_id in np.unique(self.phase[unassigned])}
+
+        # link neighboring pixels with a small misorientation
+        g = Orientation.Euler2OrientationMatrices(
+            np.degrees(self.euler.reshape((-1, 3))))
+        pixel_ids = np.arange(self.cols * self.rows).reshape(
+            (self.cols, self.rows))
+        tol = np.radians(seg_params['tol'])
+        links = []
+        for sl_a, sl_b in [((slice(None, -1), slice(None)),
+                            (slice(1, None), slice(None))),
+                           ((slice(None), slice(None, -1)),
+                            (slice(None), slice(1, None)))]:
+            pairs = unassigned[sl_a] & unassigned[sl_b] & \
+                    (self.phase[sl_a] == self.phase[sl_b])
+            ids_a = pixel_ids[sl_a][pairs]
+            ids_b = pixel_ids[sl_b][pairs]
+            pair_phase = self.phase[sl_a][pairs]
+            similar = np.zeros(len(ids_a), dtype=bool)
+            for phase_id, sym in symmetries.items():
+                index = np.nonzero(pair_phase == phase_id)[0]
+                for start in range(0, len(index), 2 ** 18):
+                    chunk = index[start:start + 2 ** 18]
+                    mis = Orientation.misorientation_angles(
+                        g[ids_a[chunk]], g[ids_b[chunk]], sym)
+                    similar[chunk] = mis < tol
+            links.append((ids_a[similar], ids_b[similar]))
+        from scipy.sparse import coo_matrix
+        from scipy.sparse.csgraph import connected_components
+        rows = np.concatenate([link[0] for link in links])
+        cols = np.concatenate([link[1] for link in links])
+        graph = coo_matrix((np.ones(len(rows), dtype=np.uint8), (rows, cols)),
+                           shape=(self.cols * self.rows,) * 2)
+        _, components = connected_components(graph, directed=False)
+        components = components.reshape((self.cols, self.rows))
+        # number the grains following the scan order (rows first)
+        scan_components = components.T[unassigned.T]
+        _, first = np.unique(scan_components, return_index=True)
+        new_ids = np.zeros(components.max() + 1, dtype='int')
+        new_ids[scan_components[np.sort(first)]] = np.arange(1, len(first) + 1)
+        grain_ids[unassigned] = new_ids[components[unassigned]]
         # assign grain_ids array to the scan
         self.grain_ids = grain_ids
         # remove small grains if needed
@@ -754,8 +756,7 @@ class OimScan:
         """
         unique_ids, counts = np.unique(self.grain_ids, return_counts=True)
         small_grains = unique_ids[counts < min_size]
-        for grain_id in small_grains:
-            self.grain_ids[self.grain_ids == grain_id] = 0
+        self.grain_ids[np.isin(self.grain_ids, small_grains)] = 0
 
     @staticmethod
     def edax_reference_frame(coord_system_id=2):
@@ -886,6 +887,53 @@ class OimScan:
                 self.god[i, j] = np.degrees(o.disorientation(o_ij, crystal_structure=sym)[0])
         print('GOD computation progress: 100.00 %')
 
+    def compute_kam_map(self, order=1, max_angle=5., exclude_boundaries=True,
+                        min_ci=None):
+        """Create a KAM (kernel average misorientation) map.
+
+        For each pixel, the misorientation angles with its neighbours of the
+        given order are averaged, see `Orientation.compute_kam`. The
+        misorientations are computed in bulk for each phase of the scan, the
+        neighbours in another phase being excluded.
+
+        :param int order: the order of the neighbours.
+        :param float max_angle: the largest misorientation angle in degrees
+            taken into account.
+        :param bool exclude_boundaries: if `True`, the neighbours belonging
+            to another grain are excluded, this needs the grain segmentation.
+        :param float min_ci: the minimum confidence index of the pixels taken
+            into account when the grain boundaries are not excluded (the
+            segmentation parameter by default).
+        :return: the KAM map in degrees.
+        """
+        if exclude_boundaries:
+            if self.grain_ids is None:
+                print('no grain_ids field, please segment your grains first')
+                return None
+            labels = self.grain_ids
+        else:
+            if min_ci is None:
+                min_ci = self.seg_params['min_ci']
+            labels = np.where(self.ci > min_ci, self.phase, 0)
+        # quaternions of the pixel orientations, converted by chunks
+        euler = np.degrees(self.euler.reshape((-1, 3)))
+        q = np.empty((len(euler), 4))
+        for start in range(0, len(euler), 2 ** 18):
+            q[start:start + 2 ** 18] = \
+                Orientation.OrientationMatrices2Quaternions(
+                    Orientation.Euler2OrientationMatrices(
+                        euler[start:start + 2 ** 18]))
+        q = q.reshape((self.cols, self.rows, 4))
+        self.kam = np.zeros_like(self.iq)
+        for phase_id in np.unique(self.phase[labels > 0]):
+            sym = self.get_phase(int(phase_id)).get_symmetry()
+            in_phase = self.phase == phase_id
+            kam = Orientation.compute_kam(
+                q, order=order, max_angle=max_angle,
+                labels=np.where(in_phase, labels, 0), symmetry=sym)
+            self.kam[in_phase] = kam[in_phase]
+        return self.kam
+
     def ang_header(self):
         # compose header
         header = 'HEADER: Start\n'
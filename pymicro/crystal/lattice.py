@@ -452,6 +452,22 @@ class Symmetry(enum.Enum):
             print('moving to FZ, index = %d' % index)
         return g_syms[index]
 
+    def move_rotations_to_FZ(self, g):
+        """Compute the rotation matrices in the Fundamental Zone of a given
+        `Symmetry` instance.
+
+        This is the vectorized counterpart of `move_rotation_to_FZ` for a
+        series of rotations.
+
+        :param g: a (n, 3, 3) array of rotation matrices.
+        :return: a new (n, 3, 3) array of the rotations in the fundamental zone.
+        """
+        syms = self.symmetry_operators()
+        g = np.asarray(g, dtype=float).reshape((-1, 3, 3))
+        # trace(s.g) is the sum of the products of s by g^T
+        traces = np.reshape(np.swapaxes(g, 1, 2), (-1, 9)) @ syms.reshape((-1, 9)).T
+        return np.matmul(syms[np.argmax(traces, axis=1)], g)
+
     def lattice_parameters_number(self):
         """Return the number of parameter associated with a lattice of this
         symmetry.
@@ -12,6 +12,7 @@ orientation:
  * :py:class:`~pymicro.crystal.microstructure.Orientation`
 """
 import numpy as np
+import itertools
 import os
 import vtk
 import h5py
@@ -23,6 +24,9 @@ from pymicro.crystal.lattice import Lattice, Symmetry, CrystallinePhase, Crystal
 from pymicro.crystal.rotation import om2ro, ro2qu, qu2om
 from pymicro.crystal.quaternion import Quaternion
 from pymicro.core.samples import SampleData
+from pymicro.core.blocks import (label_statistics, label_statistics_kernel,
+                                 merge_label_statistics, get_block_shape,
+                                 iter_image_blocks)
 import tables
 from math import atan2, pi
 from tqdm import tqdm
@@ -149,15 +153,23 @@ class Orientation:
         corresponds to euler angle (45, 0, 0)."""
         return Orientation.from_euler((45., 0., 0.))
 
+    @staticmethod
+    def random_euler_angles(n=1):
+        """Draw Euler angles of orientations uniformly distributed in space.
+
+        :param int n: the number of orientations.
+        :return: a (n, 3) array of Euler angles in degrees (Bunge passive
+            convention).
+        """
+        phi1 = np.random.rand(n) * 360.
+        Phi = 180. * np.arccos(2 * np.random.rand(n) - 1) / np.pi
+        phi2 = np.random.rand(n) * 360.
+        return np.stack((phi1, Phi, phi2), axis=1)
+
     @staticmethod
     def random():
         """Create  a random crystal orientation."""
-        from random import random
-        from math import acos
-        phi1 = random() * 360.
-        Phi = 180. * acos(2 * random() - 1) / np.pi
-        phi2 = random() * 360.
-        return Orientation.from_euler([phi1, Phi, phi2])
+        return Orientation.from_euler(Orientation.random_euler_angles()[0])
 
     def ipf_color(self, axis=np.array([0., 0., 1.]), symmetry=Symmetry.cubic, saturate=True):
         """Compute the IPF (inverse pole figure) colour for this orientation.
@@ -326,6 +338,196 @@ class Orientation:
 
         return mean_rods_syms[index_fz]
 
+    @staticmethod
+    def misorientation_angles(g1, g2, symmetry=Symmetry.triclinic,
+                              return_index=False):
+        """Compute the misorientation angles between pairs of orientations.
+
+        This is a vectorized computation of the disorientation angle of
+        `disorientation` for many pairs of orientations sharing the same
+        crystal symmetry.
+
+        :param ndarray g1: a (n, 3, 3) array of orientation matrices.
+        :param ndarray g2: a (n, 3, 3) array of orientation matrices (or a
+            single 3x3 matrix).
+        :param `Symmetry` symmetry: the crystal symmetry.
+        :param bool return_index: if True, also return for each pair the index
+            of the symmetry operator `s` such that `s.g2` is the closest
+            equivalent of `g2` to `g1`.
+        :return: the (n,) array of the misorientation angles in radians (and
+            the array of the symmetry operator indices).
+        """
+        syms = symmetry.symmetry_operators()
+        # the trace of s.g2.g1^T is the sum of the products of s by g1.g2^T,
+        # computed for all the operators with a single matrix product
+        delta = np.matmul(g1, np.swapaxes(g2, -1, -2))
+        traces = np.reshape(delta, (-1, 9)) @ syms.reshape((-1, 9)).T
+        index = np.argmax(traces, axis=1)
+        cw = 0.5 * (traces[np.arange(len(traces)), index] - 1)
+        angles = np.arccos(np.clip(cw, -1., 1.))
+        if return_index:
+            return angles, index
+        return angles
+
+    @staticmethod
+    def compute_mean_orientations(g, labels, symmetry=Symmetry.cubic,
+                                  spread=False, chunk_size=2 ** 18):
+        """Compute the mean orientation of groups of orientations.
+
+        This is the vectorized counterpart of `compute_mean_orientation` to
+        process many groups at once, typically all the pixels of the grains
+        in an orientation map, with a cost proportional to the number of
+        orientations.
+
+        Each orientation is first replaced by its symmetry equivalent
+        closest to a reference orientation of its group (its first member).
+        The aligned orientation matrices are then averaged and the mean is
+        projected on the closest rotation matrix, which is finally moved to
+        the fundamental zone.
+
+        :param ndarray g: a (n, 3, 3) array of orientation matrices.
+        :param ndarray labels: a (n,) array with the group label of each
+            orientation.
+        :param `Symmetry` symmetry: the symmetry used to move orientations
+            to their fundamental zone (cubic by default).
+        :param bool spread: if True, also compute the mean misorientation
+            angle between the orientations of each group and their mean
+            (the grain orientation spread for a grain).
+        :param int chunk_size: number of orientations processed at once.
+        :returns: a tuple with the sorted array of the unique labels, the
+            array of their mean orientation matrices and the array of the
+            orientation spreads in degrees (None if `spread` is False).
+        """
+        g = np.asarray(g, dtype=float).reshape((-1, 3, 3))
+        labels = np.asarray(labels).ravel()
+        ids, first, inverse = np.unique(labels, return_index=True,
+                                        return_inverse=True)
+        inverse = inverse.ravel()
+        counts = np.bincount(inverse, minlength=len(ids))
+        syms = symmetry.symmetry_operators()
+        # first pass: sum of the orientations aligned with the references
+        g_ref = g[first]
+        g_sum = np.zeros((len(ids), 9))
+        for start in range(0, len(g), chunk_size):
+            inv = inverse[start:start + chunk_size]
+            g_chunk = g[start:start + chunk_size]
+            _, index = Orientation.misorientation_angles(
+                g_ref[inv], g_chunk, symmetry, return_index=True)
+            aligned = np.matmul(syms[index], g_chunk).reshape((-1, 9))
+            for c in range(9):
+                g_sum[:, c] += np.bincount(inv, weights=aligned[:, c],
+                                           minlength=len(ids))
+        # closest rotation matrix to the average
+        u, _, vt = np.linalg.svd(g_sum.reshape((-1, 3, 3)))
+        u[:, :, -1] *= np.sign(np.linalg.det(np.matmul(u, vt)))[:, np.newaxis]
+        g_mean = np.matmul(u, vt)
+        # move the mean orientations to the fundamental zone
+        _, index = Orientation.misorientation_angles(
+            np.broadcast_to(np.eye(3), g_mean.shape), g_mean, symmetry,
+            return_index=True)
+        g_mean = np.matmul(syms[index], g_mean)
+        if not spread:
+            return ids, g_mean, None
+        # second pass: misorientation of each orientation with its mean
+        angle_sum = np.zeros(len(ids))
+        for start in range(0, len(g), chunk_size):
+            inv = inverse[start:start + chunk_size]
+            angles = Orientation.misorientation_angles(
+                g_mean[inv], g[start:start + chunk_size], symmetry)
+            angle_sum += np.bincount(inv, weights=angles, minlength=len(ids))
+        return ids, g_mean, np.degrees(angle_sum / counts)
+
+    @staticmethod
+    def compute_kam(q, order=1, max_angle=5., labels=None,
+                    symmetry=Symmetry.cubic, chunk_size=2 ** 18):
+        """Compute the kernel average misorientation of an orientation field.
+
+        The kernel average misorientation (KAM) of a pixel is the mean of the
+        misorientation angles with its neighbours of a given order, the
+        neighbours of order n being the pixels at a distance of n pixels
+        along the grid axes (the perimeter of the square or cube of size
+        2n+1 around the pixel). Misorientations larger than `max_angle` are
+        excluded from the mean, as well as the neighbours with a different
+        label, to exclude the grain boundaries.
+
+        The misorientations are computed in bulk for each neighbour offset,
+        each pair of neighbours being computed once. For a pair of
+        orientations, the cosine of the half misorientation angle with each
+        symmetry operator is the dot product of the quaternion of the
+        operator with the quaternion of the relative rotation, so that all
+        the operators are processed with a single matrix product.
+
+        :param ndarray q: a (nx, ny, 4) or (nx, ny, nz, 4) array of the
+            quaternions of the pixel orientations (see
+            `OrientationMatrices2Quaternions`).
+        :param int order: the order of the neighbours.
+        :param float max_angle: the largest misorientation angle in degrees
+            taken into account.
+        :param ndarray labels: an optional integer field with the shape of
+            the grid (typically a grain map); neighbours with a different
+            label are excluded and pixels with a label lower or equal to 0
+            are skipped.
+        :param `Symmetry` symmetry: the crystal symmetry.
+        :param int chunk_size: number of pixel pairs processed at once.
+        :return: the KAM field in degrees, 0 for the pixels without valid
+            neighbours.
+        """
+        q = np.asarray(q, dtype=float)
+        shape = q.shape[:-1]
+        if order < 1:
+            raise ValueError('the order of the neighbours must be at least 1')
+        if labels is None:
+            labels = np.ones(shape, dtype=np.uint8)
+        labels = np.asarray(labels)
+        syms = Orientation.OrientationMatrices2Quaternions(
+            symmetry.symmetry_operators())
+        # one contiguous array per quaternion component
+        q = np.ascontiguousarray(np.moveaxis(q, -1, 0))
+        cos_max = np.cos(0.5 * np.radians(max_angle))
+        angle_sum = np.zeros(shape)
+        count = np.zeros(shape, dtype=np.int32)
+        # number of rows along the first axis processed at once
+        step = max(1, chunk_size // max(1, int(np.prod(shape[1:]))))
+        for offset in itertools.product(range(-order, order + 1),
+                                        repeat=len(shape)):
+            offset = np.array(offset)
+            # forward offsets of the perimeter only, each pair is seen once
+            nonzero = np.flatnonzero(offset)
+            if np.abs(offset).max() != order or offset[nonzero[0]] < 0:
+                continue
+            for start in range(max(0, -offset[0]),
+                               shape[0] - max(0, offset[0]), step):
+                stop = min(start + step, shape[0] - max(0, offset[0]))
+                sl_a = (slice(start, stop),) + tuple(
+                    slice(max(0, -o), n - max(0, o))
+                    for o, n in zip(offset[1:], shape[1:]))
+                sl_b = tuple(slice(sl.start + o, sl.stop + o)
+                             for sl, o in zip(sl_a, offset))
+                pairs = (labels[sl_a] > 0) & (labels[sl_a] == labels[sl_b])
+                if not np.any(pairs):
+                    continue
+                a = q[(slice(None),) + sl_a][:, pairs]
+                b = q[(slice(None),) + sl_b][:, pairs]
+                # relative rotation: conjugate of a times b
+                dq = np.empty_like(a)
+                dq[0] = np.einsum('ij,ij->j', a, b)
+                dq[1] = a[0] * b[1] - b[0] * a[1] - a[2] * b[3] + a[3] * b[2]
+                dq[2] = a[0] * b[2] - b[0] * a[2] - a[3] * b[1] + a[1] * b[3]
+                dq[3] = a[0] * b[3] - b[0] * a[3] - a[1] * b[2] + a[2] * b[1]
+                cosines = syms @ dq
+                cos_half = np.maximum(cosines.max(axis=0),
+                                      -cosines.min(axis=0))
+                kept = cos_half >= cos_max
+                angles = np.where(kept, 2 * np.degrees(
+                    np.arccos(np.minimum(cos_half, 1.))), 0.)
+                for sl in [sl_a, sl_b]:
+                    # basic slicing gives views of the output fields
+                    angle_sum[sl][pairs] += angles
+                    count[sl][pairs] += kept
+        kam = np.zeros(shape)
+        np.divide(angle_sum, count, out=kam, where=count > 0)
+        return kam
+
     @staticmethod
     def fzDihedral(rod, n):
         """check if the given Rodrigues vector is in the fundamental zone.
@@ -688,6 +890,41 @@ class Orientation:
             omega_1, omega_2))
         return omega_1, omega_2
 
+    @staticmethod
+    def compute_dct_omega_angles(g, hkl_planes, lambda_keV):
+        """Compute the omega angles which satisfy the Bragg condition for
+        many orientations and lattice planes.
+
+        This is the vectorized counterpart of `dct_omega_angles`: the
+        trigonometric equation is solved for all the (orientation, plane)
+        pairs at once.
+
+        :param ndarray g: a (n, 3, 3) array of orientation matrices.
+        :param list hkl_planes: a list of `HklPlane` instances.
+        :param float lambda_keV: The X-rays energy expressed in keV
+        :return: a (n, n_hkl, 2) array with the two values of the rotation
+            angle around the vertical axis (in degrees) for each pair, NaN
+            where the Bragg condition cannot be fulfilled.
+        """
+        g = np.asarray(g, dtype=float).reshape((-1, 3, 3))
+        lambda_nm = 1.2398 / lambda_keV
+        Gc = np.array([hkl.scattering_vector() for hkl in hkl_planes])
+        d_spacings = np.array([hkl.interplanar_spacing() for hkl in hkl_planes])
+        with np.errstate(invalid='ignore'):
+            theta = np.arcsin(lambda_nm / (2 * d_spacings))
+        # components of the scattering vectors in the sample frame (n, n_hkl, 3)
+        Gs = np.matmul(Gc, g)
+        A = Gs[:, :, 0]
+        B = -Gs[:, :, 1]
+        C = -2 * np.sin(theta) ** 2 / lambda_nm  # the minus sign comes from the main equation
+        Delta = 4 * (A ** 2 + B ** 2 - C ** 2)
+        with np.errstate(invalid='ignore'):
+            sqrt_Delta = np.where(Delta >= 0, np.sqrt(Delta), np.nan)
+        omegas = np.empty(A.shape + (2,))
+        omegas[:, :, 0] = 2 * np.arctan2(B - 0.5 * sqrt_Delta, A + C) * 180. / np.pi % 360
+        omegas[:, :, 1] = 2 * np.arctan2(B + 0.5 * sqrt_Delta, A + C) * 180. / np.pi % 360
+        return omegas
+
     def rotating_crystal(self, hkl, lambda_keV, omega_step=0.5, display=True, verbose=False):
         from pymicro.xray.xray_utils import lambda_keV_to_nm
         lambda_nm = lambda_keV_to_nm(lambda_keV)
@@ -960,6 +1197,35 @@ class Orientation:
         orientation_matrix = np.dot(e_hat_c.T, e_hat_s)
         return orientation_matrix
 
+    @staticmethod
+    def transformation_matrices(hkl_normals_1, hkl_normals_2, n_1, n_2):
+        """Compute the orientation matrices from pairs of known lattice plane
+        normals.
+
+        This is the vectorized counterpart of `transformation_matrix` where
+        the lattice planes are given by their normals in the crystal frame.
+
+        :param ndarray hkl_normals_1: a (n, 3) array of the first lattice
+            plane unit normals in the crystal frame.
+        :param ndarray hkl_normals_2: a (n, 3) array of the second lattice
+            plane unit normals in the crystal frame.
+        :param ndarray n_1: a (n, 3) array of unit vectors normal to the
+            first lattice planes in the sample frame.
+        :param ndarray n_2: a (n, 3) array of unit vectors normal to the
+            second lattice planes in the sample frame.
+        :return: the corresponding (n, 3, 3) array of orientation matrices.
+        """
+        def frames(v1, v2):
+            v1 = np.asarray(v1, dtype=float).reshape((-1, 3))
+            e2 = np.cross(v1, v2)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                e2 /= np.linalg.norm(e2, axis=1)[:, None]
+            return np.stack([v1, e2, np.cross(v1, e2)], axis=1)
+
+        e_hat_c = frames(hkl_normals_1, hkl_normals_2)
+        e_hat_s = frames(n_1, n_2)
+        return np.matmul(np.swapaxes(e_hat_c, 1, 2), e_hat_s)
+
     @staticmethod
     def from_two_hkl_normals(hkl_1, hkl_2, xyz_normal_1, xyz_normal_2):
         g = Orientation.transformation_matrix(hkl_1, hkl_2, 
@@ -1142,6 +1408,82 @@ class Orientation:
         g = I + np.sin(theta) * omega + (1 - np.cos(theta)) * omega.dot(omega)
         return g
 
+    @staticmethod
+    def Rodrigues2OrientationMatrices(rods):
+        """
+        Compute the orientation matrices from a series of Rodrigues vectors.
+
+        This is the vectorized version of `Rodrigues2OrientationMatrix`.
+
+        :param rods: The Rodrigues vectors as a (n, 3) shaped array.
+        :returns: The (n, 3, 3) array of the orientation matrices.
+        """
+        rods = np.atleast_2d(rods).astype(float)
+        r = np.linalg.norm(rods, axis=1)
+        theta = 2 * np.arctan(r)
+        # zero rodrigues vectors give the identity matrix
+        n = np.divide(rods, r[:, np.newaxis], out=np.zeros_like(rods),
+                      where=r[:, np.newaxis] >= np.finfo(float).eps)
+        omega = np.zeros((len(rods), 3, 3))
+        omega[:, 0, 1], omega[:, 0, 2] = n[:, 2], -n[:, 1]
+        omega[:, 1, 0], omega[:, 1, 2] = -n[:, 2], n[:, 0]
+        omega[:, 2, 0], omega[:, 2, 1] = n[:, 1], -n[:, 0]
+        g = (np.eye(3) + np.sin(theta)[:, np.newaxis, np.newaxis] * omega
+             + (1 - np.cos(theta))[:, np.newaxis, np.newaxis]
+             * np.matmul(omega, omega))
+        return g
+
+    @staticmethod
+    def OrientationMatrices2Quaternions(g):
+        """
+        Compute the quaternions from a series of orientation matrices.
+
+        The quaternions follow the convention of the `rotation.qu2om`
+        function, with a positive scalar part. Each quaternion is computed
+        from its largest component to remain accurate for all rotations.
+
+        :param g: The orientation matrices as a (n, 3, 3) shaped array.
+        :returns: The (n, 4) array of the quaternions.
+        """
+        g = np.reshape(g, (-1, 3, 3)).astype(float)
+        n = len(g)
+        # the matrix of the products 4.q_i.q_j from the orientation matrix
+        k = np.empty((n, 4, 4))
+        k[:, 0, 0] = 1 + g[:, 0, 0] + g[:, 1, 1] + g[:, 2, 2]
+        k[:, 1, 1] = 1 + g[:, 0, 0] - g[:, 1, 1] - g[:, 2, 2]
+        k[:, 2, 2] = 1 - g[:, 0, 0] + g[:, 1, 1] - g[:, 2, 2]
+        k[:, 3, 3] = 1 - g[:, 0, 0] - g[:, 1, 1] + g[:, 2, 2]
+        k[:, 0, 1] = k[:, 1, 0] = g[:, 1, 2] - g[:, 2, 1]
+        k[:, 0, 2] = k[:, 2, 0] = g[:, 2, 0] - g[:, 0, 2]
+        k[:, 0, 3] = k[:, 3, 0] = g[:, 0, 1] - g[:, 1, 0]
+        k[:, 1, 2] = k[:, 2, 1] = g[:, 0, 1] + g[:, 1, 0]
+        k[:, 1, 3] = k[:, 3, 1] = g[:, 0, 2] + g[:, 2, 0]
+        k[:, 2, 3] = k[:, 3, 2] = g[:, 1, 2] + g[:, 2, 1]
+        largest = np.argmax(np.diagonal(k, axis1=1, axis2=2), axis=1)
+        q = k[np.arange(n), :, largest]
+        q /= 2 * np.sqrt(q[np.arange(n), largest])[:, np.newaxis]
+        q *= np.where(q[:, :1] < 0, -1., 1.)
+        return q
+
+    @staticmethod
+    def OrientationMatrices2Rodrigues(g):
+        """
+        Compute the rodrigues vectors from a series of orientation matrices.
+
+        This is the vectorized version of `OrientationMatrix2Rodrigues`, zero
+        vectors are returned for rotations of 180 degrees.
+
+        :param g: The (n, 3, 3) array of the orientation matrices.
+        :returns: The Rodrigues vectors as a (n, 3) shaped array.
+        """
+        g = np.asarray(g).reshape((-1, 3, 3))
+        t = np.trace(g, axis1=1, axis2=2) + 1
+        r = np.stack([g[:, 1, 2] - g[:, 2, 1],
+                      g[:, 2, 0] - g[:, 0, 2],
+                      g[:, 0, 1] - g[:, 1, 0]], axis=1)
+        return np.divide(r, t[:, np.newaxis], out=np.zeros_like(r),
+                         where=np.abs(t[:, np.newaxis]) >= np.finfo(g.dtype).eps)
+
     @staticmethod
     def Rodrigues2Axis(rod):
         """
@@ -1312,6 +1654,31 @@ class Orientation:
         g = np.array([[g11, g12, g13], [g21, g22, g23], [g31, g32, g33]])
         return g
 
+    @staticmethod
+    def Euler2OrientationMatrices(euler):
+        """Compute the orientation matrices from a series of Euler angles.
+
+        This is the vectorized version of `Euler2OrientationMatrix`.
+
+        :param euler: The (n, 3) shaped array of the Euler angles (in degrees).
+        :return g: The (n, 3, 3) array of the orientation matrices.
+        """
+        phi1, Phi, phi2 = np.radians(np.reshape(euler, (-1, 3))).T
+        c1, s1 = np.cos(phi1), np.sin(phi1)
+        c, s = np.cos(Phi), np.sin(Phi)
+        c2, s2 = np.cos(phi2), np.sin(phi2)
+        g = np.empty((len(phi1), 3, 3))
+        g[:, 0, 0] = c1 * c2 - s1 * s2 * c
+        g[:, 0, 1] = s1 * c2 + c1 * s2 * c
+        g[:, 0, 2] = s2 * s
+        g[:, 1, 0] = -c1 * s2 - s1 * c2 * c
+        g[:, 1, 1] = -s1 * s2 + c1 * c2 * c
+        g[:, 1, 2] = c2 * s
+        g[:, 2, 0] = s1 * s
+        g[:, 2, 1] = -c1 * s
+        g[:, 2, 2] = c
+        return g
+
     @staticmethod
     def Quaternion2Euler(q):
         """
@@ -1805,6 +2172,96 @@ class GrainData(tables.IsDescription):
     phase = tables.UInt8Col(dflt=1)  # Unsigned 8-bit integer
 
 
+class _ComponentsLastDataset:
+    """View of an array like dataset with its first dimension moved last.
+
+    Used to stream DCT vector fields stored with the components first.
+    """
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.shape = tuple(dataset.shape[1:]) + tuple(dataset.shape[:1])
+        self.dtype = dataset.dtype
+
+    def __getitem__(self, selection):
+        block = self.dataset[(slice(None),) + tuple(selection)]
+        return np.moveaxis(np.asarray(block), 0, -1)
+
+
+def _changed_region(changed):
+    """Return the [start, stop[ indices of the True values of an array."""
+    region = np.zeros((changed.ndim, 2), dtype=np.int64)
+    for axis in range(changed.ndim):
+        other_axes = tuple(a for a in range(changed.ndim) if a != axis)
+        indices = np.flatnonzero(changed.any(axis=other_axes))
+        region[axis] = indices[0], indices[-1] + 1
+    return region
+
+
+def _grain_ids_kernel(block, grain_map):
+    """Block kernel listing the grain ids of a grain map."""
+    grain_ids = np.unique(grain_map)
+    return None, grain_ids[grain_ids > 0]
+
+
+def _grain_boundaries_kernel(block, grain_map, kernel_size=3):
+    """Block kernel flagging the voxels close to another grain."""
+    neighbours_max = ndimage.maximum_filter(grain_map, size=kernel_size)
+    neighbours_min = ndimage.minimum_filter(grain_map, size=kernel_size)
+    boundaries = (neighbours_max != grain_map) | (neighbours_min != grain_map)
+    return {'grain_boundaries_map': boundaries.astype(np.uint8)}, None
+
+
+def _dilate_grains_kernel(block, grain_map, mask=None, new_map_name=None,
+                          dilation_steps=1, dilation_ids=None):
+    """Block kernel dilating the grains of a grain map.
+
+    The ids found in the voxels changed by the dilation and the region of
+    these voxels in the image are returned as statistics.
+    """
+    initial_map = grain_map[block.core]
+    grain_map = grain_map.copy()
+    # get rid of overlap regions flaged by -1
+    grain_map[grain_map == -1] = 0
+    grain_map = Microstructure.dilate_labels(grain_map,
+                                             dilation_steps=dilation_steps,
+                                             mask=mask,
+                                             dilation_ids=dilation_ids)
+    changed = grain_map[block.core] != initial_map
+    if not np.any(changed):
+        return {new_map_name: grain_map}, None
+    ids = np.union1d(initial_map[changed], grain_map[block.core][changed])
+    region = _changed_region(changed) + block.start[:, np.newaxis]
+    return {new_map_name: grain_map}, (ids, region)
+
+
+def _god_kernel(block, grain_map, orientation_map, ids=None, g_mean=None,
+                symmetry=Symmetry.cubic):
+    """Block kernel computing the grain orientation deviation."""
+    god = np.zeros(grain_map.shape, dtype=float)
+    rows = np.searchsorted(ids, grain_map)
+    valid = rows < len(ids)
+    valid[valid] = ids[rows[valid]] == grain_map[valid]
+    if np.any(valid):
+        g = Orientation.Rodrigues2OrientationMatrices(orientation_map[valid])
+        angles = Orientation.misorientation_angles(g_mean[rows[valid]], g,
+                                                   symmetry=symmetry)
+        god[valid] = np.degrees(angles)
+    return {'grain_orientation_deviation': god}, None
+
+
+def _kam_kernel(block, orientation_map, labels=None, order=1, max_angle=5.,
+                symmetry=Symmetry.cubic):
+    """Block kernel computing the kernel average misorientation."""
+    shape = orientation_map.shape[:-1]
+    q = Orientation.OrientationMatrices2Quaternions(
+        Orientation.Rodrigues2OrientationMatrices(
+            orientation_map.reshape((-1, 3)))).reshape(shape + (4,))
+    kam = Orientation.compute_kam(q, order=order, max_angle=max_angle,
+                                  labels=labels, symmetry=symmetry)
+    return {'kernel_average_misorientation': kam}, None
+
+
 class Microstructure(SampleData):
     """
     Class used to manipulate a full microstructure derived from the
@@ -1831,7 +2288,7 @@ class Microstructure(SampleData):
     def __init__(self,
                  filename=None, name='micro', description='empty',
                  verbose=False, overwrite_hdf5=False,
-                 phase=None, autodelete=False):
+                 phase=None, autodelete=False, fast_open=False):
         if filename is None:
             # only add '_' if not present at the end of name
             filename = name + (not name.endswith('_')) * '_' + 'data'
@@ -1848,13 +2305,19 @@ class Microstructure(SampleData):
                             sample_description=description, verbose=verbose,
                             overwrite_hdf5=overwrite_hdf5,
                             autodelete=autodelete,
-                            after_file_open_args=after_file_open_args)
+                            after_file_open_args=after_file_open_args,
+                            fast_open=fast_open)
         return
 
     def _after_file_open(self, phase_list=None, **kwargs):
         """Initialization code to run after opening a Sample Data file."""
         self.grains = self.get_node('GrainDataTable')
+        if not self._file_exist:
+            self._index_grain_ids()
         self.default_compression_options = {'complib': 'zlib', 'complevel': 5}
+        # grains edited since the last update of the geometry columns
+        self._dirty_grain_ids = set()
+        self._dirty_region = None
         if self._file_exist:
             self.active_grain_map = self.get_attribute('active_grain_map',
                                                        'CellData')
@@ -1872,6 +2335,16 @@ class Microstructure(SampleData):
             self.set_active_phase_map()
             self._init_phase(phase_list)
 
+    def _index_grain_ids(self):
+        """Index the grain ids to find grains without scanning the table.
+
+        The index is created with the grain data table and maintained by
+        PyTables when grains are added, existing files are left untouched.
+        """
+        if self.grains is not None and \
+                not self.grains.cols.idnumber.is_indexed:
+            self.grains.cols.idnumber.create_index()
+
     def __repr__(self):
         """Provide a string representation of the class."""
         # TODO: print number of grains if available
@@ -2165,10 +2638,10 @@ class Microstructure(SampleData):
 
         :return: a 1D numpy array containing the grain ids.
         """
-        grain_map = self.get_node('grain_map')
-        grains_id = np.unique(grain_map)
-        grains_id = grains_id[grains_id > 0]
-        return grains_id
+        if self._is_empty('grain_map'):
+            return np.array([], dtype=int)
+        ids = self.process_image_blocks(['grain_map'], _grain_ids_kernel)
+        return np.unique(np.concatenate(ids))
 
     def get_grain_ids(self):
         """Return the grain ids found in the GrainDataTable.
@@ -2321,10 +2794,73 @@ class Microstructure(SampleData):
 
         :return: a list of the grains.
         """
-        grains_list = [self.get_grain(gid)
-                       for gid in self.get_tablecol('GrainDataTable', 'idnumber')]
+        data = self.get_grains_data()
+        matrices = Orientation.Rodrigues2OrientationMatrices(
+            data['orientation'])
+        grains_list = []
+        for gr, g in zip(data, matrices):
+            grain = Grain(gr['idnumber'], Orientation(g))
+            grain.center = gr['center']
+            grain.volume = gr['volume']
+            grains_list.append(grain)
         return grains_list
 
+    def get_grain_rows(self, id_list):
+        """Get the row numbers of a list of grains in the grain data table.
+
+        :param list id_list: a list of the grain ids.
+        :return: a 1D numpy array with the row numbers of the grains, in the
+            order of `id_list`.
+        :raise: a ValueError if a grain is not found in the table.
+        """
+        id_list = np.atleast_1d(np.asarray(id_list, dtype=int))
+        ids = self.get_grain_ids()
+        order = np.argsort(ids, kind='stable')
+        pos = np.searchsorted(ids, id_list, sorter=order)
+        found = pos < len(ids)
+        rows = np.zeros_like(pos)
+        rows[found] = order[pos[found]]
+        found[found] = ids[rows[found]] == id_list[found]
+        if not np.all(found):
+            raise ValueError('grains %s not found in the microstructure'
+                             % id_list[~found])
+        return rows
+
+    def get_grains_data(self, id_list=None, columns=None):
+        """Get the data of a set of grains in a single table read.
+
+        Contrary to the `get_grain_*` methods using a list of ids, the grains
+        are found without building a query condition, so that the number of
+        ids is not limited, and the data is returned in the order of the ids.
+
+        :param list id_list: a list of the grain ids, all grains are returned
+            in the table order by default.
+        :param list columns: a list of the columns to return, for instance
+            ['volume', 'center'], all columns are returned by default.
+        :return: a numpy structured array with one row per grain.
+        :raise: a ValueError if a grain is not found in the table.
+        """
+        if id_list is None:
+            data = self.grains.read()
+        else:
+            rows = self.get_grain_rows(id_list)
+            # read each row once and in increasing order
+            unique_rows, inverse = np.unique(rows, return_inverse=True)
+            data = self.grains.read_coordinates(unique_rows)[inverse]
+        if columns is not None:
+            data = data[list(columns)]
+        return data
+
+    def get_grain_orientation_matrices(self, id_list=None):
+        """Get the orientation matrices of a set of grains.
+
+        :param list id_list: a list of the grain ids, all grains are used in
+            the table order by default.
+        :return: a (n, 3, 3) numpy array of the orientation matrices.
+        """
+        rods = self.get_grains_data(id_list, columns=['orientation'])
+        return Orientation.Rodrigues2OrientationMatrices(rods['orientation'])
+
     def get_grain_positions(self):
         """Return all the grain positions as a numpy array of shape (n, 3)
         where n is the number of grains.
@@ -2409,8 +2945,12 @@ class Microstructure(SampleData):
 
         The `active_grain_map` string attribute is used to locate the array
         when the `get_grain_map` method is called. This allows to have multiple
-        grain maps within a data set.
+        grain maps within a data set. Switching to another map marks all the
+        grains as edited for the `update_grain_geometry` method.
         """
+        previous_map = getattr(self, 'active_grain_map', None)
+        if previous_map is not None and previous_map != map_name:
+            self._mark_grains_dirty()
         self.active_grain_map = map_name
         self.add_attributes({'active_grain_map': map_name}, 'CellData')
         return
@@ -2427,12 +2967,17 @@ class Microstructure(SampleData):
         return
 
     def set_grain_map(self, grain_map, voxel_size=None,
-                      map_name='grain_map', compression=None):
+                      map_name='grain_map', compression=None,
+                      track_changes=False):
         """Set the grain map for this microstructure.
 
         :param ndarray grain_map: a 2D or 3D numpy array.
         :param float voxel_size: the size of the voxels in mm unit. Used only
             if the CellData image Node must be created.
+        :param bool track_changes: if True, the new map is compared with the
+            active grain map to record only the edited grains for the
+            `update_grain_geometry` method, at the cost of reading the active
+            map. By default all the grains are considered as edited.
         """
         if compression is None:
             compression = self.default_compression_options
@@ -2441,6 +2986,12 @@ class Microstructure(SampleData):
             empty = self.get_attribute(attrname='empty', nodename='CellData')
             if not empty:
                 create_image = False
+        # find the edited grains before replacing the active map
+        tracked = False
+        if track_changes and not create_image \
+                and map_name == self.active_grain_map \
+                and not self._is_empty(map_name):
+            tracked = self._mark_edited_grains(grain_map)
         if create_image:
             if voxel_size is None:
                 msg = 'Please specify voxel size for CellData image'
@@ -2467,9 +3018,113 @@ class Microstructure(SampleData):
             self.add_field(gridname='CellData', fieldname=map_name,
                            array=grain_map, replace=True,
                            compression_options=compression)
+        if not tracked:
+            self._mark_grains_dirty()
         self.set_active_grain_map(map_name)
         return
 
+    def _mark_edited_grains(self, grain_map):
+        """Record the grains edited by replacing the active grain map.
+
+        The active grain map is compared with the new one block by block so
+        that it is never loaded as a whole.
+
+        :param ndarray grain_map: the new grain map.
+        :return: False if the maps have different shapes and cannot be
+            compared, True otherwise.
+        """
+        shape = tuple(self.get_attribute(
+            'dimension', self._get_parent_name(self.active_grain_map)))
+        if tuple(n for n in grain_map.shape if n != 1) != \
+                tuple(n for n in shape if n != 1):
+            return False
+        grain_map = np.reshape(grain_map, shape)
+        block_shape = get_block_shape(shape, grain_map.dtype.itemsize)
+        for block in iter_image_blocks(shape, block_shape):
+            new_block = grain_map[block.selection]
+            previous_block = self.get_image_field_block(self.active_grain_map,
+                                                        block.selection)
+            changed = previous_block != new_block
+            if np.any(changed):
+                self._mark_grains_dirty(
+                    np.union1d(previous_block[changed], new_block[changed]),
+                    _changed_region(changed) + block.start[:, np.newaxis])
+        return True
+
+    def set_grain_map_block(self, block, selection):
+        """Write a block of the active grain map.
+
+        Only the block is read and written in the dataset. The grains found
+        in the modified voxels, before and after the edition, are recorded
+        to update their geometry with the `update_grain_geometry` method.
+
+        :param ndarray block: the new values of the block.
+        :param tuple selection: tuple of slices selecting the block along the
+            (X,Y,Z) dimensions of the grain map.
+        """
+        shape = self.get_attribute('dimension', 'CellData')
+        selection = tuple(selection) + (slice(None),) * (len(shape)
+                                                         - len(selection))
+        selection = tuple(slice(*sl.indices(n)[:2])
+                          for sl, n in zip(selection, shape))
+        previous_block = self.get_image_field_block(self.active_grain_map,
+                                                    selection)
+        block = np.broadcast_to(np.asarray(block, previous_block.dtype),
+                                previous_block.shape)
+        changed = previous_block != block
+        if not np.any(changed):
+            return
+        self.set_image_field_block(self.active_grain_map, block, selection)
+        start = np.array([sl.start for sl in selection], dtype=np.int64)
+        self._mark_grains_dirty(
+            np.union1d(previous_block[changed], block[changed]),
+            _changed_region(changed) + start[:, np.newaxis])
+        return
+
+    def _mark_grains_dirty(self, ids=None, region=None):
+        """Record grains edited since the last update of their geometry.
+
+        :param ids: the ids of the edited grains, by default all the grains
+            are considered as edited.
+        :param region: the [start, stop[ indices along each dimension of
+            the edited region of the grain map.
+        """
+        if ids is None or self._dirty_grain_ids is None:
+            self._dirty_grain_ids = None
+            self._dirty_region = None
+            return
+        ids = np.asarray(ids).ravel()
+        self._dirty_grain_ids.update(ids[ids > 0].tolist())
+        if region is not None:
+            region = np.array(region, dtype=np.int64)
+            if self._dirty_region is not None:
+                region[:, 0] = np.minimum(region[:, 0],
+                                          self._dirty_region[:, 0])
+                region[:, 1] = np.maximum(region[:, 1],
+                                          self._dirty_region[:, 1])
+            self._dirty_region = region
+        return
+
+    def get_dirty_grains(self):
+        """Get the ids of the grains edited since the last geometry update.
+
+        :return: the sorted array of the edited grain ids, or None if the
+            whole grain map has been replaced.
+        """
+        if self._dirty_grain_ids is None:
+            return None
+        return np.array(sorted(self._dirty_grain_ids), dtype=int)
+
+    def get_dirty_region(self):
+        """Get the region of the grain map edited since the last update.
+
+        :return: a tuple of slices selecting the edited region along the
+            (X,Y,Z) dimensions of the grain map, or None.
+        """
+        if self._dirty_region is None:
+            return None
+        return tuple(slice(start, stop) for start, stop in self._dirty_region)
+
     def set_phase_map(self, phase_map, voxel_size=None, map_name='phase_map',
                       compression=None):
         """Set the phase map for this microstructure.
@@ -2605,6 +3260,113 @@ class Microstructure(SampleData):
                            compression_options=compression)
         return
 
+    def _add_cell_data_image(self, dimension, spacing, origin=None):
+        """Create an empty CellData image group.
+
+        :param dimension: the number of voxels along each dimension.
+        :param spacing: the size of the voxels (scalar or one value per
+            dimension).
+        :param origin: the origin of the image (zero by default).
+        """
+        self._add_empty_image('CellData', dimension, spacing, origin=origin)
+        return
+
+    def _copy_cell_data_to(self, micro, selection=None, factor=None,
+                           majority_vote=False):
+        """Copy all the CellData fields into the CellData image of another
+        microstructure, by blocks.
+
+        The CellData image of `micro` must exist with the dimensions of the
+        copied fields. Fields keep their index name and compression settings.
+
+        :param Microstructure micro: the microstructure to copy the fields to.
+        :param tuple selection: tuple of slices selecting the region to copy
+            along the (X,Y,Z) dimensions (the whole image by default).
+        :param tuple factor: if not None, the integer downsampling factor
+            along each dimension, the selection is then ignored.
+        :param bool majority_vote: if True, integer scalar fields are
+            downsampled by taking the most frequent value in each block of
+            voxels instead of the first voxel of the block.
+        """
+        field_list = self.get_node('%s/Field_index' % self.get_node(
+            'CellData')._v_pathname)
+        for name in field_list:
+            field_name = name.decode('utf-8')
+            if self._is_empty(field_name):
+                continue
+            print('copying field %s' % field_name)
+            self.copy_image_field(field_name, micro, 'CellData',
+                                  selection=selection, factor=factor,
+                                  majority_vote=majority_vote)
+        return
+
+    def _copy_grains_in_map_to(self, micro):
+        """Fill the grain table of another microstructure with the rows of
+        the grains found in its active grain map.
+
+        The rows of this microstructure grain table are filtered and
+        appended at once, grains of the map missing in this grain table are
+        added with default values.
+
+        :param Microstructure micro: the microstructure to fill.
+        """
+        map_ids = Microstructure.compute_grain_map_statistics(
+            micro.get_node(micro.active_grain_map))['ids']
+        data = self.grains.read()
+        data = data[np.isin(data['idnumber'], map_ids)]
+        data = data[np.argsort(data['idnumber'], kind='stable')]
+        extra_cols = [col for col in data.dtype.names
+                      if col not in micro.grains.colnames]
+        if extra_cols:
+            micro.add_tablecols('GrainDataTable', np.dtype(
+                [(col, data.dtype[col]) for col in extra_cols]))
+        rows = np.zeros(len(data), dtype=micro.grains.dtype)
+        for col in data.dtype.names:
+            rows[col] = data[col]
+        micro.grains.append(rows)
+        micro.grains.flush()
+        not_in_table = map_ids[np.isin(map_ids, data['idnumber'],
+                                       invert=True)]
+        if len(not_in_table) > 0:
+            micro.append_grain_columns({'idnumber': not_in_table})
+        return
+
+    def _add_cell_data_field_from_dataset(self, dataset, fieldname,
+                                          indexname=None, voxel_size=None,
+                                          storage_order=True, selection=None,
+                                          dtype=None, compression=None):
+        """Copy a field into the CellData image by blocks.
+
+        The CellData image is created from the field dimensions if it does
+        not exist yet. See `SampleData.add_field_from_dataset` for the
+        other arguments.
+
+        :param float voxel_size: the size of the voxels in mm unit. Used only
+            if the CellData image Node must be created.
+        """
+        if compression is None:
+            compression = self.default_compression_options
+        create_image = True
+        if self.__contains__('CellData'):
+            empty = self.get_attribute(attrname='empty', nodename='CellData')
+            if not empty:
+                create_image = False
+        if create_image:
+            if voxel_size is None:
+                msg = 'Please specify voxel size for CellData image'
+                raise ValueError(msg)
+            dims = dataset.shape[:3]
+            if storage_order:
+                dims = dims[::-1]
+            if selection is not None:
+                dims = [len(range(*sl.indices(n)))
+                        for sl, n in zip(selection, dims)]
+            self._add_cell_data_image(dims, voxel_size)
+        return self.add_field_from_dataset(
+            'CellData', fieldname, dataset, indexname=indexname, replace=True,
+            compression_options=compression, storage_order=storage_order,
+            selection=selection, dtype=dtype)
+
     def set_random_orientations(self):
         """ Set random orientations for all grains in GrainDataTable """
         for grain in self.grains:
@@ -2659,9 +3421,74 @@ class Microstructure(SampleData):
         :param ids: Array of grain ids to remove from GrainDataTable
         :type ids: list
         """
-        for Id in ids:
-            where = self.grains.get_where_list('idnumber == Id')[:]
-            self.grains.remove_row(int(where))
+        if len(ids) == 0:
+            return
+        keep = np.isin(self.get_grain_ids(), ids, invert=True)
+        if np.all(keep):
+            return
+        # rewrite the remaining rows at once rather than shifting the table
+        # for each removed row
+        data = self.grains.read()[keep]
+        self.grains.truncate(0)
+        self.grains.append(data)
+        self.grains.flush()
+        return
+
+    def add_tablecols(self, tablename, description, data=None):
+        """Add new columns to a table node.
+
+        See `SampleData.add_tablecols`. As the table node is rebuilt, the
+        reference to the grain data table is updated.
+        """
+        SampleData.add_tablecols(self, tablename, description, data=data)
+        self.grains = self.get_node('GrainDataTable')
+        self._index_grain_ids()
+
+    def append_grain_columns(self, columns):
+        """Append new grains to the GrainDataTable from column arrays.
+
+        All the grains are written in a single table append. The columns that
+        are not given are filled with their default value.
+
+        :param dict columns: a dictionary with the column names as keys and
+            the arrays of the column values as values, it must contain at
+            least the `idnumber` column, for instance
+            {'idnumber': ids, 'orientation': rods}.
+        """
+        if 'idnumber' not in columns:
+            raise ValueError('the idnumber column is needed to add grains')
+        n = len(columns['idnumber'])
+        data = np.empty(n, dtype=self.grains.dtype)
+        for colname, dflt in self.grains.coldflts.items():
+            data[colname] = columns.get(colname, dflt)
+        self._index_grain_ids()
+        self.grains.append(data)
+        self.grains.flush()
+        return
+
+    def set_grain_columns(self, columns, id_list=None):
+        """Set the values of several columns of the GrainDataTable.
+
+        Each column is written in a single operation, using the row numbers
+        of the grains in the table when a list of grain ids is given.
+
+        :param dict columns: a dictionary with the column names as keys and
+            the arrays of the column values as values, for instance
+            {'volume': volumes, 'center': centers}.
+        :param list id_list: the ids of the grains corresponding to the
+            values, by default the values are given for all the grains in
+            the table order.
+        :raise: a ValueError if a grain is not found in the table.
+        """
+        if id_list is not None:
+            rows = self.get_grain_rows(id_list)
+        for colname, values in columns.items():
+            if id_list is None:
+                column = np.asarray(values)
+            else:
+                column = self.grains.col(colname)
+                column[rows] = values
+            self.set_tablecol('GrainDataTable', colname, column)
         return
 
     def add_grains(self, orientation_list, orientation_type='euler',
@@ -2678,7 +3505,6 @@ class Microstructure(SampleData):
         passive convention and degrees) or Rodrigues vectors.
         :param list grain_ids: an optional list for the ids of the new grains.
         """
-        grain = self.grains.row
         # build a list of grain ids if it is not given
         if grain_ids is None:
             if self.get_number_of_grains() > 0:
@@ -2689,16 +3515,15 @@ class Microstructure(SampleData):
         if len(grain_ids) > 0:
             s = 's' if len(grain_ids) > 1 else ''
             print(f'adding {len(grain_ids)} grain{s} to the microstructure')
-        for gid, orientation in zip(grain_ids, orientation_list):
-            grain['idnumber'] = gid
-            if orientation_type == 'euler':
-                grain['orientation'] = Orientation.Euler2Rodrigues(orientation)
-            elif orientation_type in ['rod', 'rodrigues']:
-                grain['orientation'] = orientation
-            else:
-                raise ValueError('unknown type of orientation: %s' % orientation_type)
-            grain.append()
-        self.grains.flush()
+        n = min(len(grain_ids), len(orientation_list))
+        orientations = np.reshape(orientation_list, (-1, 3))[:n]
+        if orientation_type == 'euler':
+            orientations = Orientation.eu2ro(np.radians(orientations))
+        elif orientation_type not in ['rod', 'rodrigues']:
+            raise ValueError('unknown type of orientation: %s' % orientation_type)
+        self.append_grain_columns(
+            {'idnumber': np.asarray(grain_ids)[:n],
+             'orientation': np.reshape(orientations, (n, 3))})
 
     def add_grains_in_map(self):
         """Add to GrainDataTable the grains in grain map missing in table.
@@ -2708,11 +3533,7 @@ class Microstructure(SampleData):
         _, _, not_in_table = self.compute_grains_map_table_intersection()
         # remove ID <0 from list (reserved to background)
         not_in_table = np.delete(not_in_table, np.where(not_in_table <= 0))
-        # generate random euler angles
-        phi1 = np.random.rand(len(not_in_table), 1) * 360.
-        Phi = 180. * np.arccos(2 * np.random.rand(len(not_in_table), 1) - 1) / np.pi
-        phi2 = np.random.rand(len(not_in_table), 1) * 360.
-        euler_list = np.concatenate((phi1, Phi, phi2), axis=1)
+        euler_list = Orientation.random_euler_angles(len(not_in_table))
         self.add_grains(euler_list, orientation_type='euler', grain_ids=not_in_table)
         return
 
@@ -2726,13 +3547,8 @@ class Microstructure(SampleData):
         """
         m = Microstructure(name='random_texture', phase=phase,
                            overwrite_hdf5=True)
-        grain = m.grains.row
-        for i in range(n):
-            grain['idnumber'] = i + 1
-            o = Orientation.random()
-            grain['orientation'] = o.rod
-            grain.append()
-        m.grains.flush()
+        m.add_grains(Orientation.random_euler_angles(n),
+                     grain_ids=np.arange(1, n + 1))
         return m
 
     def set_mesh(self, mesh_object=None, file=None, meshname='micro_mesh'):
@@ -2987,7 +3803,8 @@ class Microstructure(SampleData):
         return rods_gid
 
     def compute_god_map(self, id_list=None, store=True,
-                        recompute_mean_orientation=False):
+                        recompute_mean_orientation=False, n_jobs=1,
+                        block_shape=None):
         """Create a GOD (grain orientation deviation) map.
 
         This method computes the grain orientation deviation map. For each
@@ -2996,11 +3813,14 @@ class Microstructure(SampleData):
         the grain and the resulting misorientation is assigned to the pixel.
 
         A grain ids list can be used to restrict the grains where to compute
-        the orientation deviation (the number of grains in the list must be 256
-        maximum). By default, this method uses the mean orientation in the
-        GrainDataTable but the mean orientation can also be recomputed from the
-        orientation map and grain map by activating the flag
-        `recompute_mean_orientation`.
+        the orientation deviation. By default, this method uses the mean
+        orientation in the GrainDataTable but the mean orientation can also
+        be recomputed from the orientation map and grain map by activating
+        the flag `recompute_mean_orientation`.
+
+        The misorientations are computed by blocks of the maps, possibly in
+        parallel, with the `process_image_blocks` method, and the GOD map is
+        written by blocks in the dataset if it is stored.
 
         .. note::
 
@@ -3011,9 +3831,14 @@ class Microstructure(SampleData):
         for all grains by default).
         :param bool recompute_mean_orientation: if `True` the mean grain
         orientation is recalculated from the orientatin map instead of using
-        the value in the `GrainDataTable`.
+        the value in the `GrainDataTable` (this needs the whole maps in
+        memory).
         :param bool store: If `True`, store the grain orientation deviation map
         in the `CellData` group, with name `grain_orientation_deviation`.
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the maps
+            processed at once (slabs of the maps by default).
+        :return: the GOD map in degrees as a numpy array.
         """
         if self._is_empty('grain_map'):
             print('no grain map found, please add a grain map to your data set')
@@ -3021,63 +3846,109 @@ class Microstructure(SampleData):
         elif self._is_empty('orientation_map'):
             print('no orientation map found, please add an orientation map to your data set')
             return None
-        grain_ids = self.get_grain_map()
-        print('grain ids shape', grain_ids.shape)
-        orientation_map = self.get_orientation_map()
-        print('orientation map shape', orientation_map.shape)
         # assume only one phase
         if self.get_number_of_phases() > 1:
             print('error, multiple phases not yet supported')
             return None
         sym = self.get_phase().get_symmetry()
-        god = np.zeros_like(grain_ids, dtype=float)
-        if not id_list:
-            id_list = np.unique(self.get_ids_from_grain_map())
-        if not recompute_mean_orientation:
+        if id_list is None or len(id_list) == 0:
+            id_list = self.get_ids_from_grain_map()
+        ids = np.unique(id_list)
+        ids = ids[ids > 0]
+        if recompute_mean_orientation:
+            # compute the mean orientation of the grains
+            grain_map = self.get_grain_map()
+            valid = np.isin(grain_map, ids)
+            g = Orientation.Rodrigues2OrientationMatrices(
+                self.get_orientation_map()[valid])
+            ids, g_mean, _ = Orientation.compute_mean_orientations(
+                g, grain_map[valid], symmetry=sym)
+        else:
             # verify that all required grain ids are present in the GrainDataTable
-            all_grain_in_table = np.all([gid in self.get_grain_ids() for gid in id_list])
-            if not all_grain_in_table:
+            in_table = np.isin(ids, self.get_grain_ids())
+            if not np.all(in_table):
                 print('warning not all grains present in the grain map have an '
-                      'entry in the grain data table, the GOD map cannot be '
-                      'computed for the requested grains. Consider using the '
-                      'option `recompute_mean_orientation=True` or restrict the '
-                      'list of grains using the argument `id_list`.')
+                      'entry in the grain data table, the GOD map is only '
+                      'computed for the grains of the table. Consider using '
+                      'the option `recompute_mean_orientation=True` or '
+                      'restrict the list of grains using the argument '
+                      '`id_list`.')
+                ids = ids[in_table]
             else:
                 print('all grains are present in the GrainDataTable')
-        for index, gid in enumerate(id_list):
-            if gid < 1:
-                continue
-            progress = 100 * index / len(id_list)
-            print('GOD computation progress: {:.2f} % (grain {:d})'.format(progress, gid), end='\r')
-            # we use grain bounding boxes to speed up calculations
-            bb = self.get_grain_bounding_boxes(id_list=[gid])[0]
-            grain_map = self.get_grain_map()[bb[0][0]:bb[0][1],
-                                             bb[1][0]:bb[1][1],
-                                             bb[2][0]:bb[2][1]]
-            indices = np.where(grain_map == gid)
-            if recompute_mean_orientation:
-                # compute the mean orientation of this grain
-                rods_gid = np.squeeze(orientation_map[bb[0][0]:bb[0][1],
-                                                      bb[1][0]:bb[1][1],
-                                                      bb[2][0]:bb[2][1]][grain_map == gid])
-                #print('\nrods_gid shape', rods_gid.shape)
-                o = Orientation.compute_mean_orientation(rods_gid, symmetry=sym)
-            else:
-                o = self.get_grain(gid).orientation
-                #print('mean grain orientation:', o.rod)
-            # now compute the orientation deviation for each pixel of the grain
-            for i, j, k in zip(indices[0], indices[1], indices[2]):
-                ii, jj, kk = bb[0][0] + i, bb[1][0] + j, bb[2][0] + k
-                rod_ijk = orientation_map[ii, jj, kk, :]
-                o_ijk = Orientation.from_rodrigues(rod_ijk)
-                god[ii, jj, kk] = np.degrees(o.disorientation(o_ijk, crystal_structure=sym)[0])
-        print('GOD computation progress: 100.00 %')
+            g_mean = self.get_grain_orientation_matrices(id_list=ids)
         if store:
-            # pick the location of the grain map to add the new field
-            location = self._get_parent_name(self.active_grain_map)
-            self.add_field(gridname=location, array=god, replace=True,
-                           fieldname='grain_orientation_deviation')
-        return god
+            outputs = {'grain_orientation_deviation': float}
+        else:
+            shape = tuple(self.get_attribute(
+                'dimension', self._get_parent_name(self.active_grain_map)))
+            outputs = {'grain_orientation_deviation': np.zeros(shape)}
+        self.process_image_blocks(
+            [self.active_grain_map, 'orientation_map'], _god_kernel,
+            outputs=outputs, n_jobs=n_jobs, block_shape=block_shape,
+            kernel_kwargs={'ids': ids, 'g_mean': g_mean, 'symmetry': sym})
+        if store:
+            return self.get_field('grain_orientation_deviation')
+        return outputs['grain_orientation_deviation']
+
+    def compute_kam_map(self, order=1, max_angle=5., exclude_boundaries=True,
+                        store=True, n_jobs=1, block_shape=None):
+        """Create a KAM (kernel average misorientation) map.
+
+        For each voxel, the misorientation angles with its neighbours of the
+        given order are averaged, see `Orientation.compute_kam`. The maps
+        are processed by blocks extended by a halo as large as the order,
+        possibly in parallel, with the `process_image_blocks` method.
+
+        .. note::
+
+          This method needs an orientation map, and a grain map to exclude
+          the grain boundaries, a message will be displayed if this is not
+          the case.
+
+        :param int order: the order of the neighbours.
+        :param float max_angle: the largest misorientation angle in degrees
+            taken into account.
+        :param bool exclude_boundaries: if `True`, the neighbours belonging
+            to another grain are excluded, otherwise only the mask (if any)
+            is used to select the voxels.
+        :param bool store: If `True`, store the KAM map in the `CellData`
+            group, with name `kernel_average_misorientation`, instead of
+            returning it.
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the maps
+            processed at once (slabs of the maps by default).
+        :return: the KAM map in degrees as a numpy array (None if the map is
+            stored).
+        """
+        if self._is_empty('orientation_map'):
+            print('no orientation map found, please add an orientation map to your data set')
+            return None
+        if exclude_boundaries and self._is_empty('grain_map'):
+            print('no grain map found, please add a grain map to your data set')
+            return None
+        # assume only one phase
+        if self.get_number_of_phases() > 1:
+            print('error, multiple phases not yet supported')
+            return None
+        sym = self.get_phase().get_symmetry()
+        field_names = ['orientation_map']
+        if exclude_boundaries:
+            field_names.append(self.active_grain_map)
+        elif not self._is_empty('mask'):
+            field_names.append('mask')
+        if store:
+            outputs = {'kernel_average_misorientation': float}
+        else:
+            shape = tuple(self.get_attribute('dimension', 'CellData'))
+            outputs = {'kernel_average_misorientation': np.zeros(shape)}
+        self.process_image_blocks(
+            field_names, _kam_kernel, outputs=outputs, halo=order,
+            n_jobs=n_jobs, block_shape=block_shape,
+            kernel_kwargs={'order': order, 'max_angle': max_angle,
+                           'symmetry': sym})
+        if not store:
+            return outputs['kernel_average_misorientation']
 
     def add_IPF_maps(self):
         """Add IPF maps to the data set.
@@ -3396,21 +4267,95 @@ class Microstructure(SampleData):
         :param bool use_mask: if True and that this microstructure has a mask,
             the dilation will be limited by it.
         """
-        grain_map = self.get_grain_map()
+        # only the bounding box of the grain extended by the dilation is read
+        selection = self._get_grains_region([grain_id], margin=dilation_steps)
+        grain_map = self.get_image_field_block(self.active_grain_map,
+                                               selection)
         grain_volume_init = (grain_map == grain_id).sum()
         grain_data = grain_map == grain_id
         grain_data = ndimage.binary_dilation(grain_data,
                                              iterations=dilation_steps).astype(np.uint8)
         if use_mask and not self._is_empty('mask'):
-            grain_data *= self.get_mask()
+            grain_data *= self.get_image_field_block('mask', selection)
         grain_map[grain_data == 1] = grain_id
         grain_volume_final = (grain_map == grain_id).sum()
         print('grain %s was dilated by %d voxels' % (grain_id,
                                                      grain_volume_final - grain_volume_init))
-        self.set_grain_map(grain_map, self.get_voxel_size(),
-                           map_name=self.active_grain_map)
+        self.set_grain_map_block(grain_map, selection)
         self.sync()
 
+    def merge_grains(self, id_list, new_id=None):
+        """Merge several grains into a single one.
+
+        The voxels of the grains are given the new id in the active grain
+        map, only the region covered by the bounding boxes of the grains
+        being read and written. The other grains are removed from the
+        GrainDataTable, and the geometry of the merged grain can be updated
+        with the `update_grain_geometry` method.
+
+        :param list id_list: the ids of the grains to merge.
+        :param int new_id: the id of the merged grain (the smallest id of
+            the list by default).
+        :return: the id of the merged grain.
+        """
+        id_list = np.unique(id_list)
+        if new_id is None:
+            new_id = id_list[0]
+        in_table = np.isin(id_list, self.get_grain_ids())
+        if new_id not in id_list[in_table] and np.any(in_table):
+            # the merged grain takes the data of the first grain
+            row = self.get_grains_data(id_list[in_table][:1])
+            row['idnumber'] = new_id
+            self.grains.append(row)
+            self.grains.flush()
+        selection = self._get_grains_region(id_list)
+        grain_map = self.get_image_field_block(self.active_grain_map,
+                                               selection)
+        grain_map[np.isin(grain_map, id_list)] = new_id
+        self.set_grain_map_block(grain_map, selection)
+        self.remove_grains_from_table(id_list[id_list != new_id])
+        self._mark_grains_dirty([new_id])
+        return new_id
+
+    def _get_grains_region(self, id_list, margin=0):
+        """Get the region of the grain map covered by a list of grains.
+
+        The region is the union of the bounding boxes of the grains in the
+        GrainDataTable, extended by a margin and clipped to the grain map. The
+        bounding boxes of grains edited since the last geometry update may be
+        stale, the edited region is then added to the region. If a grain has
+        no valid bounding box, or if the edited region is unknown, the whole
+        map is used.
+
+        :param list id_list: the ids of the grains.
+        :param int margin: the number of voxels to add around the region.
+        :return: a tuple of slices selecting the region along the (X,Y,Z)
+            dimensions of the grain map.
+        """
+        shape = np.array(self.get_attribute('dimension', 'CellData'))
+        id_list = np.atleast_1d(np.asarray(id_list, dtype=int))
+        ids = self.get_grain_ids()
+        bounding_boxes = self.get_grains_data(
+            id_list[np.isin(id_list, ids)], columns=['bounding_box'])
+        bounding_boxes = np.reshape(bounding_boxes['bounding_box'], (-1, 3, 2))
+        bounding_boxes = bounding_boxes[:, :len(shape)]
+        dirty = self.get_dirty_grains()
+        edited = dirty is None or np.any(np.isin(id_list, dirty))
+        if len(bounding_boxes) < len(id_list) or np.any(
+                bounding_boxes[:, :, 1] <= bounding_boxes[:, :, 0]) or (
+                edited and self._dirty_region is None):
+            return tuple(slice(0, n) for n in shape)
+        start = bounding_boxes[:, :, 0].min(axis=0)
+        stop = bounding_boxes[:, :, 1].max(axis=0)
+        if edited:
+            # the edited voxels of the grains are in the edited region, the
+            # others are still in their previous bounding boxes
+            start = np.minimum(start, self._dirty_region[:, 0])
+            stop = np.maximum(stop, self._dirty_region[:, 1])
+        start = np.maximum(start - margin, 0)
+        stop = np.minimum(stop + margin, shape)
+        return tuple(slice(int(b), int(e)) for b, e in zip(start, stop))
+
     @staticmethod
     def dilate_labels(array, dilation_steps=1, mask=None, dilation_ids=None,
                       struct=None):
@@ -3497,7 +4442,8 @@ class Microstructure(SampleData):
 
     def dilate_grains(self, dilation_steps=1, dilation_ids=None,
                       new_map_name='dilated_grain_map',
-                      update_microstructure_properties=False):
+                      update_microstructure_properties=False, n_jobs=1,
+                      block_shape=None):
         """Dilate grains to fill the gap between them.
 
         This function calls `dilate_labels` with the grain map of the
@@ -3505,6 +4451,13 @@ class Microstructure(SampleData):
         after the dilation by setting the `update_microstructure_properties`
         parameter to True.
 
+        For a given number of dilation steps, the grain map is dilated by
+        blocks, possibly in parallel, with the `process_image_blocks` method:
+        each block is extended by a halo as large as the number of steps, so
+        that the result does not depend on the blocks. Dilating until all the
+        voxels are filled (`dilation_steps=-1`) requires the whole map in
+        memory.
+
         :param int dilation_steps: the number of dilation steps to
             apply to the grain map.
         :param list dilation_ids: a list to restrict the dilation to
@@ -3512,31 +4465,53 @@ class Microstructure(SampleData):
         :param str new_map_name: the name to use for the dilated grain map.
         :param bool update_microstructure_properties: a flag to update all
             grains properties and update the microstructure phase map.
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the grain map
+            processed at once (slabs of the map by default).
         """
         if not self.__contains__('grain_map'):
             raise ValueError('microstructure %s must have an associated '
                              'grain_map ' % self.get_sample_name())
             return
-        grain_map = self.get_grain_map().copy()
-        # get rid of overlap regions flaged by -1
-        grain_map[grain_map == -1] = 0
-
+        field_names = [self.active_grain_map]
         if not self._is_empty('mask'):
+            field_names.append('mask')
+        if dilation_steps == -1:
+            grain_map = self.get_grain_map().copy()
+            # get rid of overlap regions flaged by -1
+            grain_map[grain_map == -1] = 0
+            mask = self.get_mask() if len(field_names) > 1 else None
             grain_map = Microstructure.dilate_labels(grain_map,
                                                      dilation_steps=dilation_steps,
-                                                     mask=self.get_mask(),
+                                                     mask=mask,
                                                      dilation_ids=dilation_ids)
+            # finally assign the dilated grain map to the microstructure
+            self.set_grain_map(grain_map, map_name=new_map_name)
         else:
-            grain_map = Microstructure.dilate_labels(grain_map,
-                                                     dilation_steps=dilation_steps,
-                                                     dilation_ids=dilation_ids)
-        # finally assign the dilated grain map to the microstructure
-        self.set_grain_map(grain_map, map_name=new_map_name)
+            dtype = self.get_node(self.active_grain_map).dtype
+            # the blocks are read with their halo: the dilated map cannot
+            # overwrite the active map before the end of the processing
+            output_name = new_map_name
+            if new_map_name == self.active_grain_map:
+                output_name = new_map_name + '_dilated'
+            statistics = self.process_image_blocks(
+                field_names, _dilate_grains_kernel,
+                outputs={output_name: dtype}, halo=dilation_steps,
+                n_jobs=n_jobs, block_shape=block_shape,
+                kernel_kwargs={'new_map_name': output_name,
+                               'dilation_steps': dilation_steps,
+                               'dilation_ids': dilation_ids},
+                compression_options=self.default_compression_options)
+            if output_name != new_map_name:
+                self.remove_node(new_map_name)
+                self.rename_node(output_name, new_map_name)
+            # the dilated map differs from the active map by the changes
+            for ids, region in filter(None, statistics):
+                self._mark_grains_dirty(ids, region)
+            self.set_active_grain_map(new_map_name)
 
         if update_microstructure_properties:
-            self.recompute_grain_bounding_boxes()
-            self.recompute_grain_centers()
-            self.recompute_grain_volumes()
+            self.update_grain_geometry(n_jobs=n_jobs)
             # and update the phase map if necessary
             if not self._is_empty('phase_map'):
                 self.update_phase_map_from_grains()
@@ -3634,12 +4609,13 @@ class Microstructure(SampleData):
             y_start = 0
         if not z_start:
             z_start = 0
+        dims = self.get_attribute('dimension', 'CellData')
         if not x_end:
-            x_end = self.get_grain_map().shape[0]
+            x_end = dims[0]
         if not y_end:
-            y_end = self.get_grain_map().shape[1]
+            y_end = dims[1]
         if not z_end:
-            z_end = self.get_grain_map().shape[2]
+            z_end = dims[2] if len(dims) > 2 else 1
         if not crop_name:
             crop_name = self.get_sample_name() + \
                         (not self.get_sample_name().endswith('_')) * '_' + 'crop'
@@ -3653,55 +4629,30 @@ class Microstructure(SampleData):
                 micro_crop.add_phase(self.get_phase(phase_id=i))
         micro_crop.default_compression_options = self.default_compression_options
         print('cropping microstructure to %s' % micro_crop.h5_file)
-        # crop all CellData fields
-        image_group = self.get_node('CellData')
+        # crop all CellData fields, only the cropped region is read
         spacing = self.get_attribute('spacing', 'CellData')
-        FIndex_path = '%s/Field_index' % image_group._v_pathname
-        field_list = self.get_node(FIndex_path)
-        for name in field_list:
-            field_name = name.decode('utf-8')
-            print('cropping field %s' % field_name)
-            field = self.get_field(field_name)
-            if not self._is_empty(field_name):
-                if self._get_group_type('CellData') == '2DImage':
-                    field_crop = field[x_start:x_end, y_start:y_end, ...]
-                else:
-                    field_crop = field[x_start:x_end, y_start:y_end,
-                                       z_start:z_end, ...]
-                empty = micro_crop.get_attribute(attrname='empty',
-                                                 nodename='CellData')
-                if empty:
-                    micro_crop.add_image_from_field(
-                        field_array=field_crop, fieldname=field_name,
-                        imagename='CellData', location='/',
-                        spacing=spacing, replace=True)
-                else:
-                    micro_crop.add_field(gridname='CellData',
-                                         fieldname=field_name,
-                                         array=field_crop, replace=True)
+        dims = self.get_attribute('dimension', 'CellData')
+        selection = tuple(slice(start, end) for start, end in
+                          zip([x_start, y_start, z_start],
+                              [x_end, y_end, z_end]))[:len(dims)]
+        crop_dims = [len(range(*sl.indices(n)))
+                     for sl, n in zip(selection, dims)]
         # update the origin of the image group according to the crop
         origin = self.get_attribute('origin', 'CellData')
-        origin += spacing * np.array([x_start, y_start, z_start])
+        origin += spacing * np.array([x_start, y_start, z_start])[:len(dims)]
         print('origin will be set to', origin)
-        micro_crop.set_origin('CellData', origin)
+        micro_crop._add_cell_data_image(crop_dims, spacing, origin)
+        self._copy_cell_data_to(micro_crop, selection=selection)
         if verbose:
             print('cropped dataset:')
             print(micro_crop)
         micro_crop.set_active_grain_map(self.active_grain_map)
-        grain_ids = np.unique(micro_crop.get_grain_map())
-        for gid in grain_ids:
-            if not gid > 0:
-                continue
-            grain = self.grains.read_where('idnumber == gid')
-            micro_crop.grains.append(grain)
+        self._copy_grains_in_map_to(micro_crop)
         print('%d grains in cropped microstructure' % micro_crop.grains.nrows)
-        micro_crop.grains.flush()
         # recompute the grain geometry
         if recompute_geometry:
             print('updating grain geometry')
-            micro_crop.recompute_grain_bounding_boxes(verbose)
-            micro_crop.recompute_grain_centers(verbose)
-            micro_crop.recompute_grain_volumes()
+            micro_crop.recompute_grain_geometry()
         return micro_crop
 
     def sync_grain_table_with_grain_map(self, sync_geometry=False):
@@ -3754,16 +4705,21 @@ class Microstructure(SampleData):
             new_ids = self.get_grain_ids()[np.argsort(sizes)][::-1]
         else:
             new_ids = range(1, len(np.unique(grain_map)) + 1)
-        for i, g in enumerate(tqdm(self.grains, desc='renumbering grains')):
-            gid = g['idnumber']
-            if not gid > 0:
-                # only renumber positive grain ids
-                continue
-            new_id = new_ids[i]
-            grain_map_renum[grain_map == gid] = new_id
-            if not only_grain_map:
-                g['idnumber'] = new_id
-                g.update()
+        ids = self.get_grain_ids()
+        new_ids = np.asarray(new_ids)[:len(ids)]
+        # only renumber positive grain ids
+        renumber = ids > 0
+        old_ids, new_ids_map = ids[renumber], new_ids[renumber]
+        if len(old_ids) > 0:
+            # relabel the whole map at once with a sorted lookup of the ids
+            order = np.argsort(old_ids)
+            pos = np.searchsorted(old_ids, grain_map, sorter=order)
+            pos = order[np.minimum(pos, len(old_ids) - 1)]
+            match = old_ids[pos] == grain_map
+            grain_map_renum[match] = new_ids_map[pos[match]]
+        if not only_grain_map:
+            ids[renumber] = new_ids_map
+            self.set_tablecol('GrainDataTable', 'idnumber', ids)
         print('maximum grain id is now %d' % max(new_ids))
         if only_grain_map:
             return grain_map_renum
@@ -3991,31 +4947,29 @@ class Microstructure(SampleData):
             print('warning: need a grain map to recompute the bounding boxes'
                   ' of the grains')
             return
+        grain_map = self.get_grain_map()
         # find_objects will return a list of N slices, N being the max grain id
-        slices = ndimage.find_objects(self.get_grain_map())
-        for g in tqdm(self.grains, desc='computing grain bounding boxes'):
-            try:
-                g_slice = slices[g['idnumber'] - 1]
-                x_indices = (g_slice[0].start, g_slice[0].stop)
-                y_indices = (g_slice[1].start, g_slice[1].stop)
-                z_indices = (g_slice[2].start, g_slice[2].stop)
-                bbox = x_indices, y_indices, z_indices
-            except (ValueError, TypeError, IndexError):
-                '''
-                ValueError or TypeError can arise for grains in the data table
-                that are not in the grain map (None will be returned from
-                find_objects). IndexError can occur if these grain ids are
-                larger than the maximum id in the grain map.
-                '''
-                print('skipping grain %d' % g['idnumber'])
-                continue
-            if verbose:
+        slices = ndimage.find_objects(np.maximum(grain_map, 0))
+        # slices bounds as an array, with -1 for the ids missing in the map
+        bounds = -np.ones((len(slices) + 1, 3, 2), dtype=int)
+        if grain_map.ndim == 3:
+            for i, g_slice in enumerate(slices):
+                if g_slice is not None:
+                    bounds[i + 1] = [(sl.start, sl.stop) for sl in g_slice]
+        ids = self.get_grain_ids()
+        # grains in the data table that are not in the grain map are skipped
+        found = (ids > 0) & (ids <= len(slices))
+        found[found] = bounds[ids[found], 0, 0] >= 0
+        for gid in ids[~found]:
+            print('skipping grain %d' % gid)
+        bounding_boxes = self.grains.col('bounding_box')
+        bounding_boxes[found] = bounds[ids[found]]
+        if verbose:
+            for gid, bbox in zip(ids[found], bounding_boxes[found]):
                 print('grain %d bounding box: [%d:%d, %d:%d, %d:%d]'
-                      % (g['idnumber'], bbox[0][0], bbox[0][1], bbox[1][0],
+                      % (gid, bbox[0][0], bbox[0][1], bbox[1][0],
                          bbox[1][1], bbox[2][0], bbox[2][1]))
-            g['bounding_box'] = bbox
-            g.update()
-        self.grains.flush()
+        self.set_bounding_boxes(bounding_boxes)
         return self.get_grain_bounding_boxes()
 
     def compute_grains_geometry(self, overwrite_table=False):
@@ -4086,15 +5040,221 @@ class Microstructure(SampleData):
             print(str(not_in_table).strip('[]'))
         return intersection, not_in_map, not_in_table
 
+    @staticmethod
+    def compute_grain_map_statistics(grain_map, orientation_map=None,
+                                     slab_size=None):
+        """Compute the voxel statistics of all grains in a single pass.
+
+        The grain map is read by slabs along its first dimension, so that it
+        can be a HDF5 dataset (`h5py` dataset or `tables` array) larger than
+        the memory. The statistics are given in the dimension order of the
+        array: use the reversed order for arrays stored with the (Z,Y,X)
+        convention. Only positive grain ids are taken into account.
+
+        :param grain_map: a 2D or 3D array-like of the grain ids.
+        :param orientation_map: an optional array-like with the same first
+            dimensions as the grain map, giving the orientation of the grains
+            at each voxel (for instance as rodrigues vectors). The orientation
+            of a grain is taken at one of its voxels.
+        :param int slab_size: the number of slices of the grain map read at
+            once, by default slabs of about 16 million voxels are used.
+        :return: a dictionary with the ids of the grains found in the map
+            (`ids`), their number of voxels (`sizes`), their center of mass
+            in voxel unit (`centers`), their bounding box as [start, stop[
+            indices along each dimension (`bounding_boxes`) and, if an
+            orientation map is given, their orientation (`orientations`).
+        """
+        shape = tuple(grain_map.shape)
+        ndim = len(shape)
+        if slab_size is None:
+            slab_size = max(1, 2 ** 24 // max(1, int(np.prod(shape[1:]))))
+        n = 1
+        sizes = np.zeros(n, dtype=np.int64)
+        sums = np.zeros((n, ndim))
+        bbs = np.zeros((n, ndim, 2), dtype=np.int64)
+        bbs[:, :, 0] = np.iinfo(np.int64).max
+        found = np.zeros(n, dtype=bool)
+        orientations = None
+        for k0 in range(0, shape[0], slab_size):
+            labels = np.asarray(grain_map[k0:k0 + slab_size])
+            valid = labels > 0
+            slab_ids = labels[valid]
+            if len(slab_ids) == 0:
+                continue
+            if slab_ids.max() >= n:
+                # grow the statistics arrays to the largest grain id
+                grow = int(slab_ids.max()) + 1 - n
+                sizes = np.concatenate((sizes, np.zeros(grow, dtype=np.int64)))
+                sums = np.concatenate((sums, np.zeros((grow, ndim))))
+                new_bbs = np.zeros((grow, ndim, 2), dtype=np.int64)
+                new_bbs[:, :, 0] = np.iinfo(np.int64).max
+                bbs = np.concatenate((bbs, new_bbs))
+                found = np.concatenate((found, np.zeros(grow, dtype=bool)))
+                if orientations is not None:
+                    orientations = np.concatenate(
+                        (orientations,
+                         np.zeros((grow,) + orientations.shape[1:])))
+                n += grow
+            slab_sizes = np.bincount(slab_ids, minlength=n)
+            sizes += slab_sizes
+            for axis in range(ndim):
+                coords = np.arange(labels.shape[axis]) + (k0 if axis == 0 else 0)
+                coords = coords.reshape([-1 if i == axis else 1
+                                         for i in range(ndim)])
+                sums[:, axis] += np.bincount(
+                    slab_ids, weights=np.broadcast_to(coords, labels.shape)[valid],
+                    minlength=n)
+            present = np.flatnonzero(slab_sizes)
+            objects = ndimage.find_objects(np.where(valid, labels, 0))
+            bounds = np.array([[(sl.start, sl.stop) for sl in objects[gid - 1]]
+                               for gid in present])
+            bounds[:, 0, :] += k0
+            bbs[present, :, 0] = np.minimum(bbs[present, :, 0], bounds[:, :, 0])
+            bbs[present, :, 1] = np.maximum(bbs[present, :, 1], bounds[:, :, 1])
+            if orientation_map is not None:
+                new = present[~found[present]]
+                if len(new) > 0:
+                    # index of one voxel of each grain in the slab
+                    voxel = np.zeros(n, dtype=np.int64)
+                    voxel[slab_ids] = np.flatnonzero(valid)
+                    values = np.asarray(orientation_map[k0:k0 + slab_size])
+                    values = values.reshape((labels.size,)
+                                            + values.shape[ndim:])
+                    if orientations is None:
+                        orientations = np.zeros((n,) + values.shape[1:])
+                    orientations[new] = values[voxel[new]]
+            found[present] = True
+        ids = np.flatnonzero(found)
+        statistics = {'ids': ids,
+                      'sizes': sizes[ids],
+                      'centers': sums[ids] / sizes[ids][:, np.newaxis],
+                      'bounding_boxes': bbs[ids]}
+        if orientation_map is not None:
+            if orientations is None:
+                orientations = np.zeros((n,) + orientation_map.shape[ndim:])
+            statistics['orientations'] = orientations[ids]
+        return statistics
+
+    def recompute_grain_geometry(self, columns=None, n_jobs=1,
+                                 block_shape=None):
+        """Compute the volume, center and bounding box of all grains.
+
+        The geometry of the grains is computed in a single pass over the
+        active grain map, processed by blocks (possibly in parallel) with the
+        `process_image_blocks` method, and the columns of the GrainDataTable
+        are then written at once. The values are the same as the ones of the
+        `recompute_grain_volumes`, `recompute_grain_centers` and
+        `recompute_grain_bounding_boxes` methods. Grains of the table that
+        are not in the grain map are skipped.
+
+        :param list columns: the columns of the GrainDataTable to update,
+            among 'volume', 'center' and 'bounding_box' (all by default).
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the grain map
+            processed at once (slabs of the map by default).
+        """
+        if self._is_empty('grain_map'):
+            print('warning: needs a grain map to recompute the geometry '
+                  'of the grains')
+            return
+        if columns is None:
+            columns = ['volume', 'center', 'bounding_box']
+        stats = merge_label_statistics(self.process_image_blocks(
+            [self.active_grain_map], label_statistics_kernel, n_jobs=n_jobs,
+            block_shape=block_shape))
+        self._set_grains_geometry(stats, columns, self.get_grain_ids())
+        if len(columns) == 3:
+            self._dirty_grain_ids = set()
+            self._dirty_region = None
+        return
+
+    def update_grain_geometry(self, columns=None, n_jobs=1,
+                              block_shape=None):
+        """Update the volume, center and bounding box of the edited grains.
+
+        The grain map edition methods (`set_grain_map` with
+        `track_changes`, `set_grain_map_block`, `dilate_grain`,
+        `dilate_grains` and `merge_grains`) record the ids of the grains they modify and the
+        region of the modifications. Only the region covering the edited
+        region and the bounding boxes of these grains is read, and only their
+        rows of the GrainDataTable are written. Edited grains that are not
+        in the grain map anymore get a zero volume. If the whole grain map
+        has been replaced, all the geometry is recomputed with the
+        `recompute_grain_geometry` method.
+
+        :param list columns: the columns of the GrainDataTable to update,
+            among 'volume', 'center' and 'bounding_box' (all by default).
+        :param int n_jobs: the number of processes used for a complete
+            recomputation.
+        :param tuple block_shape: the shape of the blocks of the grain map
+            processed at once for a complete recomputation.
+        """
+        if self._dirty_grain_ids is None:
+            self.recompute_grain_geometry(columns=columns, n_jobs=n_jobs,
+                                          block_shape=block_shape)
+            return
+        if columns is None:
+            columns = ['volume', 'center', 'bounding_box']
+        ids = self.get_dirty_grains()
+        ids = ids[np.isin(ids, self.get_grain_ids())]
+        if len(ids) > 0 and not self._is_empty('grain_map'):
+            # covers the previous bounding boxes and the edited region
+            selection = self._get_grains_region(ids)
+            offset = [sl.start for sl in selection]
+            block = self.get_image_field_block(self.active_grain_map,
+                                               selection)
+            stats = merge_label_statistics(
+                [label_statistics(np.where(np.isin(block, ids), block, 0),
+                                  offset=offset)])
+            self._set_grains_geometry(stats, columns, ids)
+            # the edited grains which vanished from the grain map
+            vanished = ids[np.isin(ids, stats['ids'], invert=True)]
+            if 'volume' in columns and len(vanished) > 0:
+                self.set_grain_columns({'volume': np.zeros(len(vanished))},
+                                       id_list=vanished)
+        if len(columns) == 3:
+            self._dirty_grain_ids = set()
+            self._dirty_region = None
+        return
+
+    def _set_grains_geometry(self, stats, columns, ids):
+        """Write the geometry of grains in the GrainDataTable.
+
+        :param dict stats: the label statistics of the grain map, as
+            returned by `merge_label_statistics`.
+        :param list columns: the columns of the GrainDataTable to write.
+        :param ndarray ids: the ids of the grains to write, the grains which
+            are not in the statistics are skipped.
+        """
+        voxel_size = np.array(self.get_attribute('spacing', 'CellData'))
+        origin = np.array(self.get_attribute('origin', 'CellData'))
+        volumes = stats['sizes'] * np.prod(voxel_size)
+        centers = stats['centers']
+        bounding_boxes = stats['bounding_boxes']
+        if len(voxel_size) == 2:
+            voxel_size = np.concatenate((voxel_size, [0]))
+            origin = np.concatenate((origin, [0]))
+            centers = np.pad(centers, ((0, 0), (0, 1)))
+            bounding_boxes = np.concatenate(
+                (bounding_boxes, np.tile([[[0, 1]]], (len(centers), 1, 1))),
+                axis=1)
+        rows = np.searchsorted(stats['ids'], ids)
+        in_map = rows < len(stats['ids'])
+        in_map[in_map] = stats['ids'][rows[in_map]] == ids[in_map]
+        values = {'volume': volumes,
+                  'center': origin + (centers + 0.5) * voxel_size,
+                  'bounding_box': bounding_boxes}
+        self.set_grain_columns({col: values[col][rows[in_map]]
+                                for col in columns},
+                               id_list=ids[in_map])
+        return
+
     def build_grain_table_from_grain_map(self):
         """Synchronizes and recomputes GrainDataTable from active grain map."""
         # First step: synchronize table with grain map
         self.sync_grain_table_with_grain_map()
         # Second step, recompute grain geometry
-        # TODO: use recompute_grain_geometry when method is corrected
-        self.recompute_grain_bounding_boxes()
-        self.recompute_grain_centers()
-        self.recompute_grain_volumes()
+        self.recompute_grain_geometry()
         return
 
     def is_unitary_vector(v):
@@ -5175,87 +6335,60 @@ class Microstructure(SampleData):
         # create the microstructure with the phase infos
         m = Microstructure(name=name, overwrite_hdf5=True, phase=phase)
 
-        # load LabDCT cell data
+        # stream LabDCT cell data, volumes are stored in (Z,Y,X) order as
+        # the CellData image fields
         with h5py.File(file_path, 'r') as f:
             spacing = f['LabDCT']['Spacing'][0]
-            rodrigues_map = f['LabDCT']['Data']['Rodrigues'][()].transpose(2, 1, 0, 3)
-            grain_map = f['LabDCT']['Data'][grain_map_key][()].transpose(2, 1, 0)
-            print('adding cell data with shape {}'.format(grain_map.shape))
-            m.set_grain_map(grain_map, voxel_size=spacing)
-            mask = f['LabDCT']['Data']['Mask'][()].transpose(2, 1, 0)
-            m.set_mask(mask, voxel_size=spacing)
-            phase_map = f['LabDCT']['Data']['PhaseId'][()].transpose(2, 1, 0)
-            m.set_phase_map(phase_map, voxel_size=spacing)
-            m.set_orientation_map(rodrigues_map)
-            if 'Completeness' in f['LabDCT/Data']:
-                completeness_map = f['LabDCT']['Data']['Completeness'][()].transpose(2, 1, 0)
-                m.add_field(gridname='CellData', fieldname='completeness_map',
-                            array=completeness_map)
-
-        # analyze the grain map
-        grain_ids_list = range(1, grain_map.max() + 1)  # ids are consecutive
-        slices = ndimage.find_objects(grain_map)
-        mask = grain_map > 0
-        sizes = ndimage.sum(mask, grain_map, grain_ids_list)
-
-        # create grain data table infos
-        grain = m.grains.row
-        for i in tqdm(range(len(grain_ids_list)), desc='adding grains to the microstructure'):
-            gid = grain_ids_list[i]
-            # use the bounding box for this grain
-            g_slice = slices[i]
-            x_indices = (g_slice[0].start, g_slice[0].stop)
-            y_indices = (g_slice[1].start, g_slice[1].stop)
-            z_indices = (g_slice[2].start, g_slice[2].stop)
-            bb = x_indices, y_indices, z_indices
-            this_grain_map = grain_map[bb[0][0]:bb[0][1],
-                                    bb[1][0]:bb[1][1],
-                                    bb[2][0]:bb[2][1]]
-            # here orientations are constant per grain, grab the first voxel for each grain
-            indices = np.where(this_grain_map == gid)
-            rod = rodrigues_map[bb[0][0] + indices[0][0],
-                                bb[1][0] + indices[1][0],
-                                bb[2][0] + indices[2][0], :]
-            # grain center
-            grain_data_bin = (this_grain_map == gid).astype(np.uint8)
-            local_com = ndimage.measurements.center_of_mass(grain_data_bin) + \
-                        np.array([0.5, 0.5, 0.5])  # account for first voxel coordinates
-            com = spacing * (np.array(bb)[:, 0] + local_com - 0.5 * np.array(grain_map.shape))
-
-            # create new grain in the data table
-            grain['idnumber'] = gid
-            grain['orientation'] = rod
-            grain['bounding_box'] = bb
-            grain['center'] = com
-            grain['volume'] = sizes[i] * spacing ** 3
-            grain.append()
-        m.grains.flush()
+            data = f['LabDCT']['Data']
+            print('adding cell data with shape {}'.format(
+                data[grain_map_key].shape[::-1]))
+            m._add_cell_data_field_from_dataset(data[grain_map_key],
+                                                'grain_map',
+                                                voxel_size=spacing)
+            m.set_active_grain_map('grain_map')
+            mask_dtype = np.uint8 if data['Mask'].dtype == bool else None
+            m._add_cell_data_field_from_dataset(data['Mask'], 'mask',
+                                                indexname='mask',
+                                                dtype=mask_dtype)
+            m._add_cell_data_field_from_dataset(data['PhaseId'], 'phase_map',
+                                                indexname='phase_map')
+            m.set_active_phase_map('phase_map')
+            m._add_cell_data_field_from_dataset(data['Rodrigues'],
+                                                'orientation_map',
+                                                indexname='orientation_map')
+            if 'Completeness' in data:
+                m._add_cell_data_field_from_dataset(data['Completeness'],
+                                                    'completeness_map',
+                                                    compression=dict())
+            # analyze the grain map in a single pass, orientations are
+            # constant per grain, grab one voxel for each grain
+            stats = Microstructure.compute_grain_map_statistics(
+                data[grain_map_key], data['Rodrigues'])
+            dims = np.array(data[grain_map_key].shape[::-1])
+
+        # create grain data table infos, statistics are in (Z,Y,X) order
+        centers = stats['centers'][:, ::-1] + 0.5  # voxel centers
+        m.append_grain_columns(
+            {'idnumber': stats['ids'],
+             'orientation': stats['orientations'],
+             'bounding_box': stats['bounding_boxes'][:, ::-1],
+             'center': spacing * (centers - 0.5 * dims),
+             'volume': stats['sizes'] * spacing ** 3})
 
         if include_ipf_map:
             print('adding X, Y and Z-IPF maps')
             with h5py.File(file_path, 'r') as f:
-                if 'IPF001' in f['LabDCT/Data']:
-                    IPF001_map = f['LabDCT/Data/IPF001'][()].transpose(2, 1, 0, 3)
-                else:
-                    IPF001_map = m.create_IPF_map(axis=np.array([0., 0., 1.]))
-                m.add_field(gridname='CellData', fieldname='IPF001_map',
-                            array=IPF001_map, 
-                            compression_options=m.default_compression_options)
-                if 'IPF010' in f['LabDCT/Data']:
-                    IPF010_map = f['LabDCT/Data/IPF010'][()].transpose(2, 1, 0, 3)
-                else:
-                    IPF010_map = m.create_IPF_map(axis=np.array([0., 1., 0.]))
-                m.add_field(gridname='CellData', fieldname='IPF010_map',
-                            array=IPF010_map, 
-                            compression_options=m.default_compression_options)
-                if 'IPF100' in f['LabDCT/Data']:
-                    IPF100_map = f['LabDCT/Data/IPF100'][()].transpose(2, 1, 0, 3)
-                else:
-                    IPF100_map = m.create_IPF_map(axis=np.array([1., 0., 0.]))
-                m.add_field(gridname='CellData', fieldname='IPF100_map',
-                            array=IPF100_map, 
-                            compression_options=m.default_compression_options)
-                del IPF001_map, IPF010_map, IPF100_map
+                for ipf, axis in [('IPF001', [0., 0., 1.]),
+                                  ('IPF010', [0., 1., 0.]),
+                                  ('IPF100', [1., 0., 0.])]:
+                    if ipf in f['LabDCT/Data']:
+                        m._add_cell_data_field_from_dataset(
+                            f['LabDCT/Data'][ipf], ipf + '_map')
+                    else:
+                        m.add_field(gridname='CellData',
+                                    fieldname=ipf + '_map',
+                                    array=m.create_IPF_map(axis=np.array(axis)),
+                                    compression_options=m.default_compression_options)
         return m
 
     @staticmethod
@@ -5331,13 +6464,11 @@ class Microstructure(SampleData):
         phase = CrystallinePhase(name=phase_name, lattice=lattice)
         micro.set_phase(phase)
         # add all grains to the microstructure
-        grain = micro.grains.row
-        for i in range(len(index['grain'])):
-            grain['idnumber'] = index['grain'][i]['id']
-            grain['orientation'] = index['grain'][i]['R_vector']
-            grain['center'] = index['grain'][i]['center']
-            grain.append()
-        micro.grains.flush()
+        grains = index['grain']
+        micro.append_grain_columns(
+            {'idnumber': np.array([g['id'] for g in grains]),
+             'orientation': np.array([g['R_vector'] for g in grains]),
+             'center': np.array([g['center'] for g in grains])})
 
         # setup file pathes
         if use_dct_path:
@@ -5350,75 +6481,101 @@ class Microstructure(SampleData):
             mask_path = os.path.join(data_dir, mask_file)
             phase_path = os.path.join(data_dir, phase_file)
             rod_map_path = os.path.join(data_dir, rod_map_file)
+        # work out the ROI
+        selection = None
+        if roi:
+            x1, x2, y1, y2, z1, z2 = roi
+            selection = (slice(x1, x2), slice(y1, y2), slice(z1, z2))
+        # volumes written by matlab in hdf5 format are stored with swapped X
+        # and Z axes, as the CellData image fields: they are streamed into
+        # the microstructure file
         # load the grain map if available
         if os.path.exists(grain_map_path):
             try:
                 with h5py.File(grain_map_path, 'r') as f:
-                    # because how matlab writes the data, we need to swap X and Z
-                    # axes in the DCT volume
-                    print(f[vol_key][()].shape)
+                    print(f[vol_key].shape)
                     print(voxel_size)
-                    grain_map = f[vol_key][()].transpose(2, 1, 0)
+                    micro._add_cell_data_field_from_dataset(
+                        f[vol_key], 'grain_map', voxel_size=voxel_size,
+                        selection=selection)
+                micro.set_active_grain_map('grain_map')
             except OSError:
                 # fallback on matlab format
                 grain_map = loadmat(grain_map_path)[vol_key]
-            # work out the ROI
-            if roi:
-                x1, x2, y1, y2, z1, z2 = roi
-                grain_map = grain_map[x1:x2, y1:y2, z1:z2]
-            micro.set_grain_map(grain_map, voxel_size)
+                if roi:
+                    grain_map = grain_map[x1:x2, y1:y2, z1:z2]
+                micro.set_grain_map(grain_map, voxel_size)
+            grain_map_shape = micro.get_attribute('dimension', 'CellData')
             location = micro._get_parent_name(micro.active_grain_map)
-            origin = -0.5 * micro.get_voxel_size() * np.array(micro.get_grain_map().shape)
+            origin = -0.5 * micro.get_voxel_size() * np.array(grain_map_shape)
             micro.set_origin(location, origin)
             if verbose:
                 print('loaded grain ids volume with shape: {}'.format(
-                    micro.get_grain_map().shape))
+                    grain_map_shape))
             print('computing grain bounding boxes')
-            micro.recompute_grain_bounding_boxes()
+            micro.recompute_grain_geometry(columns=['bounding_box'])
         # load the mask if available
         if os.path.exists(mask_path):
+            mask = None
             try:
                 with h5py.File(mask_path, 'r') as f:
-                    mask = f[mask_key][()].transpose(2, 1, 0).astype(np.uint8)
+                    mask_shape = f[mask_key].shape[::-1]
+                    if selection is not None:
+                        mask_shape = [len(range(*sl.indices(n)))
+                                      for sl, n in zip(selection, mask_shape)]
+                    if micro._is_empty('CellData') or np.array_equal(
+                            mask_shape,
+                            micro.get_attribute('dimension', 'CellData')):
+                        micro._add_cell_data_field_from_dataset(
+                            f[mask_key], 'mask', indexname='mask',
+                            voxel_size=voxel_size, selection=selection,
+                            dtype=np.uint8)
+                    else:
+                        mask = f[mask_key][()].transpose(2, 1, 0).astype(np.uint8)
             except OSError:
                 # fallback on matlab format
                 mask = loadmat(mask_path)[mask_key]
-            if roi:
-                x1, x2, y1, y2, z1, z2 = roi
-                mask = mask[x1:x2, y1:y2, z1:z2]
-            # check if mask shape needs to be zero padded
-            if not mask.shape == micro.get_grain_map().shape:
-                offset = np.array(micro.get_grain_map().shape) - np.array(mask.shape)
-                padding = [(o // 2, o // 2) for o in offset]
-                print('mask padding is {}'.format(padding))
-                mask = np.pad(mask, padding, mode='constant')
-            print('now mask shape is {}'.format(mask.shape))
-            micro.set_mask(mask, voxel_size)
+            if mask is not None:
+                if roi:
+                    mask = mask[x1:x2, y1:y2, z1:z2]
+                # check if mask shape needs to be zero padded
+                if not mask.shape == micro.get_grain_map().shape:
+                    offset = np.array(micro.get_grain_map().shape) - np.array(mask.shape)
+                    padding = [(o // 2, o // 2) for o in offset]
+                    print('mask padding is {}'.format(padding))
+                    mask = np.pad(mask, padding, mode='constant')
+                print('now mask shape is {}'.format(mask.shape))
+                micro.set_mask(mask, voxel_size)
             if verbose:
-                print('loaded mask volume with shape: {}'.format(micro.get_mask().shape))
+                print('loaded mask volume with shape: {}'.format(
+                    micro.get_attribute('dimension', 'CellData')))
         # load the phase map if available
         if os.path.exists(phase_path):
             try:
                 with h5py.File(phase_path, 'r') as f:
-                    phase_map = f[phase_key][()].transpose(2, 1, 0).astype(np.uint8)
+                    micro._add_cell_data_field_from_dataset(
+                        f[phase_key], 'phase_map', indexname='phase_map',
+                        voxel_size=voxel_size, selection=selection,
+                        dtype=np.uint8)
+                micro.set_active_phase_map('phase_map')
             except OSError:
                 # fallback on matlab format
                 phase_map = loadmat(phase_path)[phase_key]
-            if roi:
-                x1, x2, y1, y2, z1, z2 = roi
-                phase_map = phase_map[x1:x2, y1:y2, z1:z2]
-            micro.set_phase_map(phase_map, voxel_size)
+                if roi:
+                    phase_map = phase_map[x1:x2, y1:y2, z1:z2]
+                micro.set_phase_map(phase_map, voxel_size)
             if verbose:
-                print('loaded phase_map volume with shape: {}'.format(micro.get_phase_map().shape))
+                print('loaded phase_map volume with shape: {}'.format(
+                    micro.get_attribute('dimension', 'CellData')))
         # load the orientation map if available
         if os.path.exists(rod_map_path):
             try:
                 with h5py.File(rod_map_path, 'r') as f:
-                    orientation_map = f[rod_map_key][()].transpose(3, 2, 1, 0).astype(float)
-                    if roi:
-                        x1, x2, y1, y2, z1, z2 = roi
-                        orientation_map = orientation_map[x1:x2, y1:y2, z1:z2, :]
-                    micro.set_orientation_map(orientation_map)
+                    # the rodrigues vector components are the first dimension
+                    micro._add_cell_data_field_from_dataset(
+                        _ComponentsLastDataset(f[rod_map_key]),
+                        'orientation_map', indexname='orientation_map',
+                        selection=selection, dtype=float)
                     if verbose:
                         print('loaded orientation_map volume with shape: {}'.format(micro.get_orientation_map().shape))
             except KeyError:
@@ -5460,27 +6617,34 @@ class Microstructure(SampleData):
                 else:
                     centers = np.zeros_like(avg_rods)
                 # add all grains to the microstructure
-                grain = micro.grains.row
-                for i in range(avg_rods.shape[0]):
-                    grain['idnumber'] = grain_ids[i]
-                    grain['orientation'] = avg_rods[i, :]
-                    grain['center'] = centers[i]
-                    grain.append()
-                micro.grains.flush()
-            # load cell data
-            if 'grain_ids' in f['CellData']:
-                micro.set_grain_map(f['CellData/grain_ids'][()],
-                                    f['CellData/grain_ids'].attrs['voxel_size'])
-                micro.recompute_grain_bounding_boxes()
-                micro.recompute_grain_volumes()
-            if 'mask' in f['CellData']:
-                micro.set_mask(f['CellData/mask'][()],
-                               f['CellData/mask'].attrs['voxel_size'])
+                micro.append_grain_columns({'idnumber': np.array(grain_ids),
+                                            'orientation': avg_rods,
+                                            'center': centers})
+            # load cell data, 3D volumes are copied by blocks
+            for key, name, indexname in [('grain_ids', 'grain_map', None),
+                                         ('mask', 'mask', 'mask')]:
+                if key not in f['CellData']:
+                    continue
+                dataset = f['CellData'][key]
+                voxel_size = dataset.attrs['voxel_size']
+                if dataset.ndim == 3:
+                    micro._add_cell_data_field_from_dataset(
+                        dataset, name, indexname=indexname,
+                        voxel_size=voxel_size, storage_order=False)
+                elif key == 'grain_ids':
+                    micro.set_grain_map(dataset[()], voxel_size)
+                else:
+                    micro.set_mask(dataset[()], voxel_size)
+                if key == 'grain_ids':
+                    micro.set_active_grain_map('grain_map')
+                    micro.recompute_grain_geometry(
+                        columns=['bounding_box', 'volume'])
             return micro
 
     @staticmethod
     def from_ebsd(file_path, roi=None, ds=1, tol=5., min_ci=0.2, min_size=0.0, 
-                  phase_list=None, ref_frame_id=2, grain_ids=None):
+                  phase_list=None, ref_frame_id=2, grain_ids=None,
+                  compute_gos=False):
         """"Create a microstructure from an EBSD scan.
 
         :param str file_path: the path to the file to read.
@@ -5494,10 +6658,14 @@ class Microstructure(SampleData):
         :param list phase_list: a list of CrystallinePhase to overwrite the ones
             in the file, this is particularly useful for osc files as phases
             cannot be read from them at the moment.
+        :param int ref_frame_id: the id of the spatial reference frame used
+            for the orientation data.
+        :param ndarray grain_ids: an existing segmentation of the scan to use.
+        :param bool compute_gos: if True, the grain orientation spread (mean
+            misorientation of the pixels with the grain mean orientation, in
+            degrees) is stored in a `GOS` column of the grain data table.
         :return: a new instance of `Microstructure`.
         """
-        # TODO: segmentation super slow, need to reconsider the process
-        #       (Dream3D hundreds to thousand times faster)
         # Get name of file and create microstructure instance
         name = os.path.splitext(os.path.basename(file_path))[0]
         micro = Microstructure(name=name, autodelete=False, overwrite_hdf5=True)
@@ -5538,38 +6706,54 @@ class Microstructure(SampleData):
         micro.add_field(gridname='CellData', fieldname='euler',
                         array=euler, replace=True)
 
-        # Fill GrainDataTable
-        grains = micro.grains.row
-        grain_ids_list = np.unique(grain_ids).tolist()
-        time.sleep(0.2)  # prevent tqdm from messing in the output
-        for gid in tqdm(grain_ids_list, desc='creating new grains'):
-            if gid == 0:
+        # Fill GrainDataTable, pixels are grouped by grain in a single pass
+        phase_ids = np.array([phase.phase_id for phase in scan.phase_list])
+        valid = (grain_ids > 0) & (scan.phase > 0)
+        pixel_grains = grain_ids[valid]
+        pixel_phases = scan.phase[valid].astype(int)
+        gids, inverse = np.unique(pixel_grains, return_inverse=True)
+        inverse = inverse.ravel()
+        # the phase of each grain is the most frequent one among its pixels
+        # the phase list is not necessarily sorted by phase id
+        order = np.argsort(phase_ids)
+        phase_index = np.searchsorted(phase_ids, pixel_phases, sorter=order)
+        phase_index[phase_index == len(phase_ids)] = 0
+        phase_index = order[phase_index]
+        if not np.all(phase_ids[phase_index] == pixel_phases):
+            raise ValueError('phase %d not in list' % pixel_phases[
+                phase_ids[phase_index] != pixel_phases][0])
+        phase_counts = np.bincount(inverse * len(phase_ids) + phase_index,
+                                   minlength=len(gids) * len(phase_ids))
+        phase_counts = phase_counts.reshape((len(gids), len(phase_ids)))
+        grain_phase_index = np.argmax(phase_counts, axis=1)
+        for i in np.nonzero(np.sum(phase_counts > 0, axis=1) > 1)[0]:
+            # all indexed pixel of this grain must have the same phase id
+            print('warning, phase for grain %d is not unique, using value %d'
+                  % (gids[i], phase_ids[grain_phase_index[i]]))
+        # compute the mean orientation of the grains of each phase
+        g = Orientation.Euler2OrientationMatrices(
+            np.degrees(scan.euler[valid]))
+        rods = np.zeros((len(gids), 3))
+        gos = np.zeros(len(gids))
+        pixel_phase_index = grain_phase_index[inverse]
+        for k, phase in enumerate(scan.phase_list):
+            in_phase = pixel_phase_index == k
+            if not np.any(in_phase):
                 continue
-            # get the phase for this grain
-            phase_grain = scan.phase[np.where((grain_ids == gid) & (scan.phase > 0))].astype(int)
-            values, counts = np.unique(phase_grain, return_counts=True)
-            if len(counts) == 0:
-                continue
-            grain_phase_id = values[np.argmax(counts)]
-            if len(values) > 1:
-                # all indexed pixel of this grain must have the same phase id
-                print('warning, phase for grain %d is not unique, using value %d' % (gid, grain_phase_id))
-            grain_phase_index = [phase.phase_id for phase in scan.phase_list].index(grain_phase_id)
-            sym = scan.phase_list[grain_phase_index].get_symmetry()
-            # compute the mean orientation for this grain
-            euler_grain = scan.euler[np.where((grain_ids == gid) & (scan.phase > 0))]
-            rods = Orientation.eu2ro(euler_grain)
-            rods = np.atleast_2d(rods)  # for one pixel grains
-            o_tsl = Orientation.compute_mean_orientation(rods, symmetry=sym)
-            grains['idnumber'] = gid
-            grains['phase'] = scan.phase_list[grain_phase_index].phase_id
-            grains['orientation'] = o_tsl.rod
-            grains.append()
-        micro.grains.flush()
-        #print('computing grains geometry')
-        #micro.recompute_grain_bounding_boxes()
-        #micro.recompute_grain_centers(verbose=False)
-        #micro.recompute_grain_volumes(verbose=False)
+            ids, g_mean, spread = Orientation.compute_mean_orientations(
+                g[in_phase], inverse[in_phase], phase.get_symmetry(),
+                spread=compute_gos)
+            rods[ids] = Orientation.OrientationMatrices2Rodrigues(g_mean)
+            if compute_gos:
+                gos[ids] = spread
+        micro.append_grain_columns({'idnumber': gids,
+                                    'phase': phase_ids[grain_phase_index],
+                                    'orientation': rods})
+        if compute_gos:
+            micro.add_tablecols('GrainDataTable',
+                                np.dtype([('GOS', np.float64)]))
+            micro.set_tablecol('GrainDataTable', 'GOS', gos)
+        micro.recompute_grain_geometry()
         micro.sync()
         return micro
 
@@ -5897,34 +7081,50 @@ class Microstructure(SampleData):
         merged_micro.sync()
         return merged_micro
 
-    def get_grain_boundaries_map(self, kernel_size=3):
-        """
-        method to compute grain boundaries map using microstructure grain_map
-        """
-        x, y, z = self.get_grain_map().shape
-        grain_boundaries_map = np.zeros_like(self.get_grain_map())
-        pad_grain_map = np.pad(self.get_grain_map(), pad_width=1)
-                
-        for i in range(x):
-            for j in range(y):
-                for k in range(z):
-                    kernel = pad_grain_map[i:i+kernel_size//2+1,
-                                        j:j+kernel_size//2+1,
-                                        k:k+kernel_size//2+1]
-                    mean_kernel = np.mean(kernel)
-                    inten_level = np.abs(grain_map[i, j, k] - mean_kernel)
-                    if inten_level > 0:
-                        grain_boundaries_map[i, j, k] = 1
-
-        return grain_boundaries_map
-    
+    def get_grain_boundaries_map(self, kernel_size=3, store=False, n_jobs=1,
+                                 block_shape=None):
+        """Compute a grain boundaries map from the active grain map.
+
+        A voxel belongs to a grain boundary if a voxel with another grain id
+        is found in the cubic neighbourhood of size `kernel_size` centered on
+        it, the image being surrounded by zeros. The grain map is processed
+        by blocks, possibly in parallel, with the `process_image_blocks`
+        method.
+
+        :param int kernel_size: the size of the neighbourhood in voxels.
+        :param bool store: if True, the map is written by blocks in the
+            image group of the grain map, with name `grain_boundaries_map`,
+            instead of being returned.
+        :param int n_jobs: the number of processes used.
+        :param tuple block_shape: the shape of the blocks of the grain map
+            processed at once (slabs of the map by default).
+        :return: the grain boundaries map as a numpy array of uint8 (None if
+            the map is stored).
+        """
+        shape = tuple(self.get_attribute(
+            'dimension', self._get_parent_name(self.active_grain_map)))
+        if store:
+            outputs = {'grain_boundaries_map': np.uint8}
+        else:
+            outputs = {'grain_boundaries_map': np.zeros(shape, np.uint8)}
+        self.process_image_blocks(
+            [self.active_grain_map], _grain_boundaries_kernel,
+            outputs=outputs, halo=kernel_size // 2, halo_fill=0,
+            n_jobs=n_jobs, kernel_kwargs={'kernel_size': kernel_size},
+            block_shape=block_shape,
+            compression_options=self.default_compression_options)
+        if not store:
+            return outputs['grain_boundaries_map']
+
     def resample(self, resampling_factor, resample_name=None, autodelete=False,
-            recompute_geometry=True, verbose=False):
+            recompute_geometry=True, majority_vote=False, verbose=False):
         """
         Resample the microstructure by a given factor to create a new one.
 
         This method resamples the CellData image group to a new microstructure,
-        and adapts the GrainDataTable to the resampled.
+        and adapts the GrainDataTable to the resampled. The fields are read
+        and written by blocks. By default, the first voxel of each block of
+        `resampling_factor` voxels is kept.
 
         :param int resample_factor: the factor used for resolution degradation
         :param str resample_name: the name for the resampled microstructure
@@ -5937,6 +7137,9 @@ class Microstructure(SampleData):
             grains, for instance when resampling a microstructure within the
             mask, to avoid the heavy computational cost of the grain geometry
             data update.
+        :param bool majority_vote: if `True`, the label maps (integer scalar
+            fields such as the grain map) are resampled by taking the most
+            frequent value of each block of voxels.
         :param bool verbose: activate verbose mode.
         :return: a new `Microstructure` instance with the resampled grain map.
         """
@@ -5958,86 +7161,36 @@ class Microstructure(SampleData):
                 micro_resampled.add_phase(self.get_phase(phase_id=i))
         micro_resampled.default_compression_options = self.default_compression_options
         print('resampling microstructure to %s' % micro_resampled.h5_file)
-        # Resize all CellData fields
-        image_group = self.get_node('CellData')
-        spacing = self.get_attribute('spacing', 'CellData')
-        FIndex_path = '%s/Field_index' % image_group._v_pathname
-        field_list = self.get_node(FIndex_path)
-
         dims = self.get_attribute('dimension', 'CellData')
-        # Fields dimensions should be multiples of 2 (AMITEX requirement for Zoom Structural purposes, cf L. Gelebart)
-        if len(dims) == 3:
-            X, Y, Z = dims
-            end_X, end_Y, end_Z = resampling_factor * np.array([X//resampling_factor,
-                                                                Y//resampling_factor,
-                                                                Z//resampling_factor])
-        elif len(dims) == 2:
-            X, Y = dims
-            end_X, end_Y = resampling_factor * np.array([X//resampling_factor,
-                                                        Y//resampling_factor])
-        else:
+        if len(dims) not in [2, 3]:
             raise ValueError('CellData should be either 2D or 3D')
-
-        resampled_voxel_size = self.get_voxel_size() * resampling_factor  
-
-        for name in field_list:
-            field_name = name.decode('utf-8')
-            print('resampling field %s' % field_name)
-            field = self.get_field(field_name)
-            if not self._is_empty(field_name):
-                if self._get_group_type('CellData') == '2DImage':
-                    field_resampled = field[:end_X:resampling_factor, :end_Y:resampling_factor, ...]
-
-                else:
-                    field_resampled = field[:end_X:resampling_factor, :end_Y:resampling_factor,
-                                    :end_Z:resampling_factor, ...]
-                empty = micro_resampled.get_attribute(attrname='empty',
-                                                nodename='CellData')
-                if empty:
-                    micro_resampled.add_image_from_field(
-                        field_array=field_resampled, fieldname=field_name,
-                        imagename='CellData', location='/',
-                        spacing=spacing, replace=True)
-                else:
-                    micro_resampled.add_field(gridname='CellData',
-                                        fieldname=field_name,
-                                        array=field_resampled, replace=True)
-                    print(field_resampled.shape)
-
-        # update the origin of the image group according to the resampling
+        # Fields dimensions should be multiples of 2 (AMITEX requirement for Zoom Structural purposes, cf L. Gelebart)
+        factor = (resampling_factor,) * len(dims)
+        resampled_dims = [n // resampling_factor for n in dims]
+        resampled_voxel_size = self.get_voxel_size() * resampling_factor
+        # Resize all CellData fields by blocks
+        micro_resampled._add_cell_data_image(resampled_dims,
+                                             resampled_voxel_size)
+        self._copy_cell_data_to(micro_resampled, factor=factor,
+                                majority_vote=majority_vote)
         if verbose:
             print('resampled dataset:')
             print(micro_resampled)
-        micro_resampled.set_voxel_size('CellData', resampled_voxel_size)
         print('Updating active grain map')
-        print(micro_resampled.get_grain_map().shape)
-        micro_resampled.set_active_grain_map('CellData_%s' % self.active_grain_map)
-        print(micro_resampled.get_grain_map().shape)
-        micro_resampled.add_grains_in_map()
-        grain_ids = np.unique(micro_resampled.get_grain_map())
-        orientation = []
-        for gid in grain_ids:
-            if not gid > 0:
-                continue
-            orientation.append(self.get_grain(gid).orientation.rod)
-        orientation = np.array(orientation)
-        micro_resampled.set_orientations(orientation)
-        micro_resampled.remove_grains_not_in_map()
+        micro_resampled.set_active_grain_map(self.active_grain_map)
+        self._copy_grains_in_map_to(micro_resampled)
         max_grain = micro_resampled.get_grain_ids()[-1]
         nb_grain = micro_resampled.get_number_of_grains()
         if max_grain > nb_grain:
             print('renumbering in progress : %i - %i ' % (max_grain, nb_grain))
             micro_resampled.renumber_grains()
-            
+
         print('%d grains in resampled microstructure' % micro_resampled.grains.nrows)
-        micro_resampled.grains.flush()
-        
+
         # recompute the grain geometry
         if recompute_geometry:
             print('updating grain geometry')
-            micro_resampled.recompute_grain_bounding_boxes(verbose)
-            micro_resampled.recompute_grain_centers(verbose)
-            micro_resampled.recompute_grain_volumes()
-            
+            micro_resampled.recompute_grain_geometry()
+
         return micro_resampled
 
@@ -28,3 +28,24 @@ class EbsdTests(unittest.TestCase):
         grain_ids = self.scan.segment_grains()
         n = len(np.unique(grain_ids))
         self.assertEqual(n, 4)
+
+    def test_compute_kam_map(self):
+        # 4 grains with uniform orientations, except one perturbed pixel
+        eulers = np.radians([[0., 0., 0.], [30., 20., 10.],
+                             [60., 40., 20.], [10., 45., 60.]])
+        for i in range(2):
+            for j in range(2):
+                self.scan.euler[i * 5:(i + 1) * 5, j * 5:(j + 1) * 5] = \
+                    eulers[2 * i + j]
+        self.scan.euler[2, 2, 0] += np.radians(1.)
+        self.assertIsNone(self.scan.compute_kam_map())
+        self.scan.segment_grains()
+        kam = self.scan.compute_kam_map(order=1, max_angle=5.)
+        self.assertAlmostEqual(kam[2, 2], 1., places=4)
+        self.assertAlmostEqual(kam[1, 1], 1. / 8, places=4)
+        self.assertAlmostEqual(kam[4, 4], 0., places=4)
+        # the grain boundaries are excluded
+        self.assertEqual(np.sum(kam > 1e-3), 9)
+        kam = self.scan.compute_kam_map(max_angle=180.,
+                                        exclude_boundaries=False)
+        self.assertTrue(kam[4, 4] > 1.)
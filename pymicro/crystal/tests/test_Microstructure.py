@@ -1,6 +1,7 @@
 import unittest
 import os
 import numpy as np
+from scipy import ndimage
 from pymicro.crystal.microstructure import Orientation, Microstructure
 from pymicro.crystal.lattice import Symmetry, Lattice, CrystallinePhase, HklPlane, HklDirection, SlipSystem
 from config import PYMICRO_EXAMPLES_DATA_DIR
@@ -49,6 +50,50 @@ class MicrostructureTests(unittest.TestCase):
         self.assertEqual(m.grains.nrows, 146)
         del m
 
+    def test_from_labdct(self):
+        import h5py
+        from scipy import ndimage
+        # write a small labDCT file, volumes are stored in (Z,Y,X) order
+        grain_map = np.zeros((20, 16, 12), dtype=np.int32)
+        grain_map[:10] = 1
+        grain_map[10:, :8] = 2
+        grain_map[10:, 8:] = 3
+        grain_map[:3, :3, :3] = 0
+        rods = np.random.rand(4, 3).astype(np.float32)
+        file_path = os.path.join(PYMICRO_EXAMPLES_DATA_DIR, 'tmp_labdct.h5')
+        with h5py.File(file_path, 'w') as f:
+            phase = f.create_group('PhaseInfo/Phase01')
+            phase['Name'] = np.array([b'Ti'])
+            phase['UnitCell'] = np.array([2.95, 2.95, 4.68, 90, 90, 120.])
+            phase['SpaceGroup'] = 194
+            f['LabDCT/Spacing'] = np.array([0.005])
+            data = f.create_group('LabDCT/Data')
+            data['GrainId'] = grain_map.transpose(2, 1, 0)
+            data['Mask'] = (grain_map > 0).transpose(2, 1, 0)
+            data['PhaseId'] = (grain_map > 0).astype(np.uint8).transpose(2, 1, 0)
+            data['Rodrigues'] = rods[grain_map].transpose(2, 1, 0, 3)
+        m = Microstructure.from_labdct(
+            'tmp_labdct.h5', data_dir=PYMICRO_EXAMPLES_DATA_DIR,
+            name=os.path.join(PYMICRO_EXAMPLES_DATA_DIR, 'tmp_labdct_data'))
+        m.autodelete = True
+        os.remove(file_path)
+        self.assertTrue(np.all(m.get_grain_map() == grain_map))
+        self.assertTrue(np.all(m.get_mask() == (grain_map > 0)))
+        self.assertTrue(np.allclose(m.get_orientation_map(), rods[grain_map]))
+        slices = ndimage.find_objects(grain_map)
+        self.assertEqual(m.get_grain_ids().tolist(), [1, 2, 3])
+        for g in m.grains:
+            gid = g['idnumber']
+            bb = [[sl.start, sl.stop] for sl in slices[gid - 1]]
+            self.assertEqual(g['bounding_box'].tolist(), bb)
+            com = np.array(ndimage.center_of_mass(grain_map == gid)) + 0.5
+            center = 0.005 * (com - 0.5 * np.array(grain_map.shape))
+            self.assertTrue(np.allclose(g['center'], center))
+            self.assertAlmostEqual(g['volume'],
+                                   np.sum(grain_map == gid) * 0.005 ** 3)
+            self.assertTrue(np.allclose(g['orientation'], rods[gid]))
+        del m
+
     def test_from_file(self):
         # read a test microstructure already created
         m = Microstructure(filename=os.path.join(PYMICRO_EXAMPLES_DATA_DIR,
@@ -112,6 +157,36 @@ class MicrostructureTests(unittest.TestCase):
         # self.assertTrue(not os.path.exists(xdmf_file))
         del m
 
+    def test_crop_and_resample_by_blocks(self):
+        m = Microstructure(name='test_crop_blocks', autodelete=True)
+        grain_map = np.ones((12, 10, 8), dtype=np.int32)
+        grain_map[6:] = 2
+        grain_map[6:, 6:] = 3
+        grain_map[:1, :1, :2] = 4
+        m.set_grain_map(grain_map, voxel_size=1.)
+        m.build_grain_table_from_grain_map()
+        m.set_orientations(np.random.rand(4, 3))
+        strain = np.random.rand(12, 10, 8, 6)
+        m.add_field('CellData', 'strain', strain)
+        crop = m.crop(x_start=5, y_end=6, crop_name='test_crop_blocks_crop',
+                      autodelete=True)
+        self.assertTrue(np.all(crop.get_grain_map() == grain_map[5:, :6]))
+        self.assertTrue(np.allclose(crop.get_field('strain'),
+                                    strain[5:, :6]))
+        self.assertEqual(crop.get_grain_ids().tolist(), [1, 2])
+        self.assertTrue(np.allclose(crop.get_grains_data()['orientation'],
+                                    m.get_grains_data([1, 2])['orientation']))
+        self.assertEqual(crop.get_grain_volumes().tolist(), [48., 288.])
+        del crop
+        res = m.resample(2, resample_name='test_crop_blocks_res',
+                         autodelete=True, majority_vote=True)
+        self.assertEqual(res.get_grain_map().shape, (6, 5, 4))
+        # grain 4 is a minority in its block of voxels
+        self.assertEqual(res.get_grain_ids().tolist(), [1, 2, 3])
+        self.assertTrue(np.allclose(res.get_field('strain'),
+                                    strain[::2, ::2, ::2]))
+        del res, m
+
     def test_id_list_to_condition(self):
         m = Microstructure(os.path.join(PYMICRO_EXAMPLES_DATA_DIR, 'm1_data.h5'))
         id_list = [10, 11, 12]
@@ -131,6 +206,60 @@ class MicrostructureTests(unittest.TestCase):
             self.assertAlmostEquals(rod[i], the_rod[i])
         del m
 
+    def test_get_grains_data(self):
+        m = Microstructure(name='test_bulk', autodelete=True)
+        m.add_grains(self.test_eulers, grain_ids=[5, 2, 9])
+        self.assertTrue(m.grains.cols.idnumber.is_indexed)
+        data = m.get_grains_data([9, 5, 9], columns=['idnumber', 'orientation'])
+        self.assertEqual(data['idnumber'].tolist(), [9, 5, 9])
+        self.assertEqual(data.dtype.names, ('idnumber', 'orientation'))
+        g = m.get_grain_orientation_matrices([2, 9])
+        self.assertEqual(g.shape, (2, 3, 3))
+        for i, euler in enumerate(self.test_eulers[1:]):
+            self.assertTrue(np.allclose(
+                g[i], Orientation.from_euler(euler).orientation_matrix(),
+                atol=1e-5))
+        self.assertEqual([gr.id for gr in m.get_all_grains()], [5, 2, 9])
+        with self.assertRaises(ValueError):
+            m.get_grains_data([2, 3])
+        del m
+
+    def test_index_grain_ids(self):
+        m = Microstructure(name='test_index', autodelete=True)
+        m.grains.cols.idnumber.remove_index()
+        self.assertFalse(m.grains.cols.idnumber.is_indexed)
+        m.append_grain_columns({'idnumber': np.array([3, 1])})
+        self.assertTrue(m.grains.cols.idnumber.is_indexed)
+        self.assertEqual(m.get_grains_data([1])['idnumber'].tolist(), [1])
+        del m
+
+    def test_grain_columns(self):
+        m = Microstructure(name='test_columns', autodelete=True)
+        grain_map = np.zeros((10, 10, 10), dtype=np.int32)
+        grain_map[:5] = 4
+        grain_map[5:, :3] = 7
+        grain_map[5:, 3:] = 9
+        m.set_grain_map(grain_map, voxel_size=1.)
+        m.append_grain_columns({'idnumber': np.array([9, 4, 7]),
+                                'volume': np.array([5., 6., 7.])})
+        self.assertEqual(m.get_grain_ids().tolist(), [9, 4, 7])
+        self.assertEqual(m.get_tablecol('GrainDataTable', 'phase').tolist(),
+                         [1, 1, 1])
+        m.set_grain_columns({'volume': [1., 2.]}, id_list=[7, 9])
+        self.assertEqual(m.get_grain_volumes().tolist(), [2., 6., 1.])
+        m.recompute_grain_bounding_boxes()
+        bbs = m.get_grains_data([4, 7])['bounding_box']
+        self.assertEqual(bbs[0].tolist(), [[0, 5], [0, 10], [0, 10]])
+        self.assertEqual(bbs[1].tolist(), [[5, 10], [0, 3], [0, 10]])
+        m.remove_grains_from_table([4])
+        self.assertEqual(m.get_grain_ids().tolist(), [9, 7])
+        m.renumber_grains()
+        self.assertEqual(sorted(m.get_grain_ids().tolist()), [1, 2, 3])
+        new_map = m.get_grain_map()
+        for gid in [4, 7, 9]:
+            self.assertEqual(len(np.unique(new_map[grain_map == gid])), 1)
+        del m
+
     def test_grain_geometry(self):
         m = Microstructure(name='test', autodelete=True)
         grain_map = np.ones((8, 8, 8), dtype=np.uint8)
@@ -149,6 +278,102 @@ class MicrostructureTests(unittest.TestCase):
         self.assertEqual(c1, [0., 0., 0.])
         self.assertEqual(m.compute_grain_volume(gid=1), 512)
 
+    def test_grain_map_blocks(self):
+        m = Microstructure(name='test_grain_map_blocks', autodelete=True)
+        grain_map = Microstructure.voronoi(shape=(16, 16, 12), n=12)
+        grain_map = grain_map.astype(np.int32)
+        grain_map[grain_map == 3] = 0
+        m.set_grain_map(grain_map, voxel_size=1.0)
+        m.build_grain_table_from_grain_map()
+        volumes = m.get_grain_volumes()
+        centers = m.get_grain_centers()
+        m.set_volumes(np.zeros_like(volumes))
+        # process the grain map by blocks in two processes
+        m.recompute_grain_geometry(n_jobs=2, block_shape=(5, 7, 4))
+        self.assertTrue(np.allclose(m.get_grain_volumes(), volumes))
+        self.assertTrue(np.allclose(m.get_grain_centers(), centers))
+        gb = m.get_grain_boundaries_map(n_jobs=2, block_shape=(5, 7, 4))
+        # the image is surrounded by zeros
+        padded = np.pad(grain_map, 1)
+        boundaries = ((ndimage.maximum_filter(padded, size=3) != padded)
+                      | (ndimage.minimum_filter(padded, size=3) != padded))
+        self.assertTrue(np.all(gb == boundaries[1:-1, 1:-1, 1:-1]))
+        dilated = Microstructure.dilate_labels(grain_map.copy(),
+                                               dilation_steps=2)
+        m.dilate_grains(dilation_steps=2, block_shape=(5, 7, 4))
+        self.assertEqual(m.active_grain_map, 'dilated_grain_map')
+        self.assertTrue(np.all(m.get_grain_map() == dilated))
+        del m
+
+    def test_update_grain_geometry(self):
+        m = Microstructure(name='test_update_grain_geometry', autodelete=True)
+        np.random.seed(13)
+        grain_map = Microstructure.voronoi(shape=(16, 16, 12), n=15)
+        grain_map = grain_map.astype(np.int32)
+        grain_map[grain_map == 4] = 0
+        m.set_grain_map(grain_map, voxel_size=0.5)
+        m.build_grain_table_from_grain_map()
+        self.assertEqual(len(m.get_dirty_grains()), 0)
+        m.dilate_grain(2, dilation_steps=2)
+        m.merge_grains([5, 7])
+        dirty = m.get_dirty_grains()
+        self.assertTrue(np.all(np.isin([2, 5, 7], dirty)))
+        self.assertNotIn(7, m.get_grain_ids())
+        m.update_grain_geometry()
+        self.assertEqual(len(m.get_dirty_grains()), 0)
+        self.assertIsNone(m.get_dirty_region())
+        data = m.get_grains_data()
+        m.recompute_grain_geometry()
+        expected = m.get_grains_data()
+        for col in ['volume', 'center', 'bounding_box']:
+            self.assertTrue(np.allclose(data[col], expected[col]))
+        # replacing the map invalidates the whole geometry
+        grain_map = m.get_grain_map()
+        grain_map[:3] = 0
+        m.set_grain_map(grain_map)
+        self.assertIsNone(m.get_dirty_grains())
+        m.update_grain_geometry()
+        # unless the changes are tracked
+        grain_map[-2:] = 0
+        m.set_grain_map(grain_map, track_changes=True)
+        self.assertEqual(m.get_dirty_region()[0], slice(14, 16))
+        m.update_grain_geometry()
+        data = m.get_grains_data()
+        m.recompute_grain_geometry()
+        for col in ['volume', 'center', 'bounding_box']:
+            self.assertTrue(np.allclose(data[col],
+                                        m.get_grains_data()[col]))
+        # switching the active grain map invalidates the whole geometry
+        m.dilate_grains(dilation_steps=2)
+        m.update_grain_geometry()
+        m.set_active_grain_map('grain_map')
+        self.assertIsNone(m.get_dirty_grains())
+        m.update_grain_geometry()
+        data = m.get_grains_data()
+        m.recompute_grain_geometry()
+        for col in ['volume', 'center', 'bounding_box']:
+            self.assertTrue(np.allclose(data[col],
+                                        m.get_grains_data()[col]))
+        del m
+
+    def test_dilate_grain_twice(self):
+        m = Microstructure(name='test_dilate_grain_twice', autodelete=True)
+        grain_map = np.zeros((20, 20, 20), dtype=np.int32)
+        grain_map[8:12, 8:12, 8:12] = 1
+        grain_map[:3] = 2
+        m.set_grain_map(grain_map, voxel_size=1.)
+        m.build_grain_table_from_grain_map()
+        m.recompute_grain_geometry()
+        # the second dilation must not be limited by the stale bounding box
+        m.dilate_grain(1, dilation_steps=2)
+        m.dilate_grain(1, dilation_steps=2)
+        expected = ndimage.binary_dilation(grain_map == 1, iterations=4)
+        self.assertTrue(np.array_equal(m.get_grain_map() == 1, expected))
+        m.merge_grains([1, 2])
+        self.assertTrue(np.array_equal(m.get_grain_map() == 1,
+                                       expected | (grain_map == 2)))
+        del m
+
     def test_renumber_grains(self):
         # read and copy a microstructure
         m1_path = os.path.join(PYMICRO_EXAMPLES_DATA_DIR, 'm1_data.h5')
@@ -360,6 +585,20 @@ class OrientationTests(unittest.TestCase):
         self.assertAlmostEqual(w1, 109.2, 1)
         self.assertAlmostEqual(w2, 296.9, 1)
 
+    def test_compute_dct_omega_angles(self):
+        al_fcc = Lattice.face_centered_cubic(0.40495)
+        planes = HklPlane.from_families(['111', '200'], lattice=al_fcc) + [HklPlane(20, 20, 20, al_fcc)]
+        rods = np.array([[0.0499, -0.3048, 0.1040], [0.1, 0.2, 0.3]])
+        g = Orientation.Rodrigues2OrientationMatrices(rods)
+        omegas = Orientation.compute_dct_omega_angles(g, planes, 40)
+        self.assertEqual(omegas.shape, (2, len(planes), 2))
+        for i in range(len(rods)):
+            o = Orientation.from_rodrigues(rods[i])
+            for j, plane in enumerate(planes[:-1]):
+                self.assertTrue(np.allclose(omegas[i, j], o.dct_omega_angles(plane, 40)))
+        # the (20 20 20) plane cannot diffract at this energy
+        self.assertTrue(np.all(np.isnan(omegas[:, -1])))
+
     def test_topotomo_tilts(self):
         # tests cases from ma2285 experiment on id11, omega offset = -90
         T = np.array([[0, -1, 0], [1, 0, 0], [0, 0, 1]])
@@ -464,6 +703,110 @@ class OrientationTests(unittest.TestCase):
         for i in range(3):
             self.assertAlmostEqual(o.rod[i], rod[i])
 
+    def test_compute_mean_orientations(self):
+        syms = Symmetry.cubic.symmetry_operators()
+        g_list, labels, refs = [], [], []
+        for i, euler in enumerate(self.test_eulers):
+            # scattered orientations expressed with random symmetries
+            eulers = np.array(euler) + 0.2 * np.random.randn(20, 3)
+            g = Orientation.Euler2OrientationMatrices(eulers)
+            g = np.matmul(syms[np.random.randint(0, len(syms), 20)], g)
+            rods = Orientation.OrientationMatrices2Rodrigues(g)
+            refs.append(Orientation.compute_mean_rodrigues(rods))
+            g_list.append(g)
+            labels.extend([i + 5] * 20)
+        ids, g_mean, gos = Orientation.compute_mean_orientations(
+            np.concatenate(g_list), labels, Symmetry.cubic, spread=True)
+        self.assertEqual(ids.tolist(), [5, 6, 7])
+        rods = Orientation.OrientationMatrices2Rodrigues(g_mean)
+        self.assertTrue(np.allclose(rods, refs, atol=1e-5))
+        self.assertTrue(np.all(gos < 1.))
+        angles = Orientation.misorientation_angles(
+            g_mean, np.array([o.orientation_matrix() for o in [
+                Orientation.from_euler(e) for e in self.test_eulers]]),
+            Symmetry.cubic)
+        self.assertTrue(np.all(np.degrees(angles) < 0.5))
+
+    def test_compute_kam(self):
+        from pymicro.crystal.rotation import qu2om
+        shape = (9, 7, 4)
+        base = Orientation.from_euler(self.test_eulers[2]).rod
+        rods = base + 0.02 * np.random.randn(np.prod(shape), 3)
+        g = Orientation.Rodrigues2OrientationMatrices(rods)
+        q = Orientation.OrientationMatrices2Quaternions(g)
+        self.assertTrue(np.allclose(qu2om(q[0]), g[0]))
+        q = q.reshape(shape + (4,))
+        g = g.reshape(shape + (3, 3))
+        labels = np.random.randint(0, 3, shape)
+        for order in [1, 2]:
+            kam = Orientation.compute_kam(q, order=order, max_angle=4.,
+                                          labels=labels, chunk_size=50)
+            # brute force computation for a few voxels
+            for p in [(0, 0, 0), (4, 3, 2), (8, 6, 3), (2, 5, 1)]:
+                angles = []
+                for offset in np.ndindex((2 * order + 1,) * 3):
+                    n = tuple(np.add(p, offset) - order)
+                    if max(np.abs(np.subtract(offset, order))) != order or \
+                            min(n) < 0 or np.any(np.array(n) >= shape) or \
+                            labels[n] != labels[p]:
+                        continue
+                    angle = np.degrees(Orientation.misorientation_angles(
+                        g[p][np.newaxis], g[n][np.newaxis], Symmetry.cubic))
+                    if angle <= 4.:
+                        angles.append(angle[0])
+                expected = np.mean(angles) if labels[p] > 0 and angles else 0.
+                self.assertAlmostEqual(kam[p], expected, places=5)
+        # KAM map of a microstructure, computed by blocks
+        m = Microstructure(name='test_compute_kam', autodelete=True)
+        m.set_grain_map(labels.astype(np.int32), voxel_size=1.)
+        m.set_orientation_map(rods.reshape(shape + (3,)))
+        kam_map = m.compute_kam_map(order=2, max_angle=4., store=False,
+                                    block_shape=(4, 7, 4))
+        self.assertTrue(np.allclose(kam_map, kam))
+        del m
+
+    def test_compute_god_map(self):
+        shape = (6, 5, 4)
+        grain_map = np.ones(shape, dtype=np.int32)
+        grain_map[3:] = 2
+        np.random.seed(5)
+        rods = np.empty(shape + (3,))
+        means = [Orientation.from_euler(e).rod for e in self.test_eulers[:2]]
+        for gid in [1, 2]:
+            n = np.sum(grain_map == gid)
+            rods[grain_map == gid] = means[gid - 1] + 0.01 * np.random.randn(n, 3)
+        m = Microstructure(name='test_compute_god_map', autodelete=True)
+        m.set_grain_map(grain_map, voxel_size=1.)
+        m.set_orientation_map(rods)
+        m.build_grain_table_from_grain_map()
+        m.set_orientations(np.array(means))
+        god = m.compute_god_map(store=False)
+        self.assertEqual(god.shape, shape)
+        # compare with a brute force computation for a few voxels
+        for p in [(0, 0, 0), (2, 4, 3), (5, 1, 2)]:
+            o = Orientation.from_rodrigues(rods[p])
+            expected = np.degrees(m.get_grain(grain_map[p]).orientation.disorientation(
+                o, crystal_structure=Symmetry.cubic)[0])
+            self.assertAlmostEqual(god[p], expected, places=4)
+        # the map is returned and stored by default
+        stored_god = m.compute_god_map(block_shape=(2, 5, 4))
+        self.assertTrue(np.allclose(stored_god, god))
+        self.assertTrue(np.allclose(m.get_field('grain_orientation_deviation'), god))
+        del m
+
+    def test_random_euler_angles(self):
+        np.random.seed(2)
+        euler = Orientation.random_euler_angles(2000)
+        self.assertEqual(euler.shape, (2000, 3))
+        self.assertTrue(np.all((euler >= 0.) & (euler <= [360., 180., 360.])))
+        # cos(Phi) is uniformly distributed for a random texture
+        self.assertAlmostEqual(np.cos(np.radians(euler[:, 1])).mean(), 0.,
+                               delta=0.05)
+        o = Orientation.random()
+        self.assertTrue(np.allclose(np.dot(o.orientation_matrix(),
+                                           o.orientation_matrix().T),
+                                    np.eye(3)))
+
     def test_from_two_hkl_normals(self):
         o_ref = Orientation.from_euler(self.test_eulers[1])
         gt = o_ref.orientation_matrix().T
@@ -3,9 +3,11 @@
 import os
 import h5py
 import numpy as np
+from collections import OrderedDict
 from scipy import ndimage
 from matplotlib import pyplot as plt, cm
 from pymicro.xray.experiment import ForwardSimulation
+from pymicro.xray.detectors import ImageStackReader
 from pymicro.crystal.lattice import HklPlane, Symmetry
 from pymicro.xray.xray_utils import lambda_keV_to_nm, radiograph, radiographs
 from pymicro.crystal.microstructure import Grain, Orientation
@@ -218,6 +220,19 @@ class DctForwardSimulation(ForwardSimulation):
         self.omega_end = 360.
         self.omegas = None
         self.reflexions = []
+        self.projection_cache_size = 4096  # maximum number of grain projections kept in memory
+        self.clear_cache()
+
+    def clear_cache(self):
+        """Clear the grain and projection caches of the simulation.
+
+        This must be called if the grain map or the grain orientations of
+        the sample are modified after the caches have been filled.
+        """
+        self._grain_map = None
+        self._grain_slices = None
+        self._grain_cache = {}
+        self._projection_cache = OrderedDict()
 
     def set_hkl_planes(self, hkl_planes):
         self.hkl_planes = hkl_planes
@@ -237,41 +252,98 @@ class DctForwardSimulation(ForwardSimulation):
         assert self.exp.source.min_energy == self.exp.source.max_energy  # monochromatic case
         lambda_keV = self.exp.source.max_energy
         sym = self.exp.sample.get_lattice().get_symmetry()
+        self.clear_cache()
         self.omegas = np.linspace(self.omega_start, self.omega_end,
                                   num=int((self.omega_end - self.omega_start) / omega_step), endpoint=False)
         self.reflexions = []
         for omega in self.omegas:
             self.reflexions.append([])
-        if not grain_ids:
+        if grain_ids is None or len(grain_ids) == 0:
             # list of the grains selected for the forward simulation
             grain_ids = self.exp.sample.get_grain_ids()
-        for grain_id in grain_ids:
-            for plane in self.hkl_planes:
-                h, k, l = plane.miller_indices()
-                if sym is Symmetry.hexagonal:
-                    (h, k, i, l) = HklPlane.three_to_four_indices(h, k, l)
-                try:
-                    o = Orientation.from_rodrigues(self.exp.sample.get_grain_rodrigues(id_list=[grain_id])[0])
-                    (w1, w2) = o.dct_omega_angles(plane, lambda_keV, verbose=False)
-                except ValueError:
-                    if self.verbose:
+        grain_ids = np.asarray(grain_ids)
+        rods = self.exp.sample.get_grains_data(grain_ids, columns=['orientation'])['orientation']
+        g = Orientation.Rodrigues2OrientationMatrices(rods)
+        # solve the Bragg condition for all grains and planes at once
+        omegas = Orientation.compute_dct_omega_angles(g, self.hkl_planes, lambda_keV)
+        miller = np.array([plane.miller_indices() for plane in self.hkl_planes])
+        if self.verbose:
+            for i, grain_id in enumerate(grain_ids):
+                for j, (h, k, l) in enumerate(miller):
+                    w1, w2 = omegas[i, j]
+                    if np.isnan(w1):
                         print('plane {} does not fulfil the Bragg condition for grain {:d}'.format((h, k, l), grain_id))
-                    continue
-                # add angles for Friedel pairs
-                w3 = (w1 + 180.) % 360
-                w4 = (w2 + 180.) % 360
-                if self.verbose and grain_id == self.check:
-                    print('grain %d, angles for plane %d%d%d: w1=%.3f and w2=%.3f | delta=%.1f' % (grain_id, h, k, l, w1, w2, w1-w2))
-                    print('(%3d, %3d, %3d, %3d) -- %6.2f & %6.2f' % (h, k, i, l, w1, w2))
-                try:
-                    self.reflexions[int(w1 / omega_step)].append([grain_id, (h, k, l)])
-                    self.reflexions[int(w2 / omega_step)].append([grain_id, (h, k, l)])
-                    self.reflexions[int(w3 / omega_step)].append([grain_id, (-h, -k, -l)])
-                    self.reflexions[int(w4 / omega_step)].append([grain_id, (-h, -k, -l)])
-                except IndexError:
-                    # drop reflexions after omega_end
-                    pass
-
+                    elif grain_id == self.check:
+                        print('grain %d, angles for plane %d%d%d: w1=%.3f and w2=%.3f | delta=%.1f'
+                              % (grain_id, h, k, l, w1, w2, w1 - w2))
+                        if sym is Symmetry.hexagonal:
+                            print('(%3d, %3d, %3d, %3d) -- %6.2f & %6.2f'
+                                  % (HklPlane.three_to_four_indices(h, k, l) + (w1, w2)))
+        # add angles for Friedel pairs, the events are ordered by grain, plane and (w1, w2, w3, w4)
+        omegas = np.concatenate((omegas, (omegas + 180.) % 360), axis=2)
+        gi, pi, si = np.nonzero(~np.isnan(omegas))
+        bins = (omegas[gi, pi, si] / omega_step).astype(int)
+        # drop reflexions after omega_end
+        keep = bins < len(self.omegas)
+        gi, pi, si, bins = gi[keep], pi[keep], si[keep], bins[keep]
+        hkl = np.where((si < 2)[:, None], miller[pi], -miller[pi])
+        order = np.argsort(bins, kind='stable')
+        for b, grain_id, (h, k, l) in zip(bins[order], grain_ids[gi[order]].tolist(), hkl[order].tolist()):
+            self.reflexions[b].append([grain_id, (h, k, l)])
+
+    def compute_diffraction_events(self, grain_ids=None, friedel_pairs=True):
+        """Compute all the diffraction events of a set of grains at once.
+
+        For each grain and each lattice plane of the simulation, the omega
+        angles fulfilling the Bragg condition are computed together with the
+        scattering and diffraction vectors at those angles and the position
+        where the diffracted beam coming from the grain center hits the
+        active detector.
+
+        :param list grain_ids: a list of grain ids to restrict the
+            computation (use all grains by default).
+        :param bool friedel_pairs: also include the events of the Friedel
+            pair of each plane, 180 degrees apart (True by default).
+        :return: a numpy structured array with one row per diffraction event
+            and the fields `grain_id`, `hkl`, `omega` (in degrees), `G`, `K`
+            (in the laboratory frame) and `uv` (detector coordinates in
+            pixel units).
+        """
+        lambda_keV = self.exp.source.max_energy
+        X = np.array([1., 0., 0.]) / lambda_keV_to_nm(lambda_keV)
+        sample = self.exp.get_sample()
+        detector = self.exp.get_active_detector()
+        if grain_ids is None:
+            grain_ids = sample.get_grain_ids()
+        grains = sample.get_grains_data(grain_ids, columns=['idnumber', 'orientation', 'center'])
+        g = Orientation.Rodrigues2OrientationMatrices(grains['orientation'])
+        omegas = Orientation.compute_dct_omega_angles(g, self.hkl_planes, lambda_keV)
+        Gc = np.array([plane.scattering_vector() for plane in self.hkl_planes])
+        miller = np.array([plane.miller_indices() for plane in self.hkl_planes])
+        signs = np.array([1, 1])
+        if friedel_pairs:
+            omegas = np.concatenate((omegas, (omegas + 180.) % 360), axis=2)
+            signs = np.array([1, 1, -1, -1])
+        gi, pi, si = np.nonzero(~np.isnan(omegas))
+        events = np.empty(len(gi), dtype=[('grain_id', np.int32), ('hkl', np.int32, (3,)), ('omega', float),
+                                          ('G', float, (3,)), ('K', float, (3,)), ('uv', float, (2,))])
+        events['grain_id'] = grains['idnumber'][gi]
+        events['hkl'] = signs[si, None] * miller[pi]
+        events['omega'] = omegas[gi, pi, si]
+        # rotate the scattering vectors and the grain centers around the vertical axis
+        omegar = np.radians(events['omega'])
+        c, s = np.cos(omegar)[:, None], np.sin(omegar)[:, None]
+
+        def rotate(v):
+            return np.stack([c[:, 0] * v[:, 0] - s[:, 0] * v[:, 1],
+                             s[:, 0] * v[:, 0] + c[:, 0] * v[:, 1], v[:, 2]], axis=1)
+
+        Gs = np.einsum('nji,nj->ni', g[gi], signs[si, None] * Gc[pi])
+        events['G'] = rotate(Gs)
+        events['K'] = X + events['G']
+        origins = rotate(grains['center'][gi])
+        events['uv'] = detector.lab_to_pixel(detector.project_along_directions(events['K'], origins))
+        return events
 
     def load_grain(self, gid=1):
         print('loading grain from file 4_grains/phase_01/grain_%04d.mat' % gid)
@@ -420,9 +492,70 @@ class DctForwardSimulation(ForwardSimulation):
         stack_sim = self.grain_projections(omegas, gid, hor_flip=hor_flip, ver_flip=ver_flip)
         return self.grain_projection_image(g_uv, stack_sim)
 
+    def get_grain_map(self):
+        """Get the grain map of the sample, read once and cached.
+
+        :return: the grain map as a 3D numpy array.
+        """
+        if self._grain_map is None:
+            self._grain_map = self.exp.get_sample().get_grain_map()
+            # bounding boxes of all the grains in a single pass over the map
+            self._grain_slices = ndimage.find_objects(np.maximum(self._grain_map, 0))
+        return self._grain_map
+
+    def get_grain_subvolume(self, gid):
+        """Get the binary subvolume of a grain with its center and orientation.
+
+        The subvolume is cropped to the bounding box of the grain in the
+        grain map and the result is cached.
+
+        :param int gid: the id of the grain.
+        :return: a tuple with the binary subvolume, the grain center in mm
+            and its orientation matrix, or None if the grain is not in the
+            grain map.
+        """
+        if gid not in self._grain_cache:
+            grain_ids = self.get_grain_map()
+            if not 0 < gid <= len(self._grain_slices) or self._grain_slices[gid - 1] is None:
+                return None
+            slices = self._grain_slices[gid - 1]
+            data = np.where(grain_ids[slices] == gid, 1, 0)
+            local_com = np.array(ndimage.center_of_mass(data)) + [sl.start for sl in slices]
+            detector = self.exp.get_active_detector()
+            g_center_mm = detector.get_pixel_size() * (local_com - 0.5 * np.array(grain_ids.shape))
+            g = self.exp.get_sample().get_grain(gid).orientation_matrix()
+            self._grain_cache[gid] = (data, g_center_mm, g)
+        return self._grain_cache[gid]
+
+    def grain_projection(self, gid, omega):
+        """Compute the projection of a grain at a given rotation angle.
+
+        Only the subvolume of the grain is projected. The projections are
+        cached so that they are computed once for all the reflexions of a
+        grain at this angle, the least recently used are dropped when the
+        cache exceeds `projection_cache_size`.
+
+        :param int gid: the id of the grain.
+        :param float omega: rotation angle in degrees.
+        :return: the projection of the grain as a 2D array in (Y, Z) form.
+        """
+        key = (gid, omega)
+        if key in self._projection_cache:
+            self._projection_cache.move_to_end(key)
+            return self._projection_cache[key]
+        proj = radiograph(self.get_grain_subvolume(gid)[0], omega)
+        self._projection_cache[key] = proj
+        if len(self._projection_cache) > self.projection_cache_size:
+            self._projection_cache.popitem(last=False)
+        return proj
+
     def dct_projection(self, omega, include_direct_beam=True, att=5):
         """Function to compute a full DCT projection at a given omega angle.
 
+        The diffraction spots are computed from the projections of the
+        grain subvolumes which are cached and reused for all the reflexions
+        of a grain.
+
         :param float omega: rotation angle in degrees.
         :param bool include_direct_beam: flag to compute the transmission through the sample.
         :param float att: an attenuation factor used to limit the gray levels in the direct beam.
@@ -431,7 +564,6 @@ class DctForwardSimulation(ForwardSimulation):
         if len(self.reflexions) == 0:
             print('empty list of reflexions, you should run the setup function first')
             return None
-        grain_ids = self.exp.get_sample().get_grain_map()
         detector = self.exp.get_active_detector()
         lambda_keV = self.exp.source.max_energy
         lattice = self.exp.get_sample().get_lattice()
@@ -445,29 +577,23 @@ class DctForwardSimulation(ForwardSimulation):
 
         if include_direct_beam:
             # add the direct beam part by computing the radiograph of the sample without the diffracting grains
-            data_abs = np.where(grain_ids > 0, 1, 0)
-            for (gid, (h, k, l)) in dif_grains:
-                mask_dif = (grain_ids == gid)
-                data_abs[mask_dif] = 0  # remove this grain from the absorption
+            grain_ids = self.get_grain_map()
+            dif_ids = np.unique([gid for (gid, hkl) in dif_grains])
+            data_abs = np.where((grain_ids > 0) & ~np.isin(grain_ids, dif_ids), 1, 0)
             proj = radiograph(data_abs, omega)[:, ::-1]  # (u, v) axes correspond to (Y, -Z) for DCT detector
             add_to_image(full_proj, proj / att, np.array(full_proj.shape) // 2)
 
         # add diffraction spots
         X = np.array([1., 0., 0.]) / lambda_nm
         for (gid, (h, k, l)) in dif_grains:
-            grain_data = np.where(grain_ids == gid, 1, 0)
-            if np.sum(grain_data) < 1:
+            grain = self.get_grain_subvolume(gid)
+            if grain is None:
                 print('skipping grain %d' % gid)
                 continue
-            local_com = np.array(ndimage.measurements.center_of_mass(grain_data, grain_ids))
-            print('local center of mass (voxel): {0}'.format(local_com))
-            g_center_mm = detector.get_pixel_size() * (local_com - 0.5 * np.array(grain_ids.shape))
-            print('center of mass (voxel): {0}'.format(local_com - 0.5 * np.array(grain_ids.shape)))
-            print('center of mass (mm): {0}'.format(g_center_mm))
+            _, g_center_mm, g = grain
             # compute scattering vector
-            gt = self.exp.get_sample().get_grain(gid).orientation_matrix().transpose()
             p = HklPlane(h, k, l, lattice)
-            G = np.dot(R, np.dot(gt, p.scattering_vector()))
+            G = np.dot(R, np.dot(g.T, p.scattering_vector()))
             K = X + G
             # position of the grain at this rotation angle
             g_pos_rot = np.dot(R, g_center_mm)
@@ -475,11 +601,11 @@ class DctForwardSimulation(ForwardSimulation):
             up, vp = detector.lab_to_pixel(pg)[0]
             if self.verbose:
                 print('\n* gid=%d, (%d,%d,%d) plane, angle=%.1f' % (gid, h, k, l, omega))
+                print('center of mass (mm): {0}'.format(g_center_mm))
                 print('diffraction vector:', K)
                 print('postion of the grain at omega=%.1f is ' % omega, g_pos_rot)
                 print('up=%d, vp=%d for plane (%d,%d,%d)' % (up, vp, h, k, l))
-            data_dif = grain_data[ndimage.find_objects(grain_ids == gid)[0]]
-            proj_dif = radiograph(data_dif, omega)  # (Y, Z) coordinate system
+            proj_dif = self.grain_projection(gid, omega)  # (Y, Z) coordinate system
             add_to_image(full_proj, proj_dif[:, ::-1], (up, vp), self.verbose)  # (u, v) axes correspond to (Y, -Z)
         return full_proj
 
@@ -772,18 +898,19 @@ def tt_rock(scan_name, data_dir='.', n_topo=-1, mask=None, dark_factor=1.):
             mask = np.ones((infos['Dim_1'], infos['Dim_2'], infos['TOMO_N']), dtype=np.uint8)
     # load dark image
     dark = dark_factor * edf_read(os.path.join(data_dir, scan_name, 'darkend0000.edf'))
-    print('dark average: ' % np.mean(dark))
-
-    # build the stack by combining individual images
-    tt_rock = np.empty((infos['TOMO_N'], n_topo), dtype=float)
-    for n in range(int(infos['TOMO_N'])):
-        print('computing rocking curve %d' % (n + 1), end='\r')
-        offset = n_topo * n
-        for i in range(n_topo):
-            index = offset + i + 1
-            frame_path = os.path.join(data_dir, scan_name, '%s%04d.edf' % (scan_name, index))
-            im = edf_read(frame_path) - dark
-            tt_rock[n, i] = np.sum(im * mask[:, :, n])
+    print('dark average: %.1f' % np.mean(dark))
+
+    # stream the frames and integrate each of them with the mask of its topograph
+    n_frames = int(infos['TOMO_N']) * n_topo
+    frame_paths = [os.path.join(data_dir, scan_name, '%s%04d.edf' % (scan_name, index + 1))
+                   for index in range(n_frames)]
+    reader = ImageStackReader(frame_paths, dark=dark)
+    tt_rock = np.empty(n_frames, dtype=float)
+    for start, batch in reader.batches():
+        print('computing rocking curve %d' % (start // n_topo + 1), end='\r')
+        n = np.arange(start, start + len(batch)) // n_topo
+        tt_rock[start:start + len(batch)] = np.einsum('kij,ijk->k', batch, mask[:, :, n], dtype=np.float64)
+    tt_rock = tt_rock.reshape((int(infos['TOMO_N']), n_topo))
     print('\ndone')
 
     return tt_rock
@@ -808,12 +935,13 @@ def tt_stack_h5(scan_name, data_dir='.', save_edf=False, n_angles=90,
     # parse the info file
     h5_path = os.path.join(data_dir, scan_name, '%s.h5' % scan_name)
     f = h5py.File(h5_path, 'r')
-    print('loading data from file %s...' % h5_path)
-    data = f[data_key][()]
+    print('streaming data from file %s...' % h5_path)
+    data = f[data_key]
     # check number of images
     if data.shape[0] % n_angles != 0:
         print('warning, number of images not consistent : %d total images for '
               '%d topograph' % (data.shape[0], n_angles))
+        f.close()
         return None
     else:
         n_topo = int(data.shape[0] / n_angles)
@@ -821,19 +949,17 @@ def tt_stack_h5(scan_name, data_dir='.', save_edf=False, n_angles=90,
     if dark is None:
         # create a reference image with the median over the first of each topograph
         dark = np.median(data[::2 * n_topo, :, :], axis=0)
-    data = data - dark
     # print check dark level
-    print('dark level: %.1f' % np.mean(data[::n_angles, :, :]))
+    print('dark level: %.1f' % np.mean(data[::n_angles, :, :] - dark))
     infos = {}
     infos['TOMO_N'] = n_angles
     infos['Dim_1'] = data.shape[1]
     infos['Dim_2'] = data.shape[2]
     print(infos)
 
-    # build the stack by combining individual images
-    data = data.reshape((n_topo, infos['TOMO_N'], infos['Dim_1'], infos['Dim_2']))
-    tt_stack = np.sum(data, axis=1)
-    del data
+    # build the stack by summing consecutive images
+    reader = ImageStackReader(data, dark=dark)
+    tt_stack = reader.reduce(group_size=infos['TOMO_N'])['groups']
     print(tt_stack[0].shape)
     tt_stack = tt_stack.transpose((2, 1, 0))
     f.close()
@@ -883,21 +1009,14 @@ def tt_stack(scan_name, data_dir='.', save_edf=False, n_topo=-1, dark_factor=1.)
     # load dark image
     dark = dark_factor * edf_read(os.path.join(data_dir, scan_name, 'darkend0000.edf'))
 
-    # build the stack by combining individual images
-    tt_stack = np.empty((infos['TOMO_N'], infos['Dim_1'], infos['Dim_2']))
+    # build the stack by summing the frames of each topograph
+    n_frames = int(infos['TOMO_N']) * n_topo
+    frame_paths = [os.path.join(data_dir, scan_name, '%s%04d.edf' % (scan_name, index + 1))
+                   for index in range(n_frames)]
+    reader = ImageStackReader(frame_paths, dark=dark)
+    tt_stack = reader.reduce(group_size=n_topo, verbose=True)['groups']
     print(tt_stack[0].shape)
-    for n in range(int(infos['TOMO_N'])):
-        print('building topograph %d' % (n + 1), end='\r')
-        topograph = np.zeros((infos['Dim_1'], infos['Dim_2']))
-        offset = n_topo * n
-        for i in range(n_topo):
-            index = offset + i + 1
-            frame_path = os.path.join(data_dir, scan_name, '%s%04d.edf' % (scan_name, index))
-            im = edf_read(frame_path) - dark
-            topograph += im
-        tt_stack[n] = topograph
     tt_stack = tt_stack.transpose((1, 2, 0))
-    print('\ndone')
 
     # save the data as edf if needed
     if save_edf:
@@ -1,12 +1,284 @@
 """The detectors module define classes to manipulate X-ray detectors.
 """
 import os
+import h5py
 import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from scipy import sparse
 from matplotlib import pyplot as plt, cm, rcParams
-from pymicro.file.file_utils import HST_read, HST_write
+from pymicro.file.file_utils import HST_read, HST_write, edf_read
 from pymicro.external.tifffile import TiffFile
 
 
+class IntegrationTable:
+    """Class to regroup the pixels of a detector into angular bins.
+
+    The table is a sparse matrix of shape (n_bins, n_pixels) computed once
+    from the per-pixel angle maps of a detector. Integrating an image, or a
+    whole stack of images acquired with the same geometry, then amounts to a
+    single sparse matrix product instead of one boolean mask per bin.
+
+    Bins are laid out in C order of `shape`, which is (n_2theta,) or
+    (n_psi,) for 1D regrouping and (n_2theta, n_psi) for 2D caking.
+    """
+
+    def __init__(self, bin_ids, shape, bin_centers, two_thetas=None, psis=None):
+        """Build the table from the bin index of each pixel.
+
+        :param ndarray bin_ids: an array with the same shape as the detector
+        giving the flat bin index of each pixel (-1 to exclude the pixel).
+        :param tuple shape: the shape of the bins.
+        :param tuple bin_centers: the bin center values along each dimension.
+        :param ndarray two_thetas: the 2theta map used to compute the table.
+        :param ndarray psis: the psi map used to compute the table.
+        """
+        self.shape = tuple(shape)
+        self.pixel_shape = bin_ids.shape
+        self.bin_centers = bin_centers
+        # keep a reference on the angle maps to detect geometry changes
+        self.two_thetas = two_thetas
+        self.psis = psis
+        ids = bin_ids.ravel()
+        pixels = np.flatnonzero(ids >= 0)
+        n_bins = int(np.prod(self.shape))
+        self.matrix = sparse.csr_matrix((np.ones(len(pixels)), (ids[pixels], pixels)),
+                                        shape=(n_bins, ids.size))
+        self.counts = np.bincount(ids[pixels], minlength=n_bins).astype(float)
+
+    @staticmethod
+    def compute_bin_ids(values, v_min, v_max, step, n_bins):
+        """Compute the bin index of each value, -1 is used outside of the range.
+
+        :param ndarray values: the values to regroup.
+        :param float v_min: the lower bound of the first bin.
+        :param float v_max: the upper bound of the range.
+        :param float step: the bin width.
+        :param int n_bins: the number of bins.
+        :return: an integer array of bin indices with the shape of `values`.
+        """
+        with np.errstate(invalid='ignore'):
+            outside = ~((values >= v_min) & (values <= v_max))
+            bin_ids = np.floor((np.where(outside, v_min, values) - v_min) / step).astype(np.int64)
+        bin_ids[outside | (bin_ids >= n_bins)] = -1
+        return bin_ids
+
+    def integrate(self, images, exclude_negative=True):
+        """Integrate an image or a stack of images using this table.
+
+        The averaged intensity in each bin is returned along with the number
+        of contributing pixels. Masked pixels (if a masked array is used)
+        contribute to the counts but not to the intensity.
+
+        :param ndarray images: a single image with the detector shape or a
+        stack of images with shape (n_images,) + detector shape.
+        :param bool exclude_negative: if True (default), pixels with a
+        negative intensity are excluded from each image.
+        :return: a tuple with the averaged intensities and the counts, each
+        with shape `shape` for a single image or (n_images,) + `shape` for a
+        stack of images.
+        """
+        single = np.ndim(images) == len(self.pixel_shape)
+        n_images = 1 if single else len(images)
+        data = np.ma.getdata(images).reshape(n_images, -1)
+        if data.shape[1] != self.matrix.shape[1]:
+            raise ValueError('image shape %s does not match the table pixel shape %s'
+                             % (np.shape(images), self.pixel_shape))
+        values = np.ma.filled(images, 0).reshape(n_images, -1)
+        negative = data < 0 if exclude_negative else np.zeros_like(data, dtype=bool)
+        if negative.any():
+            valid = ~negative
+            sums = self.matrix.dot(np.where(valid, values, 0).T).T
+            counts = self.matrix.dot(valid.T.astype(float)).T
+        else:
+            sums = self.matrix.dot(values.T).T
+            counts = np.tile(self.counts, (n_images, 1))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            intensities = sums / counts
+        out_shape = self.shape if single else (n_images,) + self.shape
+        return intensities.reshape(out_shape), counts.reshape(out_shape)
+
+
+class ImageStackReader:
+    """Class to stream a stack of detector images.
+
+    Frames are read by batches in background threads while the previous
+    batches are being processed, the corrections are applied to a whole
+    batch at once and reductions of the stack are accumulated on the fly so
+    that the stack never needs to be held in memory.
+
+    The frames can be given as a list of image files (EDF, TIFF or raw
+    binary files) or as an array like object with the frames along the first
+    axis (for instance a numpy array or a HDF5 dataset which is then read
+    batch per batch).
+    """
+
+    def __init__(self, source, detector=None, dark=None, flat=None, reader=None,
+                 batch_size=16, n_threads=2, prefetch=2):
+        """Create a new reader.
+
+        If a detector is given, its `correct_images` method is applied to
+        each batch (dark, flat field and geometrical corrections), otherwise
+        the dark image is subtracted and the images are normalized by the
+        flat field image (minus the dark) if these are specified.
+
+        :param source: a list of image file paths or an array like object
+        with shape (n_frames, n, m).
+        :param Detector2d detector: the detector used to correct the images.
+        :param ndarray dark: a dark image to subtract.
+        :param ndarray flat: a flat field image to normalize the images.
+        :param reader: a function to read a frame from a file path (by
+        default the reader is chosen from the file extension).
+        :param int batch_size: the number of frames in each batch.
+        :param int n_threads: the number of threads used to read the frames.
+        :param int prefetch: the number of batches to read in advance.
+        """
+        self.source = source
+        self.detector = detector
+        self.dark = dark
+        self.flat = flat
+        self.reader = reader
+        self.batch_size = batch_size
+        self.n_threads = n_threads
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return len(self.source)
+
+    def read_frame(self, path):
+        """Read a single raw frame from a file.
+
+        :param str path: the path to the image file.
+        :return: the frame as a numpy array.
+        """
+        if self.reader is not None:
+            return self.reader(path)
+        if path.endswith('.edf'):
+            return edf_read(path)
+        elif path.endswith('.tif') or path.endswith('.tiff'):
+            return TiffFile(path).asarray().T
+        elif path.endswith('.raw') and isinstance(self.detector, RegArrayDetector2d):
+            size_px = self.detector.get_size_px()
+            return HST_read(path, data_type=self.detector.data_type, dims=(size_px[0], size_px[1], 1),
+                            verbose=False)[:, :, 0]
+        raise ValueError('unrecognized file format: %s' % path)
+
+    def read_batch(self, start, stop):
+        """Read and correct the frames from `start` to `stop`.
+
+        :param int start: the index of the first frame.
+        :param int stop: the index after the last frame.
+        :return: the corrected frames as a numpy array.
+        """
+        if isinstance(self.source, (list, tuple)):
+            batch = np.stack([self.read_frame(path) for path in self.source[start:stop]])
+        else:
+            batch = np.asarray(self.source[start:stop])
+        if self.detector is not None:
+            return self.detector.correct_images(batch)
+        batch = batch.astype(np.float32 if batch.itemsize <= 4 else np.float64)
+        if self.dark is not None:
+            batch -= self.dark
+        if self.flat is not None:
+            batch /= self.flat - (self.dark if self.dark is not None else 0)
+        return batch
+
+    def batches(self):
+        """Iterate over the corrected frames by batches.
+
+        :return: a generator of tuples (start, batch) with the index of the
+        first frame and the corrected frames of each batch.
+        """
+        starts = range(0, len(self), self.batch_size)
+        with ThreadPoolExecutor(max_workers=self.n_threads) as executor:
+            pending = deque()
+            for start in starts:
+                pending.append((start, executor.submit(self.read_batch, start,
+                                                       min(start + self.batch_size, len(self)))))
+                if len(pending) > self.prefetch:
+                    start, future = pending.popleft()
+                    yield start, future.result()
+            while pending:
+                start, future = pending.popleft()
+                yield start, future.result()
+
+    def __iter__(self):
+        for start, batch in self.batches():
+            for frame in batch:
+                yield frame
+
+    def reduce(self, rois=None, center_of_mass=False, group_size=None, verbose=False):
+        """Compute reductions of the stack in a single pass.
+
+        The sum and the maximum images and the total intensity of each frame
+        are always computed. Masked pixels, if any, are ignored.
+
+        :param list rois: a list of regions of interest, each given either as
+        a tuple of slices or as a weight (or boolean) image.
+        :param bool center_of_mass: compute the intensity weighted centre of
+        mass of each frame.
+        :param int group_size: if set, also sum the frames by groups of
+        consecutive `group_size` frames.
+        :param bool verbose: activate verbose mode.
+        :return: a dictionary with the 'sum', 'max' and 'total' arrays and
+        optionally the 'roi' (n_frames, n_rois), 'center_of_mass'
+        (n_frames, 2) and 'groups' (n_groups, n, m) arrays.
+        :raise: a ValueError if the stack has no frame.
+        """
+        n_frames = len(self)
+        if n_frames == 0:
+            raise ValueError('cannot reduce an empty image stack')
+        results = {'total': np.zeros(n_frames)}
+        roi_table = None
+        if rois is not None:
+            results['roi'] = np.zeros((n_frames, len(rois)))
+        if center_of_mass:
+            results['center_of_mass'] = np.zeros((n_frames, 2))
+        for start, batch in self.batches():
+            if verbose:
+                print('reducing frames %d to %d' % (start + 1, start + len(batch)), end='\r')
+            if np.ma.isMaskedArray(batch):
+                batch = np.ma.filled(batch, 0)
+            stop = start + len(batch)
+            batch_max = batch.max(axis=0)
+            if start == 0:
+                shape = batch.shape[1:]
+                results['sum'] = np.zeros(shape)
+                results['max'] = batch_max
+                if group_size:
+                    results['groups'] = np.zeros((int(np.ceil(n_frames / group_size)),) + shape)
+                if rois is not None:
+                    weights = []
+                    for roi in rois:
+                        if isinstance(roi, tuple):
+                            w = np.zeros(shape)
+                            w[roi] = 1.
+                        else:
+                            w = np.asarray(roi, dtype=float)
+                        weights.append(w.ravel())
+                    roi_table = sparse.csr_matrix(np.array(weights))
+            else:
+                np.maximum(results['max'], batch_max, out=results['max'])
+            results['sum'] += batch.sum(axis=0)
+            flat_batch = batch.reshape(len(batch), -1)
+            results['total'][start:stop] = flat_batch.sum(axis=1, dtype=np.float64)
+            if roi_table is not None:
+                results['roi'][start:stop] = roi_table.dot(flat_batch.T).T
+            if center_of_mass:
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    results['center_of_mass'][start:stop, 0] = \
+                        batch.sum(axis=2).dot(np.arange(shape[0])) / results['total'][start:stop]
+                    results['center_of_mass'][start:stop, 1] = \
+                        batch.sum(axis=1).dot(np.arange(shape[1])) / results['total'][start:stop]
+            if group_size:
+                group_ids = np.arange(start, stop) // group_size
+                for group_id in np.unique(group_ids):
+                    results['groups'][group_id] += batch[group_ids == group_id].sum(axis=0)
+        if verbose:
+            print('\ndone')
+        return results
+
+
 class Detector2d:
     """Class to handle 2D detectors.
 
@@ -34,11 +306,136 @@ class Detector2d:
         self.save_path = '.'
         self.correction = 'none'  # could be none, bg, flat
         self.orientation = 'horizontal'  # either 'horizontal' or 'vertical'
+        self._integration_tables = {}
 
     def clear_data(self):
         """Simply set all pixels to zeros."""
         self.data = np.zeros(self.size, dtype=self.data_type)
 
+    def correct_images(self, images):
+        """Apply the intensity correction to an image or a stack of images.
+
+        The correction is set by the `correction` attribute: 'bg' to subtract
+        the `bg` image, 'flat' to apply a flat field correction using the
+        `dark` and `ref` images, no correction is applied otherwise. The
+        correction images are broadcast over the stack.
+
+        :param ndarray images: an image or a stack of images with shape
+        (n_images,) + image shape.
+        :return: the corrected image(s).
+        """
+        if self.correction == 'bg':
+            return images - self.bg
+        elif self.correction == 'flat':
+            return (images - self.dark).astype(np.float32) / (self.ref - self.dark).astype(np.float32)
+        return images
+
+    def compute_integration_table(self, mode='2theta', two_theta_mini=None, two_theta_maxi=None,
+                                  two_theta_step=None, psi_min=None, psi_max=None, psi_step=None,
+                                  mask=None):
+        """Compute a table to regroup the detector pixels into angular bins.
+
+        The table relies on the `two_thetas` and `psis` arrays which must have
+        been computed beforehand (see `compute_TwoTh_Psi_arrays`). In '2theta'
+        mode the pixels may be restricted to the open psi interval
+        ]psi_min, psi_max[, in 'psi' mode to the closed 2theta interval
+        [two_theta_mini, two_theta_maxi]; in '2d' mode both angles are binned.
+
+        :param str mode: the regrouping mode, '2theta', 'psi' or '2d'.
+        :param float two_theta_mini: lower 2theta bound in degrees.
+        :param float two_theta_maxi: upper 2theta bound in degrees.
+        :param float two_theta_step: 2theta bin width in degrees.
+        :param float psi_min: lower psi bound in degrees.
+        :param float psi_max: upper psi bound in degrees.
+        :param float psi_step: psi bin width in degrees.
+        :param ndarray mask: an optional array with the detector shape, pixels
+        where the mask is 0 are excluded.
+        :return: a new `IntegrationTable` instance.
+        """
+        if mode not in ['2theta', 'psi', '2d']:
+            raise ValueError('unsupported regrouping mode: %s' % mode)
+        if two_theta_mini is None:
+            two_theta_mini = np.nanmin(self.two_thetas)
+        if two_theta_maxi is None:
+            two_theta_maxi = np.nanmax(self.two_thetas)
+        if two_theta_step is None:
+            two_theta_step = 1. / self.calib
+        if psi_step is None:
+            psi_step = 1. / self.calib
+        shape = []
+        bin_centers = []
+        bin_ids = np.zeros(self.two_thetas.shape, dtype=np.int64)
+        excluded = np.zeros(self.two_thetas.shape, dtype=bool)
+        if mode in ['2theta', '2d']:
+            n_bins = int((two_theta_maxi - two_theta_mini) / two_theta_step)
+            ids = IntegrationTable.compute_bin_ids(self.two_thetas, two_theta_mini, two_theta_maxi,
+                                                   two_theta_step, n_bins)
+            bin_ids = ids
+            excluded |= ids < 0
+            shape.append(n_bins)
+            bin_centers.append(np.linspace(two_theta_mini, two_theta_maxi, 1 + n_bins)[:-1] + 0.5 * two_theta_step)
+        else:
+            with np.errstate(invalid='ignore'):
+                excluded |= ~((self.two_thetas >= two_theta_mini) & (self.two_thetas <= two_theta_maxi))
+        if mode in ['psi', '2d']:
+            if psi_min is None:
+                psi_min = np.nanmin(self.psis)
+            if psi_max is None:
+                psi_max = np.nanmax(self.psis)
+            n_bins = int((psi_max - psi_min) / psi_step)
+            ids = IntegrationTable.compute_bin_ids(self.psis, psi_min, psi_max, psi_step, n_bins)
+            bin_ids = bin_ids * n_bins + ids
+            excluded |= ids < 0
+            shape.append(n_bins)
+            bin_centers.append(np.linspace(psi_min, psi_max, 1 + n_bins)[:-1] + 0.5 * psi_step)
+        elif psi_min is not None or psi_max is not None:
+            with np.errstate(invalid='ignore'):
+                if psi_min is not None:
+                    excluded |= ~(self.psis > psi_min)
+                if psi_max is not None:
+                    excluded |= ~(self.psis < psi_max)
+        if mask is not None:
+            excluded |= np.asarray(mask) == 0
+        bin_ids[excluded] = -1
+        return IntegrationTable(bin_ids, shape, tuple(bin_centers), two_thetas=self.two_thetas, psis=self.psis)
+
+    def get_integration_table(self, mode='2theta', **kwargs):
+        """Return an integration table for this detector, computing it only if needed.
+
+        Tables are cached by mode and parameters and recomputed when the
+        `two_thetas` or `psis` arrays of the detector have been replaced. The
+        parameters are those of `compute_integration_table`; tables using an
+        explicit mask are not cached.
+
+        :param str mode: the regrouping mode, '2theta', 'psi' or '2d'.
+        :return: an `IntegrationTable` instance.
+        """
+        if kwargs.get('mask') is not None:
+            return self.compute_integration_table(mode=mode, **kwargs)
+        key = (mode,) + tuple(sorted(kwargs.items()))
+        table = self._integration_tables.get(key)
+        if table is None or table.two_thetas is not self.two_thetas or table.psis is not self.psis:
+            table = self.compute_integration_table(mode=mode, **kwargs)
+            self._integration_tables[key] = table
+        return table
+
+    def integrate_stack(self, images, mode='2theta', exclude_negative=True, **kwargs):
+        """Regroup a stack of images acquired with the current detector geometry.
+
+        The integration table is computed once for the whole stack (see
+        `get_integration_table` for the parameters).
+
+        :param ndarray images: a single image or a stack of images with shape
+        (n_images,) + detector shape.
+        :param str mode: the regrouping mode, '2theta', 'psi' or '2d'.
+        :param bool exclude_negative: exclude pixels with negative intensities.
+        :return: a tuple with the bin centers, the averaged intensities and
+        the counts (see `IntegrationTable.integrate`).
+        """
+        table = self.get_integration_table(mode=mode, **kwargs)
+        intensities, counts = table.integrate(images, exclude_negative=exclude_negative)
+        return table.bin_centers, intensities, counts
+
     def azimuthal_regroup(self, two_theta_mini=None, two_theta_maxi=None, two_theta_step=None,
                           psi_mask=None, psi_min=None, psi_max=None, write_txt=False,
                           output_image=False, debug=False):
@@ -49,31 +446,22 @@ class Detector2d:
             two_theta_maxi = self.two_thetas.max()
         if not two_theta_step:
             two_theta_step = 1. / self.calib
-        if (psi_mask is None) and (psi_min or psi_max):
-            psi_mask = (self.psis > psi_min) & (self.psis < psi_max)
         n_bins = int((two_theta_maxi - two_theta_mini) / two_theta_step)
         print('* Azimuthal regroup (two theta binning)')
         print('  delta range = [%.1f-%.1f] with a %g deg step (%d bins)' % (
             two_theta_mini, two_theta_maxi, two_theta_step, n_bins))
 
-        bin_edges = np.linspace(two_theta_mini, two_theta_maxi, 1 + n_bins)
-        two_theta_values = bin_edges[:-1] + 0.5 * two_theta_step
-        intensityResult = np.zeros(n_bins)  # this will be the summed intensity
-        counts = np.zeros(n_bins)  # this will be the number of pixel contributing to each point
-
-        # calculating bin indices for each pixel
-        bin_id = np.floor((self.two_thetas - two_theta_mini) / two_theta_step).astype(np.int16)
-        bin_id[self.two_thetas > two_theta_maxi] = -1
-        bin_id[self.two_thetas < two_theta_mini] = -1
-        # mark out pixels with negative intensity
-        bin_id[self.corr_data < 0] = -1
-        # mark out pixels according to the psi mask
-        if psi_mask is not None:
-            bin_id[psi_mask == 0] = -1
-        for ii in range(n_bins):
-            intensityResult[ii] = self.corr_data[bin_id == ii].sum()
-            counts[ii] = (bin_id == ii).sum()
-        intensityResult /= counts
+        # the table is reused as long as the geometry and the binning do not change
+        if (psi_mask is None) and (psi_min or psi_max):
+            table = self.get_integration_table('2theta', two_theta_mini=two_theta_mini,
+                                               two_theta_maxi=two_theta_maxi, two_theta_step=two_theta_step,
+                                               psi_min=psi_min, psi_max=psi_max)
+        else:
+            table = self.get_integration_table('2theta', two_theta_mini=two_theta_mini,
+                                               two_theta_maxi=two_theta_maxi, two_theta_step=two_theta_step,
+                                               mask=psi_mask)
+        two_theta_values = table.bin_centers[0]
+        intensityResult, counts = table.integrate(self.corr_data)
 
         if output_image:
             print(self.image_path)
@@ -132,26 +520,11 @@ class Detector2d:
         print('* Sagital regroup (psi binning)')
         print('  psi range = [%.1f-%.1f] with a %g deg step (%d bins)' % (psi_min, psi_max, psi_step, nbOfBins))
 
-        bin_edges = np.linspace(psi_min, psi_max, 1 + nbOfBins)
-        psi_values = bin_edges[:-1] + 0.5 * psi_step
-        intensityResult = np.zeros(nbOfBins);  # this will be the summed intensity
-        counts = np.zeros(nbOfBins);  # this will be the number of pixel contributing to each point
-
-        # calculating bin indices for each pixel
-        binIndices = np.floor((self.psis - psi_min) / psi_step).astype(np.int16)
-        binIndices[self.psis > psi_max] = -1
-        # mark out pixels with negative intensity
-        binIndices[self.corr_data < 0] = -1
-        # mark out pixels outside of psi range [-psi_max, psi_max]
-        if two_theta_mini:
-            binIndices[(self.two_thetas < two_theta_mini)] = -1
-        if two_theta_maxi:
-            binIndices[(self.two_thetas > two_theta_maxi)] = -1
-        for ii in range(nbOfBins):
-            intensityResult[ii] = self.corr_data[binIndices == ii].sum()
-            counts[ii] = (binIndices == ii).sum()
+        table = self.get_integration_table('psi', two_theta_mini=two_theta_mini, two_theta_maxi=two_theta_maxi,
+                                           psi_min=psi_min, psi_max=psi_max, psi_step=psi_step)
+        psi_values = table.bin_centers[0]
+        intensityResult, counts = table.integrate(self.corr_data)
         print(counts)
-        intensityResult /= counts
 
         if output_image:
             print(self.image_path)
@@ -213,6 +586,7 @@ class RegArrayDetector2d(Detector2d):
         else:
             self.P = P
         self.apply_tilts(tilts)
+        self.clear_geometry_cache()
 
     @staticmethod
     def compute_tilt_matrix(tilts):
@@ -286,6 +660,128 @@ class RegArrayDetector2d(Detector2d):
         """Return the size of the detector in millimeters."""
         return self.pixel_size * np.array(self.size)
 
+    def clear_geometry_cache(self):
+        """Clear the cached per-pixel geometry maps."""
+        self._geometry_maps = None
+        self._geometry_key = None
+        self._two_theta_psi_key = None
+        self._two_theta_psi_arrays = None
+
+    def get_geometry_key(self, origin=(0., 0., 0.), polarization_factor=0.):
+        """Return an array describing the current detector geometry.
+
+        Two identical keys mean that the per-pixel geometry maps are the same,
+        the key is used to invalidate the cached maps whenever the position,
+        the tilts, the pixel size, the binning or the size of the detector
+        have changed.
+
+        :param tuple origin: the origin of the diffracted rays (the sample
+        position) in the laboratory frame.
+        :param float polarization_factor: the polarization factor of the beam.
+        :return: a 1D numpy array of floats.
+        """
+        return np.concatenate([np.ravel(self.ref_pos), self.u_dir, self.v_dir, self.w_dir,
+                               [self.pixel_size, self.binning], self.get_size_px(),
+                               np.ravel(origin), [polarization_factor]]).astype(float)
+
+    def compute_geometry_maps(self, origin=(0., 0., 0.), polarization_factor=0.):
+        """Compute the geometry maps of all the detector pixels.
+
+        The incident beam is assumed to travel along the X axis of the
+        laboratory frame and the maps are evaluated at the pixel coordinates
+        used by `pixel_to_lab`. The following maps are computed:
+
+         * lab: the laboratory coordinates of each pixel (mm).
+         * two_theta: the scattering angle (degrees).
+         * psi: the azimuthal angle (degrees) in [0, 360[, measured from the
+           u direction of the detector towards -v (same convention as
+           `compute_TwoTh_Psi_arrays`).
+         * solid_angle: the solid angle covered by each pixel (sr).
+         * polarization: the polarization factor of each pixel, given by
+           :math:`(1 + \\cos^2 2\\theta - f \\cos 2\\psi \\sin^2 2\\theta) / 2`
+           with :math:`f` the polarization factor of the beam (0 for an
+           unpolarized beam, 1 for a beam polarized along u).
+
+        :param tuple origin: the origin of the diffracted rays (the sample
+        position) in the laboratory frame.
+        :param float polarization_factor: the polarization factor of the beam.
+        :return: a dictionary with the different maps.
+        """
+        size_px = self.get_size_px()
+        vv, uu = np.meshgrid(np.arange(size_px[1]), np.arange(size_px[0]))
+        lab = self.pixel_to_lab(uu.ravel(), vv.ravel())
+        rays = lab - np.array(origin)
+        distances = np.linalg.norm(rays, axis=1)
+        rays /= distances[:, np.newaxis]
+        cos_two_theta = np.clip(rays[:, 0], -1., 1.)
+        two_theta = np.arccos(cos_two_theta)
+        psi = np.arctan2(-np.dot(rays, self.v_dir), np.dot(rays, self.u_dir)) % (2 * np.pi)
+        solid_angle = self.get_pixel_size() ** 2 * np.abs(np.dot(rays, self.w_dir)) / distances ** 2
+        polarization = 0.5 * (1 + cos_two_theta ** 2 -
+                              polarization_factor * np.cos(2 * psi) * np.sin(two_theta) ** 2)
+        shape = tuple(size_px)
+        maps = {'lab': lab.reshape(shape + (3,)),
+                'two_theta': np.degrees(two_theta).reshape(shape),
+                'psi': np.degrees(psi).reshape(shape),
+                'solid_angle': solid_angle.reshape(shape),
+                'polarization': polarization.reshape(shape)}
+        return maps
+
+    def get_geometry_maps(self, origin=(0., 0., 0.), polarization_factor=0.):
+        """Return the geometry maps of the detector, computing them only if needed.
+
+        The maps are cached and recomputed only when the detector geometry
+        has changed (see `get_geometry_key`). The returned arrays are shared
+        with the cache and should not be modified.
+
+        :param tuple origin: the origin of the diffracted rays (the sample
+        position) in the laboratory frame.
+        :param float polarization_factor: the polarization factor of the beam.
+        :return: a dictionary with the different maps (see
+        `compute_geometry_maps`).
+        """
+        key = self.get_geometry_key(origin, polarization_factor)
+        if self._geometry_maps is None or not np.array_equal(key, self._geometry_key):
+            self._geometry_maps = self.compute_geometry_maps(origin, polarization_factor)
+            self._geometry_key = key
+        return self._geometry_maps
+
+    def save_geometry_maps(self, file_path, origin=(0., 0., 0.), polarization_factor=0.):
+        """Save the geometry maps of the detector in a HDF5 file.
+
+        :param str file_path: the path of the file to write.
+        :param tuple origin: the origin of the diffracted rays (the sample
+        position) in the laboratory frame.
+        :param float polarization_factor: the polarization factor of the beam.
+        """
+        maps = self.get_geometry_maps(origin, polarization_factor)
+        with h5py.File(file_path, 'w') as f:
+            f.attrs['geometry_key'] = self._geometry_key
+            f.attrs['origin'] = np.array(origin, dtype=float)
+            f.attrs['polarization_factor'] = polarization_factor
+            for name, data in maps.items():
+                f.create_dataset(name, data=data, chunks=True, compression='gzip', compression_opts=1)
+
+    def load_geometry_maps(self, file_path):
+        """Load geometry maps previously saved with `save_geometry_maps`.
+
+        The maps are put in the cache of the detector so that subsequent
+        calls to `get_geometry_maps` with the same origin and polarization
+        factor do not recompute them.
+
+        :param str file_path: the path of the file to read.
+        :raise ValueError: if the maps were computed for another geometry.
+        :return: a dictionary with the different maps.
+        """
+        with h5py.File(file_path, 'r') as f:
+            key = self.get_geometry_key(f.attrs['origin'], f.attrs['polarization_factor'])
+            if not np.array_equal(key, f.attrs['geometry_key']):
+                raise ValueError('geometry maps in %s do not match the detector geometry' % file_path)
+            maps = {name: f[name][()] for name in f.keys()}
+        self._geometry_maps = maps
+        self._geometry_key = key
+        return maps
+
     def get_origin(self):
         '''Return the detector origin in laboratory coordinates.'''
         return self.pixel_to_lab(0, 0)
@@ -361,7 +857,7 @@ class RegArrayDetector2d(Detector2d):
         :param ndarray points: the coordinates of the points in the laboratory frame.
         :return ndarray uv: the detector coordinates of the given points as an array of size (n, 2).
         """
-        if len(points) == 3:
+        if np.ndim(points) == 1:
             points = np.reshape(points, (1, 3))
         vec = points - np.array(self.ref_pos)
         # check that each point is on the detector plane
@@ -413,12 +909,7 @@ class RegArrayDetector2d(Detector2d):
         self.compute_corrected_image()
 
     def compute_corrected_image(self):
-        if self.correction == 'none':
-            self.corr_data = self.data
-        elif self.correction == 'bg':
-            self.corr_data = self.data - self.bg
-        elif self.correction == 'flat':
-            self.corr_data = (self.data - self.dark).astype(np.float32) / (self.ref - self.dark).astype(np.float32)
+        self.corr_data = self.correct_images(self.data)
 
     def compute_geometry(self):
         '''Calculate an array of the image size with the (2theta, psi) for each pixel.'''
@@ -428,6 +919,13 @@ class RegArrayDetector2d(Detector2d):
         '''Calculate two arrays (2theta, psi) TwoTheta and Psi angles arrays corresponding to repectively
         the vertical and the horizontal pixels.
         '''
+        # the arrays are kept as long as the calibration does not change and
+        # they have not been replaced
+        key = (self.calib, self.ucen, self.vcen) + tuple(self.get_size_px())
+        if key == self._two_theta_psi_key \
+                and self._two_theta_psi_arrays[0] is self.two_thetas \
+                and self._two_theta_psi_arrays[1] is self.psis:
+            return
         deg2rad = np.pi / 180.
         inv_deg2rad = 1. / deg2rad
         # distance xpad to sample, in pixel units
@@ -439,6 +937,8 @@ class RegArrayDetector2d(Detector2d):
         self.two_thetas = np.arctan(r / distance) * inv_deg2rad
         self.psis = np.arccos((uu - self.ucen) / r) * inv_deg2rad
         self.psis[vv > self.vcen] = 360 - self.psis[vv > self.vcen]
+        self._two_theta_psi_key = key
+        self._two_theta_psi_arrays = (self.two_thetas, self.psis)
 
     def angles_to_pixels(self, two_theta, psi):
         '''given two values 2theta and psi in degrres (that could be arrays), compute the corresponding pixel on the detector.'''
@@ -673,50 +1173,44 @@ class Xpad(Detector2d):
         or flat field correction. Then tiling and double pixels are accounted
         for to obtain a proper geometry where each pixel of the image
         represent the same physical zone.'''
+        self.corr_data = self.correct_images(self.data[np.newaxis])[0]
+
+    def correct_images(self, images):
+        '''Compute corrected images for a stack of raw images.
+
+        This applies the same corrections as `compute_corrected_image` to all
+        the images at once.
+
+        :param ndarray images: a stack of raw images with shape (n_images, 240, 560).
+        :return: the stack of corrected images (a masked array if `mask_flag` is 1).
+        '''
         # now apply intensity corrections based on the value of self.correction
-        if self.correction == 'bg':
-            self.corr_data = self.data - self.bg
-        elif self.correction == 'flat':
-            self.corr_data = (self.data - self.dark).astype(np.float32) / (self.ref - self.dark).astype(np.float32)
-        else:
-            self.corr_data = self.data.copy()
+        corr_data = Detector2d.correct_images(self, np.asarray(images))
         newX_array, newY_array, newX_Ifactor_array = self.compute_geometry()
+        newX_array = newX_array.astype(int)
+        newY_array = newY_array.astype(int)
         image_corr1_sizeX = len(newX_array)
         image_corr1_sizeY = len(newY_array)
-        thisCorrectedImage = np.zeros((image_corr1_sizeY, image_corr1_sizeX))
-        for y in range(0, image_corr1_sizeY):  # correct for double pixels
-            yold = newY_array[y];
-            for x in range(0, image_corr1_sizeX):
-                xold = newX_array[x]
-                Ifactor = newX_Ifactor_array[x]
-                if (Ifactor > 0):
-                    # print("pos")
-                    thisCorrectedImage[y, x] = self.corr_data[yold, xold] * Ifactor
-                if (Ifactor < 0):
-                    # print("neg")
-                    thisCorrectedImage[y, x] = (self.corr_data[yold, xold - 1] + self.corr_data[
-                        yold, xold + 1]) / 2.0 / self.factorIdoublePixel
+        thisCorrectedImage = np.zeros((len(corr_data), image_corr1_sizeY, image_corr1_sizeX))
+        rows = corr_data[:, newY_array, :]
+        # correct for double pixels
+        pos = newX_Ifactor_array > 0
+        thisCorrectedImage[:, :, pos] = rows[:, :, newX_array[pos]] * newX_Ifactor_array[pos]
+        neg = newX_Ifactor_array < 0
+        thisCorrectedImage[:, :, neg] = (rows[:, :, newX_array[neg] - 1] +
+                                         rows[:, :, newX_array[neg] + 1]) / 2.0 / self.factorIdoublePixel
 
         # correct the double lines (last and 1st line of the modules, at their junction)
         lineIndex1 = self.chip_sizeY - 1;  # last line of module1 = 119, is the 1st line to correct
         lineIndex5 = lineIndex1 + 3 + 1;  # 1st line of module2 (after adding the 3 empty lines), becomes the 5th line tocorrect
-        lineIndex2 = lineIndex1 + 1;
-        lineIndex3 = lineIndex1 + 2;
-        lineIndex4 = lineIndex1 + 3;
-        for x in range(0, image_corr1_sizeX):
-            i1 = thisCorrectedImage[lineIndex1, x];
-            i5 = thisCorrectedImage[lineIndex5, x];
-            i1new = i1 / self.factorIdoublePixel;
-            i5new = i5 / self.factorIdoublePixel;
-            i3 = (i1new + i5new) / 2.0;
-            thisCorrectedImage[lineIndex1, x] = i1new;
-            thisCorrectedImage[lineIndex2, x] = i1new;
-            thisCorrectedImage[lineIndex3, x] = i3;
-            thisCorrectedImage[lineIndex5, x] = i5new;
-            thisCorrectedImage[lineIndex4, x] = i5new
+        i1new = thisCorrectedImage[:, lineIndex1, :] / self.factorIdoublePixel
+        i5new = thisCorrectedImage[:, lineIndex5, :] / self.factorIdoublePixel
+        thisCorrectedImage[:, lineIndex1:lineIndex1 + 2, :] = i1new[:, np.newaxis, :]
+        thisCorrectedImage[:, lineIndex1 + 2, :] = (i1new + i5new) / 2.0
+        thisCorrectedImage[:, lineIndex1 + 3:lineIndex5 + 1, :] = i5new[:, np.newaxis, :]
 
         if self.mask_flag == 1:
-            double_pixel_mask = np.zeros_like(thisCorrectedImage)
+            double_pixel_mask = np.zeros((image_corr1_sizeY, image_corr1_sizeX), dtype=bool)
             hlist = ( \
                 (0, 4 + self.mask_size_increase), \
                 (77 - self.mask_size_increase, 85 + self.mask_size_increase), \
@@ -731,9 +1225,8 @@ class Xpad(Detector2d):
             vlist = ((118, 125),)
             for (yLineStart, yLineEnd) in vlist:
                 double_pixel_mask[yLineStart:yLineEnd + 1, :] = True
-            self.corr_data = np.ma.array(thisCorrectedImage, mask=double_pixel_mask)
-        else:
-            self.corr_data = thisCorrectedImage
+            return np.ma.array(thisCorrectedImage, mask=np.broadcast_to(double_pixel_mask, thisCorrectedImage.shape))
+        return thisCorrectedImage
 
     def compute_TwoTh_Psi_arrays(self, diffracto_delta, diffracto_gamma):
         '''Computes TwoTheta and Psi angles arrays corresponding to repectively
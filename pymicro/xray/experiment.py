@@ -220,6 +220,35 @@ class ObjectGeometry:
             is_in, xyz = is_in_array(self.cad, step=0.2, origin=self.origin)
             self.positions = xyz[np.where(is_in.ravel())]
 
+    def iter_grain_positions(self, grain_ids):
+        """Iterate over the positions of material points inside several grains.
+
+        This gives the same positions as calling `discretize_geometry` for
+        each grain, but an array geometry is scanned only once: the voxels
+        are sorted by grain id, keeping their order within each grain.
+
+        :param list grain_ids: the ids of the grains.
+        :return: a generator of (grain_id, positions) tuples, the positions
+            being given as a (n_vox, 3) array in mm unit.
+        """
+        if self.geo_type != 'array':
+            for grain_id in grain_ids:
+                self.discretize_geometry(grain_id=grain_id)
+                yield grain_id, self.positions
+            return
+        bb = self.get_bounding_box()
+        coordinates = [np.linspace(bb[0][i], bb[1][i], n)
+                       for i, n in enumerate(self.array.shape)]
+        labels = self.array.ravel()
+        order = np.argsort(labels, kind='stable')
+        sorted_labels = labels[order]
+        for grain_id in grain_ids:
+            start = np.searchsorted(sorted_labels, grain_id, side='left')
+            stop = np.searchsorted(sorted_labels, grain_id, side='right')
+            indices = np.unravel_index(order[start:stop], self.array.shape)
+            yield grain_id, np.c_[tuple(c[i] for c, i
+                                        in zip(coordinates, indices))]
+
 
 class Sample(Microstructure):
     """Class to describe a material sample.
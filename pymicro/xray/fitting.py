@@ -8,6 +8,9 @@
     * Cosine
     * Voigt
 
+   A whole stack of profiles (for instance the rocking curves of all the
+   pixels of a detector) can be fitted at once with `fit_profiles`.
+
   .. figure:: _static/fitting_functions.png
       :width: 400 px
       :height: 300 px
@@ -103,6 +106,174 @@ def lin_reg(xi, yi):
     return alpha, beta, r
 
 
+def _profiles_model(expression, x, p):
+    """Evaluate a predefined fit function and its jacobian for a batch of parameters.
+
+    :param str expression: the name of the predefined fit function.
+    :param ndarray x: the x coordinates, an array of shape (n,).
+    :param ndarray p: the parameters, an array of shape (m, n_params).
+    :return: a tuple with the function values (m, n) and the jacobian (m, n, n_params).
+    """
+    pos = p[:, 0:1]
+    d = x - pos
+    if expression == 'Gaussian':
+        s, h = p[:, 1:2], p[:, 2:3]
+        u = d / s
+        e = np.exp(-u ** 2)
+        f = h * e
+        jac = np.stack([2 * f * u / s, 2 * f * u ** 2 / s, e], axis=-1)
+    elif expression == 'Lorentzian':
+        g, h = p[:, 1:2], p[:, 2:3]
+        den = d ** 2 + g ** 2
+        f = h * g / np.pi / den
+        jac = np.stack([2 * f * d / den, h / np.pi * (d ** 2 - g ** 2) / den ** 2, g / np.pi / den], axis=-1)
+    elif expression == 'Cosine':
+        w = p[:, 1:2]
+        a = np.pi * d / (2 * w)
+        f = np.cos(a)
+        sin_a = np.sin(a)
+        jac = np.stack([sin_a * np.pi / (2 * w), sin_a * a / w], axis=-1)
+    elif expression == 'Voigt':
+        # the Lorentzian width is |gamma| to keep a Voigt profile
+        s, h = p[:, 1:2], p[:, 3:4]
+        g_sign = np.where(p[:, 2:3] < 0, -1., 1.)
+        g = g_sign * p[:, 2:3]
+        z = (d + 1j * g) / (s * np.sqrt(2))
+        w = wofz(z)
+        norm = 1. / (s * np.sqrt(2 * np.pi))
+        f = h * w.real * norm
+        # derivative of the Faddeeva function
+        dw = -2 * z * w + 2j / np.sqrt(np.pi)
+        hn = h * norm
+        jac = np.stack([-hn * dw.real / (s * np.sqrt(2)),
+                        -hn * (dw * z).real / s - f / s,
+                        -hn * dw.imag / (s * np.sqrt(2)) * g_sign,
+                        w.real * norm], axis=-1)
+    else:
+        raise ValueError('unsupported fit function for batch fitting: %s' % expression)
+    return f, jac
+
+
+def _profiles_init(expression, x, y):
+    """Estimate initial parameters of a predefined fit function for a batch of profiles.
+
+    The position is taken at the maximum of each profile and the width is
+    derived from the number of points above half maximum.
+    """
+    i_max = np.argmax(y, axis=1)
+    position = x[i_max]
+    height = y[np.arange(len(y)), i_max]
+    dx = np.abs(np.mean(np.diff(x))) if len(x) > 1 else 1.
+    fwhm = np.maximum(np.sum(y >= 0.5 * height[:, np.newaxis], axis=1), 1) * dx
+    if expression == 'Gaussian':
+        return np.stack([position, fwhm / (2 * np.sqrt(np.log(2))), height], axis=-1)
+    elif expression == 'Lorentzian':
+        gamma = 0.5 * fwhm
+        return np.stack([position, gamma, height * np.pi * gamma], axis=-1)
+    elif expression == 'Cosine':
+        return np.stack([position, 4. / 3 * fwhm], axis=-1)
+    elif expression == 'Voigt':
+        sigma = 0.5 * fwhm / (2 * np.sqrt(2 * np.log(2)))
+        gamma = 0.25 * fwhm
+        # scale the height factor with the maximum of the unit Voigt function
+        peak = wofz(1j * gamma / (sigma * np.sqrt(2))).real / (sigma * np.sqrt(2 * np.pi))
+        return np.stack([position, sigma, gamma, height / peak], axis=-1)
+    raise ValueError('unsupported fit function for batch fitting: %s' % expression)
+
+
+def fit_profiles(y, x=None, expression='Gaussian', init=None, max_iter=100, xtol=1.e-6, verbose=False):
+    """Fit a predefined function to a whole stack of 1D profiles at once.
+
+    All the profiles are fitted simultaneously with a vectorized
+    Levenberg-Marquardt algorithm using the analytical jacobian of the fit
+    function. This is typically used to fit the rocking curve of each pixel
+    of a detector. The parameters are ordered as in the corresponding fit
+    function class (`Gaussian`, `Lorentzian`, `Cosine` or `Voigt`) so the
+    result for a given profile can be used to build an instance of the class.
+    ::
+
+      >>> params, r_squared, rss = fit_profiles(stack, x=omegas, expression='Gaussian')
+      >>> params.shape
+      (2048, 2048, 3)
+
+    :param ndarray y: the profiles to fit, an array of shape (..., n).
+    :param ndarray x: the x coordinates of the profiles, an array of shape
+    (n,) (optional, None by default).
+    :param str expression: the name of the predefined fit function.
+    :param init: the initial parameters, either a sequence used for all the
+    profiles or an array of shape (..., n_params). If None, the parameters
+    are estimated from each profile.
+    :param int max_iter: the maximum number of iterations.
+    :param float xtol: the relative tolerance on the parameters to stop the
+    iterations.
+    :param bool verbose: activate verbose mode.
+    :return: a tuple with the parameter maps (..., n_params), the coefficient
+    of determination maps (...) and the residual sum of squares maps (...).
+    The constant profiles (such as dark or dead pixels) and the profiles with
+    non finite values are not fitted, all their values are NaN.
+    """
+    y = np.asarray(y, dtype=float)
+    map_shape = y.shape[:-1]
+    y = y.reshape(-1, y.shape[-1])
+    if x is None:
+        x = np.arange(y.shape[1])
+    x = np.asarray(x, dtype=float)
+    if init is None:
+        p = _profiles_init(expression, x, y)
+    else:
+        n_params = np.shape(init)[-1]
+        p = np.array(np.broadcast_to(init, map_shape + (n_params,)), dtype=float).reshape(-1, n_params)
+    n_params = p.shape[1]
+    f, jac = _profiles_model(expression, x, p)
+    rss = np.sum((y - f) ** 2, axis=1)
+    damping = np.full(len(y), 1.e-3)
+    valid = np.all(np.isfinite(y), axis=1) & (np.ptp(y, axis=1) > 0)
+    active = np.flatnonzero(valid & np.isfinite(rss))
+    eye = np.eye(n_params)
+    for it in range(max_iter):
+        if len(active) == 0:
+            break
+        if verbose:
+            print('iteration %d, %d profiles still fitting' % (it, len(active)))
+        r = y[active] - f[active]
+        J = jac[active]
+        A = np.matmul(J.transpose(0, 2, 1), J)
+        g = np.matmul(J.transpose(0, 2, 1), r[:, :, np.newaxis])[:, :, 0]
+        diag = np.einsum('ijj->ij', A)
+        M = A + (damping[active, np.newaxis] * diag + 1.e-12 * (1 + diag.max(axis=1, keepdims=True)))[:, :, np.newaxis] * eye
+        with np.errstate(all='ignore'):
+            delta = np.linalg.solve(M, g[:, :, np.newaxis])[:, :, 0]
+            p_new = p[active] + delta
+            f_new, jac_new = _profiles_model(expression, x, p_new)
+            rss_new = np.sum((y[active] - f_new) ** 2, axis=1)
+        better = rss_new < rss[active]
+        accepted = active[better]
+        p[accepted] = p_new[better]
+        f[accepted] = f_new[better]
+        jac[accepted] = jac_new[better]
+        rss[accepted] = rss_new[better]
+        damping[accepted] /= 10.
+        damping[active[~better]] *= 10.
+        # stop fitting the profiles where the parameters do not change anymore
+        small_step = np.all(np.abs(delta) <= xtol * (np.abs(p[active]) + xtol), axis=1)
+        done = (better & small_step) | (damping[active] > 1.e10) | ~np.isfinite(rss[active])
+        active = active[~done]
+    # the sign of the width is not defined by these functions
+    if expression in ['Gaussian', 'Cosine']:
+        p[:, 1] = np.abs(p[:, 1])
+    elif expression == 'Voigt':
+        p[:, 2] = np.abs(p[:, 2])
+    elif expression == 'Lorentzian':
+        p[:, 2] *= np.sign(p[:, 1])
+        p[:, 1] = np.abs(p[:, 1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        r_squared = 1. - rss / np.sum((y - y.mean(axis=1, keepdims=True)) ** 2, axis=1)
+    p[~valid] = np.nan
+    r_squared[~valid] = np.nan
+    rss[~valid] = np.nan
+    return p.reshape(map_shape + (n_params,)), r_squared.reshape(map_shape), rss.reshape(map_shape)
+
+
 class Parameter:
     '''A class to handle modiable parameters.'''
 
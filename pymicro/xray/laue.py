@@ -1,6 +1,9 @@
 """The laue module provide helpers functions to work with polychromatic X-ray diffraction.
 """
 import numpy as np
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from math import cos, sin, tan, atan2, pi
 from pymicro.crystal.lattice import HklPlane, Symmetry, HklDirection, HklObject
 from pymicro.crystal.microstructure import Orientation
@@ -476,6 +479,107 @@ def compute_Laue_pattern(orientation, detector, hkl_planes=None, Xu=np.array([1.
     return detector.data
 
 
+def compute_Laue_patterns(orientations, detector, hkl_planes, Xu=np.array([1., 0., 0.]), use_friedel_pair=False,
+                          spectrum=None, min_theta=0.1, only_on_detector=True, chunk_size=4096, file_path=None,
+                          verbose=False):
+    """Compute the Laue spots for a batch of crystal orientations.
+
+    This is the vectorized counterpart of :py:func:`compute_Laue_pattern`
+    intended to build libraries of simulated patterns: the diffraction
+    conditions of all the (orientation, hkl plane) pairs are computed at once
+    instead of looping over the planes. The orientations are processed by
+    chunks of `chunk_size` to bound the memory footprint.
+
+    A spot is kept if the plane selects a positive energy (possibly using its
+    Friedel pair), if the Bragg angle is larger than `min_theta`, if the
+    energy is within the bounds of the spectrum and if the diffracted beam
+    travels towards the detector. Other pairs are marked with NaN values.
+
+    If a file path is given, the library is written to disk in a HDF5 file
+    chunk by chunk with the following datasets: `orientation_matrices`
+    (n, 3, 3), `hkl` (n_hkl, 3), `uv` (n, n_hkl, 2) and `energy` (n, n_hkl).
+
+    :param orientations: a (n, 3, 3) array of orientation matrices or a list
+        of `Orientation` instances.
+    :param detector: An instance of the Detector2d class.
+    :param list hkl_planes: A list of the lattice planes to include in the patterns.
+    :param Xu: The unit vector of the incident X-ray beam (default along the X-axis).
+    :param bool use_friedel_pair: also consider the Friedel pair of each
+        lattice plane in the list as candidate for diffraction.
+    :param spectrum: a list of the energies (keV) of the spectrum, only the
+        bounds are used (None by default).
+    :param float min_theta: the minimum considered Bragg angle (in degrees).
+    :param bool only_on_detector: also discard the spots falling outside
+        the detector (True by default).
+    :param int chunk_size: the number of orientations processed at once.
+    :param str file_path: the path of a HDF5 file to save the library
+        (None by default).
+    :param bool verbose: activate verbose mode (False by default).
+    :return: a tuple with the (n, n_hkl, 2) array of the spot positions (in
+        pixel units) and the (n, n_hkl) array of the diffracted energies
+        (keV), or the file path if the library is saved to disk.
+    """
+    if isinstance(orientations, np.ndarray):
+        g = orientations.reshape((-1, 3, 3))
+    else:
+        g = np.array([o.orientation_matrix() for o in orientations])
+    n, n_hkl = len(g), len(hkl_planes)
+    Xu = np.array(Xu, dtype=float)
+    Gc = np.array([hkl.scattering_vector() for hkl in hkl_planes])
+    d_spacings = np.array([hkl.interplanar_spacing() for hkl in hkl_planes])
+    E_min, E_max = (min(spectrum), max(spectrum)) if spectrum is not None else (0., np.inf)
+    size = np.array(detector.get_size_px())
+    if verbose:
+        print('computing %d Laue patterns with %d lattice planes' % (n, n_hkl))
+
+    def compute_chunk(g_chunk):
+        # scattering vectors in the laboratory frame (m, n_hkl, 3)
+        Gs = np.matmul(Gc, g_chunk)
+        cos_angles = np.dot(Gs, Xu) / np.linalg.norm(Gs, axis=2)
+        sin_theta = -cos_angles  # sin(arccos(x) - pi / 2) = -x
+        if use_friedel_pair:
+            # planes selecting a negative energy diffract with their Friedel pair
+            friedel = sin_theta < 0
+            Gs[friedel] *= -1
+            sin_theta = np.abs(sin_theta)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            energies = lambda_nm_to_keV(2 * d_spacings * sin_theta)
+            valid = (sin_theta > np.sin(np.radians(min_theta))) & (energies >= E_min) & (energies <= E_max)
+            K = Xu * (energies / 1.2398)[..., None] + Gs
+            # distance to the detector plane along the diffracted beam
+            d = np.dot(detector.ref_pos, detector.w_dir) / np.dot(K, detector.w_dir)
+        valid &= (np.dot(K, Xu) != 0) & (d >= 0) & np.isfinite(d)
+        uv = np.full(K.shape[:2] + (2,), np.nan)
+        uv[valid] = detector.lab_to_pixel(d[valid, None] * K[valid])
+        if only_on_detector:
+            valid &= np.all((uv >= 0) & (uv < size), axis=2)
+            uv[~valid] = np.nan
+        energies[~valid] = np.nan
+        return uv, energies
+
+    if file_path is None:
+        uv = np.empty((n, n_hkl, 2))
+        energies = np.empty((n, n_hkl))
+        for start in range(0, n, chunk_size):
+            uv[start:start + chunk_size], energies[start:start + chunk_size] = \
+                compute_chunk(g[start:start + chunk_size])
+        return uv, energies
+    import h5py
+    with h5py.File(file_path, 'w') as f:
+        f.create_dataset('orientation_matrices', data=g)
+        f.create_dataset('hkl', data=np.array([hkl.miller_indices() for hkl in hkl_planes]))
+        chunks = (min(n, chunk_size), n_hkl)
+        uv_data = f.create_dataset('uv', shape=(n, n_hkl, 2), dtype=np.float32, chunks=chunks + (2,))
+        energy_data = f.create_dataset('energy', shape=(n, n_hkl), dtype=np.float32, chunks=chunks)
+        for start in range(0, n, chunk_size):
+            uv, energies = compute_chunk(g[start:start + chunk_size])
+            uv_data[start:start + len(uv)] = uv
+            energy_data[start:start + len(uv)] = energies
+            if verbose:
+                print('%d/%d patterns written to %s' % (start + len(uv), n, file_path))
+    return file_path
+
+
 def gnomonic_projection_point(data, OC=None):
     """compute the gnomonic projection of a given point or series of points in the general case.
 
@@ -616,62 +720,109 @@ def identify_hkl_from_list(hkl_list):
     return [hkl_list[i] for i in ids]
 
 
+def compute_angle_table(hkl_planes):
+    """Compute the sorted table of the angles between lattice plane normals.
+
+    The table only depends on the list of lattice planes so it can be
+    computed once and reused to index many Laue patterns. The planes with
+    the same normal as a previous plane of the list (the higher orders of a
+    reflection) are skipped since they do not bring new angles.
+
+    :param list hkl_planes: a list of `HklPlane` instances.
+    :return: a structured array with the angle (in degrees) between each
+        pair of planes and the indices `hkl1` < `hkl2` of the two planes in
+        the list, sorted by increasing angle.
+    """
+    normals = np.array([p.normal() for p in hkl_planes])
+    _, first = np.unique(np.round(normals, 6), axis=0, return_index=True)
+    first = np.sort(first)
+    i, j = first[np.array(np.triu_indices(len(first), 1))]
+    angles = np.degrees(np.arccos(np.clip(np.sum(normals[i] * normals[j], axis=1), -1., 1.)))
+    angles_th = np.empty(len(i), dtype=[('angle', 'f4'), ('hkl1', 'i4'), ('hkl2', 'i4')])
+    angles_th['angle'] = angles
+    angles_th['hkl1'] = i
+    angles_th['hkl2'] = j
+    angles_th.sort(order='angle')
+    return angles_th
+
+
+def _expand_ranges(lo, hi):
+    """Expand a series of [lo, hi[ ranges into flat arrays.
+
+    :param ndarray lo: the array of the range starts.
+    :param ndarray hi: the array of the range ends.
+    :return: a tuple with the index of the range and the value of each
+        element of the ranges.
+    """
+    counts = hi - lo
+    ranges = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ranges, lo[ranges] + offsets
+
+
 def triplet_indexing(OP, angles_exp, angles_th, tol=1.0, verbose=False):
-    '''
-    evaluate each triplet composed by 3 diffracted points.
-    the total number of triplet is given by the binomial coefficient (n, 3) = n*(n-1)*(n-2)/6
-    '''
-    nombre_triplet = 0
-    OP_indexed = []
-    for ti in range(len(OP) - 2):
-
-        for tj in range(ti + 1, len(OP) - 1):
-
-            triplet = np.zeros(3)
-            for tk in range(tj + 1, len(OP)):
-                nombre_triplet = nombre_triplet + 1
-                print('\n\ntriplet number = {0:d}'.format(nombre_triplet))
-                # look for possible matches for a given triplet
-                triplet = [(ti, tj), (tj, tk), (ti, tk)]
-                print('** testing triplet %s' % triplet)
-                candidates = []  # will contain the 3 lists of candidates for a given triplet
-                for (i, j) in triplet:
-                    angle_to_match = angles_exp[i, j]
-                    # find the index by looking to matching angles within the tolerance
-                    cand = np.argwhere(
-                        abs(angles_th['angle'] - angle_to_match) < tol).flatten()  # flatten since shape is (n, 1)
-                    print('* couple (OP%d, OP%d) has angle %.2f -> %d couple candidate(s) in the angle_th list: %s' % (
-                        i, j, angle_to_match, len(cand), cand))
-                    candidates.append(cand)
-                print('looking for real triplet in all %d candidates pairs:' % (
-                    len(candidates[0]) * len(candidates[1]) * len(candidates[2])))
-                for ci in candidates[0]:
-                    for cj in candidates[1]:
-                        for ck in candidates[2]:
-                            # make a list of the candidate hkl plane indices, based on the angle match
-                            hkl_list = [angles_th['hkl1'][ci], angles_th['hkl2'][ci],
-                                        angles_th['hkl1'][cj], angles_th['hkl2'][cj],
-                                        angles_th['hkl1'][ck], angles_th['hkl2'][ck]]
-                            # look how many unique planes are in the list (should be 3 for a triplet)
-                            if verbose:
-                                print('- candidates with indices %s correspond to %s' % ([ci, cj, ck], hkl_list))
-                            unique_indices = np.unique(hkl_list)
-                            if len(unique_indices) != 3:
-                                if verbose:
-                                    print('not a real triplet, skipping this one')
-                                continue
-                            print('this is a triplet: %s' % unique_indices)
-                            # the points can now be identified from the hkl_list ordering
-                            identified_list = identify_hkl_from_list(hkl_list)
-                            full_list = [tj, tk, ti]
-                            full_list.extend(identified_list)
-                            print(full_list)
-                            OP_indexed.append(full_list)
-                            print('*  (OP%d) -> %d ' % (tj, identified_list[0]))
-                            print('*  (OP%d) -> %d ' % (tk, identified_list[1]))
-                            print('*  (OP%d) -> %d ' % (ti, identified_list[2]))
-    print('indexed list length is %d' % len(OP_indexed))
-    print(OP_indexed)
+    """Index all the triplets composed by 3 diffracted points.
+
+    Each pair of points is matched with the pairs of lattice planes whose
+    angle is within the tolerance of the measured angle, using a binary
+    search in the sorted table. The candidates of the pairs (i, j) and (j, k)
+    sharing the same plane for the point j are then joined and the triplet
+    is kept if the angle between the planes of the points i and k also
+    matches the measured angle. All the triplets sharing a middle point are
+    processed at once.
+
+    :param ndarray OP: the (n, 3) array of the measured plane normals.
+    :param ndarray angles_exp: the (n, n) array of the angles (in degrees)
+        between the measured normals (only the upper part is used).
+    :param angles_th: the sorted table of the angles between the lattice
+        plane normals, see `compute_angle_table`.
+    :param float tol: the angular tolerance in degrees.
+    :param bool verbose: activate verbose mode (False by default).
+    :return: a (n_triplets, 6) array where each row lists the indices of
+        3 points (j, k, i) followed by the indices of their lattice planes.
+    """
+    n = len(OP)
+    if len(angles_th) == 0:
+        return np.empty((0, 6), dtype=int)
+    n_hkl = max(angles_th['hkl1'].max(), angles_th['hkl2'].max()) + 1
+    # keys of the pairs of planes (hkl1 < hkl2) to look up their angle
+    pair_keys = angles_th['hkl1'].astype(np.int64) * n_hkl + angles_th['hkl2']
+    key_order = np.argsort(pair_keys)
+    pair_keys = pair_keys[key_order]
+    angles_exp_flat = np.asarray(angles_exp, dtype=np.float32).ravel()
+    # candidate pairs of planes for each pair of points, in both orders
+    pi, pj = np.triu_indices(n, 1)
+    lo = np.searchsorted(angles_th['angle'], angles_exp[pi, pj] - tol, side='right')
+    hi = np.searchsorted(angles_th['angle'], angles_exp[pi, pj] + tol, side='left')
+    pair, cand = _expand_ranges(lo, hi)
+    if verbose:
+        print('%d candidate couples for %d pairs of points' % (len(cand), len(pi)))
+    pair = np.tile(pair, 2)
+    hkl_a = np.concatenate((angles_th['hkl1'][cand], angles_th['hkl2'][cand]))
+    hkl_b = np.concatenate((angles_th['hkl2'][cand], angles_th['hkl1'][cand]))
+    pair_i, pair_j = pi[pair], pj[pair]
+    triplets = []
+    for j in range(1, n - 1):
+        # couples (i, j) with i < j on the left and (j, k) with k > j on the right
+        left = np.flatnonzero(pair_j == j)
+        right = np.flatnonzero(pair_i == j)
+        right = right[np.argsort(hkl_a[right], kind='stable')]
+        keys = hkl_a[right]
+        lo = np.searchsorted(keys, hkl_b[left], side='left')
+        hi = np.searchsorted(keys, hkl_b[left], side='right')
+        l, r = _expand_ranges(lo, hi)
+        l, r = left[l], right[r]
+        # the third couple (i, k) must also match, pairs not in the table (like a plane with itself) are dropped
+        h1, h2 = hkl_a[l].astype(np.int64), hkl_b[r].astype(np.int64)
+        keys_ik = np.minimum(h1, h2) * n_hkl + np.maximum(h1, h2)
+        index = np.minimum(np.searchsorted(pair_keys, keys_ik), len(pair_keys) - 1)
+        angle_ik = angles_th['angle'][key_order[index]]
+        keep = (pair_keys[index] == keys_ik) & (np.abs(angle_ik - angles_exp_flat[pair_i[l] * n + pair_j[r]]) < tol)
+        l, r = l[keep], r[keep]
+        triplets.append(np.stack([np.full(len(l), j), pair_j[r], pair_i[l], hkl_b[l], hkl_b[r], hkl_a[l]], axis=1))
+    OP_indexed = np.concatenate(triplets) if triplets else np.empty((0, 6), dtype=int)
+    if verbose:
+        print('indexed list length is %d' % len(OP_indexed))
     return OP_indexed
 
 
@@ -684,131 +835,136 @@ def confidence_index(votes):
     return ci
 
 
-def poll_system(g_list, dis_tol=1.0, verbose=False):
+def poll_system(g_list, dis_tol=1.0, weights=None, verbose=False):
     """
     Poll system to sort a series of orientation matrices determined by the indexation procedure.
 
     For each orientation matrix, check if it corresponds to an existing solution, if so: vote for it,
-    if not add a new solution to the list
+    if not add a new solution to the list. The votes are computed in bulk: each new solution takes the
+    votes of all the following orientation matrices within the tolerance.
+
     :param list g_list: the list of orientation matrices (should be in the fz)
     :param float dis_tol: angular tolerance (degrees)
+    :param weights: the number of votes of each orientation matrix (one by default)
     :param bool verbose: activate verbose mode (False by default)
     :return: a tuple composed by the most popular orientation matrix, the corresponding vote number and the confidence index
     """
-    solution_indices = [0]
-    votes = [0]
-    vote_index = np.zeros(len(g_list), dtype=int)
-    dis_tol_rad = dis_tol * pi / 180
-    from pymicro.crystal.microstructure import Orientation
-    for i in range(len(g_list)):
-        g = g_list[i]
+    g = np.asarray(g_list).reshape((-1, 3, 3))
+    vote_index = np.zeros(len(g), dtype=int)
+    solution_indices = []
+    cos_tol = np.cos(dis_tol * pi / 180)
+    # the matrix elements of two rotations within the tolerance differ by less than the Frobenius norm of
+    # their difference: the orientations are binned on a grid of 3 matrix elements with cells of this size
+    # and only the orientations in the neighbouring cells of a solution need to be compared with it
+    delta = 2 * np.sqrt(2) * np.sin(0.5 * dis_tol * pi / 180) + 1e-6
+    offset = int(np.ceil(1. / delta)) + 1
+    span = 2 * offset + 1
+    bins = np.floor(g[:, [0, 1, 2], [1, 2, 0]] / delta).astype(np.int64) + offset
+    cells = (bins[:, 0] * span + bins[:, 1]) * span + bins[:, 2]
+    neighbours = np.array([(di * span + dj) * span + dk for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                           for dk in (-1, 0, 1)])
+    order = np.argsort(cells, kind='stable')
+    sorted_cells = cells[order]
+    voted = np.zeros(len(g), dtype=bool)
+    index = 0
+    while index < len(g):
         # rotations are already in the fundamental zone
-        for j in range(len(solution_indices)):
-            index = solution_indices[j]
-            delta = np.dot(g, g_list[index].T)
-            # compute misorientation angle in radians
-            angle = Orientation.misorientation_angle_from_delta(delta)
-            if verbose:
-                print('j=%d -- angle=%f' % (j, angle))
-            if angle <= dis_tol_rad:
-                votes[j] += 1
-                vote_index[i] = j
-                if verbose:
-                    print('angle (deg) is %.2f' % (180 / pi * angle))
-                    print('vote list is now %s' % votes)
-                    print('solution_indices list is now %s' % solution_indices)
-                break
-            elif j == len(solution_indices) - 1:
-                solution_indices.append(i)
-                votes.append(1)
-                vote_index[i] = len(votes) - 1
-                if verbose:
-                    print('vote list is now %s' % votes)
-                    print('solution_indices list is now %s' % solution_indices)
-                break
-    index_result = np.argwhere(votes == np.amax(votes)).flatten()
+        lo = np.searchsorted(sorted_cells, cells[index] + neighbours, side='left')
+        hi = np.searchsorted(sorted_cells, cells[index] + neighbours, side='right')
+        candidates = order[_expand_ranges(lo, hi)[1]]
+        candidates = candidates[~voted[candidates]]
+        cw = 0.5 * (np.sum(g[candidates] * g[index], axis=(1, 2)) - 1)
+        voters = candidates[cw >= cos_tol]
+        vote_index[voters] = len(solution_indices)
+        vote_index[index] = len(solution_indices)
+        voted[voters] = True
+        voted[index] = True
+        solution_indices.append(index)
+        # move to the next orientation without a vote
+        while index < len(g) and voted[index]:
+            window = voted[index:index + 1024]
+            index += len(window) if window.all() else np.argmin(window)
+    votes = np.bincount(vote_index, weights=weights, minlength=len(solution_indices))
+    index_result = np.flatnonzero(votes == np.amax(votes))
     if verbose:
+        print('%d solutions found' % len(solution_indices))
         print('Max vote =', np.amax(votes))
-        print('index result:', index_result)
         print('Number of equivalent solutions :', len(index_result))
-        print(type(index_result))
-        print(index_result.shape)
-    final_orientation_matrix = []
-    for n in range(len(index_result)):
-        solutions = g_list[solution_indices[index_result[n]]]
-        if verbose:
-            print('Solution number {0:d} is'.format(n+1), solutions)
-        final_orientation_matrix.append(solutions)
-    result_vote = max(votes)
-    ci = confidence_index(votes)
-    vote_field = [votes[i] for i in vote_index]
+    final_orientation_matrix = [g[solution_indices[index]] for index in index_result]
+    result_vote = np.amax(votes)
+    ci = confidence_index(votes.tolist())
+    vote_field = votes[vote_index].tolist()
     return final_orientation_matrix, result_vote, ci, vote_field
 
 
-def index(hkl_normals, hkl_planes, tol_angle=0.5, tol_disorientation=1.0, symmetry=Symmetry.cubic, display=False):
+def index(hkl_normals, hkl_planes, tol_angle=0.5, tol_disorientation=1.0, symmetry=Symmetry.cubic, display=False,
+          angles_th=None, verbose=False):
+    """Index a Laue pattern from the normals of the diffracting planes.
+
+    :param ndarray hkl_normals: the (n, 3) array of the plane normals
+        obtained from the diffraction spots.
+    :param list hkl_planes: the list of `HklPlane` instances to consider.
+    :param float tol_angle: the angular tolerance (degrees) to match the
+        angles between normals.
+    :param float tol_disorientation: the angular tolerance (degrees) to
+        group the orientation solutions.
+    :param `Symmetry` symmetry: the crystal symmetry.
+    :param bool display: plot the pole figure of the solutions.
+    :param angles_th: the sorted table of the angles between the lattice
+        plane normals, computed from the list of planes if not given. Use
+        `compute_angle_table` to compute it once when indexing many patterns.
+    :param bool verbose: activate verbose mode (False by default).
+    :return: a tuple with the list of the orientation matrices of the
+        solutions and the confidence index.
+    """
+    hkl_normals = np.asarray(hkl_normals)
     # angles between normal from the gnomonic projection
-    angles_exp = np.zeros((len(hkl_normals), len(hkl_normals)), dtype=float)
-    print('\nlist of angles between points on the detector')
-    for i in range(len(hkl_normals)):
-        for j in range(i + 1, len(hkl_normals)):
-            angle = 180 / pi * np.arccos(np.dot(hkl_normals[i], hkl_normals[j]))
-            angles_exp[i, j] = angle
-            print('%.2f, OP%d, OP%d' % (angles_exp[i, j], i, j))
-    # keep a list of the hkl values as string
-    hkl_str = []
-    for p in hkl_planes:
-        (h, k, l) = p.miller_indices()
-        hkl_str.append('(%d%d%d)' % (h, k, l))
-    # compute theoretical angle between each plane normal, store the results using a structured array
-    angles_th = np.empty(len(hkl_planes) * (len(hkl_planes) - 1) // 2,
-                         dtype=[('angle', 'f4'), ('hkl1', 'i4'), ('hkl2', 'i4')])
-    index = 0
-    for i in range(len(hkl_planes)):
-        for j in range(i + 1, len(hkl_planes)):
-            angle = 180 / pi * np.arccos(np.dot(hkl_planes[i].normal(), hkl_planes[j].normal()))
-            angles_th[index] = (angle, i, j)
-            index += 1
-
-    # sort the array by increasing angle
-    angles_th.sort(order='angle')
-    print('\nsorted list of angles between hkl plane normals')
-    for i in range(len(angles_th)):
-        print('%.3f, (%d, %d) -> %s, %s' % (
-            angles_th['angle'][i], angles_th['hkl1'][i], angles_th['hkl2'][i], hkl_str[angles_th['hkl1'][i]],
-            hkl_str[angles_th['hkl2'][i]]))
+    angles_exp = np.degrees(np.arccos(np.clip(np.dot(hkl_normals, hkl_normals.T), -1., 1.)))
+    if angles_th is None:
+        angles_th = compute_angle_table(hkl_planes)
+    if verbose:
+        hkl_str = ['(%d%d%d)' % p.miller_indices() for p in hkl_planes]
+        print('\nsorted list of angles between hkl plane normals')
+        for angle, i, j in angles_th:
+            print('%.3f, (%d, %d) -> %s, %s' % (angle, i, j, hkl_str[i], hkl_str[j]))
 
     # index by triplets
-    normal_indexed = triplet_indexing(hkl_normals, angles_exp, angles_th, tol=tol_angle)
-    print('indexed list length is %d' % len(normal_indexed))
-    print(normal_indexed)
-
-    # Compute the orientation matrix g for all different triplets
-    g_indexation = []
-    for i in range(len(normal_indexed)):
-        # a given indexed triplet allow to construct 3 orientation matrices (which should be identical)
-        pos = [[0, 1, 3, 4], [1, 2, 4, 5], [2, 0, 5, 3]]
-        for j in range(3):
-            orientation_matrix = Orientation.transformation_matrix(
-                hkl_planes[normal_indexed[i][pos[j][2]]], hkl_planes[normal_indexed[i][pos[j][3]]],
-                hkl_normals[normal_indexed[i][pos[j][0]]], hkl_normals[normal_indexed[i][pos[j][1]]])
-        # move to the fundamental zone
-        om_fz = symmetry.move_rotation_to_FZ(orientation_matrix)  # we only add the third one
-        g_indexation.append(om_fz)
-    final_orientation_matrix, vote, ci, vote_field = poll_system(g_indexation, dis_tol=tol_disorientation)
-    if final_orientation_matrix == 0:
+    normal_indexed = triplet_indexing(hkl_normals, angles_exp, angles_th, tol=tol_angle, verbose=verbose)
+    if len(normal_indexed) == 0:
         print('Troubles in the data set !')
-    else:
-        print('\n\n\n### FINAL SOLUTION(S) ###\n')
-        for n in range(len(final_orientation_matrix)):
-            print('- SOLUTION %d -' % (n + 1))
-            final_orientation = Orientation(final_orientation_matrix[n])
-            print(final_orientation.inFZ())
-            print('- Cristal orientation in Fundamental Zone \n {} \n'.format(final_orientation.euler))
-            print('- Rodrigues vector in the fundamental Zone \n {} \n'.format(final_orientation.rod))
-            if display:
-                from pymicro.crystal.texture import PoleFigure
-                PoleFigure.plot(final_orientation, axis='Z')
-        return final_orientation_matrix, ci
+        return [], 0.
+
+    # the orientation matrix of each triplet is computed from its last and first points, triplets
+    # sharing those points and their planes give the same matrix which is computed once
+    j, _, i, hkl_j, _, hkl_i = normal_indexed.T
+    n_hkl = len(hkl_planes)
+    keys = ((i * len(hkl_normals) + j) * n_hkl + hkl_i) * n_hkl + hkl_j
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    order = np.argsort(first)
+    first, counts = first[order], counts[order]
+    plane_normals = np.array([p.normal() for p in hkl_planes])
+    g_indexation = Orientation.transformation_matrices(plane_normals[hkl_i[first]], plane_normals[hkl_j[first]],
+                                                       hkl_normals[i[first]], hkl_normals[j[first]])
+    # skip the triplets indexed with parallel planes
+    finite = np.all(np.isfinite(g_indexation), axis=(1, 2))
+    if not np.any(finite):
+        print('Troubles in the data set !')
+        return [], 0.
+    # move to the fundamental zone
+    g_indexation = symmetry.move_rotations_to_FZ(g_indexation[finite])
+    final_orientation_matrix, vote, ci, vote_field = poll_system(g_indexation, dis_tol=tol_disorientation,
+                                                                 weights=counts[finite], verbose=verbose)
+    print('\n\n\n### FINAL SOLUTION(S) ###\n')
+    for n in range(len(final_orientation_matrix)):
+        print('- SOLUTION %d -' % (n + 1))
+        final_orientation = Orientation(final_orientation_matrix[n])
+        print(final_orientation.inFZ())
+        print('- Cristal orientation in Fundamental Zone \n {} \n'.format(final_orientation.euler))
+        print('- Rodrigues vector in the fundamental Zone \n {} \n'.format(final_orientation.rod))
+        if display:
+            from pymicro.crystal.texture import PoleFigure
+            PoleFigure.plot(final_orientation, axis='Z')
+    return final_orientation_matrix, ci
 
 def zone_axis_list(angle, orientation, lattice,  max_miller=5,  Xu=np.array([1., 0., 0.]), verbose=False):
     """
@@ -881,6 +1037,18 @@ def diffracting_normals_vector(gnom):
     return hkl_normals
 
 
+def omega_rotation(omega):
+    """Compute the rotation matrix around the vertical axis.
+
+    :param float omega: rotation angle (degrees) around the vertical axis.
+    :return: the 3x3 rotation matrix.
+    """
+    omegar = omega * np.pi / 180
+    return np.array([[np.cos(omegar), -np.sin(omegar), 0],
+                     [np.sin(omegar), np.cos(omegar), 0],
+                     [0, 0, 1]])
+
+
 class LaueForwardSimulation(ForwardSimulation):
     """Class to represent a Forward Simulation."""
 
@@ -1013,56 +1181,162 @@ class LaueForwardSimulation(ForwardSimulation):
                 data[uv[k][0], uv[k][1]] += 1
         return data
 
-    def select_hkl_planes(self, hkl_planes, gid=1, margin=10):
-        """Filter the list of hkl planes to keep only the ones diffracting
-        on the detector.
+    @staticmethod
+    def project_spots(orientation, hkl_planes, positions, source, detector,
+                      omega=0.):
+        """Project the diffracted beams of a crystal on the detector.
+
+        :param Orientation orientation: the crystal orientation.
+        :param list hkl_planes: a list of `HklPlane` instances.
+        :param ndarray positions: a (n_vox, 3) array of the positions of the
+            material points (already rotated by omega).
+        :param XraySource source: the X-ray source.
+        :param Detector2d detector: the detector.
+        :param omega: rotation angle (degrees) around the vertical axis.
+        :return: a tuple with the (n_vox * n_hkl, 2) array of the detector
+            coordinates of the spots (in pixel units) and the array of the
+            diffracted energies, in the voxel major order.
+        """
+        _, energies, _, K_vectors = LaueForwardSimulation.fsim_laue(
+            orientation, hkl_planes, positions, source.position, omega)
+        origins = np.repeat(positions, len(hkl_planes), axis=0)
+        OR_vectors = detector.project_along_directions(K_vectors, origins)
+        return detector.lab_to_pixel(OR_vectors), energies
+
+    @staticmethod
+    def filter_hkl_planes(orientation, hkl_planes, center, source, detector,
+                          omega=0., margin=10):
+        """Filter a list of hkl planes to keep the ones diffracting on the
+        detector from the center of a grain.
 
+        :param Orientation orientation: the grain orientation.
         :param list hkl_planes: the list of hkl plane to filter.
-        :param int gid: the grain id to use.
+        :param center: the (x, y, z) position of the grain center.
+        :param XraySource source: the X-ray source.
+        :param Detector2d detector: the detector.
+        :param omega: rotation angle (degrees) around the vertical axis.
         :param int margin: a pixel margin to take into account.
         :return: the list of hkl planes diffraction on the detector within
         the margin.
         """
-        sample = self.exp.get_sample()
-        detector = self.exp.get_active_detector()
-        positions = sample.get_grain_centers(id_list=[gid])
-        if self.omega != 0.:
+        positions = np.reshape(center, (1, 3))
+        if omega != 0.:
             # rotate grain centers
-            omegar = self.omega * np.pi / 180
-            R = np.array([[np.cos(omegar), -np.sin(omegar), 0],
-                          [np.sin(omegar), np.cos(omegar), 0],
-                          [0, 0, 1]])
-            positions = np.dot(R, positions.T).T
-        _, _, _, K_vectors = LaueForwardSimulation.fsim_laue(sample.get_grain(gid).orientation,
-                                                             hkl_planes,
-                                                             positions,
-                                                             self.exp.get_source().position,
-                                                             self.omega)
-        origins = np.repeat(positions, len(hkl_planes), axis=0)
-        OR_vectors = detector.project_along_directions(K_vectors, origins)
-        uv = detector.lab_to_pixel(OR_vectors).astype(np.int)
+            positions = np.dot(omega_rotation(omega), positions.T).T
+        uv, _ = LaueForwardSimulation.project_spots(
+            orientation, hkl_planes, positions, source, detector, omega)
+        uv = uv.astype(int)
         # look at which hkl plane diffracts on the detector within the given margin
         on_det = np.where((-margin < uv[:, 0]) &
                           (uv[:, 0] < detector.get_size_px()[0] + margin) &
                           (-margin < uv[:, 1]) &
                           (uv[:, 1] < detector.get_size_px()[1] + margin))
-        print('%d diffraction planes on the detector among %d' % (len(on_det[0]), len(uv)))
-        hkl_planes_dif = [hkl_planes[i] for i in on_det[0]]
+        return [hkl_planes[i] for i in on_det[0]]
+
+    def select_hkl_planes(self, hkl_planes, gid=1, margin=10):
+        """Filter the list of hkl planes to keep only the ones diffracting
+        on the detector.
+
+        :param list hkl_planes: the list of hkl plane to filter.
+        :param int gid: the grain id to use.
+        :param int margin: a pixel margin to take into account.
+        :return: the list of hkl planes diffraction on the detector within
+        the margin.
+        """
+        sample = self.exp.get_sample()
+        hkl_planes_dif = LaueForwardSimulation.filter_hkl_planes(
+            sample.get_grain(gid).orientation, hkl_planes,
+            sample.get_grain_centers(id_list=[gid]), self.exp.get_source(),
+            self.exp.get_active_detector(), self.omega, margin=margin)
+        print('%d diffraction planes on the detector among %d' % (len(hkl_planes_dif), len(hkl_planes)))
         return hkl_planes_dif
 
+    @staticmethod
+    def fsim_grains(grains, hkl_planes, source, detector, omega=0.,
+                    margin=10, verbose=False):
+        """Forward simulation for a batch of grains.
+
+        For each grain, the hkl planes diffracting close to the detector from
+        the grain center are selected, and the diffracted beams from all the
+        grain positions are projected on the detector. The diffraction events
+        of all the grains within the detector bounds and the energy limits
+        of the source are then counted at once in the detector pixels.
+
+        This function only works with its arguments so that batches of
+        grains can be simulated in separate processes.
+
+        :param list grains: a list of (orientation, center, positions) tuples
+            describing each grain with its `Orientation`, the position of its
+            center and the (n_vox, 3) array of its material points.
+        :param list hkl_planes: a list of `HklPlane` instances.
+        :param XraySource source: the X-ray source.
+        :param Detector2d detector: the detector.
+        :param omega: rotation angle (degrees) around the vertical axis.
+        :param int margin: a pixel margin used to select the hkl planes.
+        :param bool verbose: activate verbose mode.
+        :return: the simulated detector image, with the type of the
+            detector data.
+        """
+        size = detector.get_size_px()
+        R = omega_rotation(omega)
+        pixels = []
+        for orientation, center, positions in grains:
+            # preprocess hkl planes by filtering out the ones not diffracting close to the detector
+            grain_hkl_planes = LaueForwardSimulation.filter_hkl_planes(
+                orientation, hkl_planes, center, source, detector, omega,
+                margin=margin)
+            if verbose:
+                print('after filtering we have %d hkl planes for this grain'
+                      % len(grain_hkl_planes))
+            if len(grain_hkl_planes) == 0:
+                continue
+            if omega != 0.:
+                positions = np.dot(R, positions.T).T
+            uv, energies = LaueForwardSimulation.project_spots(
+                orientation, grain_hkl_planes, positions, source, detector,
+                omega)
+            uv = uv.astype(int)
+            # select the diffraction spots on the detector
+            on_det = ((0 < uv[:, 0]) & (uv[:, 0] < size[0]) &
+                      (0 < uv[:, 1]) & (uv[:, 1] < size[1]))
+            if source.min_energy is not None:
+                on_det &= source.min_energy < energies
+            if source.max_energy is not None:
+                on_det &= energies < source.max_energy
+            if verbose:
+                print('%d diffraction events on the detector among %d'
+                      % (np.sum(on_det), len(uv)))
+            pixels.append(uv[on_det, 0] * size[1] + uv[on_det, 1])
+        # now sum the counts on the detector individual pixels
+        data = np.zeros_like(detector.data)
+        if len(pixels) > 0:
+            counts = np.bincount(np.concatenate(pixels),
+                                 minlength=size[0] * size[1])
+            data[...] = counts.reshape(data.shape)
+        return data
+
+    def get_hkl_planes(self):
+        """Get the hkl planes used in the simulation.
+
+        If no reflection has been defined, all the planes with a Miller index
+        up to `max_miller` are used.
+        """
+        if len(self.hkl_planes) == 0:
+            print('warning: no reflection defined for this simulation, using all planes with max miller=%d' % self.max_miller)
+            lattice = self.exp.get_sample().get_lattice()
+            self.set_hkl_planes(build_list(lattice=lattice, max_miller=self.max_miller))
+        return self.hkl_planes
+
     def fsim_grain(self, gid=1):
         """Forward simulation for a given grain.
 
-        Optimized version with matrix multiplication.
+        Optimized version with matrix multiplication, see `fsim_grains`.
 
         :param int gid: the grain id number to simulate.
         """
         sample = self.exp.get_sample()
         self.grain = sample.get_grain(gid)
         lattice = sample.get_lattice()
-        source = self.exp.get_source()
-        detector = self.exp.get_active_detector()
-        data = np.zeros_like(detector.data)
         if self.verbose:
             print('Forward Simulation for grain %d' % self.grain.id)
         self.sample_geo.discretize_geometry(grain_id=self.grain.id)
@@ -1072,65 +1346,75 @@ class LaueForwardSimulation(ForwardSimulation):
             print('using hkl from the grain')
             hkl_planes = [HklPlane(h, k, l, lattice) for (h, k, l) in self.grain.hkl_planes]
         else:
-            if len(self.hkl_planes) == 0:
-                print('warning: no reflection defined for this simulation, using all planes with max miller=%d' % self.max_miller)
-                self.set_hkl_planes(build_list(lattice=lattice, max_miller=self.max_miller))
-            hkl_planes = self.hkl_planes
-        # preprocess hkl planes by filtering out the ones not diffracting close to the detector
-        hkl_planes = self.select_hkl_planes(hkl_planes, gid=gid)
-        n_hkl = len(hkl_planes)
-        print('after filtering we have %d hkl planes for this grain' % n_hkl)
-        if n_hkl == 0:
-            return data
-        positions = self.sample_geo.get_positions()  # size n_vox, with 3 elements items
-        if self.omega != 0.:
-            omegar = self.omega * np.pi / 180
-            R = np.array([[np.cos(omegar), -np.sin(omegar), 0], [np.sin(omegar), np.cos(omegar), 0], [0, 0, 1]])
-            positions = np.dot(R, positions.T).T
-
-        # call the fsim_laue function
-        thetas, the_energies, X_vectors, K_vectors = LaueForwardSimulation.fsim_laue(
-            self.grain.orientation, hkl_planes, positions, source.position, self.omega)
-
-        # with diffraction informations, project them on the detector
-        origins = np.repeat(positions, n_hkl, axis=0)
-        OR_vectors = detector.project_along_directions(K_vectors, origins)
-        uv = detector.lab_to_pixel(OR_vectors).astype(np.int)
-
-        # now construct a boolean list to select the diffraction spots
-        # FIXME handle case when min and max energies not set
-        on_det = np.where((0 < uv[:, 0]) &
-                          (uv[:, 0] < detector.get_size_px()[0]) &
-                          (0 < uv[:, 1]) &
-                          (uv[:, 1] < detector.get_size_px()[1]) &
-                          (source.min_energy < the_energies) &
-                          (the_energies < source.max_energy))
-        if self.verbose:
-            print('%d diffraction events on the detector among %d' % (len(on_det[0]), len(uv)))
-
-        # now sum the counts on the detector individual pixels
-        for spot in uv[on_det]:
-            data[spot[0], spot[1]] += 1
-        return data
-
-    def fsim(self):
+            hkl_planes = self.get_hkl_planes()
+        grain = (self.grain.orientation, sample.get_grain_centers(id_list=[gid]),
+                 self.sample_geo.get_positions())
+        return LaueForwardSimulation.fsim_grains(
+            [grain], hkl_planes, self.exp.get_source(),
+            self.exp.get_active_detector(), self.omega, verbose=self.verbose)
+
+    def fsim(self, n_jobs=1, batch_size=16):
         """Run the forward simulation.
 
         If the sample has a CAD type of geometry, a single grain (the first from the list) is assumed. In the other
         cases all the grains from the microstructure are used. In particular, if the microstructure has a grain map,
         it can be used to carry out an extended sample simulation.
+
+        The grains are simulated by batches with the `fsim_grains` method,
+        possibly in parallel, the result being the same as summing the
+        `fsim_grain` images of all the grains.
+
+        :param int n_jobs: the number of processes used.
+        :param int batch_size: the number of grains simulated at once.
+        :return: the simulated detector image.
         """
         import time
         t0 = time.time()
-        full_data = np.zeros_like(self.exp.get_active_detector().data)
         sample = self.exp.get_sample()
+        source = self.exp.get_source()
+        detector = self.exp.get_active_detector()
+        full_data = np.zeros_like(detector.data)
         # for cad geometry we assume only one grain (the first in the list)
         if self.sample_geo.geo_type == 'cad':
-            full_data += self.fsim_grain(gid=sample.grains[0]['idnumber'])
+            grain_ids = [sample.grains[0]['idnumber']]
         else:
             # in the other cases, we use all the grains defined in the microstructure
-            for grain_id in sample.get_grain_ids():
-                full_data += self.fsim_grain(gid=grain_id)
+            grain_ids = sample.get_grain_ids()
+        if len(grain_ids) == 0:
+            return full_data
+        hkl_planes = self.get_hkl_planes()
+        grains_data = sample.get_grains_data(grain_ids,
+                                             columns=['orientation', 'center'])
+
+        def batches():
+            batch = []
+            for i, (gid, positions) in enumerate(
+                    self.sample_geo.iter_grain_positions(grain_ids)):
+                batch.append((Orientation.from_rodrigues(grains_data['orientation'][i]),
+                              grains_data['center'][i], positions))
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+            if len(batch) > 0:
+                yield batch
+
+        args = (hkl_planes, source, detector, self.omega)
+        if n_jobs == 1:
+            for batch in batches():
+                full_data += LaueForwardSimulation.fsim_grains(batch, *args)
+        else:
+            pending = deque()
+            context = multiprocessing.get_context('spawn')
+            with ProcessPoolExecutor(max_workers=n_jobs,
+                                     mp_context=context) as executor:
+                for batch in batches():
+                    # bound the number of batches in memory
+                    if len(pending) >= 2 * n_jobs:
+                        full_data += pending.popleft().result()
+                    pending.append(executor.submit(
+                        LaueForwardSimulation.fsim_grains, batch, *args))
+                while pending:
+                    full_data += pending.popleft().result()
         if self.verbose:
             duration = int(time.time() - t0)
             print('forward simulation duration: {:d} seconds'.format(duration))
@@ -152,6 +152,104 @@ class LaueTests(unittest.TestCase):
         angle, ax1, ax2 = final_orientation.disorientation(orientation, crystal_structure=Symmetry.cubic)
         self.assertLess(angle * 180 / np.pi, 1.0)
 
+    def test_index_with_angle_table(self):
+        """Verify indexing several patterns with the same table of angles."""
+        from pymicro.xray.laue import compute_angle_table, triplet_indexing
+        hkl_planes = [HklPlane(h, k, l, self.ni) for h in range(-3, 4) for k in range(-3, 4)
+                      for l in range(-3, 4) if (h, k, l) != (0, 0, 0) and h % 2 == k % 2 == l % 2]
+        angles_th = compute_angle_table(hkl_planes)
+        # higher order reflections like (2, 2, 2) are not included
+        self.assertEqual(len(angles_th), 74 * 73 // 2)
+        self.assertTrue(np.all(np.diff(angles_th['angle']) >= 0))
+        for euler in [(191.9, 69.9, 138.9), (10., 20., 30.)]:
+            orientation = Orientation.from_euler(euler)
+            normals = np.array([p.normal() for p in hkl_planes[::2]])
+            hkl_normals = np.dot(normals, orientation.orientation_matrix())
+            solutions, ci = index(hkl_normals, hkl_planes, tol_angle=0.5, angles_th=angles_th)
+            angle = Orientation(solutions[0]).disorientation(orientation, crystal_structure=Symmetry.cubic)[0]
+            self.assertLess(angle * 180 / np.pi, 0.1)
+            self.assertGreater(ci, 0.)
+        # no solution without any pair of planes
+        self.assertEqual(triplet_indexing(hkl_normals, np.zeros((len(hkl_normals),) * 2), angles_th[:0]).shape, (0, 6))
+        self.assertEqual(index(hkl_normals, hkl_planes, angles_th=angles_th[:0]), ([], 0.))
+
+    def test_fsim_grains(self):
+        """Verify that the batched forward simulation sums the grain images."""
+        from pymicro.crystal.microstructure import Microstructure
+        from pymicro.xray.experiment import Experiment, Sample, XraySource
+        from pymicro.xray.laue import LaueForwardSimulation, build_list
+        sample = Sample(name='test_fsim_grains', overwrite_hdf5=True)
+        sample.autodelete = True
+        grain_map = np.ones((8, 8, 8), dtype=np.int32)
+        grain_map[4:] = 2
+        grain_map[4:, 4:] = 3
+        sample.set_grain_map(grain_map, voxel_size=0.01)
+        sample.build_grain_table_from_grain_map()
+        sample.set_orientations(np.array([self.g4.rod, [0.1, 0.2, 0.3],
+                                          [-0.2, 0.1, 0.05]]))
+        sample.set_lattice(self.ni)
+        exp = Experiment()
+        exp.set_sample(sample)
+        source = XraySource(position=(-100., 0., 0.))
+        source.set_energy_range(5., 30.)
+        exp.set_source(source)
+        detector = RegArrayDetector2d(size=(256, 256))
+        detector.pixel_size = 0.4
+        detector.ref_pos = np.array([100., 0., 0.])
+        detector.data = np.zeros((256, 256), dtype=np.uint32)
+        exp.add_detector(detector)
+        fs = LaueForwardSimulation()
+        fs.set_experiment(exp)
+        fs.set_sample_geo_type('array')
+        fs.set_hkl_planes(build_list(lattice=self.ni, max_miller=3))
+        fs.omega = 20.
+        data = fs.fsim(batch_size=2)
+        self.assertGreater(data.sum(), 0)
+        grains_data = sum(fs.fsim_grain(gid) for gid in [1, 2, 3])
+        self.assertTrue(np.array_equal(data, grains_data))
+        self.assertTrue(np.array_equal(fs.fsim(n_jobs=2, batch_size=1), data))
+        del sample
+
+    def test_compute_Laue_patterns(self):
+        """Verify the batched Laue spots against the per plane computation."""
+        import os
+        import h5py
+        import shutil
+        import tempfile
+        from pymicro.xray.laue import build_list, compute_Laue_patterns
+        detector = RegArrayDetector2d(size=(512, 512))
+        detector.pixel_size = 0.2
+        detector.ref_pos = np.array([100., 0., 0.])
+        hkl_planes = build_list(lattice=self.ni, max_miller=3)
+        orientations = [self.g4, Orientation.cube(),
+                        Orientation.from_euler([30., 40., 50.])]
+        uv, energies = compute_Laue_patterns(orientations, detector, hkl_planes,
+                                             use_friedel_pair=True, chunk_size=2)
+        self.assertEqual(uv.shape, (3, len(hkl_planes), 2))
+        for i, o in enumerate(orientations):
+            for j, hkl in enumerate(hkl_planes):
+                the_energy = select_lambda(hkl, o)[0]
+                K = diffracted_vector(hkl, o)
+                if K is None or np.dot(K, detector.w_dir) <= 0:
+                    self.assertTrue(np.isnan(energies[i, j]))
+                    continue
+                uv_ref = detector.lab_to_pixel(detector.project_along_direction(K))[0]
+                if np.any(uv_ref < 0) or np.any(uv_ref >= 512):
+                    self.assertTrue(np.isnan(energies[i, j]))
+                    continue
+                self.assertAlmostEqual(energies[i, j], abs(the_energy), 6)
+                self.assertTrue(np.allclose(uv[i, j], uv_ref))
+        self.assertGreater(np.count_nonzero(~np.isnan(energies)), 10)
+        # save the library to disk
+        data_dir = tempfile.mkdtemp()
+        file_path = os.path.join(data_dir, 'laue_library.h5')
+        compute_Laue_patterns(orientations, detector, hkl_planes, use_friedel_pair=True,
+                              chunk_size=2, file_path=file_path)
+        with h5py.File(file_path, 'r') as f:
+            self.assertTrue(np.allclose(f['energy'][()], energies, equal_nan=True))
+            self.assertEqual(f['hkl'].shape, (len(hkl_planes), 3))
+        shutil.rmtree(data_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
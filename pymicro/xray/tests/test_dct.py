@@ -0,0 +1,143 @@
+import unittest
+import numpy as np
+from pymicro.crystal.lattice import Lattice, HklPlane
+from pymicro.crystal.microstructure import Orientation
+from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.xray.experiment import Experiment, Sample, XraySource
+from pymicro.xray.dct import DctForwardSimulation
+
+
+class DctTests(unittest.TestCase):
+
+    def setUp(self):
+        """testing the dct module:"""
+        self.al = Lattice.face_centered_cubic(0.40495)
+        self.sample = Sample(name='test_dct', overwrite_hdf5=True)
+        self.sample.autodelete = True
+        grain_map = np.ones((8, 8, 8), dtype=np.int32)
+        grain_map[4:] = 2
+        grain_map[4:, 4:] = 3
+        self.sample.set_grain_map(grain_map, voxel_size=0.01)
+        self.sample.build_grain_table_from_grain_map()
+        self.rods = np.array([[0.0499, -0.3048, 0.1040], [0.1, 0.2, 0.3],
+                              [-0.2, 0.1, 0.05]])
+        self.sample.set_orientations(self.rods)
+        self.sample.set_lattice(self.al)
+        self.exp = Experiment()
+        self.exp.set_sample(self.sample)
+        source = XraySource()
+        source.set_energy(40.)
+        self.exp.set_source(source)
+        detector = RegArrayDetector2d(size=(512, 512))
+        detector.pixel_size = 0.2
+        detector.ref_pos = np.array([50., 0., 0.])
+        self.exp.add_detector(detector)
+        self.fs = DctForwardSimulation()
+        self.fs.set_experiment(self.exp)
+        self.fs.set_diffracting_famillies(['111', '200', '220'])
+
+    def tearDown(self):
+        del self.sample
+
+    def test_setup(self):
+        """Verify the reflexions found by the setup for all the grains."""
+        omega_step = 1.
+        self.fs.setup(omega_step)
+        # reference computation, grain by grain and plane by plane
+        reflexions = [[] for omega in self.fs.omegas]
+        for grain_id, rod in zip([1, 2, 3], self.rods):
+            o = Orientation.from_rodrigues(rod)
+            for plane in self.fs.hkl_planes:
+                h, k, l = plane.miller_indices()
+                w1, w2 = o.dct_omega_angles(plane, 40., verbose=False)
+                for w, hkl in [(w1, (h, k, l)), (w2, (h, k, l)),
+                               ((w1 + 180.) % 360, (-h, -k, -l)),
+                               ((w2 + 180.) % 360, (-h, -k, -l))]:
+                    reflexions[int(w / omega_step)].append([grain_id, hkl])
+        self.assertEqual(self.fs.reflexions, reflexions)
+
+    def test_compute_diffraction_events(self):
+        """Verify the Bragg condition for all the diffraction events."""
+        events = self.fs.compute_diffraction_events()
+        self.assertEqual(len(events), 3 * len(self.fs.hkl_planes) * 4)
+        # elastic scattering: |K| = |X|
+        self.assertTrue(np.allclose(np.linalg.norm(events['K'], axis=1),
+                                    40. / 1.2398))
+        # check one event against the grain orientation
+        event = events[5]
+        o = Orientation.from_rodrigues(self.rods[event['grain_id'] - 1])
+        plane = HklPlane(*event['hkl'], lattice=self.al)
+        self.assertAlmostEqual(o.compute_XG_angle(plane, event['omega']),
+                               90. - np.degrees(plane.bragg_angle(40.)), 6)
+        detector = self.exp.get_active_detector()
+        self.assertTrue(np.allclose(detector.lab_to_pixel(
+            detector.pixel_to_lab(*event['uv'])), event['uv']))
+
+    def test_dct_projection(self):
+        """Verify the DCT projection computed from the grain subvolumes."""
+        from scipy import ndimage
+        from pymicro.xray.dct import add_to_image
+        from pymicro.xray.xray_utils import radiograph
+        self.fs.setup(omega_step=2.)
+        i = np.argmax([len(r) for r in self.fs.reflexions])
+        omega = self.fs.omegas[i] + 1.
+        proj = self.fs.dct_projection(omega, include_direct_beam=False)
+        self.assertGreater(proj.sum(), 0)
+        # reference computation of the diffraction spots on the full grain map
+        grain_ids = self.sample.get_grain_map()
+        detector = self.exp.get_active_detector()
+        X = np.array([1., 0., 0.]) * 40. / 1.2398
+        omegar = np.radians(omega)
+        R = np.array([[np.cos(omegar), -np.sin(omegar), 0],
+                      [np.sin(omegar), np.cos(omegar), 0], [0, 0, 1]])
+        ref = np.zeros_like(proj)
+        for (gid, (h, k, l)) in self.fs.reflexions[i]:
+            grain_data = np.where(grain_ids == gid, 1, 0)
+            com = np.array(ndimage.center_of_mass(grain_data))
+            center = detector.get_pixel_size() * (com - 0.5 * np.array(grain_ids.shape))
+            g = Orientation.from_rodrigues(self.rods[gid - 1]).orientation_matrix()
+            K = X + R.dot(g.T.dot(HklPlane(h, k, l, self.al).scattering_vector()))
+            uv = detector.lab_to_pixel(detector.project_along_direction(K, R.dot(center)))[0]
+            data_dif = grain_data[ndimage.find_objects(grain_ids == gid)[0]]
+            add_to_image(ref, radiograph(data_dif, omega)[:, ::-1], uv)
+        self.assertTrue(np.allclose(proj, ref))
+        # the grain projections are cached
+        self.assertEqual(len(self.fs._projection_cache),
+                         len(set(gid for (gid, hkl) in self.fs.reflexions[i])))
+        proj_direct = self.fs.dct_projection(omega, include_direct_beam=True)
+        self.assertGreater(proj_direct.sum(), proj.sum())
+
+    def test_tt_stack(self):
+        """Verify the streamed topotomography stack and rocking curves."""
+        import os
+        import shutil
+        import tempfile
+        from pymicro.file.file_utils import edf_write
+        from pymicro.xray.dct import tt_stack, tt_rock
+        data_dir = tempfile.mkdtemp()
+        scan_dir = os.path.join(data_dir, 'tt')
+        os.mkdir(scan_dir)
+        with open(os.path.join(scan_dir, 'tt.info'), 'w') as f:
+            f.write('TOMO_N=3\nDim_1=6\nDim_2=5\n')
+        np.random.seed(3)
+        frames = np.random.randint(10, 100, (6, 6, 5)).astype(np.uint16)
+        dark = np.full((6, 5), 4, dtype=np.uint16)
+        edf_write(dark, os.path.join(scan_dir, 'darkend0000.edf'), verbose=False)
+        for i in range(6):
+            edf_write(frames[i], os.path.join(scan_dir, 'tt%04d.edf' % (i + 1)), verbose=False)
+        stack = tt_stack('tt', data_dir=data_dir, n_topo=2)
+        self.assertEqual(stack.shape, (6, 5, 3))
+        self.assertTrue(np.allclose(stack[:, :, 1], frames[2:4].sum(axis=0) - 2 * dark))
+        mask = np.zeros((6, 5, 3), dtype=np.uint8)
+        mask[1:3, :, 0] = 1
+        mask[:, 2:, 1:] = 1
+        rock = tt_rock('tt', data_dir=data_dir, n_topo=2, mask=mask)
+        self.assertEqual(rock.shape, (3, 2))
+        for n in range(3):
+            for i in range(2):
+                self.assertAlmostEqual(rock[n, i], np.sum((frames[2 * n + i] - 4.) * mask[:, :, n]))
+        shutil.rmtree(data_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
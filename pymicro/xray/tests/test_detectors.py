@@ -1,6 +1,10 @@
 import unittest
+import os
+import shutil
+import tempfile
 import numpy as np
-from pymicro.xray.detectors import RegArrayDetector2d
+from pymicro.file.file_utils import edf_write
+from pymicro.xray.detectors import RegArrayDetector2d, Xpad, ImageStackReader
 
 class DetectorsTests(unittest.TestCase):
 
@@ -79,3 +83,133 @@ class DetectorsTests(unittest.TestCase):
             self.assertAlmostEqual(w1, det_tilt.w_dir[0], 7)
             self.assertAlmostEqual(w2, det_tilt.w_dir[1], 7)
             self.assertAlmostEqual(w3, det_tilt.w_dir[2], 7)
+
+    def test_integration_table(self):
+        """Verify the regrouping of images with a precomputed integration table."""
+        detector = RegArrayDetector2d(size=(64, 48))
+        detector.calib = 4.
+        detector.compute_TwoTh_Psi_arrays()
+        np.random.seed(13)
+        stack = np.random.rand(3, 64, 48) - 0.1
+        detector.corr_data = stack[0]
+        two_theta_values, intensity, counts = detector.azimuthal_regroup(1., 6., 0.5, psi_min=10., psi_max=200.)
+        # compare with a per bin summation
+        bin_id = np.floor((detector.two_thetas - 1.) / 0.5).astype(int)
+        bin_id[(detector.two_thetas < 1.) | (detector.two_thetas > 6.)] = -1
+        bin_id[(detector.psis <= 10.) | (detector.psis >= 200.) | (stack[0] < 0)] = -1
+        for i in range(10):
+            self.assertEqual(counts[i], np.sum(bin_id == i))
+            self.assertAlmostEqual(intensity[i], stack[0][bin_id == i].mean())
+        self.assertAlmostEqual(two_theta_values[0], 1.25)
+        # the table is reused for the next image
+        table = detector.get_integration_table('2theta', two_theta_mini=1., two_theta_maxi=6., two_theta_step=0.5,
+                                               psi_min=10., psi_max=200.)
+        detector.corr_data = stack[1]
+        detector.azimuthal_regroup(1., 6., 0.5, psi_min=10., psi_max=200.)
+        self.assertEqual(len(detector._integration_tables), 1)
+        # a whole stack can be regrouped at once
+        intensities, stack_counts = table.integrate(stack)
+        self.assertEqual(intensities.shape, (3, 10))
+        self.assertTrue(np.allclose(intensities[0], intensity))
+        self.assertTrue(np.array_equal(stack_counts[0], counts))
+        # 2D caking
+        (tt, psi), cake, cake_counts = detector.integrate_stack(stack, mode='2d', two_theta_mini=1.,
+                                                                two_theta_maxi=6., two_theta_step=0.5,
+                                                                psi_min=0., psi_max=360., psi_step=30.)
+        self.assertEqual(cake.shape, (3, 10, 12))
+        self.assertEqual(len(psi), 12)
+        sums = np.nansum(cake * cake_counts, axis=2)
+        _, ring, ring_counts = detector.integrate_stack(stack[2], two_theta_mini=1., two_theta_maxi=6.,
+                                                        two_theta_step=0.5)
+        self.assertTrue(np.allclose(sums[2], ring * ring_counts))
+        self.assertTrue(np.array_equal(cake_counts[2].sum(axis=1), ring_counts))
+        # a new geometry invalidates the cached tables
+        detector.calib = 5.
+        detector.compute_TwoTh_Psi_arrays()
+        self.assertIsNot(detector.get_integration_table('2theta', two_theta_mini=1., two_theta_maxi=6.,
+                                                        two_theta_step=0.5, psi_min=10., psi_max=200.), table)
+
+    def test_geometry_maps(self):
+        """Verify the cached per-pixel geometry maps."""
+        detector = RegArrayDetector2d(size=(64, 48))
+        detector.pixel_size = 0.2  # mm
+        detector.ref_pos = np.array([50., 0., 0.])
+        maps = detector.get_geometry_maps(polarization_factor=0.9)
+        self.assertEqual(maps['lab'].shape, (64, 48, 3))
+        self.assertTrue(np.allclose(maps['lab'][10, 20], detector.pixel_to_lab(10, 20)[0]))
+        # compare with the angles computed from the calibration
+        detector.calib = 50. * np.tan(np.radians(1.)) / 0.2
+        detector.compute_TwoTh_Psi_arrays()
+        self.assertTrue(np.allclose(maps['two_theta'], detector.two_thetas))
+        valid = np.isfinite(detector.psis)
+        self.assertTrue(np.allclose(maps['psi'][valid], detector.psis[valid]))
+        # the central pixel sees the beam at normal incidence
+        self.assertAlmostEqual(maps['solid_angle'][32, 24], 0.2 ** 2 / 50. ** 2)
+        self.assertAlmostEqual(maps['polarization'][32, 24], 1.)
+        self.assertTrue(np.all(maps['solid_angle'] <= maps['solid_angle'][32, 24]))
+        # the maps are cached until the geometry changes
+        self.assertIs(detector.get_geometry_maps(polarization_factor=0.9), maps)
+        two_thetas = detector.two_thetas
+        detector.compute_TwoTh_Psi_arrays()
+        self.assertIs(detector.two_thetas, two_thetas)
+        # replaced arrays are recomputed
+        detector.two_thetas = np.zeros_like(two_thetas)
+        detector.compute_TwoTh_Psi_arrays()
+        self.assertTrue(np.allclose(detector.two_thetas, two_thetas))
+        detector.apply_tilts((0., 2., 0.))
+        tilted_maps = detector.get_geometry_maps(polarization_factor=0.9)
+        self.assertIsNot(tilted_maps, maps)
+        self.assertFalse(np.allclose(tilted_maps['two_theta'], maps['two_theta']))
+        # save and reload the maps
+        data_dir = tempfile.mkdtemp()
+        file_path = os.path.join(data_dir, 'geometry_maps.h5')
+        detector.save_geometry_maps(file_path, polarization_factor=0.9)
+        detector.clear_geometry_cache()
+        loaded_maps = detector.load_geometry_maps(file_path)
+        self.assertTrue(np.array_equal(loaded_maps['psi'], tilted_maps['psi']))
+        self.assertIs(detector.get_geometry_maps(polarization_factor=0.9), loaded_maps)
+        detector.ref_pos = np.array([60., 0., 0.])
+        with self.assertRaises(ValueError):
+            detector.load_geometry_maps(file_path)
+        shutil.rmtree(data_dir)
+
+    def test_image_stack_reader(self):
+        """Verify the streaming reductions of an image stack."""
+        np.random.seed(7)
+        stack = np.random.randint(0, 1000, (10, 12, 8)).astype(np.uint16)
+        dark = np.full((12, 8), 10.)
+        roi_mask = np.zeros((12, 8), dtype=bool)
+        roi_mask[2:5, 3:7] = True
+        reader = ImageStackReader(stack, dark=dark, batch_size=3)
+        results = reader.reduce(rois=[(slice(0, 6), slice(0, 4)), roi_mask], center_of_mass=True, group_size=4)
+        corr = stack - dark
+        self.assertTrue(np.allclose(results['sum'], corr.sum(axis=0)))
+        self.assertTrue(np.allclose(results['max'], corr.max(axis=0)))
+        self.assertTrue(np.allclose(results['total'], corr.sum(axis=(1, 2))))
+        self.assertTrue(np.allclose(results['roi'][:, 0], corr[:, :6, :4].sum(axis=(1, 2))))
+        self.assertTrue(np.allclose(results['roi'][:, 1], corr[:, roi_mask].sum(axis=1)))
+        self.assertTrue(np.allclose(results['center_of_mass'][5],
+                                    [np.sum(corr[5] * np.arange(12)[:, None]) / corr[5].sum(),
+                                     np.sum(corr[5] * np.arange(8)) / corr[5].sum()]))
+        self.assertEqual(results['groups'].shape, (3, 12, 8))
+        self.assertTrue(np.allclose(results['groups'][2], corr[8:].sum(axis=0)))
+        with self.assertRaises(ValueError):
+            ImageStackReader(stack[:0], dark=dark).reduce()
+        # read the same frames from individual files
+        data_dir = tempfile.mkdtemp()
+        paths = []
+        for i in range(len(stack)):
+            paths.append(os.path.join(data_dir, 'frame%04d.edf' % i))
+            edf_write(stack[i], paths[-1], verbose=False)
+        frames = list(ImageStackReader(paths, dark=dark, batch_size=4))
+        self.assertEqual(len(frames), 10)
+        self.assertTrue(np.allclose(frames[7], corr[7]))
+        shutil.rmtree(data_dir)
+        # the xpad corrections are applied to a whole batch
+        xpad = Xpad()
+        raw = np.random.rand(3, 240, 560)
+        corrected = ImageStackReader(raw, detector=xpad).read_batch(0, 3)
+        self.assertEqual(corrected.shape, (3, 243, 578))
+        xpad.data = raw[1]
+        xpad.compute_corrected_image()
+        self.assertTrue(np.array_equal(xpad.corr_data, corrected[1]))
@@ -1,6 +1,6 @@
 import unittest
 import numpy as np
-from pymicro.xray.fitting import lin_reg
+from pymicro.xray.fitting import lin_reg, fit_profiles, Gaussian, Lorentzian, Voigt
 
 class FittingTests(unittest.TestCase):
 
@@ -15,3 +15,46 @@ class FittingTests(unittest.TestCase):
         self.assertAlmostEqual(beta, 61.2721865, 7)
         self.assertAlmostEqual(alpha, -39.0619559, 7)
         self.assertAlmostEqual(r,  0.99458379, 7)
+
+    def test_fit_profiles(self):
+        """Verify the batch fitting of a stack of profiles."""
+        np.random.seed(42)
+        x = np.linspace(-2, 2, 41)
+        positions = np.random.uniform(-0.5, 0.5, (4, 5))
+        widths = np.random.uniform(0.2, 0.6, (4, 5))
+        for function_class in [Gaussian, Lorentzian, Voigt]:
+            y = np.empty((4, 5, len(x)))
+            for index in np.ndindex(4, 5):
+                F = function_class(position=positions[index])
+                F.parameters[1].set(widths[index])
+                F.set_height(100.)
+                y[index] = F(x)
+            noisy = y + np.random.normal(0, 0.5, y.shape)
+            params, r_squared, rss = fit_profiles(noisy, x, expression=function_class.__name__)
+            self.assertEqual(params.shape, (4, 5, len(F.parameters)))
+            self.assertEqual(r_squared.shape, (4, 5))
+            self.assertTrue(np.allclose(params[:, :, 0], positions, atol=0.01))
+            self.assertTrue(np.all(r_squared > 0.99))
+            # compare with the fit of a single profile
+            F.set_position(0.)
+            F.fit(noisy[2, 3], x)
+            self.assertLessEqual(rss[2, 3], np.sum((noisy[2, 3] - F(x)) ** 2) * (1 + 1e-6))
+        # initial parameters can be given for all the profiles
+        params, r_squared, rss = fit_profiles(noisy[0], x, expression='Voigt', init=[0., 0.3, 0.1, 50.])
+        self.assertTrue(np.allclose(params[:, 0], positions[0], atol=0.01))
+        # the Lorentzian width of the Voigt profiles stays positive
+        gaussians = 100. * np.exp(-((x - positions[:, :, np.newaxis]) / 0.4) ** 2)
+        gaussians += np.random.normal(0, 2., gaussians.shape)
+        params, r_squared, rss = fit_profiles(gaussians, x, expression='Voigt')
+        self.assertTrue(np.all(params[:, :, 2] >= 0))
+        self.assertTrue(np.all(r_squared > 0.99))
+        # dark, flat and invalid profiles are not fitted
+        stack = np.array([np.zeros_like(x), np.full_like(x, 5.), np.full_like(x, np.nan), gaussians[0, 0]])
+        for expression in ['Gaussian', 'Lorentzian', 'Cosine', 'Voigt']:
+            params, r_squared, rss = fit_profiles(stack, x, expression=expression)
+            self.assertTrue(np.all(np.isnan(params[:3])))
+            self.assertTrue(np.all(np.isnan(r_squared[:3])))
+            self.assertTrue(np.all(np.isnan(rss[:3])))
+            self.assertTrue(np.all(np.isfinite(params[3])))
+        with self.assertRaises(ValueError):
+            fit_profiles(noisy, x, expression='Parabola')
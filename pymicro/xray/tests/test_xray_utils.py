@@ -1,5 +1,7 @@
 import unittest
-from pymicro.xray.xray_utils import f_atom
+import numpy as np
+from skimage.transform import radon
+from pymicro.xray.xray_utils import f_atom, radiographs, clear_radiographs_cache, ParallelBeamProjector
 
 class XrayUtilsTests(unittest.TestCase):
 
@@ -7,4 +9,22 @@ class XrayUtilsTests(unittest.TestCase):
         """Verify the calculation of the atom form factor."""
         for Z in range(1, 30):
             # error is less than 3%
-            self.assertLess(abs(f_atom(0., Z) - Z) / Z, 0.03)
\ No newline at end of file
+            self.assertLess(abs(f_atom(0., Z) - Z) / Z, 0.03)
+
+    def test_radiographs(self):
+        """Verify the projections against the radon transform of each slice."""
+        data = np.random.rand(17, 12, 4)
+        omegas = np.array([0., 13.7, 90., 181.2, 359.])
+        projections = radiographs(data, omegas)
+        self.assertEqual(projections.shape, (25, 4, 5))
+        for z in range(data.shape[2]):
+            ref = radon(data[:, :, z], -omegas, circle=False)
+            self.assertTrue(np.allclose(projections[:, z, :], ref, rtol=1e-9, atol=0.))
+        # reuse of the projection geometry with several threads
+        projector = ParallelBeamProjector(max_cache_size=2000)
+        self.assertTrue(np.allclose(radiographs(data, omegas, n_jobs=2, projector=projector), projections))
+        self.assertLessEqual(projector._cache_size, 2000)
+        self.assertGreater(len(projector._matrices), 0)
+        self.assertEqual(projector._cache_size,
+                         sum(m.nnz for m in projector._matrices.values()))
+        clear_radiographs_cache()
@@ -1,6 +1,9 @@
-import os, numpy as np
+import os, threading, numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from matplotlib import pyplot as plt
-from skimage.transform import radon
+from scipy import sparse
+from skimage.util import img_as_float
 from math import *
 from config import PYMICRO_XRAY_DATA_DIR
 
@@ -223,37 +226,182 @@ def plot_xray_trans(mat='Al', ts=[1.0], rho=None, energy_lim=[1, 100], legfmt='%
         plt.savefig('xray_trans_' + mat + '.png')
 
 
-def radiograph(data, omega):
+class ParallelBeamProjector:
+    """A class to compute parallel beam projections of 3D volumes.
+
+    The volume, given in (XYZ) form, rotates around the Z axis in the middle
+    of the data set. Each projection reproduces the radon transform of the
+    skimage package (with `circle=False`): the XY slice is padded to a square
+    of its diagonal size, rotated with a bilinear interpolation and summed
+    along the beam. Since this is a linear operation depending only on the
+    slice shape and the rotation angle, it is stored as a sparse projection
+    matrix and applied to all the slices of the volume at once.
+
+    The projection matrices are cached so that the geometry is reused by
+    subsequent calls with the same slice shape and angles. The cache is
+    bounded by the total number of non zero entries of the matrices and is
+    guarded by a lock, so a projector can be shared between threads.
+
+    The results are equivalent to the slice by slice radon transform within
+    a relative tolerance of 1e-9, only the summation order differs (float32
+    volumes are projected in double precision whereas skimage works in single
+    precision, so the difference is then of the order of 1e-6).
+    """
+
+    def __init__(self, max_cache_size=2 ** 25):
+        """Create a new projector.
+
+        :param int max_cache_size: the maximum total number of non zero
+            entries of the cached projection matrices.
+        """
+        self.max_cache_size = max_cache_size
+        self._matrices = OrderedDict()
+        self._cache_size = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def projection_width(shape):
+        """Return the number of pixels of the projections of a volume.
+
+        :param tuple shape: the shape of the volume.
+        :return: the width of the projections.
+        """
+        return int(np.ceil(max(shape[0], shape[1]) * 2 ** 0.5))
+
+    def projection_matrix(self, shape, omega):
+        """Get the sparse matrix projecting a XY slice at a given angle.
+
+        :param tuple shape: the shape of the volume (only the first two
+            dimensions are used).
+        :param float omega: the rotation angle value in degrees.
+        :return: a (width, nx * ny) sparse matrix in CSR format.
+        """
+        nx, ny = shape[0], shape[1]
+        key = (nx, ny, float(omega))
+        with self._lock:
+            if key in self._matrices:
+                self._matrices.move_to_end(key)
+                return self._matrices[key]
+        # same padding as the radon function of skimage
+        diagonal = np.sqrt(2) * max(nx, ny)
+        pad = [int(np.ceil(diagonal - n)) for n in (nx, ny)]
+        pad_before = [(n + p) // 2 - n // 2 for n, p in zip((nx, ny), pad)]
+        width = nx + pad[0]
+        center = width // 2
+        # position of each pixel of the rotated image in the padded image
+        angle = np.deg2rad(-omega)
+        cos_a, sin_a = np.cos(angle), np.sin(angle)
+        r, c = np.mgrid[0:width, 0:width]
+        r, c = r.ravel(), c.ravel()
+        c_in = cos_a * c + sin_a * r - center * (cos_a + sin_a - 1)
+        r_in = -sin_a * c + cos_a * r - center * (cos_a - sin_a - 1)
+        r0, c0 = np.floor(r_in), np.floor(c_in)
+        dr, dc = r_in - r0, c_in - c0
+        r0 = r0.astype(np.int64) - pad_before[0]
+        c0 = c0.astype(np.int64) - pad_before[1]
+        # bilinear interpolation weights of the 4 neighbours of each position
+        rows, cols, weights = [], [], []
+        for i, j, w in [(0, 0, (1 - dr) * (1 - dc)), (0, 1, (1 - dr) * dc),
+                        (1, 0, dr * (1 - dc)), (1, 1, dr * dc)]:
+            inside = (r0 + i >= 0) & (r0 + i < nx) & (c0 + j >= 0) & (c0 + j < ny) & (w != 0)
+            rows.append(c[inside])
+            cols.append((r0[inside] + i) * ny + c0[inside] + j)
+            weights.append(w[inside])
+        matrix = sparse.coo_matrix((np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))),
+                                   shape=(width, nx * ny)).tocsr()
+        with self._lock:
+            if key in self._matrices:
+                # computed meanwhile by another thread
+                self._matrices.move_to_end(key)
+                return self._matrices[key]
+            self._matrices[key] = matrix
+            self._cache_size += matrix.nnz
+            while self._cache_size > self.max_cache_size and \
+                    len(self._matrices) > 1:
+                self._cache_size -= self._matrices.popitem(last=False)[1].nnz
+        return matrix
+
+    def clear_cache(self):
+        """Clear the cache of the projection matrices."""
+        with self._lock:
+            self._matrices.clear()
+            self._cache_size = 0
+
+    def project(self, data, omegas, n_jobs=1):
+        """Compute the projections of a 3D volume at several angles.
+
+        Like the radon function of skimage, integer data is scaled by the
+        maximum value of its type.
+
+        :param np.array data: an array representing the 3D object in (XYZ) form.
+        :param omegas: an array of the rotation values in degrees.
+        :param int n_jobs: number of threads used to compute the projections.
+        :returns projections: a 3D array in (Y, Z, omega) form.
+        """
+        assert data.ndim == 3
+        omegas = np.atleast_1d(np.asarray(omegas, dtype=float))
+        nx, ny, nz = data.shape
+        flat = img_as_float(data).astype(np.float64).reshape((nx * ny, nz))
+        projections = np.zeros((self.projection_width(data.shape), nz, len(omegas)), dtype=np.float64)
+
+        def project_at(i):
+            projections[:, :, i] = self.projection_matrix(data.shape, omegas[i]) @ flat
+
+        if n_jobs > 1:
+            with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(project_at, range(len(omegas))))
+        else:
+            for i in range(len(omegas)):
+                project_at(i)
+        return projections
+
+
+# projector shared by the radiograph functions to reuse the projection geometry,
+# its cache is kept small since it lives as long as the process
+_projector = ParallelBeamProjector(max_cache_size=2 ** 20)
+
+
+def clear_radiographs_cache():
+    """Release the projection matrices cached by the radiograph functions."""
+    _projector.clear_cache()
+
+
+def radiograph(data, omega, projector=None):
     """Compute a single radiograph of a 3D object using the radon transform.
 
     :param np.array data: an array representing the 3D object in (XYZ) form.
     :param omega: the rotation angle value in degrees.
+    :param ParallelBeamProjector projector: the projector to use (the shared
+        projector of this module by default).
     :returns projection: a 2D array in (Y, Z) form.
     """
-    projection = radiographs(data, [omega])
+    projection = radiographs(data, [omega], projector=projector)
     return projection[:, :, 0]
 
 
-def radiographs(data, omegas):
+def radiographs(data, omegas, n_jobs=1, projector=None):
     """Compute the radiographs of a 3D object using the radon transform.
 
     The object is represented by a 3D numpy array in (XYZ) form and a series of projection at each omega angle
-    are computed assuming the rotation is along Z in the middle of the data set. Internally this function uses
-    the radon transform from the skimage package.
+    are computed assuming the rotation is along Z in the middle of the data set. The projections are equivalent
+    to applying the radon transform from the skimage package to each XY slice, but they are computed for the
+    whole volume at once with the cached projection matrices of a `ParallelBeamProjector`.
+
+    By default, a projector shared by all the calls is used, with a cache
+    limited to 2**20 non zero entries which can be released with
+    `clear_radiographs_cache`. A projector with a larger cache can be given
+    to reuse more projection geometries, its cache is released with it.
 
     :param np.array data: an array representing the 3D object in (XYZ) form.
     :param omegas: an array of the rotation values in degrees.
+    :param int n_jobs: number of threads used to compute the projections.
+    :param ParallelBeamProjector projector: the projector to use (the shared
+        projector of this module by default).
     :returns projections: a 3D array in (Y, Z, omega) form.
     """
-    assert data.ndim == 3
-    if type(omegas) is list:
-        omegas = np.array(omegas)
-    width = int(np.ceil(max(data.shape[0], data.shape[1]) * 2 ** 0.5))
-    projections = np.zeros((width, np.shape(data)[2], len(omegas)), dtype=np.float64)
-    for z in range(np.shape(data)[2]):
-        a = radon(data[:, :, z], -omegas, circle=False)  # - 90  # the 90 seems to come from the radon function itself
-        projections[:, z, :] = a[:, :]
-    return projections
+    if projector is None:
+        projector = _projector
+    return projector.project(data, omegas, n_jobs=n_jobs)
 
 
 